@@ -9,8 +9,10 @@ import gltext
 import copengl as gl
 
 import fps_counter
+import gl_setup
 import graph_window
 import graph_renderer
+import spectrum
 
 
 
@@ -19,6 +21,12 @@ class AniplotBase(QtOpenGL.QGLWidget):
         Use AniplotWidget instead.
     '''
 
+    # timer interval while something moves and while idle. a frame is rendered only if a channel got new samples,
+    # the graph is animating or there was user input. after IDLE_TICKS ticks of nothing the timer slows down.
+    TICK_MS = 1000. / 60
+    IDLE_TICK_MS = 100.
+    IDLE_TICKS = 30
+
     def __init__(self, parent=None):
         super(AniplotBase, self).__init__(parent)
 
@@ -34,53 +42,75 @@ class AniplotBase(QtOpenGL.QGLWidget):
         # renders graphs, grids, legend, scrollbar, border.
         self.grapher = graph_renderer.GraphRenderer(self.gltext)
         self.channels = []
+        self.marker_channels = []
         self.graph_window = None
+        # power spectrum view settings and segment cache. see GraphRenderer.set_spectrum()
+        self.spectrum = spectrum.Spectrum()
 
         self._fps_counter = fps_counter.FpsCounter()
+        # show grid cache statistics above the fps counter
+        self.show_profile = False
         self._mouse_last_pos = None # event.pos()
         self._mouse_dragging = False
         self._last_tick_time = time.time()
 
+        # channel change counters at the last rendered frame
+        self._change_counters = None
+        self._redraw = True
+        self._idle_ticks = 0
+
     def _start(self):
         ''' begins drawing if all channels are setup '''
-        self.grapher.setup(self.channels)
+        self.grapher.setup(self.channels, self.marker_channels)
         # converts input events to smooth zoom/movement of the graph.
         self.graph_window = graph_window.GraphWindow(self, font=self.gltext, graph_renderer=self.grapher, keys=None, x=0, y=0, w=10, h=10)
-        self.timer.start(1./60*1000)
+        self.timer.start(self.TICK_MS)
 
     def __del__(self):
         self.makeCurrent()
+        self.grapher.release()
 
-    def initializeGL(self):
-        gl.glDisable(gl.GL_TEXTURE_2D)
-        gl.glDisable(gl.GL_DEPTH_TEST)
-        gl.glDisable(gl.GL_FOG)
-        gl.glDisable(gl.GL_DITHER)
-        gl.glDisable(gl.GL_LIGHTING)
-        gl.glShadeModel(gl.GL_FLAT)
-        gl.glEnable(gl.GL_BLEND)
-        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
-        gl.glDisable(gl.GL_LINE_SMOOTH)
-        gl.glEnable(gl.GL_POINT_SMOOTH)
-        gl.glDisable(gl.GL_LINE_STIPPLE)
-        gl.glDisable(gl.GL_LIGHT1)
-        #glFrontFace(gl.GL_CW)
-
-        gl.glEnable(gl.GL_NORMALIZE)
-        gl.glHint(gl.GL_PERSPECTIVE_CORRECTION_HINT, gl.GL_NICEST)
-        gl.glDisable(gl.GL_CULL_FACE)
-        #glCullFace(gl.GL_BACK)
-        gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_FILL)
-        # wireframe view
-        #glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_LINE)
+    def closeEvent(self, event):
+        # the grid display lists live in this widget's context
+        self.makeCurrent()
+        self.grapher.release()
+        super(AniplotBase, self).closeEvent(event)
 
+    def initializeGL(self):
+        gl_setup.init_gl()
         self.gltext.init()
 
     def tick(self):
         t = time.time()
-        self._fps_counter.tick(t - self._last_tick_time)
-        self.updateGL()
-        self._last_tick_time = t
+        # move samples pushed by other threads to the channels, so the change counters see them
+        self.grapher.tick()
+        if self._needs_redraw():
+            self._fps_counter.tick(t - self._last_tick_time)
+            self.updateGL()
+            self._last_tick_time = t
+            if self._idle_ticks >= self.IDLE_TICKS:
+                self.timer.setInterval(self.TICK_MS)
+            self._idle_ticks = 0
+        else:
+            self._idle_ticks += 1
+            if self._idle_ticks == self.IDLE_TICKS:
+                self.timer.setInterval(self.IDLE_TICK_MS)
+
+    def request_redraw(self):
+        ''' render the next tick even if no samples were added and nothing moves. call after changing channel
+            visual settings (f_color_avg, ..) or anything else the scheduler can't see. '''
+        self._redraw = True
+        if self._idle_ticks >= self.IDLE_TICKS:
+            self._idle_ticks = 0
+            self.timer.setInterval(self.TICK_MS)
+
+    def _needs_redraw(self):
+        counters = [channel.get_change_counter() for channel in self.channels + self.marker_channels]
+        redraw = self._redraw or counters != self._change_counters or \
+                 (self.graph_window is not None and self.graph_window.is_moving())
+        self._change_counters = counters
+        self._redraw = False
+        return redraw
 
     def gl_coordinates(self, x, y):
         return x, self.size().height() - y
@@ -101,36 +131,15 @@ class AniplotBase(QtOpenGL.QGLWidget):
 
             self.grapher.tick()
             self.graph_window.tick()
+            gl_setup.render_graph_window(self.graph_window, w, h)
 
-            gl.glClearColor(0.2, 0.2, 0.2, 1.0)
-            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
-
-            gl.glViewport(0, 0, w, h)
-
-            gl.glMatrixMode(gl.GL_PROJECTION)
-            gl.glLoadIdentity()
-            gl.glOrtho(0., w, h, 0., -100, 100)
-
-            gl.glDisable(gl.GL_DEPTH_TEST)
-            gl.glDisable(gl.GL_TEXTURE_2D)
-            gl.glDisable(gl.GL_LIGHTING)
-
-            gl.glMatrixMode(gl.GL_MODELVIEW)
-            gl.glLoadIdentity()
-            gl.glScalef(1.,1.,-1.)
-
-            self.graph_window.x = -1
-            self.graph_window.y = -1
-            self.graph_window.w = w + 2
-            self.graph_window.h = h + 2
-
-            # render 2d objects
-            gl.glDisable(gl.GL_DEPTH_TEST)
-            gl.glDisable(gl.GL_TEXTURE_2D)
-            self.graph_window.render()
             gl.glEnable(gl.GL_TEXTURE_2D)
             self.gltext.drawbr("fps: %.0f" % (self._fps_counter.fps), w, h, fgcolor = (.9, .9, .9, 1.), bgcolor = (0.3, 0.3, 0.3, .0))
-            self.gltext.drawbm("usage: arrows, shift, mouse", w/2, h-3, fgcolor = (.5, .5, .5, 1.), bgcolor = (0., 0., 0., .0))
+            if self.show_profile:
+                self.gltext.drawbr("grid: %s" % self.grapher.grid_profile, w, h - self.gltext.height, fgcolor = (.9, .9, .9, 1.), bgcolor = (0.3, 0.3, 0.3, .0))
+                if self.grapher.spectrum:
+                    self.gltext.drawbr("spectrum: %s" % self.spectrum.profile, w, h - self.gltext.height * 2, fgcolor = (.9, .9, .9, 1.), bgcolor = (0.3, 0.3, 0.3, .0))
+            self.gltext.drawbm("usage: arrows, shift, mouse, a (auto-fit), f (spectrum), d (density)", w/2, h-3, fgcolor = (.5, .5, .5, 1.), bgcolor = (0., 0., 0., .0))
 
     def resizeGL(self, width, height):
         pass
@@ -139,6 +148,17 @@ class AniplotBase(QtOpenGL.QGLWidget):
     def keyPressEvent(self, event):
         key = event.key()
         if self.graph_window:
+            self.request_redraw()
+            # fit the vertical range to the visible samples, on/off
+            if key == QtCore.Qt.Key_A:
+                self.graph_window.set_auto_fit_y(not self.graph_window.auto_fit_y)
+            # power spectrum of the visible samples instead of the samples, on/off
+            if key == QtCore.Qt.Key_F:
+                self.grapher.set_spectrum(None if self.grapher.spectrum else self.spectrum)
+            # density view of every channel instead of lines, on/off
+            if key == QtCore.Qt.Key_D:
+                for channel in self.grapher.channels:
+                    channel.f_render_density = not channel.f_render_density
             # if shift is not pressed, move the graph.
             if not (event.modifiers() & QtCore.Qt.ShiftModifier):
                 d = 1. / 3
@@ -169,6 +189,7 @@ class AniplotBase(QtOpenGL.QGLWidget):
     @QtCore.Slot(QtGui.QMouseEvent)
     def mousePressEvent(self, event):
         if self.graph_window:
+            self.request_redraw()
             self._mouse_last_pos = event.pos()
             if event.button() == QtCore.Qt.LeftButton:
                 self._mouse_dragging = True
@@ -177,6 +198,7 @@ class AniplotBase(QtOpenGL.QGLWidget):
     @QtCore.Slot(QtGui.QMouseEvent)
     def mouseReleaseEvent(self, event):
         if self.graph_window:
+            self.request_redraw()
             if event.button() == QtCore.Qt.LeftButton:
                 self._mouse_dragging = False
                 self.graph_window.set_smooth_movement(True)
@@ -190,4 +212,5 @@ class AniplotBase(QtOpenGL.QGLWidget):
             dy = event.y() - self._mouse_last_pos.y()
             if self._mouse_dragging:
                 self.graph_window.move_by_pixels(dx, dy)
+                self.request_redraw()
             self._mouse_last_pos = event.pos()
\ No newline at end of file
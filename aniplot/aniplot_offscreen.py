@@ -0,0 +1,256 @@
+import os
+import time
+import zlib
+import struct
+import ctypes
+import ctypes.util
+
+import numpy
+
+from OpenGL.GL import * # Otherwise gltext import fails
+import gltext
+
+import gl_setup
+import graph_window
+import graph_renderer
+from graph_channel import GraphChannel
+from marker_channel import MarkerChannel
+
+
+# headless rendering. no Qt, no window, no display server. the context is an EGL pbuffer, so this works with mesa
+# (llvmpipe software rendering included) and the nvidia drivers on linux. copengl keeps calling libGL as usual,
+# libglvnd dispatches the calls to the current EGL context.
+
+
+EGL_DEFAULT_DISPLAY           = 0
+EGL_NO_CONTEXT                = 0
+EGL_NONE                      = 0x3038
+EGL_ALPHA_SIZE                = 0x3021
+EGL_BLUE_SIZE                 = 0x3022
+EGL_GREEN_SIZE                = 0x3023
+EGL_RED_SIZE                  = 0x3024
+EGL_SURFACE_TYPE              = 0x3033
+EGL_RENDERABLE_TYPE           = 0x3040
+EGL_HEIGHT                    = 0x3056
+EGL_WIDTH                     = 0x3057
+EGL_OPENGL_API                = 0x30A2
+EGL_PBUFFER_BIT               = 0x0001
+EGL_OPENGL_BIT                = 0x0008
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+GL_RGBA                       = 0x1908
+GL_UNSIGNED_BYTE              = 0x1401
+GL_PACK_ALIGNMENT             = 0x0D05
+
+
+class EglContext:
+    """ one desktop OpenGL context with one pbuffer surface per used size. make_current() before rendering. """
+
+    def __init__(self):
+        self._egl = ctypes.CDLL(ctypes.util.find_library("EGL") or "libEGL.so.1")
+        self._gl  = ctypes.CDLL(ctypes.util.find_library("GL") or "libGL.so.1")
+        egl = self._egl
+        for name in ("eglGetDisplay", "eglCreatePbufferSurface", "eglCreateContext", "eglGetProcAddress"):
+            getattr(egl, name).restype = ctypes.c_void_p
+        egl.eglGetDisplay.argtypes = [ctypes.c_void_p]
+        egl.eglInitialize.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+        egl.eglChooseConfig.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p]
+        egl.eglCreatePbufferSurface.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+        egl.eglCreateContext.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+        egl.eglMakeCurrent.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+        egl.eglDestroySurface.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        egl.eglDestroyContext.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        egl.eglTerminate.argtypes = [ctypes.c_void_p]
+        egl.eglGetProcAddress.argtypes = [ctypes.c_char_p]
+
+        # prefer the surfaceless platform. eglGetDisplay(EGL_DEFAULT_DISPLAY) may try to open an X display.
+        self._display = None
+        p = egl.eglGetProcAddress(b"eglGetPlatformDisplayEXT")
+        if p:
+            get_platform_display = ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)(p)
+            self._display = get_platform_display(EGL_PLATFORM_SURFACELESS_MESA, None, None)
+        if not self._display:
+            self._display = egl.eglGetDisplay(EGL_DEFAULT_DISPLAY)
+        if not self._display or not egl.eglInitialize(self._display, None, None):
+            raise RuntimeError("EGL initialization failed")
+
+        attribs = self._attribs(EGL_SURFACE_TYPE, EGL_PBUFFER_BIT, EGL_RENDERABLE_TYPE, EGL_OPENGL_BIT,
+                                EGL_RED_SIZE, 8, EGL_GREEN_SIZE, 8, EGL_BLUE_SIZE, 8, EGL_ALPHA_SIZE, 8)
+        self._config = ctypes.c_void_p()
+        num_configs = ctypes.c_int()
+        if not egl.eglChooseConfig(self._display, attribs, ctypes.byref(self._config), 1, ctypes.byref(num_configs)) \
+                or not num_configs.value:
+            raise RuntimeError("no EGL config with desktop OpenGL pbuffer support")
+
+        egl.eglBindAPI(EGL_OPENGL_API)
+        self._context = egl.eglCreateContext(self._display, self._config, EGL_NO_CONTEXT, None)
+        if not self._context:
+            raise RuntimeError("EGL context creation failed")
+        # (w, h) : surface
+        self._surfaces = {}
+
+    def make_current(self, w, h):
+        surface = self._surfaces.get((w, h))
+        if not surface:
+            surface = self._egl.eglCreatePbufferSurface(self._display, self._config, self._attribs(EGL_WIDTH, w, EGL_HEIGHT, h))
+            if not surface:
+                raise RuntimeError("EGL pbuffer creation failed (%ix%i)" % (w, h))
+            self._surfaces[(w, h)] = surface
+        if not self._egl.eglMakeCurrent(self._display, surface, surface, self._context):
+            raise RuntimeError("eglMakeCurrent failed")
+
+    def read_pixels(self, w, h):
+        """ return the current surface as a (h, w, 4) uint8 RGBA array. top row first. """
+        a = numpy.empty((h, w, 4), numpy.uint8)
+        self._gl.glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        self._gl.glReadPixels(0, 0, w, h, GL_RGBA, GL_UNSIGNED_BYTE, a.ctypes.data_as(ctypes.c_void_p))
+        # opengl rows are bottom-up
+        return a[::-1].copy()
+
+    def finish(self):
+        self._gl.glFinish()
+
+    def destroy(self):
+        if self._display:
+            self._egl.eglMakeCurrent(self._display, None, None, None)
+            for surface in self._surfaces.values():
+                self._egl.eglDestroySurface(self._display, surface)
+            self._egl.eglDestroyContext(self._display, self._context)
+            self._egl.eglTerminate(self._display)
+            self._surfaces = {}
+            self._display = None
+
+    def _attribs(self, *args):
+        args = args + (EGL_NONE,)
+        return (ctypes.c_int * len(args))(*args)
+
+
+def write_png(filename, pixels):
+    """ write a (h, w, 4) uint8 RGBA array as PNG. no PIL needed. """
+    h, w = pixels.shape[:2]
+    # filter type 0 (none) in front of every row
+    raw = numpy.zeros((h, w * 4 + 1), numpy.uint8)
+    raw[:, 1:] = pixels.reshape(h, w * 4)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 6, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+class AniplotOffscreen:
+    """ renders the same picture as AniplotWidget (without the fps counter and usage text) into memory.
+
+        plotter = AniplotOffscreen(640, 240)
+        ch1 = plotter.create_channel(frequency=1000, value_min=0., value_min_raw=0., value_max=5., value_max_raw=255.)
+        ch1.append_array(samples)
+        plotter.start()
+        plotter.show_samples(0, ch1.size())
+        pixels = plotter.render()               # (240, 640, 4) numpy.uint8 RGBA
+        plotter.save_png("capture.png")
+        plotter.release()
+
+        all AniplotOffscreen objects share one OpenGL context, so creating thousands of them one after another
+        (one per capture to thumbnail) is cheap. release() frees what a plotter keeps in the shared context, the
+        garbage collector can't.
+    """
+
+    _context = None
+    _gltext = None
+
+    default_color = (30/255., 144/255., 1., 1.) # dodgerblue 1, same as AniplotWidget
+    derived_color = (50/255., 205/255., 50/255., 1.) # limegreen, same as AniplotWidget
+    marker_color = (1., 215/255., 0., 1.) # gold 1, same as AniplotWidget
+
+    def __init__(self, w=640, h=240):
+        self.w, self.h = w, h
+        if not AniplotOffscreen._context:
+            AniplotOffscreen._context = EglContext()
+            AniplotOffscreen._context.make_current(w, h)
+            gl_setup.init_gl()
+            AniplotOffscreen._gltext = gltext.GLText(os.path.join(os.path.dirname(__file__), 'data', 'font_proggy_opti_small.txt'))
+            AniplotOffscreen._gltext.init()
+        self.gltext = AniplotOffscreen._gltext
+
+        # renders graphs, grids, legend, scrollbar, border.
+        self.grapher = graph_renderer.GraphRenderer(self.gltext)
+        self.channels = []
+        self.marker_channels = []
+        self.graph_window = None
+
+        # seconds spent in the last render(), without reading back the pixels. glFinish() included.
+        self.render_time = 0.
+
+    def create_channel(self, frequency=1000, value_min=0., value_min_raw=0., value_max=5., value_max_raw=255., legend="graph", unit="V", color=default_color, max_samples=0, max_seconds=0., queue_size=0, branching=2, skip_levels=0, sample_type="float32"):
+        ''' Returns GraphChannel object. Same as AniplotWidget.create_channel, but color is an (r, g, b, a) tuple
+            of floats 0..1 instead of QColor. '''
+        channel = GraphChannel(frequency=frequency, legend=legend, unit=unit, color=color,
+                               max_samples=max_samples, max_seconds=max_seconds, queue_size=queue_size,
+                               branching=branching, skip_levels=skip_levels, sample_type=sample_type)
+        channel.set_mapping(value_min=value_min, value_min_raw=value_min_raw, value_max=value_max, value_max_raw=value_max_raw)
+        self.channels.append(channel)
+        return channel
+
+    def create_derived_channel(self, sources, gains=None, offset=0., filter="none", filter_param=0., frequency=None, legend="derived", unit=None, color=derived_color, value_min=None, value_max=None, max_samples=0, max_seconds=0.):
+        ''' Returns GraphChannel object. Same as AniplotWidget.create_derived_channel, but color is an (r, g, b, a)
+            tuple of floats 0..1 instead of QColor. '''
+        channel = GraphChannel.derived(sources, gains=gains, offset=offset, filter=filter, filter_param=filter_param,
+                                       frequency=frequency, legend=legend, unit=unit, color=color,
+                                       value_min=value_min, value_max=value_max, max_samples=max_samples, max_seconds=max_seconds)
+        self.channels.append(channel)
+        return channel
+
+    def create_marker_channel(self, channel=None, legend="markers", color=marker_color):
+        ''' Returns MarkerChannel object. Same as AniplotWidget.create_marker_channel, but color is an (r, g, b, a)
+            tuple of floats 0..1 instead of QColor. '''
+        markers = MarkerChannel(channel or self.channels[0], legend=legend, color=color)
+        self.marker_channels.append(markers)
+        return markers
+
+    def open_channel(self, filename):
+        ''' Returns GraphChannel object of a file written by GraphChannel.save(), read-only. '''
+        channel = GraphChannel.load(filename)
+        self.channels.append(channel)
+        return channel
+
+    def start(self):
+        ''' call after all channels are setup. '''
+        self.grapher.setup(self.channels, self.marker_channels)
+        self.graph_window = graph_window.GraphWindow(self, font=self.gltext, graph_renderer=self.grapher, keys=None, x=0, y=0, w=self.w, h=self.h)
+        self.graph_window.set_smooth_movement(False)
+
+    def show_samples(self, start, end):
+        ''' show samples start..end of channels[0] over the whole window width, full value range vertically. '''
+        ch = self.channels[0]
+        self.graph_window.set_visible_samplespace(start, ch.value_max, end, ch.value_min, smooth=False)
+
+    def gl_coordinates(self, x, y):
+        return x, self.h - y
+
+    def render(self):
+        ''' render one frame and return it as a (h, w, 4) numpy.uint8 RGBA array, top row first. '''
+        context = AniplotOffscreen._context
+        context.make_current(self.w, self.h)
+        t = time.time()
+        self.grapher.tick()
+        self.graph_window.tick()
+        gl_setup.render_graph_window(self.graph_window, self.w, self.h)
+        context.finish()
+        self.render_time = time.time() - t
+        return context.read_pixels(self.w, self.h)
+
+    def save_png(self, filename):
+        ''' render one frame into a PNG file '''
+        write_png(filename, self.render())
+
+    def release(self):
+        ''' delete the grid display lists, vertex buffers and textures of this plotter from the shared context.
+            render() after this works, it just builds them again. '''
+        context = AniplotOffscreen._context
+        if context and context._display:
+            context.make_current(self.w, self.h)
+            self.grapher.release()
@@ -2,17 +2,20 @@ from PySide import QtGui
 
 from aniplot_base import AniplotBase
 from graph_channel import GraphChannel
+from marker_channel import MarkerChannel
 
 
 
 class AniplotWidget(AniplotBase):
 
     default_color = QtGui.QColor(30, 144, 255) # http://cloford.com/resources/colours/500col.htm dodgerblue 1
+    derived_color = QtGui.QColor(50, 205, 50) # limegreen
+    marker_color = QtGui.QColor(255, 215, 0) # gold 1
 
     def __init__(self):
         AniplotBase.__init__(self)
 
-    def create_channel(self, frequency=1000, value_min=0., value_min_raw=0., value_max=5., value_max_raw=255., legend="graph", unit="V", color=default_color):
+    def create_channel(self, frequency=1000, value_min=0., value_min_raw=0., value_max=5., value_max_raw=255., legend="graph", unit="V", color=default_color, max_samples=0, max_seconds=0., queue_size=0, branching=2, skip_levels=0, sample_type="float32"):
         ''' Returns GraphChannel object.
 
             "frequency"     : sampling frequency
@@ -23,6 +26,19 @@ class AniplotWidget(AniplotBase):
 
             For example with 10 bit ADC with AREF of 3.3 V these values are: value_min=0., value_min_raw=0., value_max=3.3, value_max_raw=1023.
 
+            "max_samples"   : if not 0, keep only the newest max_samples samples at full resolution, twice as many
+                              at half the resolution and so on. memory use stays constant.
+            "max_seconds"   : same as max_samples, but in seconds.
+            "queue_size"    : if not 0, samples can be appended from one other thread (a serial/usb reader) with
+                              push(), push_array() and push_minmaxavg_arrays(). they wait in a lock-free queue of
+                              queue_size samples and are moved to the graph at the next frame.
+            "branching"     : every 'branching' (2, 4, 8, ..) entries of a mip level make one entry of the next one.
+            "skip_levels"   : num of mip levels left out after the full resolution one. larger branching and
+                              skip_levels append faster and use less memory, but render slower when zoomed out.
+            "sample_type"   : storage type of the raw values: "float32", "int8", "uint8", "int16", "uint16" or
+                              "int32". value_*_raw map them to units. a 10 bit ADC fits "uint16", half the memory
+                              of "float32".
+
             Use case:
                 plotter = AniplotWidget()
                 ch1 = plotter.create_channel(frequency=1000, value_min=0., value_min_raw=0., value_max=5., value_max_raw=255.)
@@ -38,13 +54,81 @@ class AniplotWidget(AniplotBase):
                         ch2.append(sample2)
 
             Data can be appended also with custom timestamp: ch1.append(sample1, time.time())
+            Blocks of samples (a numpy array of any float dtype) are much faster
+            to append at once: ch1.append_array(samples, time_of_last_sample)
+
+            append*() methods are not thread safe, call them only from the GUI thread. From a reader thread:
+                ch3 = plotter.create_channel(frequency=10000, queue_size=10000)
+                # in the reader thread
+                ch3.push_array(samples)
+
+            To stream to disk while plotting: ch1.save("ch1.mip"). See open_channel().
         '''
         r, g, b, a = color.getRgb()
-        channel = GraphChannel(frequency=frequency, legend=legend, unit=unit, color=(r/255., g/255., b/255., a/255.,))
+        channel = GraphChannel(frequency=frequency, legend=legend, unit=unit, color=(r/255., g/255., b/255., a/255.,),
+                               max_samples=max_samples, max_seconds=max_seconds, queue_size=queue_size,
+                               branching=branching, skip_levels=skip_levels, sample_type=sample_type)
         channel.set_mapping(value_min=value_min, value_min_raw=value_min_raw, value_max=value_max, value_max_raw=value_max_raw)
         self.channels.append(channel)
         return channel
 
+    def create_derived_channel(self, sources, gains=None, offset=0., filter="none", filter_param=0., frequency=None, legend="derived", unit=None, color=derived_color, value_min=None, value_max=None, max_samples=0, max_seconds=0.):
+        ''' Returns GraphChannel object computed from other channels as their samples arrive:
+
+                filter(offset + gains[0] * sources[0] + gains[1] * sources[1] + ..)
+
+            in the displayed units of the sources. The math runs in the cpp module on every appended block, the
+            result has its own mip pyramid and renders, searches and triggers like any other channel.
+
+            "gains"         : one per source, 1. each by default
+            "filter"        : "none", "moving_avg" (mean of the last filter_param samples) or "lowpass" (one-pole
+                              IIR low-pass with cutoff filter_param Hz)
+            "frequency"     : sample rate of the result, sources[0].freq by default. sources of other rates are
+                              linearly interpolated.
+            "value_min"     : displayed range, by default what the ranges of the sources add up to
+            "value_max"
+
+            Use case:
+                diff = plotter.create_derived_channel([ch1, ch2], [1., -1.], legend="ch1 - ch2")
+                smooth = plotter.create_derived_channel([ch1], filter="lowpass", filter_param=5.)
+        '''
+        r, g, b, a = color.getRgb()
+        channel = GraphChannel.derived(sources, gains=gains, offset=offset, filter=filter, filter_param=filter_param,
+                                       frequency=frequency, legend=legend, unit=unit, color=(r/255., g/255., b/255., a/255.,),
+                                       value_min=value_min, value_max=value_max, max_samples=max_samples, max_seconds=max_seconds)
+        self.channels.append(channel)
+        return channel
+
+    def create_marker_channel(self, channel=None, legend="markers", color=marker_color):
+        ''' Returns MarkerChannel object: discrete events (relay switches, errors, operator notes) drawn as vertical
+            lines over the graphs, with an optional text.
+
+            "channel"       : GraphChannel the markers are positioned in, the first created channel by default.
+                              sample nums and times are the ones of this channel.
+
+            Markers are kept sorted by sample num and every frame finds the visible ones with a binary search, so
+            millions of them cost no more per frame than a few. Zoomed out, markers closer than
+            markers.f_min_spacing pixels collapse into one line with their count.
+
+            Use case:
+                events = plotter.create_marker_channel(ch1, legend="relays")
+                events.add(ch1.size(), "relay 1 on")            # at a sample num
+                events.add_timeutc(time.time(), "operator note") # at a time.time() timestamp
+                events.add_time(12.5, "test start")              # at seconds from the first sample
+                events.add_array(sample_nums, texts)             # many at once, any order
+        '''
+        r, g, b, a = color.getRgb()
+        markers = MarkerChannel(channel or self.channels[0], legend=legend, color=(r/255., g/255., b/255., a/255.,))
+        self.marker_channels.append(markers)
+        return markers
+
+    def open_channel(self, filename, writable=False, queue_size=0):
+        ''' Returns GraphChannel object of a file written by GraphChannel.save(). The file is memory-mapped, so
+            even a capture of many GB opens instantly. "writable" : continue appending to the file. '''
+        channel = GraphChannel.load(filename, writable=writable, queue_size=queue_size)
+        self.channels.append(channel)
+        return channel
+
     def start(self):
         ''' Start drawing.
             If channels are setup call this method to begin plotting.
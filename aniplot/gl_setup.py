@@ -0,0 +1,59 @@
+import copengl as gl
+
+
+# opengl state setup shared by the Qt widget and the offscreen renderer. nothing here knows about windows.
+
+
+def init_gl():
+    """ call once after the context is created """
+    gl.glDisable(gl.GL_TEXTURE_2D)
+    gl.glDisable(gl.GL_DEPTH_TEST)
+    gl.glDisable(gl.GL_FOG)
+    gl.glDisable(gl.GL_DITHER)
+    gl.glDisable(gl.GL_LIGHTING)
+    gl.glShadeModel(gl.GL_FLAT)
+    gl.glEnable(gl.GL_BLEND)
+    gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+    gl.glDisable(gl.GL_LINE_SMOOTH)
+    gl.glEnable(gl.GL_POINT_SMOOTH)
+    gl.glDisable(gl.GL_LINE_STIPPLE)
+    gl.glDisable(gl.GL_LIGHT1)
+    #glFrontFace(gl.GL_CW)
+
+    gl.glEnable(gl.GL_NORMALIZE)
+    gl.glHint(gl.GL_PERSPECTIVE_CORRECTION_HINT, gl.GL_NICEST)
+    gl.glDisable(gl.GL_CULL_FACE)
+    #glCullFace(gl.GL_BACK)
+    gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_FILL)
+    # wireframe view
+    #glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_LINE)
+
+
+def render_graph_window(graph_window, w, h):
+    """ clear the w*h pixel viewport and render graph_window over all of it. top-left pixel is (0, 0) """
+    gl.glClearColor(0.2, 0.2, 0.2, 1.0)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+
+    gl.glViewport(0, 0, w, h)
+
+    gl.glMatrixMode(gl.GL_PROJECTION)
+    gl.glLoadIdentity()
+    gl.glOrtho(0., w, h, 0., -100, 100)
+
+    gl.glDisable(gl.GL_DEPTH_TEST)
+    gl.glDisable(gl.GL_TEXTURE_2D)
+    gl.glDisable(gl.GL_LIGHTING)
+
+    gl.glMatrixMode(gl.GL_MODELVIEW)
+    gl.glLoadIdentity()
+    gl.glScalef(1.,1.,-1.)
+
+    graph_window.x = -1
+    graph_window.y = -1
+    graph_window.w = w + 2
+    graph_window.h = h + 2
+
+    # render 2d objects
+    gl.glDisable(gl.GL_DEPTH_TEST)
+    gl.glDisable(gl.GL_TEXTURE_2D)
+    graph_window.render()
@@ -1,4 +1,10 @@
 import time
+import math
+import json
+import bisect
+import collections
+
+import numpy
 
 from modules import cpp
 import copengl as gl
@@ -8,8 +14,21 @@ class GraphChannel:
     """
     hold MipBufRenderer and add some channel-specific variables
     """
-    def __init__(self, frequency, legend="graph", unit="V", color=(1.0,0.5,0.5,1.0,)):
+    def __init__(self, frequency, legend="graph", unit="V", color=(1.0,0.5,0.5,1.0,), max_samples=0, max_seconds=0., queue_size=0,
+                 branching=2, skip_levels=0, sample_type="float32"):
         """
+        max_samples, max_seconds : bounded memory mode. keep only the newest max_samples samples (or max_seconds
+            worth of samples) at full resolution, twice as long history at half the resolution and so on. sample
+            indices keep growing, first() tells the oldest sample still available at full resolution.
+            0 keeps everything.
+        queue_size : if not 0, enables push*() for appending from another thread. that many samples can wait for
+            the next render.
+        branching, skip_levels : shape of the mip pyramid. every 'branching' (2, 4, 8, ..) entries of a level make one
+            entry of the next one, skip_levels levels after the full resolution one are left out. larger values append
+            faster and use less memory, but render more entries per pixel when zoomed out. see mip_buf_t.h
+        sample_type : storage type of the raw values. "float32", "int8", "uint8", "int16", "uint16" or "int32". an
+            8 bit ADC channel as "uint8" takes a quarter of the memory. float samples are rounded and clamped to it,
+            set_mapping() maps the raw integers to units as usual.
         """
         self.freq = frequency
         # mappings from raw values in MipBuf to displayed values. for example, maybe the raw recorded value 255 should
@@ -25,20 +44,46 @@ class GraphChannel:
         self.f_color_minmax = (.4, .1, .1, 1.)
         self.f_render_minmax = False
         self.f_render_avg = True
+        # instead of avg and minmax, one line through the first, min, max and last sample of every pixel column.
+        # exact envelope at any zoom level, at most 4 vertices per pixel. uses f_color_avg.
+        self.f_render_m4 = False
+        # instead of lines, a histogram of the values of every pixel column. brighter where the signal spends more
+        # time. needs the value_window of render(). uses f_color_avg.
+        self.f_render_density = False
         self.f_linewidth = 1.
+        # draw from vertex buffer objects instead of glBegin/glEnd. falls
+        # back to glBegin/glEnd if the driver is older than OpenGL 1.5.
+        self.f_use_vbo = False
 
         # can be displayed on the legend
         self.name = legend
         self.si_unit = unit
 
-        self.data = cpp.MipBufRenderer()
+        capacity = max_samples or int(max_seconds * frequency + 0.5)
+        min_capacity = branching ** (skip_levels + 1)
+        self.data = cpp.MipBufRenderer(max(capacity, min_capacity) if capacity else 0, queue_size, branching, skip_levels,
+                                       sample_type)
 
         # list of timestamps for every self.freq samples (one timestamp for every second)
         self._timelist = []
+        # num of timestamps dropped from the front of _timelist. _timelist[0] is the timestamp of sample
+        # _timebase * freq * _seconds. grows only when max_samples or max_seconds drops old samples.
+        self._timebase = 0
         self._seconds = 1
         self._size = 0
+        # (num of samples pushed, timestamp of the last one). appended by the producer thread, popped by drain()
+        self._push_timestamps = collections.deque()
+        self._pushed = 0
+        self._drained = 0
         # unit value / raw value
         self._value_scale = 1.
+        # (mode, raw level, raw level2) of set_trigger()
+        self._trigger = ("none", 0., 0.)
+        # (cpp.MipDerived computing this channel, the channel its timestamps come from). None if samples are appended
+        # to it. see derived()
+        self._derive = None
+        # channels derived from this one, updated after every append
+        self._derived = []
         self.set_mapping(self.value_min, self.value_min_raw, self.value_max, self.value_max_raw)
 
     def set_mapping(self, value_min, value_min_raw, value_max, value_max_raw):
@@ -59,15 +104,105 @@ class GraphChannel:
         self.value_min_raw = value_min_raw
         self.value_max_raw = value_max_raw
         self._value_scale = (self.value_max - self.value_min) / (self.value_max_raw - self.value_min_raw)
+        if self.data.has_file() and self.data.is_writable():
+            self._save_header()
+
+    # files. save() moves the samples into a memory-mapped file, new samples stream into it. load() opens a saved
+    # file instantly, nothing is read until rendered. mapping, freq, legend, unit, color and timestamps are saved too.
+
+    def save(self, filename):
+        """ copy everything appended so far into a new file and keep appending there. not for max_samples or
+        max_seconds channels. raises IOError. """
+        self.data.create_file(filename)
+        self._save_header()
+        if self._timelist:
+            self.data.append_timestamps(numpy.asarray(self._timelist, numpy.float64))
+        self.data.flush_file()
+
+    @classmethod
+    def load(cls, filename, writable=False, queue_size=0):
+        """ return a new GraphChannel showing a file written by save(). writable: continue appending to the file.
+        raises IOError. """
+        data = cpp.MipBufRenderer(0, queue_size)
+        data.open_file(filename, writable)
+        header = json.loads(data.get_user_data() or "{}")
+        channel = cls(header.get("freq", 1000.), legend=header.get("legend", "graph"), unit=header.get("unit", "V"),
+                      color=tuple(header.get("color", (1.0,0.5,0.5,1.0))))
+        channel.data = data
+        channel._seconds = header.get("seconds", 1)
+        channel._timelist = data.get_timestamps()
+        channel._size = data.size()
+        if "value_min" in header:
+            # set_mapping saves the header again, channel.data has to be the file already.
+            channel.set_mapping(header["value_min"], header["value_min_raw"], header["value_max"], header["value_max_raw"])
+        return channel
+
+    @classmethod
+    def derived(cls, sources, gains=None, offset=0., filter="none", filter_param=0., frequency=None, legend="derived",
+                unit=None, color=(0.5,1.0,0.5,1.0), value_min=None, value_max=None, max_samples=0, max_seconds=0.):
+        """ return a new GraphChannel computed in the cpp module from other channels as their samples arrive:
+                filter(offset + gains[0] * sources[0] + gains[1] * sources[1] + ..)
+        in the displayed units of the sources. gains default to 1 each, so A - B is derived([a, b], [1., -1.]).
+        filter "none", "moving_avg" (mean of the last filter_param samples) or "lowpass" (one-pole IIR, cutoff
+        filter_param Hz). frequency defaults to the one of sources[0], sources of other rates are linearly
+        interpolated. value_min, value_max: the displayed range, by default what the ranges of the sources add up to.
+        the mappings of the sources are read once, here. everything the sources hold is computed right away.
+        renders, searches and triggers like any channel. don't append to it. """
+        gains = [1.] * len(sources) if gains is None else gains
+        assert sources and len(gains) == len(sources)
+        frequency = frequency or sources[0].freq
+        # the range of the sum
+        lo = hi = offset
+        for source, gain in zip(sources, gains):
+            lo += min(gain * source.value_min, gain * source.value_max)
+            hi += max(gain * source.value_min, gain * source.value_max)
+        channel = cls(frequency, legend=legend, unit=unit or sources[0].si_unit, color=color, max_samples=max_samples,
+                      max_seconds=max_seconds)
+        value_min = lo if value_min is None else value_min
+        value_max = hi if value_max is None else value_max
+        # raw values are the units
+        channel.set_mapping(value_min, 0., value_max, value_max - value_min)
+
+        derive = cpp.MipDerived(channel.data, frequency)
+        for source, gain in zip(sources, gains):
+            # displayed value is (raw - value_min_raw) * scale, see render_avg
+            derive.add_source(source.data, source.freq, gain * source._value_scale)
+            offset -= gain * source._value_scale * source.value_min_raw
+        derive.set_offset(offset)
+        derive.set_filter(filter, filter_param)
+        channel._derive = (derive, sources[0])
+        for source in sources:
+            source._derived.append(channel)
+        channel._update_derived()
+        return channel
+
+    def flush(self):
+        """ write everything to disk. does nothing if not saved to a file. """
+        self.data.flush_file()
+
+    def _save_header(self):
+        header = {"freq": self.freq, "legend": self.name, "unit": self.si_unit, "color": self.f_color_avg,
+                  "value_min": self.value_min, "value_min_raw": self.value_min_raw,
+                  "value_max": self.value_max, "value_max_raw": self.value_max_raw,
+                  "seconds": self._seconds}
+        self.data.set_user_data(json.dumps(header))
 
-    def render(self, start_index, end_index, resolution):
-        """ combined render of avg and minmax lines """
+    def render(self, start_index, end_index, resolution, value_window=None):
+        """ combined render of avg and minmax lines. value_window : (value1, value2, height in pixels), the value range
+        of the visible graph and its height. only the density render needs it. """
         # TODO: use ideas from these places:
         # http://jet.ro/2011/06/04/better-looking-anti-aliased-lines-with-simple-trick/
         # http://artgrammer.blogspot.com/2011/05/drawing-nearly-perfect-2d-line-segments.html
         # http://artgrammer.blogspot.com/2011/07/drawing-polylines-by-tessellation.html
         # http://homepage.mac.com/arekkusu/bugs/invariance/TexAA.html
         # http://people.csail.mit.edu/ericchan/articles/prefilter/
+        self.data.set_use_vbo(self.f_use_vbo)
+        if self.f_render_density and value_window:
+            self.render_density(start_index, end_index, resolution, *value_window)
+            return
+        if self.f_render_m4:
+            self.render_m4(start_index, end_index, resolution)
+            return
         if self.f_render_minmax:
             self.render_minmax(start_index, end_index, resolution)
         if self.f_render_avg:
@@ -90,42 +225,285 @@ class GraphChannel:
         self.data.render_minmax(start_index, end_index, resolution)
         gl.glPopMatrix()
 
+    def render_m4(self, start_index, end_index, resolution):
+        gl.glPushMatrix()
+        gl.glScalef(1., self._value_scale, 1.)
+        gl.glTranslatef(0., -self.value_min_raw, 0.)
+        gl.glColor4f(*self.f_color_avg)
+        gl.glLineWidth(self.f_linewidth)
+        self.data.render_m4(start_index, end_index, resolution)
+        gl.glPopMatrix()
+
+    def render_density(self, start_index, end_index, resolution, value1, value2, height):
+        gl.glPushMatrix()
+        gl.glScalef(1., self._value_scale, 1.)
+        gl.glTranslatef(0., -self.value_min_raw, 0.)
+        gl.glColor4f(*self.f_color_avg)
+        self.data.render_density(start_index, end_index, resolution, self.value_to_rawvalue(value1),
+                                 self.value_to_rawvalue(value2), height)
+        gl.glPopMatrix()
+
+    def release_gl(self):
+        """ delete the vertex buffers and textures of render(). the GL context it was called in has to be current.
+        the garbage collector frees only memory. """
+        self.data.release_gl()
+
     def size(self):
         return self.data.size()
 
+    def get_change_counter(self):
+        """ grows with every appended sample. nothing can reset it. """
+        return self.data.get_change_counter()
+
+    def first(self):
+        """ index of the oldest sample still kept. always 0 unless max_samples or max_seconds was used. """
+        return self.data.first()
+
     def get(self, i):
         """ return: minval, maxval, avg """
         return self.data.get(i)
 
+    def range_stats(self, start, end):
+        """ return: minval, maxval, mean, count of the raw values of samples start..end-1. None if the range holds
+        no samples. min and max are exact, the cost is logarithmic in the length of the range. """
+        return self.data.range_stats(int(math.ceil(start)), int(math.ceil(end)))
+
+    def range_stats_time(self, time_start, time_end):
+        """ range_stats of the samples from relative time time_start (included) to time_end (excluded) """
+        return self.range_stats(self.time_to_sample(time_start), self.time_to_sample(time_end))
+
+    def value_range(self, start, end):
+        """ return: lowest, highest value of the samples touching the sample-space range start..end, mapped the same
+        way render_*() maps them. None if there are no samples. logarithmic cost, see range_stats. """
+        stats = self.data.range_stats(int(math.floor(start)), int(math.ceil(end)))
+        if not stats:
+            return None
+        y1 = (stats[0] - self.value_min_raw) * self._value_scale
+        y2 = (stats[1] - self.value_min_raw) * self._value_scale
+        return min(y1, y2), max(y1, y2)
+
+    def power_spectrum(self, spectrum, start, end):
+        """ return (frequencies in Hz, power spectral density in unit^2 / Hz) of the avg line of samples start..end-1,
+        two numpy arrays. None if the range is shorter than a segment. spectrum : a spectrum.Spectrum, holds the
+        segment length and window and caches the transformed segments. """
+        result = spectrum.psd(self.data, self.freq, start, end)
+        if result is None:
+            return None
+        freqs, psd = result
+        return freqs, psd * self._value_scale ** 2
+
+    # oscilloscope trigger on the avg line. the cpp module indexes the triggers as samples arrive, and skips through
+    # the mip levels when searching the history.
+
+    def set_trigger(self, mode, level=0., level2=0., holdoff=0.):
+        """ mode "rising", "falling", "window" or "none". rising: the avg line crosses 'level' upwards. falling:
+        downwards. window: the avg line leaves level..level2. levels are in units like the displayed values.
+        holdoff: seconds after a trigger that can't trigger again. every sample kept so far is searched right away. """
+        raw, raw2 = self.value_to_rawvalue(level), self.value_to_rawvalue(level2)
+        # if value_max_raw < value_min_raw, rising raw values are falling units
+        if self._value_scale < 0. and mode in ("rising", "falling"):
+            mode = "falling" if mode == "rising" else "rising"
+        self.data.set_trigger(mode, raw, raw2, int(holdoff * self.freq + 0.5))
+        self._trigger = (mode, raw, raw2)
+
+    def find_trigger(self, start, end):
+        """ first sample of the range start..end-1 that triggers, None if none. holdoff doesn't apply. a range
+        without triggers costs O(log(end - start)). """
+        return self.data.find_trigger(int(math.ceil(start)), int(math.ceil(end)))
+
+    def triggers(self, start, end):
+        """ list of the triggered samples start..end-1, holdoff applied """
+        return self.data.get_triggers(int(math.ceil(start)), int(math.ceil(end)))
+
+    def last_trigger(self, end=None):
+        """ position of the newest trigger before sample 'end' (default: the newest one) in the sample-space of
+        render(), None if none. the crossing is interpolated between the centers of the triggered sample and the
+        one before it, so a view locked to it doesn't jitter by a whole sample. """
+        t = self.data.last_trigger(None if end is None else int(math.ceil(end)))
+        if t is None:
+            return None
+        # the sample before is gone (the first one ever, or dropped by the ring)
+        if t - 1 < self.data.first():
+            return float(t)
+        a, b = self.data.get(t - 1)[2], self.data.get(t)[2]
+        mode, level, level2 = self._trigger
+        if mode == "window":
+            # crossed the edge the sample went past
+            level = max(level, level2) if b > max(level, level2) else min(level, level2)
+        k = (level - a) / (b - a) if b != a else 1.
+        return t - 0.5 + min(max(k, 0.), 1.)
+
+    # threshold search through the history. the cpp module skips the mip entries whose min and max can't match, so
+    # searching hours of samples costs about as much as a few.
+
+    def find_next(self, start, mode, level, level2=0., end=None):
+        """ the first sample at or after 'start' that matches, None if none. mode "above", "below", "outside" or
+        "inside". above: some part of the sample (min..max) is above 'level'. below: below it. outside: above or below
+        the band level..level2. inside: all of the sample within the band. levels are in units like the displayed
+        values. """
+        return self.data.find_next(int(math.ceil(start)), *self._search_args(mode, level, level2), end=end)
+
+    def find_prev(self, end, mode, level, level2=0.):
+        """ the last sample before 'end' that matches, None if none. see find_next """
+        return self.data.find_prev(int(math.ceil(end)), *self._search_args(mode, level, level2))
+
+    def find_all(self, mode, level, level2=0., start=0, end=None):
+        """ list of the matching samples of start..end-1. see find_next """
+        return self.data.find_all(*self._search_args(mode, level, level2), start=int(math.ceil(start)), end=end)
+
+    def _search_args(self, mode, level, level2):
+        """ (mode, raw level, raw level2) for the cpp module """
+        # if value_max_raw < value_min_raw, higher raw values are lower units
+        if self._value_scale < 0. and mode in ("above", "below"):
+            mode = "below" if mode == "above" else "above"
+        return mode, self.value_to_rawvalue(level), self.value_to_rawvalue(level2)
+
     def append(self, avg, timestamp=None):
         """ append raw values (direct measurements) that go directly to the underlying MipBuf object """
         self.data.append(avg)
-        # add timestamp every second
-        if not self._size % int(self.freq * self._seconds):
-            if not timestamp:
-                timestamp = time.time()
-            self._timelist.append(timestamp)
-        self._size += 1
+        self._append_timestamps(1, timestamp)
+        self._update_derived()
 
-    def append_minmaxavg(self, minval, maxval, avg):
+    def append_minmaxavg(self, minval, maxval, avg, timestamp=None):
         self.data.append_minmaxavg(minval, maxval, avg)
-        # add timestamp every second
-        if not self._size % int(self.freq * self._seconds):
-            self._timelist.append(timestamp)
-        self._size += 1
+        self._append_timestamps(1, timestamp)
+        self._update_derived()
+
+    def append_array(self, avg, timestamp=None):
+        """ append a block of raw values at once. avg is a float buffer (numpy array of any float dtype, list,
+        ..), converted to float32 once, or a numpy array of the channel sample_type (numpy.uint8 for "uint8", ..),
+        which is copied as is. much faster than calling append() for every sample.
+        timestamp is the time of the last sample in the block. """
+        self.data.append_array(avg)
+        self._append_timestamps(len(avg), timestamp)
+        self._update_derived()
+
+    def append_minmaxavg_arrays(self, minval, maxval, avg, timestamp=None):
+        """ bulk append_minmaxavg. timestamp is the time of the last sample in the block. """
+        self.data.append_minmaxavg_arrays(minval, maxval, avg)
+        self._append_timestamps(len(avg), timestamp)
+        self._update_derived()
+
+    def append_array_parallel(self, avg, timestamp=None, num_threads=0):
+        """ append_array for loading a whole recording at once. the mip levels are built on num_threads threads
+        (0: one per core) with the GIL released. same result as append_array. """
+        self.data.append_array_parallel(avg, num_threads)
+        self._append_timestamps(len(avg), timestamp)
+        self._update_derived()
+
+    # thread safe appending. a serial/usb reader thread calls push*(), the render tick calls drain(). the samples
+    # wait in a lock-free queue in between, the GIL is released while copying. only ONE thread may push to a channel.
+    # pushed samples without a timestamp get theirs when drained, so they can be up to one frame late.
+
+    def push(self, avg):
+        """ append() from the producer thread. return 1 if queued, 0 if the queue was full and the sample dropped. """
+        return self._pushed_timestamp(self.data.push(avg), None)
+
+    def push_array(self, avg, timestamp=None):
+        """ append_array() from the producer thread. return num of samples queued, the rest were dropped.
+        timestamp is the time of the last sample in the block. """
+        return self._pushed_timestamp(self.data.push_array(avg), timestamp)
+
+    def push_minmaxavg_arrays(self, minval, maxval, avg, timestamp=None):
+        """ append_minmaxavg_arrays() from the producer thread. return num of samples queued. """
+        return self._pushed_timestamp(self.data.push_minmaxavg_arrays(minval, maxval, avg), timestamp)
+
+    def drain(self):
+        """ move pushed samples to the graph. called by GraphRenderer.tick() """
+        n = self.data.drain()
+        if n:
+            self._drained += n
+            # the newest pushed timestamp that got drained, moved to the last drained sample
+            timestamp = None
+            while self._push_timestamps and self._push_timestamps[0][0] <= self._drained:
+                pushed, t = self._push_timestamps.popleft()
+                timestamp = t + (self._drained - pushed) / float(self.freq)
+            self._append_timestamps(n, timestamp)
+            self._update_derived()
+        return n
+
+    def get_dropped(self):
+        """ num of pushed samples that didn't fit into the queue. increase queue_size if this grows. """
+        return self.data.get_dropped()
+
+    def queue_free(self):
+        """ num of samples push*() can take right now. call from the producer thread. """
+        return self.data.queue_free()
+
+    def _update_derived(self):
+        """ compute the new samples of this channel if it's derived, and of every channel derived from it """
+        if self._derive:
+            derive, clock = self._derive
+            n = derive.update()
+            if n:
+                # the time of the last new sample, from the timestamps of the first source
+                t = clock.sample_to_timeutc((self.size() - 1) * clock.freq / self.freq)
+                self._append_timestamps(n, t or None)
+        for channel in self._derived:
+            channel._update_derived()
+
+    def _pushed_timestamp(self, n, timestamp):
+        """ producer thread. remember the timestamp of the last pushed sample for drain(). """
+        self._pushed += n
+        if n and timestamp:
+            self._push_timestamps.append((self._pushed, timestamp))
+        return n
+
+    def _append_timestamps(self, n, timestamp):
+        """ n samples were just appended and the last one was measured at 'timestamp'. add a timestamp for every
+        sample that starts a new second. """
+        step = int(self.freq * self._seconds)
+        # first sample num >= self._size that starts a new second
+        first = (self._size + step - 1) // step * step
+        last = self._size + n - 1
+        if first <= last:
+            if not timestamp:
+                timestamp = time.time()
+            freq = float(self.freq)
+            timestamps = [timestamp - (last - i) / freq for i in xrange(first, last + 1, step)]
+            self._timelist.extend(timestamps)
+            if self.data.has_file():
+                self.data.append_timestamps(numpy.asarray(timestamps, numpy.float64))
+            # forget the seconds the ring dropped, once there are as many of them as kept ones. so the list stays at
+            # most twice the kept time and trimming costs O(1) per timestamp.
+            dropped = self.data.first() // step - self._timebase
+            if dropped > 0 and dropped >= len(self._timelist) - dropped:
+                del self._timelist[:dropped]
+                self._timebase += dropped
+        self._size += n
 
     def sample_to_timeutc(self, sample_num):
         if not self._timelist:
             return 0.
         assert self._timelist
         tl = self._timelist
-        timeindex = int(sample_num) / int(self.freq * self._seconds)
+        step = int(self.freq * self._seconds)
+        timeindex = int(sample_num) / step
         if timeindex < 0:
             return 0.
+        # index in the trimmed list. samples of the dropped seconds are still drawn from the coarse levels, count
+        # back from the oldest timestamp left.
+        timeindex -= self._timebase
+        if timeindex < 0:
+            return tl[0] + (sample_num - self._timebase * step) / self.freq
         if timeindex >= len(tl) - 1:
-            return tl[-1] + (sample_num - (len(tl) - 1) * int(self.freq * self._seconds)) / self.freq
-        return tl[timeindex] + (tl[timeindex + 1] - tl[timeindex]) / int(self.freq * self._seconds) * \
-                               (sample_num - int(self.freq * self._seconds) * timeindex)
+            return tl[-1] + (sample_num - (self._timebase + len(tl) - 1) * step) / self.freq
+        return tl[timeindex] + (tl[timeindex + 1] - tl[timeindex]) / step * \
+                               (sample_num - step * (self._timebase + timeindex))
+
+    def timeutc_to_sample(self, timestamp):
+        """ inverse of sample_to_timeutc. sample num measured at utc 'timestamp', 0 if there are no timestamps. """
+        if not self._timelist:
+            return 0.
+        tl = self._timelist
+        step = int(self.freq * self._seconds)
+        timeindex = bisect.bisect_right(tl, timestamp) - 1
+        base = self._timebase * step
+        if timeindex < 0:
+            return base + (timestamp - tl[0]) * self.freq
+        if timeindex >= len(tl) - 1 or tl[timeindex + 1] <= tl[timeindex]:
+            return base + timeindex * step + (timestamp - tl[timeindex]) * self.freq
+        return base + timeindex * step + (timestamp - tl[timeindex]) / (tl[timeindex + 1] - tl[timeindex]) * step
 
     def value_to_rawvalue(self, value):
         """ map graph-coordinates (final values, unit values) to raw values in MapBuf. for example 1V to raw 255 """
@@ -145,5 +523,34 @@ class GraphChannel:
 
 
 if __name__ == "__main__":
+    import os
+    import tempfile
     g = GraphChannel(100.)
+    # timestamps survive save() and load(), both the ones from before save() and the streamed ones
+    filename = os.path.join(tempfile.mkdtemp(), "test.mip")
+    g.append_array(numpy.zeros(250, numpy.float32), timestamp=1000.)
+    g.save(filename)
+    g.append_array(numpy.zeros(100, numpy.float32), timestamp=1001.)
+    g.data.flush_file()
+    loaded = GraphChannel.load(filename)
+    assert len(g._timelist) == 4 and list(loaded._timelist) == g._timelist
+    assert loaded.sample_to_timeutc(300) == g.sample_to_timeutc(300)
+    del loaded, g
+    os.remove(filename)
+    # a trigger on the oldest kept sample has nothing to interpolate against
+    ring = GraphChannel(100., max_samples=100)
+    ring.set_mapping(0., 0., 255., 255.)
+    ring.set_trigger("rising", 100.)
+    ring.append_array(numpy.zeros(150, numpy.float32))
+    ring.append_array(numpy.zeros(100, numpy.float32) + 200.)
+    assert ring.first() == 150 and ring.triggers(0, ring.size()) == [150] and ring.last_trigger() == 150.
+    # a ring forgets the timestamps of the dropped seconds, but converts times as if it kept them all
+    ring, full = GraphChannel(100., max_samples=1000), GraphChannel(100.)
+    for k in xrange(100):
+        ring.append_array(numpy.zeros(100, numpy.float32), timestamp=1000. + k)
+        full.append_array(numpy.zeros(100, numpy.float32), timestamp=1000. + k)
+    assert ring._timebase > 0 and len(ring._timelist) <= 2 * 1000 / 100 + 1
+    for sample in (ring.first(), ring.first() + 150.5, ring.size() - 1, ring.size() + 50):
+        assert abs(ring.sample_to_timeutc(sample) - full.sample_to_timeutc(sample)) < 1e-6
+        assert abs(ring.timeutc_to_sample(ring.sample_to_timeutc(sample)) - sample) < 1e-6
     print "test done"
\ No newline at end of file
@@ -2,8 +2,16 @@ import sys
 import math
 import time
 
+import numpy
 import copengl as gl
 
+import profile_counter
+
+
+# grid label colors
+GRID_LABEL_BGCOLOR = (0.2, 0.2, 0.2, .8)
+GRID_LABEL_FGCOLOR = (1.9, 1.9, 1.9, .8)
+
 
 class GraphRenderer:
     """
@@ -14,14 +22,39 @@ class GraphRenderer:
         self.font = font
         # graph_channel objects that are filled with data from the outside world
         self.channels = []
+        # marker_channel objects drawn over the graphs
+        self.markers = []
 
         if sys.platform == "win32":
             self._time = time.clock
         else:
             self._time = time.time
 
-    def setup(self, channels):
+        # grid lines and grid labels are compiled into display lists. they are rebuilt only if the division step
+        # (zoom level) or the window size changes. scrolling just translates them.
+        self.f_cache_grid = True
+        # grid rendering time per frame. a hit is a frame that didn't have to rebuild anything.
+        self.grid_profile = profile_counter.ProfileCounter()
+        # kind : (key, display list)
+        self._grid_lists = {}
+        # kind : (step key, {division index : (display list, text width)})
+        self._grid_labels = {}
+        self._grid_missed = False
+
+        # show the power spectrum of the visible samples instead of the samples. see set_spectrum()
+        self.spectrum = None
+        # dB from the top of the spectrum view to the bottom
+        self.spectrum_db_range = 100.
+
+    def set_spectrum(self, spectrum):
+        """ spectrum : spectrum.Spectrum or None. if set, render() draws the power spectral density (dB) of the
+        samples in view of every channel against frequency, 0Hz to half the freq of channels[0]. scrolling and zooming
+        still pick the samples. the top of the view follows the highest peak in 10dB steps. """
+        self.spectrum = spectrum
+
+    def setup(self, channels, markers=()):
         """ channels - list of graph_channel objects
+            markers - list of marker_channel objects
         :type channels: list(GraphChannel)
         TODO: this type format seems that doesn't work
 
@@ -31,9 +64,24 @@ class GraphRenderer:
           2. channels[0] has to be the fastest channel.
         """
         self.channels = channels[:]
+        self.markers = list(markers)
 
     def tick(self):
-        pass
+        for channel in self.channels:
+            channel.drain()
+
+    def release(self):
+        """ delete the display lists of the grid cache and the vertex buffers and textures of the channels. the OpenGL
+        context they were made in has to be current. rendering again rebuilds them. """
+        for channel in self.channels:
+            channel.release_gl()
+        for key, l in self._grid_lists.itervalues():
+            gl.glDeleteLists(l, 1)
+        for step_key, labels in self._grid_labels.itervalues():
+            for l, width in labels.itervalues():
+                gl.glDeleteLists(l, 1)
+        self._grid_lists = {}
+        self._grid_labels = {}
 
     def _pixel_to_sample(self, y_pixel, h_pixels, y2, h2):
         """ return sample val of a pixel at height y_pixel (0 is top). pixel center coordinates.
@@ -48,13 +96,15 @@ class GraphRenderer:
     def _samplenum_to_pixel(self, samplenum, x2, w2, w_pixels):
         return (samplenum - x2) / w2 * w_pixels
 
-    def _render_grid_hortext(self, w, h, x2, y2, w2, h2, channel, left=False, min_div_hpix=50.):
+    def _render_grid_hortext(self, w, h, x2, y2, w2, h2, channel, left=False, min_div_hpix=50., unit=None):
         """
         render text for the horizontal lines. value legend.
         min_div_hpix : minimum division height (grid line distance) in pixels
+        unit : shown after the values instead of the si_unit of the channel
         """
         assert  h > 1.
         ch = channel
+        unit = ch.si_unit if unit is None else unit
         if abs(h2) < 0.000001:
             return
 
@@ -72,20 +122,19 @@ class GraphRenderer:
         v_end   = v2 + v_font_height / 2.
         v_num   = math.floor((v_end - v_begin) / v_step)
 
-        c = 0.2
-        v = v_begin
-        while v < v_end:
+        k = int(math.floor(v_begin / v_step + .5))
+        while k * v_step < v_end:
+            v = k * v_step
             px = self._sample_to_pixel(v, y2, h2, h)
             #if ch == self.temperature_channel:
             #    txt = "%.1f%s" % (tempc.convertTemp(ch.value_for_volt(v)), ch.si_unit)
-            txt = "%.2f%s" % (v, ch.si_unit)
             if left:
-                xcoord = w - self.font.width(txt) - 1
+                self._render_grid_label("hor_left", (v_step, unit), k, lambda k: "%.2f%s" % (k * v_step, unit),
+                                        w - 1, px - self.font.height / 2., "right")
             else:
-                xcoord = 1
-            self.font.drawtl(txt, xcoord, px - self.font.height / 2., bgcolor = (c, c, c, .8), fgcolor = (1.9, 1.9, 1.9, .8))
-
-            v += v_step
+                self._render_grid_label("hor", (v_step, unit), k, lambda k: "%.2f%s" % (k * v_step, unit),
+                                        1, px - self.font.height / 2., "left")
+            k += 1
 
     def _render_grid_vertext(self, w, h, x2, y2, w2, h2, min_div_hpix=100.):
         assert w > 0.
@@ -111,13 +160,27 @@ class GraphRenderer:
         st_begin = math.floor((st1 - st_text_maxwidth) / st_step) * st_step + st_step
         st_end   = st2 + st_text_maxwidth / 2.
 
-        c = 0.2
-        st = st_begin
-        while st < st_end:
-            px = self._samplenum_to_pixel(st * ch.freq, x2, w2, w)
-            txt = self._grid_timestr(st, st_step)
-            self.font.drawtl(txt, px - self.font.width(txt) / 2. - 0.5, 1, bgcolor = (c, c, c, .8), fgcolor = (1.9, 1.9, 1.9, .8))
-            st += st_step
+        k = int(math.floor(st_begin / st_step + .5))
+        while k * st_step < st_end:
+            px = self._samplenum_to_pixel(k * st_step * ch.freq, x2, w2, w)
+            self._render_grid_label("ver", st_step, k, lambda k: self._grid_timestr(k * st_step, st_step),
+                                    px - 0.5, 1, "center")
+            k += 1
+
+    def _render_grid_freqtext(self, w, h, f2, min_div_hpix=100.):
+        """ labels of the frequency lines of the spectrum view. f2 : frequency at the right edge """
+        assert w > 0.
+        f_step = math.pow(2, math.ceil(math.log(f2 / w * min_div_hpix, 2)))
+        k = 1
+        while k * f_step < f2:
+            px = k * f_step / f2 * w
+            self._render_grid_label("freq", f_step, k, lambda k: self._grid_freqstr(k * f_step), px - 0.5, 1, "center")
+            k += 1
+
+    def _grid_freqstr(self, hz):
+        if hz < 1000.:
+            return "%.2fHz" % hz
+        return "%.2fkHz" % (hz / 1000.)
 
     def _grid_timestr(self, seconds, step):
         s = abs(seconds)
@@ -166,15 +229,23 @@ class GraphRenderer:
         sign = 1 if px_end > px_begin else -1
         px_step  = pixels_per_volt * v_step * sign
 
-        gl.glBegin(gl.GL_LINES)
+        # the list has lines one unit apart, scaled to px_step when called. so smooth zooming and auto-fit, which
+        # change px_step every frame, reuse it until the division step changes. divisions are at least
+        # min_div_hpix apart, enough lines for any px_step of this window. extra ones are cut by the scissor test.
+        num = int(h / min_div_hpix) + 1
 
-        px = px_begin
-        while px * sign < px_end:
-            gl.glVertex3f( 0., px, 0. )
-            gl.glVertex3f(  w, px, 0. )
-            px += px_step
+        def build():
+            gl.glBegin(gl.GL_LINES)
+            for i in xrange(num):
+                gl.glVertex3f( 0., i, 0. )
+                gl.glVertex3f(  w, i, 0. )
+            gl.glEnd()
 
-        gl.glEnd()
+        gl.glPushMatrix()
+        gl.glTranslatef(0., px_begin, 0.)
+        gl.glScalef(1., px_step, 1.)
+        self._render_grid_list("horlines", (v_step, w, h), build)
+        gl.glPopMatrix()
 
     def _render_grid_verlines(self, w, h, x2, y2, w2, h2, min_div_hpix=100.):
         """
@@ -206,15 +277,97 @@ class GraphRenderer:
         sign = 1 if px_end > px_begin else -1
         px_step  = pixels_per_second * st_step * sign
 
-        gl.glBegin(gl.GL_LINES)
+        # unit spaced lines scaled to px_step, see _render_grid_horlines
+        num = int(w / min_div_hpix) + 1
 
-        px = px_begin
-        while px * sign < px_end:
-            gl.glVertex3f( px, 0., 0. )
-            gl.glVertex3f( px,  h, 0. )
-            px += px_step
+        def build():
+            gl.glBegin(gl.GL_LINES)
+            for i in xrange(num):
+                gl.glVertex3f( i, 0., 0. )
+                gl.glVertex3f( i,  h, 0. )
+            gl.glEnd()
 
-        gl.glEnd()
+        gl.glPushMatrix()
+        gl.glTranslatef(px_begin, 0., 0.)
+        gl.glScalef(px_step, 1., 1.)
+        self._render_grid_list("verlines", (st_step, w, h), build)
+        gl.glPopMatrix()
+
+    def _render_grid_freqlines(self, w, h, f2, min_div_hpix=100.):
+        """ vertical lines of the spectrum view, 0Hz at the left edge. f2 : frequency at the right edge """
+        assert w > 0.
+        f_step = math.pow(2, math.ceil(math.log(f2 / w * min_div_hpix, 2)))
+        px_step = math.floor(f_step / f2 * w * 1024. + .5) / 1024.
+        num = int(w / px_step) + 1
+
+        def build():
+            gl.glBegin(gl.GL_LINES)
+            for i in xrange(1, num):
+                gl.glVertex3f( i * px_step, 0., 0. )
+                gl.glVertex3f( i * px_step,  h, 0. )
+            gl.glEnd()
+
+        self._render_grid_list("freqlines", (px_step, h, num), build)
+
+    def _render_grid_list(self, kind, key, build):
+        """ run build() through display list 'kind'. recompile the list only if key differs from last time. """
+        if not self.f_cache_grid:
+            self._grid_missed = True
+            build()
+            return
+        cached = self._grid_lists.get(kind)
+        if cached and cached[0] == key:
+            gl.glCallList(cached[1])
+            return
+        self._grid_missed = True
+        l = cached[1] if cached else gl.glGenLists(1)
+        gl.glNewList(l, gl.GL_COMPILE_AND_EXECUTE)
+        build()
+        gl.glEndList()
+        self._grid_lists[kind] = (key, l)
+
+    def _render_grid_label(self, kind, step_key, k, format_text, x, y, align):
+        """ render the label of division k. format_text(k) returns the text, called only if not cached.
+        all labels of this kind are dropped when step_key (the zoom level) changes.
+        align : "left", "right" or "center" of the text at x """
+        if not self.f_cache_grid:
+            self._grid_missed = True
+            txt = format_text(k)
+            x = self._grid_label_x(x, self.font.width(txt), align)
+            self.font.drawtl(txt, x, y, bgcolor=GRID_LABEL_BGCOLOR, fgcolor=GRID_LABEL_FGCOLOR)
+            return
+
+        cached = self._grid_labels.get(kind)
+        # also start over if scrolling at the same zoom level has piled up too many labels
+        if not cached or cached[0] != step_key or len(cached[1]) > 256:
+            if cached:
+                for l, width in cached[1].itervalues():
+                    gl.glDeleteLists(l, 1)
+            cached = (step_key, {})
+            self._grid_labels[kind] = cached
+
+        label = cached[1].get(k)
+        if not label:
+            self._grid_missed = True
+            txt = format_text(k)
+            l = gl.glGenLists(1)
+            gl.glNewList(l, gl.GL_COMPILE)
+            self.font.drawtl(txt, 0., 0., bgcolor=GRID_LABEL_BGCOLOR, fgcolor=GRID_LABEL_FGCOLOR)
+            gl.glEndList()
+            label = (l, self.font.width(txt))
+            cached[1][k] = label
+
+        gl.glPushMatrix()
+        gl.glTranslatef(self._grid_label_x(x, label[1], align), y, 0.)
+        gl.glCallList(label[0])
+        gl.glPopMatrix()
+
+    def _grid_label_x(self, x, width, align):
+        if align == "right":
+            return x - width
+        if align == "center":
+            return x - width / 2.
+        return x
 
     def _render_grid_text(self, w, h, x2, y2, w2, h2):
         self._render_grid_hortext(w, h, x2, y2, w2, h2, self.channels[0])
@@ -275,7 +428,10 @@ class GraphRenderer:
             gl.glPopMatrix()
 
         gl.glDisable(gl.GL_LINE_SMOOTH)
+        t = self._time()
+        self._grid_missed = False
         self._render_grid_lines(w, h, x2, y2, w2, h2)
+        grid_time = self._time() - t
         gl.glEnable(gl.GL_LINE_SMOOTH)
 
         gl.glPushMatrix()
@@ -286,14 +442,127 @@ class GraphRenderer:
             #self.channels_local[2].render_avg(x2, x2+w2, w)
         channel0 = self.channels[0]
         for channel in self.channels:
-            channel.render(x2 * channel.freq / channel0.freq, (x2+w2) * channel.freq / channel0.freq, w)
+            channel.render(x2 * channel.freq / channel0.freq, (x2+w2) * channel.freq / channel0.freq, w,
+                           (y2, y2 + h2, max(int(h) - 1, 1)))
         gl.glPopMatrix()
 
         gl.glTranslatef(0., -0.5, 0.)
         gl.glDisable(gl.GL_LINE_SMOOTH)
+        self._render_markers(w, h, x2, w2)
+        t = self._time()
         self._render_grid_text(w, h, x2, y2, w2, h2)
+        grid_time += self._time() - t
+        self.grid_profile.tick(grid_time, not self._grid_missed)
+
+        gl.glPopMatrix()
+
+    def _render_markers(self, w, h, x2, w2):
+        """ vertical lines of the markers in view, in pixel coordinates. markers closer than f_min_spacing pixels are
+        one line at the first of them, a band to the last one and their count. texts at the bottom, a row per marker
+        channel. """
+        if abs(w2) < 0.000001:
+            return
+        channel0 = self.channels[0]
+        for row, markers in enumerate(self.markers):
+            # samples of markers.channel per sample of channel0
+            k = markers.channel.freq / channel0.freq
+            x_start, x_end = sorted((x2 * k, (x2 + w2) * k))
+            buckets = markers.buckets(x_start, x_end, markers.f_min_spacing * abs(w2) / w * k)
+            if not buckets:
+                continue
+            px = lambda sample_num: self._samplenum_to_pixel(sample_num / k, x2, w2, w)
+
+            r, g, b, a = markers.f_color
+            gl.glColor4f(r, g, b, a * .25)
+            gl.glBegin(gl.GL_QUADS)
+            for first, last, count, i in buckets:
+                if count > 1:
+                    gl.glVertex3f(px(first), 0., 0.)
+                    gl.glVertex3f(px(last) + 1., 0., 0.)
+                    gl.glVertex3f(px(last) + 1., h, 0.)
+                    gl.glVertex3f(px(first), h, 0.)
+            gl.glEnd()
+            gl.glColor4f(r, g, b, a)
+            gl.glLineWidth(1.)
+            gl.glBegin(gl.GL_LINES)
+            for first, last, count, i in buckets:
+                gl.glVertex3f(px(first) + .5, 0., 0.)
+                gl.glVertex3f(px(first) + .5, h, 0.)
+            gl.glEnd()
+
+            # a text only if it doesn't run over the previous one
+            y = h - (row + 1) * self.font.height - 1
+            text_end = None
+            for first, last, count, i in buckets:
+                txt = markers.get(i)[1] if count == 1 else "%i" % count
+                if not txt or (count == 1 and not markers.f_render_text):
+                    continue
+                x = px(first) + 2.
+                if text_end is not None and x < text_end:
+                    continue
+                self.font.drawtl(txt, x, y, bgcolor=GRID_LABEL_BGCOLOR, fgcolor=markers.f_color)
+                text_end = x + self.font.width(txt) + 2.
+
+    def _render_spectrum(self, x, y, w, h, x2, y2, w2, h2):
+        """
+        x,  y,  w,  h : pos and dimensions inside parent window
+        x2, y2, w2, h2: visible sample-space. only x2 and w2 matter, they pick the samples to analyse.
+        """
+        channel0 = self.channels[0]
+        spectra = []
+        peak = None
+        for channel in self.channels:
+            k = channel.freq / channel0.freq
+            s = channel.power_spectrum(self.spectrum, x2 * k, (x2 + w2) * k)
+            if s:
+                # -300dB instead of log(0)
+                db = 10. * numpy.log10(numpy.maximum(s[1], 1e-30))
+                spectra.append((channel, s[0], db))
+                peak = db.max() if peak is None else max(peak, db.max())
+
+        # frequency-space: 0Hz..nyquist left to right, dB top..top-range top to bottom
+        f2 = channel0.freq / 2.
+        y2 = math.ceil(peak / 10.) * 10. if peak is not None else 0.
+        h2 = -self.spectrum_db_range
+
+        gl.glPushMatrix()
+        gl.glTranslatef(x, y, 0.)
+        gl.glTranslatef(0., 0.5, 0.)
+
+        gl.glDisable(gl.GL_LINE_SMOOTH)
+        t = self._time()
+        self._grid_missed = False
+        gl.glLineWidth(1.)
+        gl.glColor4f(0.15, 0.15, 0.15, 1.)
+        self._render_grid_horlines(w, h, 0., y2, f2, h2)
+        self._render_grid_freqlines(w, h, f2)
+        grid_time = self._time() - t
+        gl.glEnable(gl.GL_LINE_SMOOTH)
+
+        gl.glPushMatrix()
+        gl.glScalef(w / f2, float(h - 1.) / h2, 1.)
+        gl.glTranslatef(0., -y2, 0.)
+        for channel, freqs, db in spectra:
+            gl.glColor4f(*channel.f_color_avg)
+            gl.glLineWidth(channel.f_linewidth)
+            gl.glBegin(gl.GL_LINE_STRIP)
+            for f, v in zip(freqs.tolist(), db.tolist()):
+                gl.glVertex3f(f, v, 0.)
+            gl.glEnd()
+        gl.glPopMatrix()
+
+        gl.glTranslatef(0., -0.5, 0.)
+        gl.glDisable(gl.GL_LINE_SMOOTH)
+        t = self._time()
+        self._render_grid_hortext(w, h, 0., y2, f2, h2, channel0, unit="dB")
+        self._render_grid_freqtext(w, h, f2)
+        grid_time += self._time() - t
+        self.grid_profile.tick(grid_time, not self._grid_missed)
 
         gl.glPopMatrix()
 
     def render(self, x, y, w, h, x2, y2, w2, h2):
-        self._render_graphs(x, y, w, h, x2, y2, w2, h2)
+        if self.spectrum:
+            self._render_spectrum(x, y, w, h, x2, y2, w2, h2)
+        else:
+            self._render_graphs(x, y, w, h, x2, y2, w2, h2)
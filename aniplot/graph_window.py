@@ -1,4 +1,5 @@
 import time
+import math
 
 import draw
 import copengl as gl
@@ -26,10 +27,22 @@ class GraphWindow:
         # graph is moving from right to left? newest sample is anchored to the right window edge.
         self.anchored = True
 
+        # fit the vertical range to the samples in view on every tick. see set_auto_fit_y()
+        self.auto_fit_y = False
+        # empty space above and below the fitted samples, ratio of the fitted range
+        self.auto_fit_margin = 0.05
+
+        # keep the newest trigger of the first channel at trigger_position (0 left edge, 1 right edge) of the
+        # window. see set_trigger_lock()
+        self.trigger_lock = False
+        self.trigger_position = 0.5
+
+        # (mode, level, level2) of GraphChannel.find_next. what find_next() and find_prev() look for. see set_search()
+        self.search = None
+
         num_visible_samples = int(5 * self.graph_renderer.channels[0].freq + 0.5)
 
         # TODO: make these private
-        # also, create set_visible_samplespace() method
 
         # visible sample-space rectangle. x1, y1 is top-left on screen
         # so the top-left screen-pixel of the graph window should have the sample at coordinates (sx1, sy2)
@@ -52,6 +65,9 @@ class GraphWindow:
     def tick(self, dt=1./60):
         d = 0.4
 
+        if self.auto_fit_y:
+            self._auto_fit_y()
+
         # turns out that it's better to not have separate values for left/right and top/bottom,
         # ie. it's better to have just ax, ay instead of ax1, ax2, ay1, ay2
         # smooth out the movement. trying to lower the initial speed.
@@ -113,6 +129,28 @@ class GraphWindow:
             x, y = self.render_legend_pos
             self._render_legend(self.x + x, self.y + y)
 
+    def set_visible_samplespace(self, sx1, sy1, sx2, sy2, smooth=True):
+        """ show samples sx1..sx2 with value sy1 at the top and sy2 at the bottom of the window.
+        if not smooth, jump there immediately instead of animating. showing the last sample anchors the window. """
+        self.wsx1, self.wsy1, self.wsx2, self.wsy2 = sx1, sy1, sx2, sy2
+        if not smooth:
+            self.sx1, self.sy1, self.sx2, self.sy2 = sx1, sy1, sx2, sy2
+        self.anchored = sx2 >= self.graph_renderer.channels[0].size()
+        self._hold_bounds()
+
+    def is_moving(self):
+        """ True while the visible sample-space rectangle is still animating towards the wanted one. differences
+        below 1/10000 of the visible range (way less than a pixel) don't count. """
+        dx = abs(self.wsx2 - self.wsx1) * 0.0001
+        dy = abs(self.wsy2 - self.wsy1) * 0.0001
+        return abs(self.wsx1 - self.sx1) > dx or abs(self.wsx2 - self.sx2) > dx or \
+               abs(self.wsy1 - self.sy1) > dy or abs(self.wsy2 - self.sy2) > dy
+
+    def set_auto_fit_y(self, auto_fit):
+        """ keep the vertical range fitted to the lowest and highest value of all channels in the visible range.
+        animates there like any other movement. vertical zoom and movement by hand are overridden while on. """
+        self.auto_fit_y = auto_fit
+
     def set_smooth_movement(self, smooth):
         self._smooth_movement = smooth
         #if not smooth:
@@ -150,6 +188,35 @@ class GraphWindow:
             self.anchored = False
         self._hold_bounds()
 
+    def set_trigger_lock(self, lock, position=0.5):
+        """ oscilloscope display. the newest trigger of the first channel (see GraphChannel.set_trigger) with a whole
+        window of samples after it stays at 'position' of the window width, so a periodic signal stands still however
+        fast it's sampled. the window jumps from trigger to trigger. while there are no triggers, the window stays
+        anchored to the last sample as usual. """
+        self.trigger_lock = lock
+        self.trigger_position = position
+        self._hold_bounds()
+
+    def set_search(self, mode, level, level2=0.):
+        """ what find_next() and find_prev() look for in the first channel. see GraphChannel.find_next.
+        mode None: nothing. """
+        self.search = (mode, level, level2) if mode else None
+
+    def find_next(self):
+        """ center the window on the first matching sample right of the center. return its index, None if there is
+        none (the window stays). """
+        if not self.search:
+            return None
+        c = (self.wsx1 + self.wsx2) / 2.
+        return self._center_on(self.graph_renderer.channels[0].find_next(math.floor(c) + 1, *self.search))
+
+    def find_prev(self):
+        """ center the window on the last matching sample left of the center. see find_next """
+        if not self.search:
+            return None
+        c = (self.wsx1 + self.wsx2) / 2.
+        return self._center_on(self.graph_renderer.channels[0].find_prev(math.floor(c), *self.search))
+
     def move_by_ratio(self, dx, dy):
         d = (self.wsx2 - self.wsx1) * dx
         self.wsx1 += d
@@ -216,13 +283,37 @@ class GraphWindow:
 
         self._hold_bounds()
 
+    def _auto_fit_y(self):
+        """ set wsy1, wsy2 to the value envelope of the wanted visible range of every channel """
+        channel0 = self.graph_renderer.channels[0]
+        low, high = None, None
+        for channel in self.graph_renderer.channels:
+            k = float(channel.freq) / channel0.freq
+            r = channel.value_range(self.wsx1 * k, self.wsx2 * k)
+            if r:
+                low = r[0] if low is None else min(low, r[0])
+                high = r[1] if high is None else max(high, r[1])
+        if low is None:
+            return
+        margin = (high - low) * self.auto_fit_margin
+        if not margin:
+            # a flat line. center it.
+            margin = (channel0.value_max - channel0.value_min) * 0.05 or 1.
+        # inverted graph, the top of the window has the larger value
+        if self.wsy1 >= self.wsy2:
+            self.wsy1, self.wsy2 = high + margin, low - margin
+        else:
+            self.wsy1, self.wsy2 = low - margin, high + margin
+
     def _hold_bounds(self):
         """ anchores and releases right window edge to last sample. bounds zooms and movements. """
         adc_channel = self.graph_renderer.channels[0]
         if self.sx2 > adc_channel.size():
             self.anchored = True
 
-        if self.anchored:
+        locked = self.trigger_lock and self._lock_to_trigger(adc_channel)
+
+        if self.anchored and not locked:
             # anchor right side of the window to the last graph sample. so the graph always animates, grows out from
             # the right side of the window. (anchor sx2 to adc_channel.size())
             dx = self.sx2 - adc_channel.size()
@@ -232,11 +323,9 @@ class GraphWindow:
             self.wsx1 -= dxw
             self.wsx2 -= dxw
 
-        # eliminate integer overflow problems. only allow indices smaller than a 32bit integer value. and then divide
-        # it by four just to be sure.. maybe it's not necessary, but maybe there are some other tricks used in the
-        # graph rendering..
-        bound = 0xffffffff / 4
-        # hmm. this allows only 12 days of data with ~960Hz. time to go 64bit?
+        # sample indices are doubles here and 64bit integers in MipBuf, so only keep them in the range where a double
+        # still counts every single sample exactly. that's ~285 years at 1MHz.
+        bound = 2 ** 53
         self.sx1 = max(self.sx1, -bound)
         self.sy1 = max(self.sy1, -bound)
         self.sx1 = min(self.sx1,  bound)
@@ -266,6 +355,10 @@ class GraphWindow:
         # limit vertical movement and vertical zoom
         #
 
+        # the fitted range can be anywhere, signals don't care about value_min and value_max.
+        if self.auto_fit_y:
+            return
+
         val_min = adc_channel.value_min
         val_max = adc_channel.value_max
 
@@ -301,6 +394,31 @@ class GraphWindow:
             if self.wsy2 < val_bottom:
                 self.wsy2 = val_bottom
 
+    def _center_on(self, i):
+        """ animate the window to sample i in the middle, keeping the zoom. return i. """
+        if i is None:
+            return None
+        d = i + 0.5 - (self.wsx1 + self.wsx2) / 2.
+        self.wsx1 += d
+        self.wsx2 += d
+        self.anchored = False
+        self._hold_bounds()
+        return i
+
+    def _lock_to_trigger(self, channel):
+        """ move the window so the newest trigger with a whole window of samples after it is at trigger_position.
+        return False if there is no such trigger. """
+        width = self.wsx2 - self.wsx1
+        t = channel.last_trigger(channel.size() - width * (1. - self.trigger_position))
+        if t is None:
+            return False
+        dx = self.wsx1 + width * self.trigger_position - t
+        self.sx1 -= dx
+        self.sx2 -= dx
+        self.wsx1 -= dx
+        self.wsx2 -= dx
+        return True
+
     def _render_scrollbar(self, x, y, w, h):
         v = .6
         draw.line(x + 0.5, y+h + 0.5, x+w, y + h + 0.5, (v,v,v,1.))
@@ -330,8 +448,9 @@ class GraphWindow:
         gl.glDisable(gl.GL_LINE_SMOOTH)
         # calculate legend window size
         w = 0.
-        h = self.font.height * len(self.graph_renderer.channels)
-        for channel in self.graph_renderer.channels:
+        channels = self.graph_renderer.channels + self.graph_renderer.markers
+        h = self.font.height * len(channels)
+        for channel in channels:
             w = max(w, self.font.width(channel.name))
         # draw legend window background and border
         draw.filled_rect(x, y, w+24, h+4, (0.3, 0.3, 0.3, 0.3))
@@ -343,10 +462,14 @@ class GraphWindow:
             gl.glLineWidth(channel.f_linewidth)
             draw.line(x + 4, dy, x + 14, dy, channel.f_color_avg)
             dy += self.font.height
+        gl.glLineWidth(1.)
+        for markers in self.graph_renderer.markers:
+            draw.line(x + 9, dy - 4, x + 9, dy + 4, markers.f_color)
+            dy += self.font.height
         # draw legend window text
         gl.glTranslatef(-.5, -.5, 0.)
         dy = y + 2.
-        for channel in self.graph_renderer.channels:
+        for channel in channels:
             self.font.drawtl(channel.name, x + 20, dy, bgcolor=(0.,0.,0.,0.), fgcolor=(0.9, 0.9, 0.9, .8))
             dy += self.font.height
         gl.glPopMatrix()
@@ -0,0 +1,221 @@
+import os
+import time
+import errno
+import socket
+import struct
+import asyncore
+import threading
+
+import numpy
+
+
+# feeds GraphChannels from other processes. producers connect over TCP or a unix socket and send frames:
+#
+#     header  16 bytes, little-endian. FRAME_HEADER
+#         uint16  channel id
+#         uint8   sample type, index to FRAME_SAMPLE_TYPES
+#         uint8   reserved, 0
+#         uint32  num of samples
+#         float64 timestamp of the last sample, time.time() of the producer. 0: not known
+#     samples little-endian, num of samples * sample size bytes
+#
+# pack_frame() makes one. one asyncore loop in a background thread reads every connection and push_array()s the
+# samples, so it's the ONE producer thread of every channel. the GUI thread only drains them as usual. channels need
+# a queue_size (AniplotWidget.create_channel(queue_size=..)) of at least a few frames worth of samples.
+#
+# back-pressure: a frame that doesn't fit into the queue of its channel waits, and its connection isn't read until
+# the render thread has drained enough. the socket buffers fill up and the producer blocks in send(). frames still
+# waiting after max_wait seconds (the viewer is stuck) are dropped.
+
+
+FRAME_HEADER = struct.Struct("<HBBId")
+FRAME_SAMPLE_TYPES = ("float32", "int8", "uint8", "int16", "uint16", "int32")
+# anything larger is garbage, not a frame
+MAX_FRAME_SAMPLES = 1 << 22
+
+_DTYPES = [numpy.dtype(t).newbyteorder("<") for t in FRAME_SAMPLE_TYPES]
+
+
+def pack_frame(channel_id, samples, timestamp=0.):
+    """ return one frame as a string. samples: numpy array of one of FRAME_SAMPLE_TYPES, anything else is sent as
+    float32. timestamp: time of the last sample. """
+    samples = numpy.asarray(samples)
+    if samples.dtype.name not in FRAME_SAMPLE_TYPES:
+        samples = samples.astype(numpy.float32)
+    sample_type = FRAME_SAMPLE_TYPES.index(samples.dtype.name)
+    data = samples.astype(_DTYPES[sample_type]).tobytes()
+    return FRAME_HEADER.pack(channel_id, sample_type, 0, len(samples), timestamp) + data
+
+
+class IngestServer(asyncore.dispatcher):
+    """ receives frames (see pack_frame) and routes them to GraphChannels.
+
+        plotter = AniplotWidget()
+        for i in range(100):
+            plotter.create_channel(frequency=10000, queue_size=65536, legend="ch%i" % i)
+        server = IngestServer(plotter.channels, ("127.0.0.1", 7400))
+        server.start()
+        plotter.start()
+        ...
+        server.stop()
+
+        statistics, read from any thread:
+            frames, samples : frames and samples pushed to the channels
+            dropped_frames  : didn't fit into the queue of the channel in max_wait seconds, or unknown channel id
+            late_frames     : timestamp older than the previous frame of the channel. dropped, the graph can't go back.
+            errors          : broken frames. the connection is closed.
+    """
+
+    def __init__(self, channels, address=("127.0.0.1", 7400), max_wait=1.):
+        """ channels: list or dict of GraphChannels, the index/key is the channel id of the frames.
+        address: (host, port) for TCP, a filename for a unix socket. """
+        self._map = {}
+        asyncore.dispatcher.__init__(self, map=self._map)
+        self.channels = channels if isinstance(channels, dict) else dict(enumerate(channels))
+        self.max_wait = max_wait
+        self.address = address
+
+        self.frames = 0
+        self.samples = 0
+        self.dropped_frames = 0
+        self.late_frames = 0
+        self.errors = 0
+
+        # channel id : timestamp of the last frame
+        self._timestamps = {}
+        # open connections and closed ones with frames still waiting
+        self._connections = []
+        self._thread = None
+        self._running = False
+
+        if isinstance(address, basestring):
+            if os.path.exists(address):
+                os.unlink(address)
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+        self.bind(address)
+        self.listen(16)
+
+    def start(self):
+        """ serve in a background thread """
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="IngestServer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+        self.close()
+        if isinstance(self.address, basestring) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def _run(self):
+        while self._running:
+            # short timeout while frames wait for room, they are retried after every poll
+            waiting = [c for c in self._connections if c.waiting()]
+            asyncore.loop(timeout=0.005 if waiting else 0.1, map=self._map, count=1)
+            for connection in waiting:
+                connection.process()
+            self._connections = [c for c in self._connections if c.connected or c.waiting()]
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair:
+            self._connections.append(_Connection(self, pair[0], self._map))
+
+    def _route(self, channel_id, samples, timestamp):
+        """ a frame arrived. return [channel, samples, timestamp, arrival time] to push, or None if it was dropped. """
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            self.dropped_frames += 1
+            return None
+        if timestamp and timestamp < self._timestamps.get(channel_id, 0.):
+            self.late_frames += 1
+            return None
+        if timestamp:
+            self._timestamps[channel_id] = timestamp
+        return [channel, samples, timestamp, time.time()]
+
+    def _push(self, frame):
+        """ return False if the frame has to wait for room in the queue """
+        channel, samples, timestamp, arrived = frame
+        if channel.queue_free() < len(samples):
+            if time.time() - arrived < self.max_wait:
+                return False
+            self.dropped_frames += 1
+            return True
+        channel.push_array(samples, timestamp or None)
+        self.frames += 1
+        self.samples += len(samples)
+        return True
+
+
+class _Connection(asyncore.dispatcher):
+    """ one producer. frames are parsed from the receive buffer in place. """
+
+    def __init__(self, server, sock, map):
+        asyncore.dispatcher.__init__(self, sock, map=map)
+        self._server = server
+        self._buf = bytearray()
+        self._pos = 0
+        # a frame waiting for room in the queue of its channel
+        self._frame = None
+
+    def waiting(self):
+        return self._frame is not None
+
+    def readable(self):
+        # back-pressure. not reading makes the producer block in send().
+        return self._frame is None
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        try:
+            data = self.recv(1 << 16)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+        self._buf += data
+        self.process()
+
+    def handle_close(self):
+        # the rest of the frames already received are still pushed
+        self.close()
+
+    def process(self):
+        """ push every complete frame in the buffer, until one has to wait """
+        server = self._server
+        while True:
+            if self._frame:
+                if not server._push(self._frame):
+                    break
+                self._frame = None
+            if len(self._buf) - self._pos < FRAME_HEADER.size:
+                break
+            channel_id, sample_type, reserved, n, timestamp = FRAME_HEADER.unpack_from(self._buf, self._pos)
+            if sample_type >= len(FRAME_SAMPLE_TYPES) or n > MAX_FRAME_SAMPLES:
+                server.errors += 1
+                self._buf, self._pos = bytearray(), 0
+                self.close()
+                return
+            dtype = _DTYPES[sample_type]
+            end = self._pos + FRAME_HEADER.size + n * dtype.itemsize
+            if end > len(self._buf):
+                break
+            samples = numpy.frombuffer(self._buf, dtype, n, self._pos + FRAME_HEADER.size).astype(numpy.float32)
+            self._pos = end
+            self._frame = server._route(channel_id, samples, timestamp)
+        if self._pos:
+            del self._buf[:self._pos]
+            self._pos = 0
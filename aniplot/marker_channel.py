@@ -0,0 +1,159 @@
+import time
+import math
+
+import numpy
+
+
+class MarkerChannel:
+    """
+    discrete events (relay switches, errors, operator notes) shown as vertical lines over the graphs. a marker is a
+    sample num of a GraphChannel and a text.
+
+    the sample nums are kept sorted, so the markers in view are found with a binary search, never by looking at
+    every marker. zoomed out, markers closer than f_min_spacing pixels collapse into one line with their count. the
+    groups are buckets at fixed sample positions (multiples of the bucket width), scrolling doesn't regroup them.
+    """
+
+    def __init__(self, channel, legend="markers", color=(1., .8, .2, 1.)):
+        """
+        channel : GraphChannel. markers are positioned in its sample nums, times are converted with its
+                  time_to_sample() and timeutc_to_sample().
+        """
+        self.channel = channel
+
+        # visual settings flags. read/write. used in GraphRenderer
+        self.f_color = color
+        # markers closer than this many pixels are drawn as one line with their count
+        self.f_min_spacing = 8.
+        # show the text of single markers
+        self.f_render_text = True
+
+        # can be displayed on the legend
+        self.name = legend
+
+        # sorted sample nums. the first _size are markers, the rest is room to append.
+        self._samples = numpy.empty(1024, numpy.float64)
+        self._size = 0
+        # text of every marker, same order as _samples
+        self._texts = []
+        self._change_counter = 0
+
+    def add(self, sample_num, text=""):
+        """ add a marker at sample num of the channel. appending in time order is O(1), an older marker has to
+        move the newer ones. """
+        i = self._size
+        if i and sample_num < self._samples[i - 1]:
+            i = int(numpy.searchsorted(self._samples[:self._size], sample_num, "right"))
+        self._reserve(1)
+        self._samples[i + 1:self._size + 1] = self._samples[i:self._size]
+        self._samples[i] = sample_num
+        self._texts.insert(i, text)
+        self._size += 1
+        self._change_counter += 1
+
+    def add_time(self, seconds, text=""):
+        """ add a marker at relative time (seconds from the first sample) """
+        self.add(self.channel.time_to_sample(seconds), text)
+
+    def add_timeutc(self, timestamp=None, text=""):
+        """ add a marker at utc time.time() 'timestamp', now if None """
+        if timestamp is None:
+            timestamp = time.time()
+        self.add(self.channel.timeutc_to_sample(timestamp), text)
+
+    def add_array(self, sample_nums, texts=None):
+        """ add many markers at once. sample_nums : sequence or numpy array, any order. texts : a text for every
+        marker or None. """
+        samples = numpy.asarray(sample_nums, numpy.float64).ravel()
+        texts = list(texts) if texts is not None else [""] * len(samples)
+        assert len(texts) == len(samples)
+        if not len(samples):
+            return
+        if (not self._size or samples[0] >= self._samples[self._size - 1]) and numpy.all(samples[1:] >= samples[:-1]):
+            self._reserve(len(samples))
+            self._samples[self._size:self._size + len(samples)] = samples
+            self._texts.extend(texts)
+        else:
+            # sort the new ones and insert them after the markers of the same sample
+            order = numpy.argsort(samples, kind="mergesort")
+            samples = samples[order]
+            texts = [texts[k] for k in order]
+            positions = numpy.searchsorted(self._samples[:self._size], samples, "right")
+            merged_texts = []
+            prev = 0
+            for position, text in zip(positions.tolist(), texts):
+                merged_texts.extend(self._texts[prev:position])
+                merged_texts.append(text)
+                prev = position
+            merged_texts.extend(self._texts[prev:])
+            self._texts = merged_texts
+            self._samples = numpy.insert(self._samples[:self._size], positions, samples)
+        self._size += len(samples)
+        self._change_counter += 1
+
+    def clear(self):
+        self._size = 0
+        self._texts = []
+        self._change_counter += 1
+
+    def size(self):
+        return self._size
+
+    def get_change_counter(self):
+        """ changes every time markers are added or removed """
+        return self._change_counter
+
+    def get(self, i):
+        """ return (sample num, text) of marker i, 0 is the first in time """
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("MarkerChannel index out of range")
+        return float(self._samples[i]), self._texts[i]
+
+    def find(self, start, end):
+        """ return (i, j): markers i..j-1 are the ones at start <= sample num < end """
+        samples = self._samples[:self._size]
+        return int(numpy.searchsorted(samples, start, "left")), int(numpy.searchsorted(samples, end, "left"))
+
+    def markers(self, start, end):
+        """ list of (sample num, text) of the markers at start <= sample num < end """
+        i, j = self.find(start, end)
+        return zip(self._samples[i:j].tolist(), self._texts[i:j])
+
+    def buckets(self, start, end, width):
+        """ markers around start..end grouped into buckets of 'width' samples. bucket k is k * width .. (k+1) *
+        width. return a list of (first sample num, last sample num, count, index of the first marker) of the
+        non-empty buckets. one binary search per bucket. """
+        if not self._size or end <= start or width <= 0.:
+            return []
+        k1 = int(math.floor(start / width))
+        k2 = int(math.floor(end / width)) + 1
+        bounds = numpy.arange(k1, k2 + 1) * width
+        index = numpy.searchsorted(self._samples[:self._size], bounds, "left")
+        counts = numpy.diff(index)
+        first = index[:-1][counts > 0]
+        counts = counts[counts > 0]
+        return zip(self._samples[first].tolist(), self._samples[first + counts - 1].tolist(), counts.tolist(),
+                   first.tolist())
+
+    def _reserve(self, n):
+        """ make room for n more markers """
+        if self._size + n > len(self._samples):
+            samples = numpy.empty(max(len(self._samples) * 2, self._size + n), numpy.float64)
+            samples[:self._size] = self._samples[:self._size]
+            self._samples = samples
+
+
+if __name__ == "__main__":
+    class Channel:
+        freq = 100.
+        def time_to_sample(self, time):
+            return time * self.freq
+    m = MarkerChannel(Channel())
+    m.add_array(numpy.arange(0, 1000000, 10))
+    m.add(55., "note")
+    assert m.size() == 100001 and m.get(6) == (55., "note")
+    assert m.find(50, 70) == (5, 8)
+    assert m.buckets(0, 100, 50) == [(0., 40., 5, 0), (50., 90., 6, 5), (100., 140., 5, 11)]
+    print "test done"
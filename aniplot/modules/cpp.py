@@ -1,19 +1,22 @@
-import sys
-
-_64bit = sys.maxint == 0x7fffffffffffffff
-
-if 0x2070000 <= sys.hexversion < 0x2080000:
-    if   sys.platform == "linux2" and _64bit:
-        from linux.py27_64.cpp import *
-    elif sys.platform == "linux2" and not _64bit:
-        from linux.py27_32.cpp import *
-    elif sys.platform == "darwin":
-        from macosx.py27.cpp import *
-    elif sys.platform == "win32":
-        from windows.py27.cpp import *
-    else:
-        raise RuntimeError, "unsupported platform '%s'" % sys.platform
-else:
-    print "error importing 'cpp' module: python version 2.7.x required. you have", sys.version
-    raise ImportError
-
+import sys
+
+_64bit = sys.maxint == 0x7fffffffffffffff
+
+# no prebuilt module for this platform/python: the numpy MipBufRenderer instead. same api, no mip files.
+try:
+    if 0x2070000 <= sys.hexversion < 0x2080000:
+        if   sys.platform == "linux2" and _64bit:
+            from linux.py27_64.cpp import *
+        elif sys.platform == "linux2" and not _64bit:
+            from linux.py27_32.cpp import *
+        elif sys.platform == "darwin":
+            from macosx.py27.cpp import *
+        elif sys.platform == "win32":
+            from windows.py27.cpp import *
+        else:
+            raise ImportError, "unsupported platform '%s'" % sys.platform
+    else:
+        raise ImportError, "python version 2.7.x required. you have %s" % sys.version
+except ImportError, e:
+    print "error importing 'cpp' module: %s. using the numpy MipBufRenderer" % e
+    from mip_buf_numpy import *
@@ -0,0 +1,961 @@
+import math
+import bisect
+import threading
+import collections
+
+import numpy
+from OpenGL import GL as gl
+
+
+# numpy implementation of the cpp module MipBufRenderer (modules_src/mip_buf_src). same api, same pyramid (see
+# mip_buf_t.h), same pixels. every level is three numpy columns and is downsampled a whole block at a time, so
+# appending costs a few numpy calls per level no matter how many samples there are. rendering goes through client
+# side vertex arrays, one glDrawArrays per call.
+#
+# used by modules/cpp.py if there is no prebuilt cpp module for this platform/python. mip files (create_file,
+# open_file) need the cpp module.
+
+
+# storage types, in the order of the cpp module SAMPLE_TYPES. also numpy dtype names.
+SAMPLE_TYPES = ("float32", "int8", "uint8", "int16", "uint16", "int32")
+
+# trigger modes of set_trigger, in the order of the cpp module TRIGGER_MODES
+TRIGGER_MODES = ("none", "rising", "falling", "window")
+
+# modes of find_next, find_prev and find_all, in the order of the cpp module SEARCH_MODES
+SEARCH_MODES = ("above", "below", "outside", "inside")
+
+# filters of MipDerived.set_filter, in the order of the cpp module FILTERS
+FILTERS = ("none", "moving_avg", "lowpass")
+
+
+class _Level:
+    """ one mip level. numpy columns that grow by doubling. entries before 'offset' are dropped (rings). """
+
+    def __init__(self, dtype):
+        self.minval = numpy.empty(1024, dtype)
+        self.maxval = numpy.empty(1024, dtype)
+        self.avg    = numpy.empty(1024, dtype)
+        # used entries of the columns
+        self.n      = 0
+        # absolute index of the first column entry
+        self.offset = 0
+
+    def size(self):
+        return self.offset + self.n
+
+    def append(self, minval, maxval, avg):
+        k = len(avg)
+        if self.n + k > len(self.avg):
+            capacity = max(len(self.avg) * 2, self.n + k)
+            for name in ("minval", "maxval", "avg"):
+                column = numpy.empty(capacity, self.avg.dtype)
+                column[:self.n] = getattr(self, name)[:self.n]
+                setattr(self, name, column)
+        self.minval[self.n:self.n + k] = minval
+        self.maxval[self.n:self.n + k] = maxval
+        self.avg[self.n:self.n + k] = avg
+        self.n += k
+
+    def drop(self, first):
+        """ forget entries before 'first'. moves the columns only after half of them became unused. """
+        d = first - self.offset
+        if d > 0 and d >= self.n // 2:
+            for column in (self.minval, self.maxval, self.avg):
+                column[:self.n - d] = column[d:self.n]
+            self.n -= d
+            self.offset = first
+
+    def columns(self, i, j):
+        """ views of the entries i..j-1 (absolute indices) """
+        a, b = i - self.offset, j - self.offset
+        return self.minval[a:b], self.maxval[a:b], self.avg[a:b]
+
+
+class MipBufRenderer(object):
+
+    def __init__(self, capacity=0, queue_size=0, branching=2, skip_levels=0, sample_type="float32"):
+        """
+        capacity 0 keeps every sample. otherwise every mip level keeps only its newest 'capacity' entries:
+        the last 'capacity' samples at full resolution, the last 2*capacity at half resolution and so on.
+        queue_size 0 disables push*(). otherwise it's the num of samples that can wait in the queue for drain().
+        branching: every 'branching' entries of a mip level make one entry of the next. 2, 4, 8, .. 256.
+        skip_levels: num of levels left out after level 0. see mip_buf_t.h
+        sample_type: storage type, one of SAMPLE_TYPES. samples of other types are rounded and clamped to it.
+        """
+        if branching < 2 or branching > 256 or branching & (branching - 1):
+            raise ValueError("MipBufRenderer branching has to be a power of two 2..256")
+        if skip_levels < 0 or branching ** (skip_levels + 1) >= 2 ** 31:
+            raise ValueError("MipBufRenderer skip_levels out of range")
+        if capacity and capacity < branching ** (skip_levels + 1):
+            raise ValueError("MipBufRenderer capacity has to be 0 or at least branching^(skip_levels+1)")
+        if queue_size < 0:
+            raise ValueError("MipBufRenderer queue_size can't be negative")
+        if sample_type not in SAMPLE_TYPES:
+            raise ValueError("MipBufRenderer sample_type has to be one of %s" % ", ".join(SAMPLE_TYPES))
+
+        self._dtype = numpy.dtype(sample_type)
+        self._capacity = capacity
+        self._branching_shift = int(math.log(branching, 2) + 0.5)
+        self._skip_levels = skip_levels
+        self._levels = [_Level(self._dtype)]
+        # integer types: exact sums (int64, samples) of the entries of every level after its last complete group. the
+        # levels are built from exact sums like MipSample::exact in mip_buf_t.h.
+        self._sums = [numpy.zeros(0, numpy.int64)]
+        self._change_counter = 0
+        # set_trigger() arguments, the next sample _update_trigger() looks at, the sorted trigger index
+        self._trigger = ("none", 0., 0., 0)
+        self._trigger_next = 0
+        self._triggers = []
+        self._num_triggers = 0
+        # _tail() of every level, up to date if _tails_counter is _change_counter
+        self._tails = []
+        self._tails_counter = -1
+        self._num_vertices = 0
+        self._use_vbo = False
+        # GL texture name of render_density, 0 before the first one
+        self._density_texture = 0
+
+        # push*() queue. blocks of (minval, maxval, avg) arrays. the lock guards only _queued.
+        self._queue = collections.deque()
+        self._queue_capacity = 1 << int(math.ceil(math.log(queue_size, 2))) if queue_size else 0
+        self._queued = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def get_sample_type(self):
+        """ storage type, one of SAMPLE_TYPES """
+        return self._dtype.name
+
+    def append(self, avg):
+        self.append_minmaxavg(avg, avg, avg)
+
+    def append_minmaxavg(self, minval, maxval, avg):
+        self._append(self._convert([minval]), self._convert([maxval]), self._convert([avg]))
+
+    def append_array(self, avg):
+        """ append every value of a float buffer or of a buffer of the sample_type. the latter is copied as is. """
+        avg = self._convert(avg)
+        if len(avg):
+            self._append(avg, avg, avg)
+
+    def append_minmaxavg_arrays(self, minval, maxval, avg):
+        """ bulk append_minmaxavg. all three buffers have to be of the same length """
+        if not (len(minval) == len(maxval) == len(avg)):
+            raise ValueError("minval, maxval and avg have different lengths")
+        if len(avg):
+            self._append(self._convert(minval), self._convert(maxval), self._convert(avg))
+
+    def append_array_parallel(self, avg, num_threads=0):
+        """ append_array. numpy builds every level a whole block at a time anyway, num_threads is ignored. """
+        self.append_array(avg)
+
+    def append_minmaxavg_arrays_parallel(self, minval, maxval, avg, num_threads=0):
+        self.append_minmaxavg_arrays(minval, maxval, avg)
+
+    def push(self, avg):
+        """ thread safe append() for one producer thread. return 1 if queued, 0 if the queue was full """
+        return self.push_minmaxavg_arrays([avg], [avg], [avg])
+
+    def push_array(self, avg):
+        """ thread safe append_array() for one producer thread. return num of samples queued, the rest didn't fit
+        and were dropped. """
+        avg = self._convert(avg)
+        return self._push(avg, avg, avg)
+
+    def push_minmaxavg_arrays(self, minval, maxval, avg):
+        """ thread safe append_minmaxavg_arrays() for one producer thread. return num of samples queued. """
+        if not (len(minval) == len(maxval) == len(avg)):
+            raise ValueError("minval, maxval and avg have different lengths")
+        return self._push(self._convert(minval), self._convert(maxval), self._convert(avg))
+
+    def drain(self):
+        """ move the pushed samples into the mip levels. call from the render thread. return num of samples moved. """
+        blocks = []
+        # only what was in the queue when we started
+        for i in range(len(self._queue)):
+            blocks.append(self._queue.popleft())
+        if not blocks:
+            return 0
+        n = sum(len(block[2]) for block in blocks)
+        with self._lock:
+            self._queued -= n
+        self._append(*[numpy.concatenate([block[c] for block in blocks]) for c in range(3)])
+        return n
+
+    def get_dropped(self):
+        """ num of pushed samples that didn't fit into the queue """
+        return self._dropped
+
+    def queue_free(self):
+        """ num of samples push*() can take right now. call from the producer thread. """
+        return self._queue_capacity - self._queued
+
+    # mip files need the cpp module
+
+    def create_file(self, path):
+        raise IOError("can't create mip file %s, mip files need the cpp module" % path)
+
+    def open_file(self, path, writable=False):
+        raise IOError("can't open mip file %s, mip files need the cpp module" % path)
+
+    def flush_file(self):
+        pass
+
+    def has_file(self):
+        return False
+
+    def is_writable(self):
+        return True
+
+    def append_timestamps(self, timestamps):
+        return 0
+
+    def get_timestamps(self):
+        return []
+
+    def get_user_data(self):
+        return b""
+
+    def set_user_data(self, data):
+        raise IOError("can't save user data, mip files need the cpp module")
+
+    def render_avg(self, start_index, end_index, resolution):
+        level, start_pixel, i_start, end_pixel, i_end = self._get_buf(start_index, end_index, resolution)
+        self._num_vertices = 0
+        if i_end - i_start <= 0:
+            return
+
+        # vertices relative to the first visible entry, like the cpp renderer
+        gl.glPushMatrix()
+        gl.glTranslatef(start_pixel, 0., 0.)
+        gl.glScalef((end_pixel - start_pixel) / (i_end - i_start), 1., 1.)
+
+        # branching > 2 or skip_levels may leave many entries per pixel. combine them to about one per pixel.
+        group = int((i_end - i_start) / (end_pixel - start_pixel))
+        tail = self._tail_vertex(level, i_start, i_end)
+        if tail:
+            i_end -= 1
+        if group >= 2:
+            self._render_groups(self._levels[level], i_start, i_end, group, False, tail)
+        else:
+            avg = self._levels[level].columns(i_start, i_end + 1)[2]
+            vertices = numpy.empty((len(avg) + bool(tail), 2), numpy.float32)
+            vertices[:len(avg), 0] = numpy.arange(len(avg))
+            vertices[:len(avg), 1] = avg
+            if tail:
+                vertices[-1] = tail[0], tail[3]
+            self._draw(gl.GL_LINE_STRIP, vertices)
+
+        gl.glPopMatrix()
+
+    def render_minmax(self, start_index, end_index, resolution):
+        level, start_pixel, i_start, end_pixel, i_end = self._get_buf(start_index, end_index, resolution)
+        self._num_vertices = 0
+        if i_end - i_start <= 0:
+            return
+
+        gl.glPushMatrix()
+        gl.glTranslatef(start_pixel, 0., 0.)
+        gl.glScalef((end_pixel - start_pixel) / (i_end - i_start), 1., 1.)
+
+        group = int((i_end - i_start) / (end_pixel - start_pixel))
+        tail = self._tail_vertex(level, i_start, i_end)
+        if tail:
+            i_end -= 1
+        if group >= 2:
+            self._render_groups(self._levels[level], i_start, i_end, group, True, tail)
+        else:
+            minval, maxval, avg = self._levels[level].columns(i_start, i_end + 1)
+            vertices = numpy.empty((len(avg) + bool(tail), 2, 2), numpy.float32)
+            vertices[:len(avg), :, 0] = numpy.arange(len(avg))[:, None]
+            vertices[:len(avg), 0, 1] = minval
+            vertices[:len(avg), 1, 1] = maxval
+            if tail:
+                vertices[-1] = (tail[0], tail[1]), (tail[0], tail[2])
+            self._draw(gl.GL_LINES, vertices.reshape(-1, 2))
+
+        gl.glPopMatrix()
+
+    def render_m4(self, start_index, end_index, resolution):
+        """ first/min/max/last of every pixel column as one line strip. exact envelope, at most 4 vertices per pixel. """
+        self._num_vertices = 0
+        if end_index <= start_index or resolution <= 0.1:
+            return
+
+        samples_per_pixel = (end_index - start_index) / float(resolution)
+        if samples_per_pixel < 2.:
+            self.render_avg(start_index, end_index, resolution)
+            return
+
+        # sample i is drawn at pixel (i + 0.5 - start_index) / samples_per_pixel. column p gets the samples drawn
+        # into p..p+1
+        columns = int(math.ceil(resolution))
+        bounds = numpy.ceil(start_index + numpy.arange(columns + 1) * samples_per_pixel - 0.5).astype(numpy.int64)
+        a = numpy.maximum(bounds[:-1], self.first())
+        b = numpy.minimum(bounds[1:], self.size())
+        p = numpy.nonzero(a < b)[0]
+        if not len(p):
+            return
+        a, b = a[p], b[p]
+
+        minval, maxval, mean, count = self._stats(a, b)
+        l = self._levels[0]
+        first_avg = l.avg[a - l.offset].astype(numpy.float32)
+        last_avg = l.avg[b - 1 - l.offset].astype(numpy.float32)
+        minval = minval.astype(numpy.float32)
+        maxval = maxval.astype(numpy.float32)
+
+        # visit the extreme closer to the first sample first. the strip covers min..max either way.
+        min_first = first_avg - minval < maxval - first_avg
+        vertices = numpy.empty((len(p), 4, 2), numpy.float32)
+        vertices[:, :, 0] = (p + 0.5)[:, None]
+        vertices[:, 0, 1] = first_avg
+        vertices[:, 1, 1] = numpy.where(min_first, minval, maxval)
+        vertices[:, 2, 1] = numpy.where(min_first, maxval, minval)
+        vertices[:, 3, 1] = last_avg
+        if len(p) * 4 >= 2:
+            self._draw(gl.GL_LINE_STRIP, vertices.reshape(-1, 2))
+
+    def render_density(self, start_index, end_index, resolution, value_min, value_max, height):
+        """ histogram of the samples of every pixel column, 'height' bins from raw value_min to value_max, drawn as an
+        alpha texture in the current color. like the cpp module (see mip_density.h), but every call computes every
+        column, and an entry of a coarse level goes to the column of its first sample. """
+        self._num_vertices = 0
+        if end_index <= start_index or resolution < 1. or height < 1 or value_min == value_max:
+            return
+
+        # column c holds the samples drawn to pixels c - start_index / spc .. +1, see render_m4
+        spc = (end_index - start_index) / float(resolution)
+        c0 = int(math.floor(start_index / spc))
+        c1 = int(math.floor(end_index / spc)) + 1
+        a = max(int(math.ceil(c0 * spc - 0.5)), self.first())
+        b = min(int(math.ceil(c1 * spc - 0.5)), self.size())
+        if a >= b:
+            return
+
+        # entries of at most 1/32 of a column (MIP_DENSITY_DETAIL), and the samples after the last complete one
+        level = 0
+        while level + 1 < len(self._levels) and (1 << self._level_shift(level + 1)) * 32 <= spc:
+            level += 1
+        shift = self._level_shift(level)
+        i0 = max(a >> shift, self._first(level))
+        i1 = max(min(b >> shift, self._levels[level].size()), i0)
+        parts = [(level, i0, i1), (0, max(i1 << shift, a), b)] if level else [(0, a, b)]
+
+        # every entry spread over the bins from its minval to its maxval. bin boundaries summed up into bins.
+        k = height / float(value_max - value_min)
+        hist = numpy.zeros((c1 - c0, height + 1))
+        for lv, i, j in parts:
+            if i >= j:
+                continue
+            minval, maxval, avg = self._levels[lv].columns(i, j)
+            col = numpy.floor(((numpy.arange(i, j) << self._level_shift(lv)) + 0.5) / spc).astype(numpy.int64) - c0
+            y0 = (minval.astype(numpy.float64) - value_min) * k
+            y1 = (maxval.astype(numpy.float64) - value_min) * k
+            y0, y1 = numpy.minimum(y0, y1), numpy.maximum(y0, y1)
+            keep = (y1 >= 0.) & (y0 < height) & (col >= 0) & (col < c1 - c0)
+            col, lo, hi = col[keep], numpy.floor(y0[keep]), numpy.floor(y1[keep])
+            w = (1 << self._level_shift(lv)) / (hi - lo + 1.)
+            numpy.add.at(hist, (col, numpy.maximum(lo, 0.).astype(numpy.int64)), w)
+            numpy.add.at(hist, (col, numpy.minimum(hi, height - 1.).astype(numpy.int64) + 1), -w)
+        n = numpy.maximum(numpy.cumsum(hist[:, :height], axis=1), 0.)
+
+        # a column per texture row, power of two sizes
+        rows, pitch = 1, 1
+        while rows < c1 - c0:
+            rows *= 2
+        while pitch < height:
+            pitch *= 2
+        pixels = numpy.zeros((rows, pitch), numpy.uint8)
+        scale = 255. / math.log(1. + max(spc, 1.))
+        pixels[:c1 - c0, :height] = numpy.minimum(numpy.log1p(n) * scale + 0.5, 255.)
+
+        if not self._density_texture:
+            self._density_texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self._density_texture)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_ALPHA, pitch, rows, 0, gl.GL_ALPHA, gl.GL_UNSIGNED_BYTE, pixels)
+
+        x0 = c0 - start_index / spc
+        x1 = x0 + (c1 - c0)
+        t1 = (c1 - c0) / float(rows)
+        s1 = height / float(pitch)
+        gl.glEnable(gl.GL_TEXTURE_2D)
+        gl.glTexEnvi(gl.GL_TEXTURE_ENV, gl.GL_TEXTURE_ENV_MODE, gl.GL_MODULATE)
+        gl.glBegin(gl.GL_QUADS)
+        gl.glTexCoord2f(0., 0.); gl.glVertex3f(x0, value_min, 0.)
+        gl.glTexCoord2f(0., t1); gl.glVertex3f(x1, value_min, 0.)
+        gl.glTexCoord2f(s1, t1); gl.glVertex3f(x1, value_max, 0.)
+        gl.glTexCoord2f(s1, 0.); gl.glVertex3f(x0, value_max, 0.)
+        gl.glEnd()
+        gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+        gl.glDisable(gl.GL_TEXTURE_2D)
+        self._num_vertices = 4
+
+    def get_num_vertices(self):
+        """ num of vertices the last render_*() call sent to GL """
+        return self._num_vertices
+
+    def set_use_vbo(self, use_vbo):
+        """ ignored, always client side vertex arrays """
+        self._use_vbo = bool(use_vbo)
+
+    def get_use_vbo(self):
+        return self._use_vbo
+
+    def release_gl(self):
+        """ delete the density texture. the GL context it was made in has to be current. """
+        if self._density_texture:
+            gl.glDeleteTextures([self._density_texture])
+        self._density_texture = 0
+
+    def get(self, i):
+        """ return (minval, maxval, avg) of the sample at index i """
+        if i < 0:
+            i += self.size()
+        if not self.first() <= i < self.size():
+            raise IndexError("MipBufRenderer index out of range")
+        l = self._levels[0]
+        i -= l.offset
+        return float(l.minval[i]), float(l.maxval[i]), float(l.avg[i])
+
+    def get_avg_array(self, start, out):
+        """ copy the avg of samples start..start+len(out)-1 into out (a float32 array). return num copied, fewer if the
+        range reaches past the last sample, 0 if sample 'start' is not kept. """
+        if not self.first() <= start < self.size():
+            return 0
+        n = min(len(out), self.size() - start)
+        out[:n] = self._levels[0].columns(start, start + n)[2]
+        return n
+
+    def range_stats(self, start, end):
+        """ return (minval, maxval, mean, count) of samples start..end-1, or None if none of them is kept.
+        logarithmic in end - start, no loop over the samples. """
+        minval, maxval, total, count = self._stats_one(start, end)
+        if not count:
+            return None
+        return float(minval), float(maxval), total / count, count
+
+    # oscilloscope trigger. same as the cpp module, but every search is a numpy scan of the samples.
+
+    def set_trigger(self, mode, level=0., level2=0., holdoff=0):
+        """ trigger on the avg of the samples. mode is one of TRIGGER_MODES. rising: the sample where avg goes from
+        below level to level or above. falling: from above level to level or below. window: the sample where avg
+        leaves level..level2. holdoff: num of samples after a trigger that can't trigger. levels are raw values.
+        the samples kept so far are indexed right away, new ones as they are appended. """
+        if mode not in TRIGGER_MODES:
+            raise ValueError("MipBufRenderer trigger mode has to be one of %s" % ", ".join(TRIGGER_MODES))
+        if holdoff < 0:
+            raise ValueError("MipBufRenderer trigger holdoff can't be negative")
+        if mode == "window":
+            level, level2 = min(level, level2), max(level, level2)
+        else:
+            level2 = level
+        self._trigger = (mode, float(level), float(level2), int(holdoff))
+        self._trigger_next = 0
+        self._triggers = []
+        self._num_triggers = 0
+        self._update_trigger()
+
+    def find_trigger(self, start, end):
+        """ the first sample of start..end-1 that triggers, None if none. holdoff and the index are not used. """
+        # growing blocks. a trigger close to start costs little, a long search few numpy calls.
+        block = 4096
+        for i, j in self._trigger_blocks(start, end):
+            while i < j:
+                k = min(i + block, j)
+                hits = self._trigger_hits(i, k)
+                if len(hits):
+                    return int(hits[0])
+                i = k
+                block *= 2
+        return None
+
+    def num_triggers(self):
+        """ num of triggers indexed since set_trigger """
+        return self._num_triggers
+
+    def get_triggers(self, start, end):
+        """ list of the indexed triggers in start..end-1. triggers of samples not kept anymore don't count. """
+        start = max(start, self.first())
+        return self._triggers[bisect.bisect_left(self._triggers, start):bisect.bisect_left(self._triggers, end)]
+
+    def last_trigger(self, end=None):
+        """ the last indexed trigger before 'end' (default: the newest one), None if none """
+        j = bisect.bisect_left(self._triggers, self.size() + 1 if end is None else end)
+        return self._triggers[j - 1] if j and self._triggers[j - 1] >= self.first() else None
+
+    # threshold search. same as the cpp module, but a numpy scan of the samples in growing blocks.
+
+    def find_next(self, start, mode, level, level2=0., end=None):
+        """ the first sample at or after 'start' (and before 'end') that matches, None if none. mode is one of
+        SEARCH_MODES. above: the maxval of the sample is above level. below: minval below level. outside: above level2
+        or below level. inside: minval and maxval within level..level2. levels are raw values. """
+        self._check_search_mode(mode)
+        start, end = max(start, self.first()), min(self.size() if end is None else end, self.size())
+        block = 4096
+        while start < end:
+            j = min(start + block, end)
+            hits = self._search_hits(mode, level, level2, start, j)
+            if len(hits):
+                return int(hits[0])
+            start = j
+            block = min(block * 2, 1 << 20)
+        return None
+
+    def find_prev(self, end, mode, level, level2=0., start=0):
+        """ the last sample before 'end' (and at or after 'start') that matches, None if none. see find_next """
+        self._check_search_mode(mode)
+        start, end = max(start, self.first()), min(end, self.size())
+        block = 4096
+        while start < end:
+            i = max(end - block, start)
+            hits = self._search_hits(mode, level, level2, i, end)
+            if len(hits):
+                return int(hits[-1])
+            end = i
+            block = min(block * 2, 1 << 20)
+        return None
+
+    def find_all(self, mode, level, level2=0., start=0, end=None):
+        """ list of the matching samples of start..end-1. see find_next """
+        self._check_search_mode(mode)
+        start, end = max(start, self.first()), min(self.size() if end is None else end, self.size())
+        result = []
+        for i in range(start, end, 1 << 20):
+            result.extend(self._search_hits(mode, level, level2, i, min(i + (1 << 20), end)).tolist())
+        return result
+
+    def size(self):
+        return self._levels[0].size()
+
+    def first(self):
+        """ index of the oldest sample still kept. sample indices never restart, size() keeps growing. """
+        return self._first(0)
+
+    def get_change_counter(self):
+        """ append() will increment this. will be zero after creation. nothing can reset it. """
+        return self._change_counter
+
+    def inc_change_counter(self):
+        self._change_counter += 1
+
+    def _convert(self, samples):
+        """ samples to a numpy array of the storage type. floats are rounded and clamped, other types have to be the
+        storage type already. """
+        a = numpy.asarray(samples)
+        if a.dtype == self._dtype:
+            return a
+        if a.dtype.kind not in "fi" or (a.dtype.kind == "i" and a.ndim and not isinstance(samples, list)):
+            raise TypeError("%s samples for a %s MipBufRenderer" % (a.dtype.name, self._dtype.name))
+        if self._dtype.kind == "f":
+            return a.astype(self._dtype)
+        info = numpy.iinfo(self._dtype)
+        a = numpy.floor(numpy.where(a == a, a, 0.) + 0.5)
+        return numpy.clip(a, info.min, info.max).astype(self._dtype)
+
+    def _push(self, minval, maxval, avg):
+        n = len(avg)
+        free = self._queue_capacity - self._queued
+        if n > free:
+            self._dropped += n - free
+            n = free
+        if n > 0:
+            # copies, the caller may reuse its buffers
+            self._queue.append((numpy.array(minval[:n]), numpy.array(maxval[:n]), numpy.array(avg[:n])))
+            with self._lock:
+                self._queued += n
+        return max(n, 0)
+
+    def _level_shift(self, level):
+        """ one entry of the level covers 2^level_shift samples """
+        return (level + self._skip_levels) * self._branching_shift if level else 0
+
+    def _first(self, level):
+        l = self._levels[level]
+        return max(l.size() - self._capacity, 0) if self._capacity else 0
+
+    def _append(self, minval, maxval, avg):
+        self._levels[0].append(minval, maxval, avg)
+        self._change_counter += len(avg)
+        exact = self._dtype.kind != "f"
+        # exact sums of the new entries of the level
+        sums = numpy.asarray(avg, numpy.int64) if exact else None
+
+        # complete the groups of every level, a whole block at a time
+        level = 0
+        while True:
+            src = self._levels[level]
+            shift = self._level_shift(level + 1) - self._level_shift(level)
+            g = 1 << shift
+            i, end = (self._levels[level + 1].size() if level + 1 < len(self._levels) else 0) * g, src.size() // g * g
+            if exact:
+                # sums of the entries i..
+                sums = numpy.concatenate((self._sums[level], sums))
+                self._sums[level] = sums[max(end - i, 0):]
+            if i >= end:
+                break
+            if level + 1 == len(self._levels):
+                self._levels.append(_Level(self._dtype))
+                self._sums.append(numpy.zeros(0, numpy.int64))
+            dst = self._levels[level + 1]
+            smin, smax, savg = src.columns(i, end)
+            dmin = smin.reshape(-1, g).min(axis=1)
+            dmax = smax.reshape(-1, g).max(axis=1)
+            if self._dtype.kind == "f" and g == 2:
+                davg = (savg[0::2] + savg[1::2]) * numpy.float32(0.5)
+            elif self._dtype.kind == "f":
+                davg = savg.reshape(-1, g).astype(numpy.float64).sum(axis=1) / g
+            else:
+                # round halves up. same as MipSample in mip_buf_t.h
+                sums = sums[:end - i].reshape(-1, g).sum(axis=1)
+                davg = (sums + (1 << (self._level_shift(level + 1) - 1))) >> self._level_shift(level + 1)
+            dst.append(dmin, dmax, davg.astype(self._dtype))
+            level += 1
+
+        self._update_trigger()
+        if self._capacity:
+            for level, l in enumerate(self._levels):
+                l.drop(self._first(level))
+
+    def _trigger_blocks(self, start, end):
+        """ start..end clamped to the samples that have a previous one, in blocks of at most 2^20 samples. _append
+        indexes the triggers before the ring drops the old samples, so a block larger than the ring is scanned
+        whole, same as the cpp module. """
+        start = max(start, self._levels[0].offset + 1)
+        end = min(end, self.size())
+        return [(i, min(i + (1 << 20), end)) for i in range(start, end, 1 << 20)]
+
+    def _trigger_hits(self, start, end):
+        """ all the samples of start..end-1 that trigger, start has to be at least first() + 1 """
+        mode, level, level2 = self._trigger[:3]
+        l = self._levels[0]
+        prev = l.avg[start - 1 - l.offset:end - 1 - l.offset].astype(numpy.float64)
+        cur = l.avg[start - l.offset:end - l.offset].astype(numpy.float64)
+        if mode == "rising":
+            hit = (prev < level) & (cur >= level)
+        elif mode == "falling":
+            hit = (prev > level) & (cur <= level)
+        else:
+            hit = (prev >= level) & (prev <= level2) & ((cur < level) | (cur > level2))
+        return numpy.flatnonzero(hit) + start
+
+    def _check_search_mode(self, mode):
+        if mode not in SEARCH_MODES:
+            raise ValueError("MipBufRenderer search mode has to be one of %s" % ", ".join(SEARCH_MODES))
+
+    def _search_hits(self, mode, level, level2, start, end):
+        """ all the matching samples of start..end-1, which have to be kept """
+        minval, maxval = [c.astype(numpy.float64) for c in self._levels[0].columns(start, end)[:2]]
+        if mode == "above":
+            hit = maxval > level
+        elif mode == "below":
+            hit = minval < level
+        else:
+            level, level2 = min(level, level2), max(level, level2)
+            if mode == "outside":
+                hit = (maxval > level2) | (minval < level)
+            else:
+                hit = (minval >= level) & (maxval <= level2)
+        return numpy.flatnonzero(hit) + start
+
+    def _update_trigger(self):
+        """ index the triggers of the samples appended since the last call. holdoff skips the triggers too close to
+        the previous one. """
+        mode, holdoff = self._trigger[0], self._trigger[3]
+        if mode == "none":
+            return
+        for i, j in self._trigger_blocks(self._trigger_next, self.size()):
+            for t in self._trigger_hits(i, j).tolist():
+                if t >= self._trigger_next:
+                    self._triggers.append(t)
+                    self._num_triggers += 1
+                    self._trigger_next = t + max(holdoff, 1)
+        self._trigger_next = max(self._trigger_next, self.size())
+        # forget the triggers of dropped samples once they are half of the index
+        k = bisect.bisect_left(self._triggers, self.first())
+        if k and k >= len(self._triggers) // 2:
+            del self._triggers[:k]
+
+    def _get_buf(self, start_index, end_index, resolution):
+        """ same as MipBuf_t::get_buf. return level, start_pixel, start_index, end_pixel, end_index """
+        if end_index <= start_index or resolution <= 0.1:
+            return 0, 0., 0, 0., 0
+
+        samples_per_pixel = (end_index - start_index) / float(resolution)
+        pixels_per_sample = resolution / float(end_index - start_index)
+
+        # too much resolution, or the level doesn't reach back to start_index anymore. go to the coarser level.
+        level = 0
+        g = float(1 << self._level_shift(1))
+        while level + 1 < len(self._levels) and \
+                ((samples_per_pixel >= g and (end_index - start_index) >= 2. * g + 1.) or
+                 (self._first(level) > 0 and self._round(start_index) < self._first(level))):
+            start_index /= g
+            end_index /= g
+            samples_per_pixel /= g
+            pixels_per_sample *= g
+            level += 1
+            g = float(1 << (self._level_shift(level + 1) - self._level_shift(level)))
+
+        size = self._levels[level].size()
+        i_start = max(self._round(start_index), self._first(level))
+        i_end = min(self._round(end_index) - 1, size - 1)
+        # the range reaches past the last complete entry. the tail there holds the newest samples.
+        if i_end == size - 1 and end_index > size and self._tail(level):
+            i_end = size
+        start_pixel = (i_start + 0.5 - start_index) * pixels_per_sample
+        end_pixel = resolution - (end_index - i_end - 0.5) * pixels_per_sample
+        return level, start_pixel, i_start, end_pixel, i_end
+
+    def _tail(self, level):
+        """ same as MipBuf_t::get_tail. return (minval, maxval, avg, count) of the partial entry at index size() of the
+        level, or None. """
+        if self._tails_counter != self._change_counter:
+            self._update_tails()
+        return self._tails[level] if 0 < level < len(self._tails) else None
+
+    def _update_tails(self):
+        """ the tail of a level is the tail of the previous level plus the entries of the previous level after the
+        last complete group. summed one by one like the cpp module does. """
+        self._tails_counter = self._change_counter
+        self._tails = [None]
+        minval = maxval = None
+        total, count = 0., 0
+        for level in range(1, len(self._levels)):
+            src = self._levels[level - 1]
+            i = self._levels[level].size() << (self._level_shift(level) - self._level_shift(level - 1))
+            if i < src.size():
+                smin, smax, savg = src.columns(i, src.size())
+                weight = 1 << self._level_shift(level - 1)
+                minval = smin.min() if minval is None else min(minval, smin.min())
+                maxval = smax.max() if maxval is None else max(maxval, smax.max())
+                if self._dtype.kind == "f":
+                    for avg in savg.tolist():
+                        total += avg * weight
+                else:
+                    total += float(self._sums[level - 1].sum())
+                count += weight * len(savg)
+            self._tails.append((minval, maxval, self._convert([total / count])[0], count) if count else None)
+
+    def _tail_vertex(self, level, start, end):
+        """ if 'end' from _get_buf is the tail of the level, return (x, minval, maxval, avg) of it. x is relative to
+        entry 'start', at the middle of the samples in the tail. """
+        tail = self._tail(level)
+        if not tail or end < self._levels[level].size():
+            return None
+        x = end - start + (tail[3] / float(1 << self._level_shift(level)) - 1.) * 0.5
+        return x, float(tail[0]), float(tail[1]), float(tail[2])
+
+    def _round(self, x):
+        """ c round(), halves away from zero """
+        return int(math.floor(x + 0.5)) if x >= 0. else -int(math.floor(-x + 0.5))
+
+    def _render_groups(self, l, start, end, group, minmax, tail=None):
+        """ draw entries start..end of the level combined 'group' at a time, and the _tail_vertex after them if
+        given. groups start at multiples of 'group' so they stay the same while scrolling. """
+        a = numpy.arange(start - start % group, end + 1, group, dtype=numpy.int64)
+        a[0] = start
+        b = numpy.minimum(numpy.append(a[1:] - 1, end), end)
+        smin, smax, savg = l.columns(start, end + 1)
+        offsets = a - start
+        x = (a + b) * 0.5 - start
+        if minmax:
+            vertices = numpy.empty((len(a), 2, 2), numpy.float32)
+            vertices[:, :, 0] = x[:, None]
+            vertices[:, 0, 1] = numpy.minimum.reduceat(smin, offsets)
+            vertices[:, 1, 1] = numpy.maximum.reduceat(smax, offsets)
+            vertices = vertices.reshape(-1, 2)
+            if tail:
+                vertices = numpy.append(vertices, [(tail[0], tail[1]), (tail[0], tail[2])], axis=0).astype(numpy.float32)
+            self._draw(gl.GL_LINES, vertices)
+        else:
+            vertices = numpy.empty((len(a), 2), numpy.float32)
+            vertices[:, 0] = x
+            vertices[:, 1] = numpy.add.reduceat(savg.astype(numpy.float64), offsets) / (b - a + 1)
+            if tail:
+                vertices = numpy.append(vertices, [(tail[0], tail[3])], axis=0).astype(numpy.float32)
+            self._draw(gl.GL_LINE_STRIP, vertices)
+
+    def _draw(self, mode, vertices):
+        self._num_vertices = len(vertices)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glVertexPointer(2, gl.GL_FLOAT, 0, vertices)
+        gl.glDrawArrays(mode, 0, len(vertices))
+        gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+
+    def _stats(self, starts, ends):
+        """ min, max, mean and count of every range starts[i]..ends[i]-1, all ranges at once. the largest aligned
+        entries of every level that fit, like MipBuf_t::get_stats. return four arrays. """
+        n = len(starts)
+        minval = numpy.full(n, numpy.inf)
+        maxval = numpy.full(n, -numpy.inf)
+        total = numpy.zeros(n)
+        start = numpy.maximum(starts, self.first())
+        end = numpy.minimum(ends, self.size())
+        end = numpy.maximum(end, start)
+        count = end - start
+
+        def take(level, i, mask, samples):
+            l = self._levels[level]
+            j = i - l.offset
+            minval[mask] = numpy.minimum(minval[mask], l.minval[j])
+            maxval[mask] = numpy.maximum(maxval[mask], l.maxval[j])
+            total[mask] += l.avg[j] * float(samples)
+
+        top = len(self._levels) - 1
+        for level in range(top + 1):
+            shift = self._level_shift(level)
+            size = 1 << shift
+            if level == top:
+                # only whole top level entries are left, fewer than branching^(skip_levels+1)
+                while True:
+                    mask = start + size <= end
+                    if not mask.any():
+                        break
+                    take(level, start[mask] >> shift, mask, size)
+                    start[mask] += size
+                break
+            # both ends inward until they are aligned to the next level
+            next_size = 1 << self._level_shift(level + 1)
+            for j in range(next_size // size - 1):
+                mask = (start % next_size != 0) & (start + size <= end)
+                if not mask.any():
+                    break
+                take(level, start[mask] >> shift, mask, size)
+                start[mask] += size
+            for j in range(next_size // size - 1):
+                mask = (end % next_size != 0) & (end - size >= start)
+                if not mask.any():
+                    break
+                end[mask] -= size
+                take(level, end[mask] >> shift, mask, size)
+
+        # a ring forgot the start of these at full resolution. the coarser levels remember.
+        for i in numpy.nonzero((starts < self.first()) & (ends > starts))[0]:
+            minval[i], maxval[i], total[i], count[i] = self._stats_one(int(starts[i]), int(ends[i]))
+
+        mean = numpy.where(count > 0, total / numpy.maximum(count, 1), 0.)
+        return minval, maxval, mean, count
+
+    def _stats_one(self, start, end):
+        """ MipBuf_t::get_stats for one range, entry by entry. cheaper than _stats() for a single range.
+        return min, max, sum, count """
+        top = len(self._levels) - 1
+        start = max(start, self._first(top) << self._level_shift(top))
+        end = min(end, self.size())
+        minval, maxval, total, count = numpy.inf, -numpy.inf, 0., 0
+        while start < end:
+            level = 0
+            while level < top and start & ((1 << self._level_shift(level + 1)) - 1) == 0 and \
+                    start + (1 << self._level_shift(level + 1)) <= end:
+                level += 1
+            # a ring may have dropped it already. coarser levels keep longer.
+            while level < top and (start >> self._level_shift(level)) < self._first(level):
+                level += 1
+            i = start >> self._level_shift(level)
+            if i < self._first(level):
+                break
+            l = self._levels[level]
+            minval = min(minval, l.minval[i - l.offset])
+            maxval = max(maxval, l.maxval[i - l.offset])
+            next_start = (i + 1) << self._level_shift(level)
+            total += float(l.avg[i - l.offset]) * (min(next_start, end) - start)
+            count += min(next_start, end) - start
+            start = next_start
+        return minval, maxval, total, count
+
+
+class MipDerived(object):
+    """ appends offset + gain * source + .. of other MipBufRenderers to a MipBufRenderer, filtered, as the samples of
+    the sources arrive. same as the cpp module (see mip_derived.h), a block of numpy calls per update. """
+
+    def __init__(self, out, freq):
+        """ out: the MipBufRenderer the results are appended to, sampling at freq Hz """
+        if freq <= 0.:
+            raise ValueError("MipDerived freq has to be positive")
+        self._out = out
+        self._freq = float(freq)
+        # (renderer, source samples per output sample, gain)
+        self._sources = []
+        self._offset = 0.
+        # next output sample
+        self._next = 0
+        self.set_filter("none")
+
+    def add_source(self, source, freq, gain=1.):
+        """ add gain * source, sampling at freq Hz. resampled linearly if freq differs. before the first update() """
+        if freq <= 0.:
+            raise ValueError("MipDerived source freq has to be positive")
+        self._sources.append((source, freq / self._freq, float(gain)))
+
+    def set_offset(self, offset):
+        self._offset = float(offset)
+
+    def set_filter(self, filter, param=0.):
+        """ filter is one of FILTERS. moving_avg: mean of the last 'param' samples. lowpass: one-pole IIR low-pass
+        with cutoff 'param' Hz. before the first update() """
+        if filter not in FILTERS:
+            raise ValueError("MipDerived filter has to be one of %s" % ", ".join(FILTERS))
+        self._filter = filter
+        self._window_size = max(int(param), 1) if filter == "moving_avg" else 1
+        # the last window_size - 1 samples before the filter
+        self._window = numpy.zeros(0)
+        self._alpha = 1. - math.exp(-2. * math.pi * param / self._freq) if filter == "lowpass" else 1.
+        # the last output of the low-pass, None before the first one
+        self._y = None
+
+    def update(self):
+        """ compute and append every sample all the sources have samples for. return num appended. """
+        if not self._sources:
+            return 0
+        if min(source.size() for source, ratio, gain in self._sources) == 0:
+            return 0
+        end = min(int(math.floor((source.size() - 1) / ratio)) + 1 for source, ratio, gain in self._sources)
+        block = max(int((1 << 20) / max([1.] + [ratio for source, ratio, gain in self._sources])), 1)
+        appended = 0
+        while self._next < end:
+            n = min(end - self._next, block)
+            total = numpy.full(n, self._offset)
+            for source, ratio, gain in self._sources:
+                total += gain * self._resampled(source, ratio, n)
+            self._out.append_array(self._filtered(total).astype(numpy.float32))
+            self._next += n
+            appended += n
+        return appended
+
+    def _resampled(self, source, ratio, n):
+        """ the source linearly interpolated at output samples _next.._next+n-1 """
+        x = numpy.arange(self._next, self._next + n, dtype=numpy.float64) * ratio
+        i = numpy.floor(x)
+        # clamped to the samples kept
+        first, last = source.first(), source.size() - 1
+        lo = min(max(int(i[0]), first), last)
+        hi = min(max(int(i[-1]) + 1, lo), last)
+        avg = source._levels[0].columns(lo, hi + 1)[2].astype(numpy.float64)
+        a = avg[numpy.clip(i.astype(numpy.int64), lo, hi) - lo]
+        b = avg[numpy.clip(i.astype(numpy.int64) + 1, lo, hi) - lo]
+        return a + (b - a) * (x - i)
+
+    def _filtered(self, x):
+        if self._filter == "moving_avg":
+            # sums of the windows from a cumulative sum over the kept samples and the new ones
+            c = numpy.concatenate((self._window, x))
+            cs = numpy.concatenate(([0.], numpy.cumsum(c)))
+            p = numpy.arange(len(self._window), len(c))
+            lo = numpy.maximum(p - self._window_size + 1, 0)
+            self._window = c[len(c) - self._window_size + 1:] if self._window_size > 1 else c[:0]
+            return (cs[p + 1] - cs[lo]) / (p + 1 - lo)
+        if self._filter == "lowpass":
+            # every sample depends on the previous one
+            y, a = self._y, self._alpha
+            result = numpy.empty(len(x))
+            for k, v in enumerate(x.tolist()):
+                y = v if y is None else y + a * (v - y)
+                result[k] = y
+            self._y = y
+            return result
+        return x
@@ -0,0 +1,31 @@
+class ProfileCounter:
+
+    def __init__(self):
+        """
+        times a piece of code that either has its result cached (hit) or does the full work (miss).
+        read self.saved for the estimated seconds the cache has saved so far.
+        """
+
+        self.hits      = 0
+        self.misses    = 0
+        self.hit_time  = 0.
+        self.miss_time = 0.
+        self.saved     = 0.
+
+    def tick(self, dt, hit):
+
+        if hit:
+            self.hits     += 1
+            self.hit_time += dt
+        else:
+            self.misses    += 1
+            self.miss_time += dt
+
+        # every hit saved the difference of an average miss and an average hit
+        if self.hits and self.misses:
+            self.saved = self.hits * (self.miss_time / self.misses - self.hit_time / self.hits)
+
+    def __str__(self):
+        hit  = self.hit_time  / self.hits   * 1000. if self.hits   else 0.
+        miss = self.miss_time / self.misses * 1000. if self.misses else 0.
+        return "%i hits %.3fms, %i misses %.3fms, saved %.2fs" % (self.hits, hit, self.misses, miss, self.saved)
@@ -0,0 +1,124 @@
+import sys
+import math
+import time
+import weakref
+import collections
+
+import numpy
+
+import profile_counter
+
+
+# windows of Spectrum. name : function returning the window of n samples
+WINDOWS = {"hann": numpy.hanning, "hamming": numpy.hamming, "rect": numpy.ones}
+
+
+class Spectrum:
+    """
+    power spectral density of a range of samples. welch's method: the range is cut into segments of nperseg samples
+    that overlap by half, every segment is windowed and transformed, the power of the segments is averaged.
+
+    the segments start at multiples of nperseg / 2 counted from the first sample ever appended, not from the start of
+    the range. the same samples make the same segment wherever the range starts, so the power of every segment is kept
+    in an LRU cache: scrolling transforms only the segments that came into view, the anchored live view only the ones
+    the new samples completed.
+    """
+
+    def __init__(self, nperseg=1024, window="hann", max_segments=256, cache_size=4096):
+        """
+        nperseg : samples per segment. the frequency resolution is freq / nperseg.
+        window : "hann", "hamming" or "rect"
+        max_segments : at most this many segments are averaged. a longer range uses every 2nd, 4th, .. segment.
+        cache_size : num of segments kept in the cache, nperseg / 2 + 1 float64 each.
+        """
+        self.max_segments = max_segments
+        self.cache_size = cache_size
+        # psd() time per call. a hit is a call that didn't have to transform anything.
+        self.profile = profile_counter.ProfileCounter()
+        # (id(MipBufRenderer), segment start, nperseg, window) : power of the segment. oldest first.
+        self._cache = collections.OrderedDict()
+        # id(MipBufRenderer) : weakref to it, for every renderer with segments in the cache. the keys don't keep a
+        # removed channel's buffer alive, and its segments are forgotten when it's freed, before the id can be reused.
+        self._refs = {}
+
+        if sys.platform == "win32":
+            self._time = time.clock
+        else:
+            self._time = time.time
+
+        self.set_segment(nperseg, window)
+
+    def set_segment(self, nperseg, window="hann"):
+        """ change the segment length and window. the cache is kept, switching back reuses it. """
+        if window not in WINDOWS:
+            raise ValueError("Spectrum window has to be one of %s" % ", ".join(sorted(WINDOWS)))
+        assert nperseg >= 2
+        self.nperseg = nperseg
+        self.window = window
+        self._window = WINDOWS[window](nperseg)
+        # sum of the squared window, scales the power to density
+        self._window_power = float(numpy.sum(self._window ** 2))
+
+    def clear(self):
+        """ forget every cached segment """
+        self._cache.clear()
+
+    def _forget(self, key):
+        """ drop the cached segments of the renderer with id 'key'. called when it's freed. """
+        self._refs.pop(key, None)
+        for k in [k for k in self._cache if k[0] == key]:
+            del self._cache[k]
+
+    def psd(self, data, freq, start, end):
+        """ return (frequencies in Hz, power spectral density in raw value^2 / Hz) of the avg of samples start..end-1
+        of 'data' (a MipBufRenderer sampling at freq Hz), two numpy arrays of nperseg / 2 + 1 values. one-sided, the
+        mean of every segment is removed first. only the segments completely inside the range and still kept count,
+        None if there are none. """
+        t = self._time()
+        n = self.nperseg
+        hop = n // 2
+        start = max(int(math.ceil(start)), data.first())
+        end = min(int(math.floor(end)), data.size())
+        # segments k * hop .. k * hop + n - 1 inside the range
+        k1 = (start + hop - 1) // hop
+        k2 = (end - n) // hop + 1
+        # every step'th segment. step is a power of two and the segments are its multiples, so the picked segments
+        # stay the same while scrolling.
+        step = 1
+        while (k2 - k1 + step - 1) // step > self.max_segments:
+            step *= 2
+        k1 = (k1 + step - 1) // step * step
+        starts = range(k1 * hop, k2 * hop, step * hop)
+        if not starts:
+            return None
+
+        key = id(data)
+        if key not in self._refs:
+            self._refs[key] = weakref.ref(data, lambda ref, key=key: self._forget(key))
+        powers = [self._cache.pop((key, s, n, self.window), None) for s in starts]
+        missing = [j for j, power in enumerate(powers) if power is None]
+        if missing:
+            # all the new segments in one transform
+            x = numpy.empty((len(missing), n), numpy.float32)
+            for row, j in enumerate(missing):
+                data.get_avg_array(starts[j], x[row])
+            x = x.astype(numpy.float64)
+            x -= x.mean(axis=1)[:, None]
+            power = numpy.abs(numpy.fft.rfft(x * self._window, axis=1)) ** 2
+            for row, j in enumerate(missing):
+                powers[j] = power[row].copy()
+
+        # most recently used last
+        for s, power in zip(starts, powers):
+            self._cache[(key, s, n, self.window)] = power
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        result = numpy.mean(powers, axis=0) / (freq * self._window_power)
+        # one-sided: the negative frequencies fold onto the positive ones. dc and nyquist have no pair.
+        if n % 2:
+            result[1:] *= 2.
+        else:
+            result[1:-1] *= 2.
+        self.profile.tick(self._time() - t, not missing)
+        return numpy.fft.rfftfreq(n, 1. / freq), result
@@ -0,0 +1,76 @@
+#
+# graphs fed by other processes through aniplot/ingest_server.py
+#
+# usage: python ingest_demo.py viewer [num_channels]
+#        python ingest_demo.py producer [num_channels] [frequency]
+#
+# start the viewer first, then any number of producers. every producer sends its own sine waves to all the
+# channels, so run one for a clean picture.
+#
+
+import sys
+import time
+import socket
+import numpy
+
+sys.path.append('..')
+from aniplot.ingest_server import pack_frame
+
+
+ADDRESS = ("127.0.0.1", 7400)
+
+
+def producer(num_channels, frequency):
+    s = socket.create_connection(ADDRESS)
+    block = max(int(frequency / 100), 1)
+    phases = numpy.arange(num_channels) * .7
+    i = 0
+    t_start = time.time()
+    while True:
+        t = (i + numpy.arange(block)) / float(frequency)
+        for ch in range(num_channels):
+            samples = 127. + 100. * numpy.sin(t * (ch + 1) * 2. + phases[ch]) + 10. * numpy.sin(t * 50.)
+            # sendall blocks while the viewer is busy. the ingest server back-pressure.
+            s.sendall(pack_frame(ch, samples.astype(numpy.uint8), t_start + t[-1]))
+        i += block
+        delay = t_start + i / float(frequency) - time.time()
+        if delay > 0.:
+            time.sleep(delay)
+
+
+def viewer(num_channels):
+    from PySide import QtCore, QtGui
+    from aniplot import AniplotWidget
+    from aniplot.ingest_server import IngestServer
+
+    app = QtGui.QApplication(sys.argv)
+    plotter = AniplotWidget()
+    for ch in range(num_channels):
+        color = QtGui.QColor.fromHsv(ch * 360 // num_channels, 200, 255)
+        plotter.create_channel(frequency=1000, value_min=0., value_min_raw=0., value_max=5., value_max_raw=255.,
+                               legend="ch%i" % ch, color=color, queue_size=65536, sample_type="uint8")
+    server = IngestServer(plotter.channels, ADDRESS)
+    server.start()
+    plotter.start()
+    plotter.resize(800, 400)
+    plotter.show()
+
+    def report():
+        print "frames %i samples %i dropped %i late %i errors %i" % \
+              (server.frames, server.samples, server.dropped_frames, server.late_frames, server.errors)
+    timer = QtCore.QTimer()
+    timer.timeout.connect(report)
+    timer.start(1000)
+
+    r = app.exec_()
+    server.stop()
+    sys.exit(r)
+
+
+if __name__ == '__main__':
+    mode = sys.argv[1] if len(sys.argv) > 1 else "viewer"
+    num_channels = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    if mode == "producer":
+        producer(num_channels, float(sys.argv[3]) if len(sys.argv) > 3 else 1000.)
+    else:
+        viewer(num_channels)
@@ -0,0 +1,81 @@
+#
+# the numpy MipBufRenderer (aniplot/modules/mip_buf_numpy.py) against the cpp one: append throughput, range_stats and
+# render times. renders offscreen like offscreen_thumbnails.py.
+#
+# usage: python mip_buf_numpy_bench.py [num_samples]
+#        default is 10000000 samples.
+#
+# force mesa software rendering with LIBGL_ALWAYS_SOFTWARE=1
+#
+
+import sys
+import time
+import numpy
+
+sys.path.append('..')
+from aniplot.aniplot_offscreen import EglContext
+from aniplot.modules import mip_buf_numpy
+from aniplot.modules import cpp
+
+
+BLOCK_SIZE = 4096
+WIDTH      = 1024
+FRAMES     = 20
+
+
+def bench(name, cls, samples, context):
+    n = len(samples)
+
+    # single append() on a smaller buffer, it's the slow path anyway
+    n_single = min(n // 100, 100000)
+    m = cls()
+    t = time.time()
+    for i in xrange(n_single):
+        m.append(samples[i])
+    t_single = time.time() - t
+
+    m = cls()
+    t = time.time()
+    for i in xrange(0, n, BLOCK_SIZE):
+        m.append_array(samples[i:i + BLOCK_SIZE])
+    t_array = time.time() - t
+
+    queries = numpy.random.RandomState(0).randint(0, n, (1000, 2))
+    t = time.time()
+    for a, b in queries:
+        m.range_stats(int(min(a, b)), int(max(a, b)) + 1)
+    t_stats = (time.time() - t) / len(queries)
+
+    # whole capture and 10000 samples zoomed in
+    render_times = []
+    for render in (m.render_avg, m.render_minmax, m.render_m4):
+        for start, end in ((0., n), (n / 2., n / 2. + 10000.)):
+            render(start, end, WIDTH)
+            context.finish()
+            t = time.time()
+            for i in xrange(FRAMES):
+                render(start, end, WIDTH)
+            context.finish()
+            render_times.append((time.time() - t) / FRAMES * 1000.)
+
+    print "  %-6s %10.2f %10.1f %10.1f " % (name, n_single / t_single / 1e6, n / t_array / 1e6, t_stats * 1e6) + \
+          " ".join("%8.2f" % t for t in render_times)
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    n = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10000000
+    samples = (127. + 60. * numpy.sin(numpy.arange(n) / 1000.) + numpy.random.RandomState(1).randn(n)).astype(numpy.float32)
+
+    context = EglContext()
+    context.make_current(WIDTH, 256)
+
+    print "%i samples, render times in ms, %i pixels wide" % (n, WIDTH)
+    print "  %-6s %10s %10s %10s " % ("", "append", "array", "stats") + \
+          " ".join("%8s" % s for s in ("avg", "avg", "minmax", "minmax", "m4", "m4"))
+    print "  %-6s %10s %10s %10s " % ("", "Msample/s", "Msample/s", "us") + \
+          " ".join("%8s" % s for s in ("all", "zoom") * 3)
+    if cpp.MipBufRenderer is not mip_buf_numpy.MipBufRenderer:
+        bench("cpp", cpp.MipBufRenderer, samples, context)
+    bench("numpy", mip_buf_numpy.MipBufRenderer, samples, context)
+    context.destroy()
@@ -0,0 +1,41 @@
+#
+# renders a PNG thumbnail of every capture without a window or a display server.
+#
+# usage: python offscreen_thumbnails.py [num_captures]
+#
+# force mesa software rendering with LIBGL_ALWAYS_SOFTWARE=1
+#
+
+import sys
+import time
+import numpy
+
+sys.path.append('..')
+from aniplot.aniplot_offscreen import AniplotOffscreen
+
+
+def make_capture(seed, n=1000000):
+    ''' fake 8 bit ADC capture '''
+    t = numpy.arange(n, dtype=numpy.float32) / 1000.
+    s = 127. + 60. * numpy.sin(t * (seed + 1) * .3) + 20. * numpy.sin(t * 33.3)
+    return numpy.clip(s, 0., 255.).astype(numpy.float32)
+
+
+if __name__ == '__main__':
+    num_captures = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    render_times = []
+
+    t = time.time()
+    for i in range(num_captures):
+        plotter = AniplotOffscreen(320, 120)
+        ch = plotter.create_channel(frequency=1000, value_min=0., value_min_raw=0., value_max=5., value_max_raw=255., legend="capture %i" % i)
+        ch.append_array(make_capture(i))
+        plotter.start()
+        plotter.show_samples(0, ch.size())
+        plotter.save_png("capture_%04i.png" % i)
+        render_times.append(plotter.render_time)
+        plotter.release()
+
+    print "%i thumbnails in %.2fs. render latency min %.2fms avg %.2fms max %.2fms" % (
+        num_captures, time.time() - t,
+        min(render_times) * 1000., sum(render_times) / len(render_times) * 1000., max(render_times) * 1000.)
@@ -0,0 +1,224 @@
+#ifndef __ARRAY_T_H__
+#define __ARRAY_T_H__
+
+//
+// growable contiguous array of plain old data. like a minimal std::vector,
+// but elements are never constructed or destructed, and the whole content
+// can be handed out as a raw pointer (for SIMD loops, glVertexPointer, ..).
+//
+// grows by doubling the capacity, so append() is amortized O(1) and get()
+// is always O(1). sizes and indices are 64 bit. pointers returned by data(),
+// get() and append() are valid only until the next append. a failed
+// allocation throws std::bad_alloc, like new.
+//
+
+#include <stdlib.h> // realloc, free
+#include <string.h> // memcpy
+#include <assert.h>
+#include <new>      // std::bad_alloc
+
+
+template<class T>
+class array_t
+{
+public:
+
+    array_t(long long capacity=0);
+    ~array_t();
+
+    // everything inside will be destroyed. capacity is kept.
+    void clear();
+    void reserve(long long capacity);
+    // make room for n more items, growing like append(). the next n items
+    // appended won't reallocate.
+    void reserve_more(long long n);
+
+    void appendval(T item);
+    // append n uninitialized items. return pointer to the first one.
+    // be VERY careful with this. you have to fill the items yourself.
+    T*   append(long long n);
+
+    // -size..size-1. 0 is the first one appended. -1 is the last element.
+    T*   get(long long i);
+    T*   data();
+
+    long long size();
+    long long capacity();
+
+
+    // execute some internal tests. lifesavers while developing this class.
+    void test();
+
+
+protected:
+
+    long long m_size;
+    long long m_capacity;
+    T*   m_data;
+
+    void m_grow(long long min_capacity);
+};
+
+
+// --------------------------------------------------------------------------
+// ---- LIFECYCLE -----------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+array_t<T>::array_t(long long capacity)
+{
+    m_size     = 0;
+    m_capacity = 0;
+    m_data     = 0;
+
+    if (capacity > 0)
+        reserve(capacity);
+}
+
+
+template<class T>
+array_t<T>::~array_t()
+{
+    free(m_data);
+}
+
+
+// --------------------------------------------------------------------------
+// ---- METHODS -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+void array_t<T>::clear()
+{
+    m_size = 0;
+}
+
+
+template<class T>
+void array_t<T>::reserve(long long capacity)
+{
+    if (capacity <= m_capacity)
+        return;
+    T* data = (T*)realloc(m_data, sizeof(T) * capacity);
+    // m_data stays valid, nothing was appended yet
+    if (!data)
+        throw std::bad_alloc();
+    m_data     = data;
+    m_capacity = capacity;
+}
+
+
+template<class T>
+inline void array_t<T>::reserve_more(long long n)
+{
+    if (m_size + n > m_capacity)
+        m_grow(m_size + n);
+}
+
+
+template<class T>
+inline void array_t<T>::appendval(T item)
+{
+    if (m_size >= m_capacity)
+        m_grow(m_size + 1);
+    m_data[m_size++] = item;
+}
+
+
+template<class T>
+inline T* array_t<T>::append(long long n)
+{
+    if (m_size + n > m_capacity)
+        m_grow(m_size + n);
+    T* r = m_data + m_size;
+    m_size += n;
+    return r;
+}
+
+
+template<class T>
+inline T* array_t<T>::get(long long i)
+{
+    if (i >= m_size)
+        return NULL;
+    if (i < 0)
+        i += m_size;
+    if (i < 0)
+        return NULL;
+    return m_data + i;
+}
+
+
+template<class T>
+inline T* array_t<T>::data()
+{
+    return m_data;
+}
+
+
+template<class T>
+inline long long array_t<T>::size()
+{
+    return m_size;
+}
+
+
+template<class T>
+inline long long array_t<T>::capacity()
+{
+    return m_capacity;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+void array_t<T>::m_grow(long long min_capacity)
+{
+    long long capacity = m_capacity < 16 ? 16 : m_capacity;
+    while (capacity < min_capacity)
+        capacity *= 2;
+    reserve(capacity);
+}
+
+
+// --------------------------------------------------------------------------
+// ---- TESTING -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+void array_t<T>::test()
+{
+    array_t<int> a;
+    assert(a.size() == 0);
+    assert(a.get(0) == NULL);
+    assert(a.get(-1) == NULL);
+
+    for (int i = 0; i < 100; i++)
+        a.appendval(i);
+    assert(a.size() == 100);
+    assert(a.capacity() >= 100);
+
+    int* p = a.append(3);
+    p[0] = 100; p[1] = 101; p[2] = 102;
+    assert(a.size() == 103);
+
+    for (int i = 0; i < a.size(); i++)
+        assert(*a.get(i) == i && a.data()[i] == i);
+    assert(*a.get(-1) == 102);
+    assert(*a.get(-103) == 0);
+    assert(a.get(-104) == NULL);
+    assert(a.get(103) == NULL);
+
+    a.clear();
+    assert(a.size() == 0);
+}
+
+
+#endif // __ARRAY_T_H__
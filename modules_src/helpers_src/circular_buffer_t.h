@@ -34,6 +34,11 @@ public:
 
     // -1 is last. 0 is first, the eldest (oldest?)
     T*   get(int i);
+    // same as get(), but also writes to *count the num of elements that
+    // follow i contiguously in memory (i included). never more than are left
+    // to the last element. so a loop over all elements needs at most two
+    // runs.
+    T*   get_contiguous(int i, int* count);
 
     // append() and clear() will increment this. will be zero after creation.
     // nothing can reset it.
@@ -76,7 +81,8 @@ circular_buffer_t<T>::circular_buffer_t(int capacity)
     m_size           = 0;
     m_buffer         = 0;
 
-    set_capacity(capacity);
+    if (capacity > 0)
+        set_capacity(capacity);
 }
 
 
@@ -159,6 +165,23 @@ T* circular_buffer_t<T>::get(int i)
 }
 
 
+template<class T>
+T* circular_buffer_t<T>::get_contiguous(int i, int* count)
+{
+    int r = m_index(i);
+    if (r < 0)
+    {
+        *count = 0;
+        return NULL;
+    }
+
+    if (i < 0) i += m_size;
+    int left = m_size - i;
+    *count = r + left <= m_capacity ? left : m_capacity - r;
+    return &m_buffer[r];
+}
+
+
 template<class T>
 int circular_buffer_t<T>::change_counter()
 {
@@ -264,14 +287,25 @@ void circular_buffer_t<T>::test()
     assert(b.get(-8) == NULL);
     assert(b.get(7)  == NULL);
 
+    // 13..19 is stored as 18 19 13 14 15 16 17
+    int n;
+    assert(*b.get_contiguous(0, &n) == 13 && n == 5);
+    assert(*b.get_contiguous(4, &n) == 17 && n == 1);
+    assert(*b.get_contiguous(5, &n) == 18 && n == 2);
+    assert(*b.get_contiguous(-1, &n) == 19 && n == 1);
+    assert(b.get_contiguous(7, &n) == NULL && n == 0);
+
 
-    circular_buffer_t<int> c;
+    circular_buffer_t<int> c(3);
     assert(c.size() == 0);
+    assert(c.get(0)  == NULL);
+    assert(c.get(-1) == NULL);
     c.appendval(11);
     c.appendval(12);
-    assert(b.get(0)  == NULL);
-    assert(b.get(1)  == NULL);
-    assert(b.get(-1) == NULL);
+    assert(*c.get(0)  == 11);
+    assert(*c.get(-1) == 12);
+    assert(c.get(2)   == NULL);
+    assert(*c.get_contiguous(0, &n) == 11 && n == 2);
 
 
     // all tests passed
@@ -0,0 +1,127 @@
+#ifndef __PARALLEL_FOR_H__
+#define __PARALLEL_FOR_H__
+
+//
+// run func(i, arg) for every i in 0..n-1 on a few threads, return when all
+// of them are done. items are handed out in order through a shared counter,
+// so uneven items balance out. the calling thread works too.
+//
+// no pool, the threads are created on every call. meant for a few large
+// items (milliseconds each), not for tight loops.
+//
+
+#if defined(WIN32)
+    #include <windows.h>
+#else
+    #include <pthread.h>
+    #include <unistd.h>
+#endif
+
+#define PARALLEL_FOR_MAX_THREADS 64
+
+
+typedef void (*parallel_for_func_t)(int i, void* arg);
+
+
+struct parallel_for_t
+{
+    parallel_for_func_t func;
+    void* arg;
+    int   n;
+    int   next;
+#if defined(WIN32)
+    CRITICAL_SECTION lock;
+#else
+    pthread_mutex_t  lock;
+#endif
+};
+
+
+// num of cores. 1 if it can't be found out.
+inline int parallel_for_num_cores()
+{
+#if defined(WIN32)
+    SYSTEM_INFO info;
+    GetSystemInfo(&info);
+    int n = int(info.dwNumberOfProcessors);
+#else
+    int n = int(sysconf(_SC_NPROCESSORS_ONLN));
+#endif
+    return n > 0 ? n : 1;
+}
+
+
+inline int parallel_for_take(parallel_for_t* p)
+{
+#if defined(WIN32)
+    EnterCriticalSection(&p->lock);
+    int i = p->next++;
+    LeaveCriticalSection(&p->lock);
+#else
+    pthread_mutex_lock(&p->lock);
+    int i = p->next++;
+    pthread_mutex_unlock(&p->lock);
+#endif
+    return i;
+}
+
+
+#if defined(WIN32)
+inline DWORD WINAPI parallel_for_thread(LPVOID arg)
+#else
+inline void* parallel_for_thread(void* arg)
+#endif
+{
+    parallel_for_t* p = (parallel_for_t*)arg;
+    for (int i = parallel_for_take(p); i < p->n; i = parallel_for_take(p))
+        p->func(i, p->arg);
+    return 0;
+}
+
+
+// num_threads 0: one per core
+inline void parallel_for(int n, parallel_for_func_t func, void* arg, int num_threads=0)
+{
+    if (num_threads <= 0)
+        num_threads = parallel_for_num_cores();
+    if (num_threads > n)
+        num_threads = n;
+    if (num_threads > PARALLEL_FOR_MAX_THREADS)
+        num_threads = PARALLEL_FOR_MAX_THREADS;
+
+    parallel_for_t p;
+    p.func = func;
+    p.arg  = arg;
+    p.n    = n;
+    p.next = 0;
+
+#if defined(WIN32)
+    HANDLE threads[PARALLEL_FOR_MAX_THREADS];
+    InitializeCriticalSection(&p.lock);
+    int started = 0;
+    for (int t = 1; t < num_threads; t++)
+        if ((threads[started] = CreateThread(NULL, 0, parallel_for_thread, &p, 0, NULL)))
+            started++;
+    parallel_for_thread(&p);
+    if (started)
+        WaitForMultipleObjects(started, threads, TRUE, INFINITE);
+    for (int t = 0; t < started; t++)
+        CloseHandle(threads[t]);
+    DeleteCriticalSection(&p.lock);
+#else
+    pthread_t threads[PARALLEL_FOR_MAX_THREADS];
+    pthread_mutex_init(&p.lock, NULL);
+    int started = 0;
+    // a thread that can't be created leaves its share to the others
+    for (int t = 1; t < num_threads; t++)
+        if (pthread_create(&threads[started], NULL, parallel_for_thread, &p) == 0)
+            started++;
+    parallel_for_thread(&p);
+    for (int t = 0; t < started; t++)
+        pthread_join(threads[t], NULL);
+    pthread_mutex_destroy(&p.lock);
+#endif
+}
+
+
+#endif // __PARALLEL_FOR_H__
@@ -49,15 +49,15 @@ public:
     T*   append();
 
     // -size..size-1. 0 is the first one appended. -1 is the last element.
-    T*   get(int i);
+    T*   get(long long i);
 
     // TODO: iterator logic. implement get_next and get_prev.
     // append() and clear() will increment this. will be zero after creation.
     // nothing can reset it.
-    int  get_change_counter();
+    long long get_change_counter();
     void inc_change_counter();
 
-    int  size();
+    long long size();
 
 
     // execute some internal tests. lifesavers while developing this class.
@@ -66,8 +66,8 @@ public:
 
 protected:
 
-    int   m_size;
-    int   m_change_counter;
+    long long m_size;
+    long long m_change_counter;
     int   m_PTRBUF_ELEMENTS;
     int   m_SEGMENT_ELEMENTS;
 
@@ -77,7 +77,7 @@ protected:
     pool_dummy_t** m_ptrbuf;
 
     void* m_create_ptrbuf();
-    void* m_get_ptrbuf(int n);
+    void* m_get_ptrbuf(long long n);
     void  m_release_ptrbuf(void* ptrbuf);
 };
 
@@ -131,16 +131,16 @@ template<class T>
 T* pool_t<T>::append()
 {
     //printf("\n\nAPPEND\n");
-    int index_in_segment = m_size % m_SEGMENT_ELEMENTS;
-    int ptrbuf_num       = m_size / m_SEGMENT_ELEMENTS / m_PTRBUF_ELEMENTS;
-    int segment_num      = m_size / m_SEGMENT_ELEMENTS % m_PTRBUF_ELEMENTS; // segment num in ptrbuf
+    int       index_in_segment = m_size % m_SEGMENT_ELEMENTS;
+    long long ptrbuf_num       = m_size / m_SEGMENT_ELEMENTS / m_PTRBUF_ELEMENTS;
+    int       segment_num      = m_size / m_SEGMENT_ELEMENTS % m_PTRBUF_ELEMENTS; // segment num in ptrbuf
 
     if (!m_ptrbuf)
         m_ptrbuf = (pool_dummy_t**)m_create_ptrbuf();
 
     // find ptrbuf according to ptrbuf_num. create it if not found.
     pool_dummy_t** ptrbuf = m_ptrbuf;
-    for (int i = 0; i < ptrbuf_num; i++)
+    for (long long i = 0; i < ptrbuf_num; i++)
     {
         if (ptrbuf[m_PTRBUF_ELEMENTS])
             ptrbuf = (pool_dummy_t**)ptrbuf[m_PTRBUF_ELEMENTS];
@@ -176,7 +176,7 @@ T* pool_t<T>::append()
 
 
 template<class T>
-T* pool_t<T>::get(int i)
+T* pool_t<T>::get(long long i)
 {
     if (i >= m_size)
         return NULL;
@@ -185,9 +185,9 @@ T* pool_t<T>::get(int i)
     if (i < 0)
         return NULL;
 
-    int index_in_segment = i % m_SEGMENT_ELEMENTS;
-    int ptrbuf_num       = i / m_SEGMENT_ELEMENTS / m_PTRBUF_ELEMENTS;
-    int segment_num      = i / m_SEGMENT_ELEMENTS % m_PTRBUF_ELEMENTS; // segment num in ptrbuf
+    int       index_in_segment = i % m_SEGMENT_ELEMENTS;
+    long long ptrbuf_num       = i / m_SEGMENT_ELEMENTS / m_PTRBUF_ELEMENTS;
+    int       segment_num      = i / m_SEGMENT_ELEMENTS % m_PTRBUF_ELEMENTS; // segment num in ptrbuf
 
     //printf("index_in_segment %i ptrbuf_num %i segment_num %i\n", index_in_segment, ptrbuf_num, segment_num);
     //printf("PTRBUF_ELEMENTS %i SEGMENT_ELEMENTS %i m_size %i\n", m_PTRBUF_ELEMENTS, m_SEGMENT_ELEMENTS, m_size);
@@ -201,7 +201,7 @@ T* pool_t<T>::get(int i)
 
 
 template<class T>
-int pool_t<T>::get_change_counter()
+long long pool_t<T>::get_change_counter()
 {
     return m_change_counter;
 }
@@ -215,7 +215,7 @@ void pool_t<T>::inc_change_counter()
 
 
 template<class T>
-int pool_t<T>::size()
+long long pool_t<T>::size()
 {
     return m_size;
 }
@@ -252,10 +252,10 @@ void pool_t<T>::m_release_ptrbuf(void* ptrbuf)
 
 // return n-th ptrbuf. return NULL if doesn't exist.
 template<class T>
-void* pool_t<T>::m_get_ptrbuf(int n)
+void* pool_t<T>::m_get_ptrbuf(long long n)
 {
     pool_dummy_t** ptrbuf = m_ptrbuf;
-    for (int i = 0; i < n; i++)
+    for (long long i = 0; i < n; i++)
     {
         if (ptrbuf[m_PTRBUF_ELEMENTS])
             ptrbuf = (pool_dummy_t**)ptrbuf[m_PTRBUF_ELEMENTS];
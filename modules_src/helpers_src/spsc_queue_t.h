@@ -0,0 +1,261 @@
+#ifndef __SPSC_QUEUE_T_H__
+#define __SPSC_QUEUE_T_H__
+
+//
+// lock-free single-producer single-consumer ring of plain old data.
+//
+// one thread calls push(), one other thread calls front() and pop(). no
+// locks, no waiting. push() takes only as much as fits and returns how much
+// that was. capacity is rounded up to a power of two.
+//
+// m_head is written only by the producer, m_tail only by the consumer. both
+// are free running 32 bit counters, wraparound is harmless as long as the
+// capacity stays below 2^31. items are written before m_head is published
+// and read before m_tail is published, with a memory barrier in between, so
+// the consumer never sees a half-written item.
+//
+
+#include <string.h> // memcpy
+#include <stdlib.h> // malloc, free
+#include <assert.h>
+
+#ifndef NULL
+#define NULL 0
+#endif
+
+
+#if defined(_MSC_VER)
+    #include <intrin.h>
+    #pragma intrinsic(_ReadWriteBarrier)
+    // x86/x64 aligned 32 bit accesses are atomic and not reordered with
+    // other stores (or loads with loads). only the compiler has to be held back.
+    #define SPSC_BARRIER() _ReadWriteBarrier()
+#else
+    #define SPSC_BARRIER() __sync_synchronize()
+#endif
+
+
+template<class T>
+class spsc_queue_t
+{
+public:
+
+    spsc_queue_t(int capacity=0);
+    ~spsc_queue_t();
+
+    // everything inside will be destroyed. not thread safe.
+    void set_capacity(int capacity);
+
+    // producer. copy up to n items in. return num of items copied.
+    int  push(const T* items, int n);
+
+    // consumer. pointer to the oldest item and the num of items following it
+    // contiguously in memory (*count). *count is 0 if empty. call pop() when
+    // done with them.
+    T*   front(int* count);
+    // consumer. release the n oldest items.
+    void pop(int n);
+
+    // a snapshot. exact only if called from the producer or the consumer
+    // thread while the other one is idle.
+    int  size();
+    int  capacity();
+
+
+    // execute some internal tests. lifesavers while developing this class.
+    void test();
+
+
+protected:
+
+    T*   m_buffer;
+    unsigned int m_mask;
+
+    // keep the producer and consumer counters on separate cache lines
+    char m_pad0[64];
+    volatile unsigned int m_head; // one past the newest. producer writes.
+    char m_pad1[64];
+    volatile unsigned int m_tail; // the oldest. consumer writes.
+    char m_pad2[64];
+
+    unsigned int m_load(volatile unsigned int* p);
+    void m_store(volatile unsigned int* p, unsigned int v);
+};
+
+
+// --------------------------------------------------------------------------
+// ---- LIFECYCLE -----------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+spsc_queue_t<T>::spsc_queue_t(int capacity)
+{
+    m_buffer = NULL;
+    m_mask   = 0;
+    m_head   = 0;
+    m_tail   = 0;
+
+    if (capacity > 0)
+        set_capacity(capacity);
+}
+
+
+template<class T>
+spsc_queue_t<T>::~spsc_queue_t()
+{
+    free(m_buffer);
+}
+
+
+// --------------------------------------------------------------------------
+// ---- METHODS -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+void spsc_queue_t<T>::set_capacity(int capacity)
+{
+    assert(capacity > 0 && capacity <= 0x40000000);
+    unsigned int c = 1;
+    while (c < (unsigned int)capacity)
+        c *= 2;
+
+    free(m_buffer);
+    m_buffer = (T*)malloc(sizeof(T) * c);
+    assert(m_buffer);
+    m_mask = c - 1;
+    m_head = 0;
+    m_tail = 0;
+}
+
+
+template<class T>
+int spsc_queue_t<T>::push(const T* items, int n)
+{
+    if (!m_buffer || n <= 0)
+        return 0;
+
+    unsigned int head = m_head;
+    unsigned int free_count = m_mask + 1 - (head - m_load(&m_tail));
+    if ((unsigned int)n > free_count)
+        n = int(free_count);
+
+    // at most two runs, to the end of the buffer and from the start
+    unsigned int i     = head & m_mask;
+    unsigned int first = m_mask + 1 - i;
+    if (first > (unsigned int)n)
+        first = n;
+    memcpy(m_buffer + i, items, sizeof(T) * first);
+    memcpy(m_buffer, items + first, sizeof(T) * (n - first));
+
+    m_store(&m_head, head + n);
+    return n;
+}
+
+
+template<class T>
+T* spsc_queue_t<T>::front(int* count)
+{
+    *count = 0;
+    if (!m_buffer)
+        return NULL;
+
+    unsigned int tail  = m_tail;
+    unsigned int avail = m_load(&m_head) - tail;
+    unsigned int i     = tail & m_mask;
+    unsigned int run   = m_mask + 1 - i;
+    *count = int(avail < run ? avail : run);
+    return m_buffer + i;
+}
+
+
+template<class T>
+void spsc_queue_t<T>::pop(int n)
+{
+    assert(n >= 0 && (unsigned int)n <= m_head - m_tail);
+    m_store(&m_tail, m_tail + n);
+}
+
+
+template<class T>
+inline int spsc_queue_t<T>::size()
+{
+    return int(m_head - m_tail);
+}
+
+
+template<class T>
+inline int spsc_queue_t<T>::capacity()
+{
+    return m_buffer ? int(m_mask + 1) : 0;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+// read the other thread's counter. everything it wrote before publishing
+// the counter is visible after this.
+template<class T>
+inline unsigned int spsc_queue_t<T>::m_load(volatile unsigned int* p)
+{
+    unsigned int v = *p;
+    SPSC_BARRIER();
+    return v;
+}
+
+
+// publish our counter. everything written before this is visible to the
+// other thread once it sees the new value.
+template<class T>
+inline void spsc_queue_t<T>::m_store(volatile unsigned int* p, unsigned int v)
+{
+    SPSC_BARRIER();
+    *p = v;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- TESTING -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+void spsc_queue_t<T>::test()
+{
+    int count;
+    int items[10] = {0, 1, 2, 3, 4, 5, 6, 7, 8, 9};
+
+    spsc_queue_t<int> a;
+    assert(a.capacity() == 0);
+    assert(a.push(items, 3) == 0);
+    assert(a.front(&count) == NULL && count == 0);
+
+    spsc_queue_t<int> b(5);
+    assert(b.capacity() == 8);
+    assert(b.push(items, 6) == 6);
+    assert(b.size() == 6);
+    int* p = b.front(&count);
+    assert(count == 6 && p[0] == 0 && p[5] == 5);
+    b.pop(4);
+    assert(b.size() == 2);
+
+    // only 6 fit. wraps around the end of the buffer.
+    assert(b.push(items, 10) == 6);
+    assert(b.size() == 8);
+    p = b.front(&count);
+    assert(count == 4 && p[0] == 4 && p[1] == 5 && p[2] == 0 && p[3] == 1);
+    b.pop(4);
+    p = b.front(&count);
+    assert(count == 4 && p[0] == 2 && p[3] == 5);
+    b.pop(4);
+    assert(b.size() == 0);
+    b.front(&count);
+    assert(count == 0);
+}
+
+
+#endif // __SPSC_QUEUE_T_H__
@@ -0,0 +1,153 @@
+// append/read microbenchmark. flat structure-of-arrays MipBuf_t against the
+// old pool_t-backed MipBufPool_t.
+//
+// linux:  g++ -O2 mip_buf_bench.cpp ../mip_file.cpp -I.. -I../../helpers_src -o mip_buf_bench
+// macosx: gcc -O2 mip_buf_bench.cpp ../mip_file.cpp -I.. -I../../helpers_src -lstdc++ -o mip_buf_bench
+//
+// usage:  ./mip_buf_bench [num_samples ..]
+//         default is 1000000 10000000 100000000. 10^9 samples needs ~24GB
+//         RAM for both engines together.
+//
+// the checksum printed after every run is the sum of the level-0 avg
+// values, the same for both engines if they stored the same samples.
+
+#include "mip_buf_t.h"
+#include "mip_buf_pool_t.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+
+#define BLOCK_SIZE 4096
+
+
+static double now()
+{
+    return double(clock()) / CLOCKS_PER_SEC;
+}
+
+
+static double checksum(MipBuf_t<float>& m)
+{
+    double sum = 0.;
+    MipBufEntry<float> e(0, 0, 0);
+    for (mip_index_t i = 0; i < m.size(); i++)
+        if (m.get(i, &e))
+            sum += e.avg;
+    return sum;
+}
+
+
+static double checksum(MipBufPool_t<float>& m)
+{
+    double sum = 0.;
+    for (int i = 0; i < m.m_buf.size(); i++)
+        sum += m.get(i)->avg;
+    return sum;
+}
+
+
+static void report(const char* name, int n, double seconds, double checksum)
+{
+    printf("  %-34s %8.3fs %8.1f Msamples/s   (checksum %g)\n",
+        name, seconds, n / seconds / 1e6, checksum);
+}
+
+
+// read 'n' random level-0 entries
+static void bench_get(int n)
+{
+    {
+        MipBuf_t<float> m;
+        for (int i = 0; i < n; i += BLOCK_SIZE)
+        {
+            float block[BLOCK_SIZE];
+            int c = n - i < BLOCK_SIZE ? n - i : BLOCK_SIZE;
+            for (int j = 0; j < c; j++)
+                block[j] = float((i + j) & 0xff);
+            m.append_array(block, c);
+        }
+        unsigned int r = 1;
+        double sum = 0.;
+        double t = now();
+        for (int i = 0; i < n; i++)
+        {
+            r = r * 1103515245 + 12345;
+            MipBufEntry<float> e(0, 0, 0);
+            m.get(r % n, &e);
+            sum += e.avg;
+        }
+        report("MipBuf_t random get()", n, now() - t, sum);
+    }
+    {
+        MipBufPool_t<float> m;
+        for (int i = 0; i < n; i++)
+            m.append(float(i & 0xff));
+        unsigned int r = 1;
+        double sum = 0.;
+        double t = now();
+        for (int i = 0; i < n; i++)
+        {
+            r = r * 1103515245 + 12345;
+            sum += m.get(r % n)->avg;
+        }
+        report("MipBufPool_t random get()", n, now() - t, sum);
+    }
+}
+
+
+static void bench_append(int n)
+{
+    float* block = new float[BLOCK_SIZE];
+    for (int j = 0; j < BLOCK_SIZE; j++)
+        block[j] = float(j & 0xff);
+
+    {
+        MipBuf_t<float> m;
+        double t = now();
+        for (int i = 0; i < n; i++)
+            m.append(float(i & 0xff));
+        report("MipBuf_t append()", n, now() - t, checksum(m));
+    }
+    {
+        MipBuf_t<float> m;
+        double t = now();
+        for (int i = 0; i < n; i += BLOCK_SIZE)
+            m.append_array(block, n - i < BLOCK_SIZE ? n - i : BLOCK_SIZE);
+        report("MipBuf_t append_array()", n, now() - t, checksum(m));
+    }
+    {
+        MipBufPool_t<float> m;
+        double t = now();
+        for (int i = 0; i < n; i++)
+            m.append(float(i & 0xff));
+        report("MipBufPool_t append()", n, now() - t, checksum(m));
+    }
+    {
+        MipBufPool_t<float> m;
+        double t = now();
+        for (int i = 0; i < n; i += BLOCK_SIZE)
+            m.append_array(block, n - i < BLOCK_SIZE ? n - i : BLOCK_SIZE);
+        report("MipBufPool_t append_array()", n, now() - t, checksum(m));
+    }
+
+    delete [] block;
+}
+
+
+int main(int argc, char** argv)
+{
+    int default_sizes[] = {1000000, 10000000, 100000000};
+    int num_sizes = argc > 1 ? argc - 1 : 3;
+
+    for (int i = 0; i < num_sizes; i++)
+    {
+        int n = argc > 1 ? atoi(argv[i + 1]) : default_sizes[i];
+        printf("%i samples\n", n);
+        bench_append(n);
+        bench_get(n);
+    }
+
+    return 0;
+}
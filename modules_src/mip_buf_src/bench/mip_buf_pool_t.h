@@ -0,0 +1,254 @@
+#ifndef __MIP_BUF_POOL_T_H__
+#define __MIP_BUF_POOL_T_H__
+
+//
+// the original pool_t-backed MipBuf implementation, where every level is a
+// separate MipBufPool_t object reached through m_child pointers. replaced by
+// the flat structure-of-arrays storage in mip_buf_t.h and kept only as the
+// baseline for bench/mip_buf_bench.cpp.
+//
+
+#include "math.h"
+
+
+#include "pool_t.h"
+
+
+#define MIP_POOL_MIN(X,Y) ((X) < (Y) ? (X) : (Y))
+#define MIP_POOL_MAX(X,Y) ((X) > (Y) ? (X) : (Y))
+
+
+template<class T>
+struct MipBufPoolEntry
+{
+    MipBufPoolEntry(T _minval, T _maxval, T _avg): minval(_minval), maxval(_maxval), avg(_avg) {}
+    T minval;
+    T maxval;
+    T avg;
+};
+
+
+template<class T>
+class MipBufPool_t
+{
+public:
+    MipBufPool_t();
+    ~MipBufPool_t();
+
+    void append(T avg);
+    void append_minmaxavg(T minval, T maxval, T avg);
+    // bulk versions of append() and append_minmaxavg(). all mip levels are
+    // built level by level after the whole block is in, instead of one
+    // recursive child append per sample.
+    void append_array(const T* avg, int n);
+    void append_minmaxavg_arrays(const T* minval, const T* maxval, const T* avg, int n);
+
+    void get_buf(
+            float start_index, float end_index, float resolution,
+            MipBufPool_t** out_buf,
+            float* out_start_pixel, int* out_start_index,
+            float* out_end_pixel,   int* out_end_index);
+
+    MipBufPoolEntry<T>* get(int i);
+
+    pool_t<MipBufPoolEntry<T> > m_buf;
+
+private:
+
+    MipBufPool_t* m_child;
+
+    // append to m_child every pair of entries completed since m_buf had
+    // 'first' entries. recurses once per level, not once per entry.
+    void m_update_child(int first);
+};
+
+
+// --------------------------------------------------------------------------
+// ---- LIFECYCLE -----------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+MipBufPool_t<T>::MipBufPool_t(): m_buf(20000, 2000)
+{
+    m_child = NULL;
+}
+
+
+template<class T>
+MipBufPool_t<T>::~MipBufPool_t()
+{
+    delete m_child;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- METHODS -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+inline void MipBufPool_t<T>::append(T avg)
+{
+    append_minmaxavg(avg, avg, avg);
+}
+
+
+template<class T>
+void MipBufPool_t<T>::append_minmaxavg(T minval, T maxval, T avg)
+{
+    MipBufPoolEntry<T>* e = m_buf.append();
+    e->minval = minval;
+    e->maxval = maxval;
+    e->avg    = avg;
+
+    if ((m_buf.size() & 1) == 0)
+    {
+        if (!m_child)
+            m_child = new MipBufPool_t<T>();
+        MipBufPoolEntry<T>* e1 = m_buf.get(-2);
+        MipBufPoolEntry<T>* e2 = m_buf.get(-1);
+        // TODO: avg1 + avg2 overflow if unsigned char?
+        m_child->append_minmaxavg(MIP_POOL_MIN(e1->minval, e2->minval), MIP_POOL_MAX(e1->maxval, e2->maxval), (e1->avg + e2->avg) / 2.);
+    }
+}
+
+
+template<class T>
+void MipBufPool_t<T>::append_array(const T* avg, int n)
+{
+    int first = m_buf.size();
+    for (int i = 0; i < n; i++)
+    {
+        MipBufPoolEntry<T>* e = m_buf.append();
+        e->minval = avg[i];
+        e->maxval = avg[i];
+        e->avg    = avg[i];
+    }
+    m_update_child(first);
+}
+
+
+template<class T>
+void MipBufPool_t<T>::append_minmaxavg_arrays(const T* minval, const T* maxval, const T* avg, int n)
+{
+    int first = m_buf.size();
+    for (int i = 0; i < n; i++)
+    {
+        MipBufPoolEntry<T>* e = m_buf.append();
+        e->minval = minval[i];
+        e->maxval = maxval[i];
+        e->avg    = avg[i];
+    }
+    m_update_child(first);
+}
+
+
+// out_start_pixel and start_index always go in pairs,
+// as do out_end_pixel and end_index.
+//
+// "resolution" here is a strange parameter.
+// for example if it's 1, out_start_pixel and out_end_pixel will be 0 and 1,
+// seemingly taking 2 pixels. but actually the space between pixels 0 and 1 will
+// be 1 pixel wide.
+//
+// start_index and end_index treat the samples as a continuous line. 0..1) is first sample,
+// 1..2) is second sample and so on.
+// out_start_index and out_end_index are traditional sample indices.
+template<class T>
+void MipBufPool_t<T>::get_buf(
+        float start_index, float end_index, float resolution,
+        MipBufPool_t** out_buf,
+        float* out_start_pixel, int* out_start_index,
+        float* out_end_pixel,   int* out_end_index)
+{
+    // sanity check
+    if (end_index <= start_index || resolution <= 0.1)
+    {
+        *out_buf = this;
+        *out_start_pixel = 0;
+        *out_start_index = 0;
+        *out_end_pixel   = 0;
+        *out_end_index   = 0;
+    }
+
+    // mathematically not exactly what it says.
+    float samples_per_pixel = (end_index - start_index) / resolution;
+    float pixels_per_sample = resolution / (end_index - start_index);
+
+    if (samples_per_pixel >= 2. && m_child && (end_index - start_index) >= 4. + 1.)
+    {
+         // too much resolution. get child buf.
+        m_child->get_buf(start_index / 2., end_index / 2., resolution,
+                out_buf, out_start_pixel, out_start_index, out_end_pixel, out_end_index);
+    }
+    else
+    {
+        int i_start = round(start_index);
+        int i_end   = round(end_index) - 1;
+
+        if (i_start < 0)
+            i_start = 0;
+
+        if (i_end >= m_buf.size())
+            i_end = m_buf.size() - 1;
+
+        *out_start_pixel = (i_start + 0.5 - start_index) * pixels_per_sample;
+        *out_end_pixel   = resolution - (end_index - i_end - 0.5) * pixels_per_sample;
+
+        *out_start_index = i_start;
+        *out_end_index   = i_end;
+
+        //if (*out_end_pixel <= *out_start_pixel)
+        //    printf("ERROR: out_start_pixel %.4f out_end_pixel %.4f start_index %.4f end_index %.4f i_start %i i_end %i mbufsize %i\n",
+        //            *out_start_pixel, *out_end_pixel, start_index, end_index, i_start, i_end, m_buf.size());
+
+        *out_buf = this;
+    }
+}
+
+
+template<class T>
+MipBufPoolEntry<T>* MipBufPool_t<T>::get(int i)
+{
+    return m_buf.get(i);
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+void MipBufPool_t<T>::m_update_child(int first)
+{
+    // if 'first' is odd, the entry before it is the first half of a pair
+    // that the new entries completed.
+    int i   = first & ~1;
+    int end = m_buf.size() & ~1;
+
+    if (i >= end)
+        return;
+
+    if (!m_child)
+        m_child = new MipBufPool_t<T>();
+
+    int child_first = m_child->m_buf.size();
+
+    for (; i < end; i += 2)
+    {
+        MipBufPoolEntry<T>* e1 = m_buf.get(i);
+        MipBufPoolEntry<T>* e2 = m_buf.get(i + 1);
+        MipBufPoolEntry<T>* c  = m_child->m_buf.append();
+        c->minval = MIP_POOL_MIN(e1->minval, e2->minval);
+        c->maxval = MIP_POOL_MAX(e1->maxval, e2->maxval);
+        // TODO: avg1 + avg2 overflow if unsigned char?
+        c->avg    = (e1->avg + e2->avg) / 2.;
+    }
+
+    m_child->m_update_child(child_first);
+}
+
+
+#endif // __MIP_BUF_POOL_T_H__
@@ -1,3 +1,6 @@
+import numpy
+
+
 #
 # c++
 #
@@ -11,26 +14,148 @@ cdef extern from "mip_buf_renderer.h":
         float avg
 
     struct cpp_MipBufRenderer "MipBufRenderer":
-        void  (*append)(float avg)
-        void  (*append_minmaxavg)(float minval, float maxval, float avg)
-        void  (*render_avg)(float start_index, float end_index, float resolution)
-        void  (*render_minmax)(float start_index, float end_index, float resolution)
-        cpp_MipBufEntryFloat* (*get)(int i)
-        int   (*size)()
-        int   (*get_change_counter)()
+        int   (*get_sample_type)()
+        void  (*append)(float avg) except +
+        void  (*append_minmaxavg)(float minval, float maxval, float avg) except +
+        void  (*append_array)(float* avg, int n) except +
+        void  (*append_minmaxavg_arrays)(float* minval, float* maxval, float* avg, int n) except +
+        void  (*append_raw_array)(void* avg, int n) except +
+        void  (*append_raw_minmaxavg_arrays)(void* minval, void* maxval, void* avg, int n) except +
+        void  (*append_arrays_parallel)(float* minval, float* maxval, float* avg, long long n, int num_threads) except + nogil
+        void  (*append_raw_arrays_parallel)(void* minval, void* maxval, void* avg, long long n, int num_threads) except + nogil
+        int   (*push)(float avg) nogil
+        int   (*push_array)(float* avg, int n) nogil
+        int   (*push_minmaxavg_arrays)(float* minval, float* maxval, float* avg, int n) nogil
+        int   (*drain)() except +
+        long long (*get_dropped)()
+        int   (*queue_free)()
+        bint  (*create_file)(char* path)
+        bint  (*open_file)(char* path, bint writable)
+        bint  (*flush_file)()
+        bint  (*has_file)()
+        bint  (*is_writable)()
+        int   (*append_timestamps)(double* timestamps, int n)
+        int   (*get_timestamps)(long long start, int n, double* out)
+        long long (*num_timestamps)()
+        int   (*get_user_data)(char* out, int max_size)
+        bint  (*set_user_data)(char* data, int size)
+        void  (*render_avg)(double start_index, double end_index, double resolution) except +
+        void  (*render_minmax)(double start_index, double end_index, double resolution) except +
+        void  (*render_m4)(double start_index, double end_index, double resolution) except +
+        void  (*render_density)(double start_index, double end_index, double resolution, double value_min, double value_max, int height) except +
+        int   (*get_num_vertices)()
+        void  (*set_use_vbo)(bint use_vbo)
+        bint  (*get_use_vbo)()
+        void  (*release_gl)()
+        bint  (*get)(long long i, cpp_MipBufEntryFloat* out)
+        int   (*get_avg)(long long start, int n, float* out)
+        bint  (*range_stats)(long long start, long long end, float* minval, float* maxval, double* mean, long long* count)
+        void  (*set_trigger)(int mode, double level, double level2, long long holdoff) except +
+        long long (*find_trigger)(long long start, long long end)
+        long long (*num_triggers)()
+        int   (*get_triggers)(long long start, long long end, long long* out, int max_n)
+        long long (*last_trigger)(long long end)
+        int   (*find)(int mode, double level, double level2, long long start, long long end, bint backward, long long* out, int max_n)
+        long long (*size)()
+        long long (*first)()
+        long long (*get_change_counter)()
         void  (*inc_change_counter)()
 
     void delete "delete " (void *o)
-    cpp_MipBufRenderer* new_MipBufRenderer "new MipBufRenderer" ()
+    cpp_MipBufRenderer* new_MipBufRenderer "MipBufRenderer::create" (int sample_type, int capacity, int queue_size, int branching, int skip_levels) except +
+    int MipBufRenderer_file_sample_type "MipBufRenderer::file_sample_type" (char* path)
+
+
+cdef extern from "mip_derived.h":
+
+    struct cpp_MipDerived "MipDerived":
+        void  (*add_source)(cpp_MipBufRenderer* source, double freq, double gain) except +
+        void  (*set_offset)(double offset)
+        void  (*set_filter)(int filter, double param) except +
+        int   (*update)() except +
+
+    cpp_MipDerived* new_MipDerived "new MipDerived" (cpp_MipBufRenderer* out, double freq) except +
+
+
+# storage types of MipBufRenderer, in the order of the MIP_FLOAT32, MIP_INT8, .. enum
+SAMPLE_TYPES = ("float32", "int8", "uint8", "int16", "uint16", "int32")
+
+# trigger modes of MipBufRenderer.set_trigger, in the order of the MIP_TRIGGER_NONE, MIP_TRIGGER_RISING, .. enum
+TRIGGER_MODES = ("none", "rising", "falling", "window")
+
+# modes of MipBufRenderer.find_next, find_prev and find_all, in the order of the MIP_SEARCH_ABOVE, .. enum
+SEARCH_MODES = ("above", "below", "outside", "inside")
+
+# filters of MipDerived.set_filter, in the order of the MIP_FILTER_NONE, MIP_FILTER_MOVING_AVG, .. enum
+FILTERS = ("none", "moving_avg", "lowpass")
+
+ctypedef signed char    mip_int8
+ctypedef unsigned char  mip_uint8
+ctypedef short          mip_int16
+ctypedef unsigned short mip_uint16
+ctypedef int            mip_int32
+
+ctypedef fused mip_sample:
+    float
+    mip_int8
+    mip_uint8
+    mip_int16
+    mip_uint16
+    mip_int32
+
+
+cdef inline int _sample_type_of(mip_sample x):
+    if mip_sample is float:
+        return 0
+    elif mip_sample is mip_int8:
+        return 1
+    elif mip_sample is mip_uint8:
+        return 2
+    elif mip_sample is mip_int16:
+        return 3
+    elif mip_sample is mip_uint16:
+        return 4
+    else:
+        return 5
 
 
 cdef class MipBufRenderer:
 
     cdef cpp_MipBufRenderer* instance
+    cdef int capacity, queue_size, branching, skip_levels
+    # num of MipDerived pointing to instance. open_file() can't replace it then.
+    cdef int derived_refs
+    # spectrum.Spectrum keeps only weak references to renderers
+    cdef object __weakref__
 
-    def __cinit__(self):
+    def __cinit__(self, int capacity=0, int queue_size=0, int branching=2, int skip_levels=0, sample_type="float32"):
+        """
+        capacity 0 keeps every sample. otherwise every mip level keeps only its newest 'capacity' entries:
+        the last 'capacity' samples at full resolution, the last 2*capacity at half resolution and so on.
+        queue_size 0 disables push*(). otherwise it's the num of samples that can wait in the queue for drain().
+        branching: every 'branching' entries of a mip level make one entry of the next. 2, 4, 8, .. 256.
+        skip_levels: num of levels left out after level 0. see mip_buf_t.h
+        sample_type: storage type, one of SAMPLE_TYPES. "uint8" takes a quarter of the memory of "float32". samples
+        of other types are rounded and clamped to it on append.
+        appending raises MemoryError if the storage can't grow. the samples appended before stay, but the coarser mip
+        levels may miss the last ones.
+        """
         #print "msg MipBufRenderer pyx creation"
-        self.instance = new_MipBufRenderer()
+        if branching < 2 or branching > 256 or branching & (branching - 1):
+            raise ValueError, "MipBufRenderer branching has to be a power of two 2..256"
+        if skip_levels < 0 or branching ** (skip_levels + 1) >= 2 ** 31:
+            raise ValueError, "MipBufRenderer skip_levels out of range"
+        if capacity and capacity < branching ** (skip_levels + 1):
+            raise ValueError, "MipBufRenderer capacity has to be 0 or at least branching^(skip_levels+1)"
+        if queue_size < 0:
+            raise ValueError, "MipBufRenderer queue_size can't be negative"
+        if sample_type not in SAMPLE_TYPES:
+            raise ValueError, "MipBufRenderer sample_type has to be one of %s" % ", ".join(SAMPLE_TYPES)
+        self.capacity = capacity
+        self.queue_size = queue_size
+        self.branching = branching
+        self.skip_levels = skip_levels
+        self.instance = new_MipBufRenderer(SAMPLE_TYPES.index(sample_type), capacity, queue_size, branching, skip_levels)
 
     def __dealloc__(self):
         #print "msg MipBufRenderer pyx destruction"
@@ -38,28 +163,374 @@ cdef class MipBufRenderer:
 
 
     def append(self, float avg):
+        self._check_writable()
         self.instance.append(avg)
 
     def append_minmaxavg(self, float minval, float maxval, float avg):
+        self._check_writable()
         self.instance.append_minmaxavg(minval, maxval, avg)
 
-    def render_avg(self, float start_index, float end_index, float resolution):
+    def append_array(self, avg):
+        """ append every value of a float buffer (numpy array of any float dtype, list, ..) or of a numpy array of the
+        sample_type (numpy.uint8 for "uint8", ..). the latter is copied as is. """
+        self._append_array(self._samples(avg))
+
+    def _append_array(self, mip_sample[::1] avg):
+        self._check_writable()
+        if mip_sample is not float:
+            self._check_sample_type(_sample_type_of(<mip_sample>0))
+        if not avg.shape[0]:
+            return
+        if mip_sample is float:
+            self.instance.append_array(&avg[0], avg.shape[0])
+        else:
+            self.instance.append_raw_array(&avg[0], avg.shape[0])
+
+    def append_minmaxavg_arrays(self, minval, maxval, avg):
+        """ bulk append_minmaxavg. all three buffers have to be of the same length """
+        self._append_minmaxavg_arrays(*self._samples(minval, maxval, avg))
+
+    def _append_minmaxavg_arrays(self, mip_sample[::1] minval, mip_sample[::1] maxval, mip_sample[::1] avg):
+        self._check_writable()
+        if not (minval.shape[0] == maxval.shape[0] == avg.shape[0]):
+            raise ValueError, "minval, maxval and avg have different lengths"
+        if mip_sample is not float:
+            self._check_sample_type(_sample_type_of(<mip_sample>0))
+        if not avg.shape[0]:
+            return
+        if mip_sample is float:
+            self.instance.append_minmaxavg_arrays(&minval[0], &maxval[0], &avg[0], avg.shape[0])
+        else:
+            self.instance.append_raw_minmaxavg_arrays(&minval[0], &maxval[0], &avg[0], avg.shape[0])
+
+    def append_array_parallel(self, avg, int num_threads=0):
+        """ append_array for a whole recording. the mip levels are built on num_threads threads (0: one per core)
+        with the GIL released. the result is exactly the same as append_array. """
+        avg = self._samples(avg)
+        self._append_minmaxavg_arrays_parallel(avg, avg, avg, num_threads)
+
+    def append_minmaxavg_arrays_parallel(self, minval, maxval, avg, int num_threads=0):
+        """ append_minmaxavg_arrays for a whole recording, see append_array_parallel """
+        minval, maxval, avg = self._samples(minval, maxval, avg)
+        self._append_minmaxavg_arrays_parallel(minval, maxval, avg, num_threads)
+
+    def _append_minmaxavg_arrays_parallel(self, mip_sample[::1] minval, mip_sample[::1] maxval, mip_sample[::1] avg,
+                                          int num_threads):
+        cdef mip_sample* p_minval
+        cdef mip_sample* p_maxval
+        cdef mip_sample* p_avg
+        cdef long long n = avg.shape[0]
+        self._check_writable()
+        if not (minval.shape[0] == maxval.shape[0] == avg.shape[0]):
+            raise ValueError, "minval, maxval and avg have different lengths"
+        if mip_sample is not float:
+            self._check_sample_type(_sample_type_of(<mip_sample>0))
+        if not n:
+            return
+        p_minval = &minval[0]
+        p_maxval = &maxval[0]
+        p_avg = &avg[0]
+        if mip_sample is float:
+            with nogil:
+                self.instance.append_arrays_parallel(p_minval, p_maxval, p_avg, n, num_threads)
+        else:
+            with nogil:
+                self.instance.append_raw_arrays_parallel(p_minval, p_maxval, p_avg, n, num_threads)
+
+    def push(self, float avg):
+        """ thread safe append() for one producer thread. return 1 if queued, 0 if the queue was full """
+        cdef int r
+        with nogil:
+            r = self.instance.push(avg)
+        return r
+
+    def push_array(self, avg):
+        """ thread safe append_array() for one producer thread. the GIL is released while copying.
+        return num of samples queued, the rest didn't fit and were dropped. """
+        return self._push_array(numpy.ascontiguousarray(avg, numpy.float32))
+
+    def _push_array(self, float[::1] avg):
+        cdef float* p_avg
+        cdef int n = avg.shape[0]
+        cdef int r = 0
+        if n:
+            p_avg = &avg[0]
+            with nogil:
+                r = self.instance.push_array(p_avg, n)
+        return r
+
+    def push_minmaxavg_arrays(self, minval, maxval, avg):
+        """ thread safe append_minmaxavg_arrays() for one producer thread. return num of samples queued. """
+        return self._push_minmaxavg_arrays(numpy.ascontiguousarray(minval, numpy.float32),
+                                           numpy.ascontiguousarray(maxval, numpy.float32),
+                                           numpy.ascontiguousarray(avg, numpy.float32))
+
+    def _push_minmaxavg_arrays(self, float[::1] minval, float[::1] maxval, float[::1] avg):
+        cdef float* p_minval
+        cdef float* p_maxval
+        cdef float* p_avg
+        cdef int n = avg.shape[0]
+        cdef int r = 0
+        if not (minval.shape[0] == maxval.shape[0] == avg.shape[0]):
+            raise ValueError, "minval, maxval and avg have different lengths"
+        if n:
+            p_minval = &minval[0]
+            p_maxval = &maxval[0]
+            p_avg = &avg[0]
+            with nogil:
+                r = self.instance.push_minmaxavg_arrays(p_minval, p_maxval, p_avg, n)
+        return r
+
+    def drain(self):
+        """ move the pushed samples into the mip levels. call from the render thread. return num of samples moved. """
+        return self.instance.drain()
+
+    def get_dropped(self):
+        """ num of pushed samples that didn't fit into the queue """
+        return self.instance.get_dropped()
+
+    def queue_free(self):
+        """ num of samples push*() can take right now. call from the producer thread. """
+        return self.instance.queue_free()
+
+    # memory-mapped files. see mip_file.h
+
+    def create_file(self, char* path):
+        """ keep the samples in a new file from now on. everything appended so far is copied there. """
+        if not self.instance.create_file(path):
+            raise IOError, "can't create mip file %s" % path
+
+    def open_file(self, char* path, bint writable=False):
+        """ show the samples of a file saved before. only on an empty MipBufRenderer. nothing is read until
+        rendered, so any size opens instantly. writable: continue appending to the file. the sample type of the
+        file replaces the one given to the constructor, not while a MipDerived uses this MipBufRenderer. """
+        cdef int sample_type = MipBufRenderer_file_sample_type(path)
+        cdef cpp_MipBufRenderer* instance
+        if 0 <= sample_type < len(SAMPLE_TYPES) and sample_type != self.instance.get_sample_type() and \
+                self.instance.size() == 0 and not self.instance.has_file():
+            if self.derived_refs:
+                raise IOError, "can't open mip file %s of another sample type while a MipDerived uses this " \
+                               "MipBufRenderer" % path
+            instance = new_MipBufRenderer(sample_type, self.capacity, self.queue_size, self.branching, self.skip_levels)
+            delete(self.instance)
+            self.instance = instance
+        if not self.instance.open_file(path, writable):
+            raise IOError, "can't open mip file %s" % path
+
+    def flush_file(self):
+        """ write everything to disk. does nothing if there's no file. """
+        if not self.instance.flush_file():
+            raise IOError, "mip file flush failed"
+
+    def has_file(self):
+        return self.instance.has_file()
+
+    def is_writable(self):
+        """ False if the samples are in a file opened read-only """
+        return self.instance.is_writable()
+
+    def append_timestamps(self, double[::1] timestamps):
+        """ save timestamps (a contiguous numpy.float64 array) in the file. return num saved, 0 if there's no file. """
+        if timestamps.shape[0]:
+            return self.instance.append_timestamps(&timestamps[0], timestamps.shape[0])
+        return 0
+
+    def get_timestamps(self):
+        """ list of all the timestamps saved in the file """
+        cdef double block[4096]
+        cdef long long i = 0
+        cdef int n
+        result = []
+        while i < self.instance.num_timestamps():
+            n = self.instance.get_timestamps(i, 4096, block)
+            if not n:
+                break
+            result.extend([block[j] for j in range(n)])
+            i += n
+        return result
+
+    def get_user_data(self):
+        """ the free-form string saved in the file header """
+        cdef char block[16384]
+        cdef int n = self.instance.get_user_data(block, sizeof(block))
+        return block[:min(n, sizeof(block))]
+
+    def set_user_data(self, bytes data):
+        """ at most 16384 bytes """
+        if not self.instance.set_user_data(data, len(data)):
+            raise IOError, "can't save user data to the mip file"
+
+    def _check_writable(self):
+        if not self.instance.is_writable():
+            raise IOError, "MipBufRenderer file is read-only"
+
+    def _samples(self, *buffers):
+        """ buffers as contiguous numpy arrays of one type for the fused _append methods. arrays of the sample_type
+        stay as they are, float buffers and lists become float32 (rounded and clamped to the sample_type in c++).
+        converted once, so a float64 array costs one copy. """
+        dtype = numpy.dtype(self.get_sample_type())
+        arrays = [numpy.asarray(b) for b in buffers]
+        if any(a.dtype != dtype for a in arrays):
+            for b, a in zip(buffers, arrays):
+                if a.dtype.kind != "f" and a.dtype != dtype and not isinstance(b, list):
+                    raise TypeError, "%s samples for a %s MipBufRenderer" % (a.dtype.name, dtype.name)
+            dtype = numpy.float32
+        arrays = [numpy.ascontiguousarray(a, dtype) for a in arrays]
+        return arrays[0] if len(arrays) == 1 else arrays
+
+    def _check_sample_type(self, int sample_type):
+        if sample_type != self.instance.get_sample_type():
+            raise TypeError, "%s samples for a %s MipBufRenderer" % (SAMPLE_TYPES[sample_type], self.get_sample_type())
+
+    def get_sample_type(self):
+        """ storage type, one of SAMPLE_TYPES """
+        return SAMPLE_TYPES[self.instance.get_sample_type()]
+
+    def render_avg(self, double start_index, double end_index, double resolution):
         self.instance.render_avg(start_index, end_index, resolution)
 
-    def render_minmax(self, float start_index, float end_index, float resolution):
+    def render_minmax(self, double start_index, double end_index, double resolution):
         self.instance.render_minmax(start_index, end_index, resolution)
 
-    def get(self, i):
+    def render_m4(self, double start_index, double end_index, double resolution):
+        """ first/min/max/last of every pixel column as one line strip. exact envelope, at most 4 vertices per pixel. """
+        self.instance.render_m4(start_index, end_index, resolution)
+
+    def render_density(self, double start_index, double end_index, double resolution, double value_min,
+                       double value_max, int height):
+        """ histogram of the samples of every pixel column, 'height' bins from raw value_min to value_max, drawn as an
+        alpha texture in the current color. columns already drawn at the same zoom are not computed again. see
+        mip_density.h """
+        self.instance.render_density(start_index, end_index, resolution, value_min, value_max, height)
+
+    def get_num_vertices(self):
+        """ num of vertices the last render_*() call sent to GL """
+        return self.instance.get_num_vertices()
+
+    def set_use_vbo(self, bint use_vbo):
+        self.instance.set_use_vbo(use_vbo)
+
+    def get_use_vbo(self):
+        return self.instance.get_use_vbo()
+
+    def release_gl(self):
+        """ delete the vertex buffers and textures. the GL context they were made in has to be current. garbage
+        collection frees only memory. """
+        self.instance.release_gl()
+
+    def get(self, long long i):
         """ return (minval, maxval, avg) of the sample at index i """
-        cdef cpp_MipBufEntryFloat* e
-        e = self.instance.get(i)
-        if not e:
+        cdef cpp_MipBufEntryFloat e
+        if not self.instance.get(i, &e):
             raise IndexError, "MipBufRenderer index out of range"
         return e.minval, e.maxval, e.avg
 
+    def get_avg_array(self, long long start, float[::1] out):
+        """ copy the avg of samples start..start+len(out)-1 into out (a contiguous numpy.float32 array). return num
+        copied, fewer if the range reaches past the last sample, 0 if sample 'start' is not kept. """
+        if out.shape[0]:
+            return self.instance.get_avg(start, out.shape[0], &out[0])
+        return 0
+
+    def range_stats(self, long long start, long long end):
+        """ return (minval, maxval, mean, count) of samples start..end-1, or None if none of them is kept.
+        logarithmic in end - start, no loop over the samples. count is the num of samples the stats cover, less than
+        end - start if the range reaches outside first()..size(). """
+        cdef float minval, maxval
+        cdef double mean
+        cdef long long count
+        if not self.instance.range_stats(start, end, &minval, &maxval, &mean, &count):
+            return None
+        return minval, maxval, mean, count
+
+    # oscilloscope trigger. see mip_trigger_t.h
+
+    def set_trigger(self, mode, double level=0., double level2=0., long long holdoff=0):
+        """ trigger on the avg of the samples. mode is one of TRIGGER_MODES. rising: the sample where avg goes from
+        below level to level or above. falling: from above level to level or below. window: the sample where avg
+        leaves level..level2. holdoff: num of samples after a trigger that can't trigger. levels are raw values.
+        the samples kept so far are indexed right away, new ones as they are appended. """
+        if mode not in TRIGGER_MODES:
+            raise ValueError, "MipBufRenderer trigger mode has to be one of %s" % ", ".join(TRIGGER_MODES)
+        if holdoff < 0:
+            raise ValueError, "MipBufRenderer trigger holdoff can't be negative"
+        self.instance.set_trigger(TRIGGER_MODES.index(mode), level, level2, holdoff)
+
+    def find_trigger(self, long long start, long long end):
+        """ the first sample of start..end-1 that triggers, None if none. holdoff and the index are not used.
+        whole mip entries that can't hold a trigger are skipped, a quiet range costs O(log(end - start)). """
+        cdef long long i = self.instance.find_trigger(start, end)
+        return i if i >= 0 else None
+
+    def num_triggers(self):
+        """ num of triggers indexed since set_trigger """
+        return self.instance.num_triggers()
+
+    def get_triggers(self, long long start, long long end):
+        """ list of the indexed triggers in start..end-1. triggers of samples not kept anymore don't count. """
+        cdef long long block[4096]
+        cdef int n
+        result = []
+        while start < end:
+            n = self.instance.get_triggers(start, end, block, 4096)
+            result.extend([block[j] for j in range(n)])
+            if n < 4096:
+                break
+            start = block[n - 1] + 1
+        return result
+
+    def last_trigger(self, end=None):
+        """ the last indexed trigger before 'end' (default: the newest one), None if none """
+        cdef long long i = self.instance.last_trigger(self.instance.size() + 1 if end is None else end)
+        return i if i >= 0 else None
+
+    # threshold search. see mip_search_t.h
+
+    def find_next(self, long long start, mode, double level, double level2=0., end=None):
+        """ the first sample at or after 'start' (and before 'end') that matches, None if none. mode is one of
+        SEARCH_MODES. above: the maxval of the sample is above level. below: minval below level. outside: above level2
+        or below level. inside: minval and maxval within level..level2. levels are raw values. mip entries that can't
+        hold a match are skipped, a range without matches costs O(log(end - start)). """
+        found = self._find(mode, level, level2, start, self.instance.size() if end is None else end, False, 1)
+        return found[0] if found else None
+
+    def find_prev(self, long long end, mode, double level, double level2=0., long long start=0):
+        """ the last sample before 'end' (and at or after 'start') that matches, None if none. see find_next """
+        found = self._find(mode, level, level2, start, end, True, 1)
+        return found[0] if found else None
+
+    def find_all(self, mode, double level, double level2=0., long long start=0, end=None):
+        """ list of the matching samples of start..end-1. see find_next """
+        return self._find(mode, level, level2, start, self.instance.size() if end is None else end, False, -1)
+
+    def _find(self, mode, double level, double level2, long long start, long long end, bint backward, max_n):
+        """ at most max_n matches (-1: all), newest first if backward """
+        if mode not in SEARCH_MODES:
+            raise ValueError, "MipBufRenderer search mode has to be one of %s" % ", ".join(SEARCH_MODES)
+        cdef long long block[4096]
+        cdef int n
+        result = []
+        while start < end and max_n != 0:
+            n = self.instance.find(SEARCH_MODES.index(mode), level, level2, start, end, backward, block,
+                                   4096 if max_n < 0 else min(max_n, 4096))
+            result.extend([block[j] for j in range(n)])
+            if max_n > 0:
+                max_n -= n
+            if n < 4096:
+                break
+            if backward:
+                end = block[n - 1]
+            else:
+                start = block[n - 1] + 1
+        return result
+
     def size(self):
         return self.instance.size()
 
+    def first(self):
+        """ index of the oldest sample still kept. sample indices never restart, size() keeps growing. """
+        return self.instance.first()
+
 
     def get_change_counter(self):
         """
@@ -70,3 +541,49 @@ cdef class MipBufRenderer:
 
     def inc_change_counter(self):
         self.instance.inc_change_counter()
+
+
+cdef class MipDerived:
+    """ appends offset + gain * source + .. of other MipBufRenderers to a MipBufRenderer, filtered, as the samples of
+    the sources arrive. see mip_derived.h """
+
+    cdef cpp_MipDerived* instance
+    # out and the sources. the cpp object points to them.
+    cdef object renderers
+
+    def __cinit__(self, MipBufRenderer out, double freq):
+        """ out: the MipBufRenderer the results are appended to, sampling at freq Hz """
+        if freq <= 0.:
+            raise ValueError, "MipDerived freq has to be positive"
+        self.renderers = [out]
+        self.instance = new_MipDerived(out.instance, freq)
+        out.derived_refs += 1
+
+    def __dealloc__(self):
+        delete(self.instance)
+        # None if the garbage collector cleared it first. the renderers then stay refused to open_file()
+        if self.renderers is not None:
+            for renderer in self.renderers:
+                (<MipBufRenderer>renderer).derived_refs -= 1
+
+    def add_source(self, MipBufRenderer source, double freq, double gain=1.):
+        """ add gain * source, sampling at freq Hz. resampled linearly if freq differs. before the first update() """
+        if freq <= 0.:
+            raise ValueError, "MipDerived source freq has to be positive"
+        self.renderers.append(source)
+        source.derived_refs += 1
+        self.instance.add_source(source.instance, freq, gain)
+
+    def set_offset(self, double offset):
+        self.instance.set_offset(offset)
+
+    def set_filter(self, filter, double param=0.):
+        """ filter is one of FILTERS. moving_avg: mean of the last 'param' samples. lowpass: one-pole IIR low-pass
+        with cutoff 'param' Hz. before the first update() """
+        if filter not in FILTERS:
+            raise ValueError, "MipDerived filter has to be one of %s" % ", ".join(FILTERS)
+        self.instance.set_filter(FILTERS.index(filter), param)
+
+    def update(self):
+        """ compute and append every sample all the sources have samples for. return num appended. """
+        return self.instance.update()
@@ -0,0 +1,117 @@
+// append throughput and memory of MipBuf_t for different branching factors
+// and skip_levels, and what it costs when rendering.
+//
+// linux:  g++ -O2 mip_buf_branching_bench.cpp mip_file.cpp -I../helpers_src -o mip_buf_branching_bench
+//
+// usage:  ./mip_buf_branching_bench [num_samples]
+//         default is 100000000 samples.
+//
+// every configuration runs in its own process, so the resident set size
+// (RSS) growth is exactly what the pyramid took. 'entries/frame' is the num
+// of entries get_buf returns for the whole capture on a 1024 pixel wide
+// window. the renderer combines them back to about one per pixel, but it
+// has to read them all, every frame.
+
+#include "mip_buf_t.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <unistd.h>
+#include <sys/time.h>
+#include <sys/wait.h>
+
+
+#define BLOCK_SIZE 4096
+#define WIDTH      1024
+
+
+static double now()
+{
+    timeval tv;
+    gettimeofday(&tv, NULL);
+    return tv.tv_sec + tv.tv_usec / 1e6;
+}
+
+
+static double rss_mb()
+{
+    long pages = 0, resident = 0;
+    FILE* f = fopen("/proc/self/statm", "r");
+    if (f)
+    {
+        if (fscanf(f, "%ld %ld", &pages, &resident) != 2)
+            resident = 0;
+        fclose(f);
+    }
+    return resident * double(sysconf(_SC_PAGESIZE)) / (1024. * 1024.);
+}
+
+
+static void bench(int n, int branching, int skip_levels)
+{
+    float* block = new float[BLOCK_SIZE];
+    for (int j = 0; j < BLOCK_SIZE; j++)
+        block[j] = float((j * 7) & 0xff);
+
+    // single append() on a smaller buffer, it's the slow path anyway
+    int n_single = n / 10;
+    double t_single;
+    {
+        MipBuf_t<float> m(0, branching, skip_levels);
+        double t = now();
+        for (int i = 0; i < n_single; i++)
+            m.append(float(i & 0xff));
+        t_single = now() - t;
+    }
+
+    double rss = rss_mb();
+    MipBuf_t<float> m(0, branching, skip_levels);
+    double t = now();
+    for (int i = 0; i < n; i += BLOCK_SIZE)
+        m.append_array(block, n - i < BLOCK_SIZE ? n - i : BLOCK_SIZE);
+    double t_array = now() - t;
+    rss = rss_mb() - rss;
+
+    mip_index_t entries = 0;
+    for (int level = 0; level < m.num_levels(); level++)
+        entries += m.level(level)->size();
+
+    int         level;
+    double      start_pixel, end_pixel;
+    mip_index_t start_index, end_index;
+    m.get_buf(0., double(n), WIDTH, &level, &start_pixel, &start_index, &end_pixel, &end_index);
+
+    printf("  %4i %6i %7i %10.1f %10.1f %10.1f %9.2f %14lli\n",
+        branching, skip_levels, m.num_levels(),
+        n_single / t_single / 1e6, n / t_array / 1e6, rss,
+        double(entries) / n, end_index - start_index + 1);
+    fflush(stdout);
+    delete [] block;
+}
+
+
+int main(int argc, char** argv)
+{
+    int n = argc > 1 ? int(atof(argv[1])) : 100000000;
+    int configs[][2] = {
+        {2, 0}, {4, 0}, {8, 0}, {16, 0},
+        {2, 2}, {4, 1}, {8, 1}, {16, 1}};
+
+    printf("%i samples\n", n);
+    printf("  %4s %6s %7s %10s %10s %10s %9s %14s\n",
+        "B", "skip", "levels", "append", "array", "RSS MB", "entries/n", "entries/frame");
+    printf("  %4s %6s %7s %10s %10s %10s %9s %14s\n",
+        "", "", "", "Msample/s", "Msample/s", "", "", "");
+    fflush(stdout);
+    for (unsigned int i = 0; i < sizeof(configs) / sizeof(configs[0]); i++)
+    {
+        pid_t pid = fork();
+        if (pid == 0)
+        {
+            bench(n, configs[i][0], configs[i][1]);
+            _exit(0);
+        }
+        waitpid(pid, NULL, 0);
+    }
+    return 0;
+}
@@ -0,0 +1,75 @@
+// MipBuf_t::append_minmaxavg_arrays_parallel against serial append_array,
+// for 1, 2, 4, .. threads up to the num of cores.
+//
+// linux:  g++ -O2 mip_buf_parallel_bench.cpp mip_file.cpp -I../helpers_src -lpthread -o mip_buf_parallel_bench
+//
+// usage:  ./mip_buf_parallel_bench [num_samples]
+//         default is 200000000 samples, ~5GB of RAM for the two pyramids.
+//
+// the input is one float array, like a recording read from disk. 'same' is
+// whether the parallel pyramid is identical to the serial one.
+
+#include "mip_buf_t.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/time.h>
+
+
+static double now()
+{
+    timeval tv;
+    gettimeofday(&tv, NULL);
+    return tv.tv_sec + tv.tv_usec / 1e6;
+}
+
+
+static bool same_pyramid(MipBuf_t<float>* a, MipBuf_t<float>* b)
+{
+    if (a->num_levels() != b->num_levels())
+        return false;
+    for (int level = 0; level < a->num_levels(); level++)
+    {
+        float *amin, *amax, *aavg, *bmin, *bmax, *bavg;
+        mip_index_t n = a->level(level)->span(0, a->level(level)->size(), &amin, &amax, &aavg);
+        if (n != b->level(level)->span(0, b->level(level)->size(), &bmin, &bmax, &bavg) ||
+                memcmp(amin, bmin, sizeof(float) * n) || memcmp(amax, bmax, sizeof(float) * n) ||
+                memcmp(aavg, bavg, sizeof(float) * n))
+            return false;
+    }
+    return true;
+}
+
+
+int main(int argc, char** argv)
+{
+    mip_index_t n = argc > 1 ? mip_index_t(atof(argv[1])) : 200000000;
+    float* samples = new float[n];
+    for (mip_index_t i = 0; i < n; i++)
+        samples[i] = float((i * 7919) % 1009);
+
+    printf("%lli samples, %i cores\n", n, parallel_for_num_cores());
+    printf("  %-8s %10s %10s %8s %5s\n", "threads", "seconds", "Msample/s", "speedup", "same");
+
+    MipBuf_t<float> serial;
+    double t = now();
+    for (mip_index_t i = 0; i < n; i += 1 << 30)
+        serial.append_array(samples + i, int(n - i < (1 << 30) ? n - i : (1 << 30)));
+    double t_serial = now() - t;
+    printf("  %-8s %10.2f %10.1f %8.2f %5s\n", "serial", t_serial, n / t_serial / 1e6, 1., "");
+    fflush(stdout);
+
+    for (int threads = 1; threads <= parallel_for_num_cores(); threads *= 2)
+    {
+        MipBuf_t<float> m;
+        t = now();
+        m.append_minmaxavg_arrays_parallel(samples, samples, samples, n, threads);
+        t = now() - t;
+        printf("  %-8i %10.2f %10.1f %8.2f %5s\n", threads, t, n / t / 1e6, t_serial / t,
+            same_pyramid(&serial, &m) ? "yes" : "NO");
+        fflush(stdout);
+    }
+
+    delete [] samples;
+    return 0;
+}
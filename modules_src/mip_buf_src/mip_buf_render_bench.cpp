@@ -0,0 +1,268 @@
+// frame time of MipBufRenderer, glBegin/glEnd against vertex buffer objects,
+// and render_m4 against render_avg/render_minmax. runs offscreen in an EGL pbuffer, so it works headless under mesa software
+// rendering (llvmpipe).
+//
+// linux:  g++ -O2 mip_buf_render_bench.cpp mip_buf_renderer.cpp mip_density.cpp mip_buf_vbo.cpp mip_file.cpp -I../helpers_src -lEGL -lGL -o mip_buf_render_bench
+//
+// usage:  ./mip_buf_render_bench [num_samples [num_frames]]
+//         default is 1000000 samples, 200 frames.
+//
+// force software rendering with LIBGL_ALWAYS_SOFTWARE=1
+//
+// before timing, both paths render one frame of every view and the pixels
+// are compared. the vbo path adds one glTranslatef per block, and float
+// rounding in the modelview matrix may move a vertical line by one pixel.
+// anything more than that is an error.
+//
+// render_m4 is compared against a line strip through every single sample
+// (the truth render_avg and render_minmax approximate). the num of pixels
+// off by more than one pixel horizontally is printed for all three.
+
+#include "mip_buf_renderer.h"
+
+#include <EGL/egl.h>
+#include <EGL/eglext.h>
+#include <GL/gl.h>
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+#include <sys/time.h>
+
+
+#define WIDTH  1024
+#define HEIGHT 256
+
+
+static double now()
+{
+    timeval tv;
+    gettimeofday(&tv, NULL);
+    return tv.tv_sec + tv.tv_usec / 1e6;
+}
+
+
+static bool init_gl()
+{
+    PFNEGLGETPLATFORMDISPLAYEXTPROC get_platform_display =
+        (PFNEGLGETPLATFORMDISPLAYEXTPROC)eglGetProcAddress("eglGetPlatformDisplayEXT");
+    EGLDisplay display = get_platform_display ?
+        get_platform_display(EGL_PLATFORM_SURFACELESS_MESA, EGL_DEFAULT_DISPLAY, NULL) :
+        eglGetDisplay(EGL_DEFAULT_DISPLAY);
+
+    EGLint major, minor;
+    if (!eglInitialize(display, &major, &minor))
+        return false;
+
+    EGLint config_attribs[] = {
+        EGL_SURFACE_TYPE, EGL_PBUFFER_BIT,
+        EGL_RENDERABLE_TYPE, EGL_OPENGL_BIT,
+        EGL_RED_SIZE, 8, EGL_GREEN_SIZE, 8, EGL_BLUE_SIZE, 8, EGL_ALPHA_SIZE, 8,
+        EGL_NONE};
+    EGLConfig config;
+    EGLint num_configs;
+    if (!eglChooseConfig(display, config_attribs, &config, 1, &num_configs) || !num_configs)
+        return false;
+
+    EGLint pbuffer_attribs[] = {EGL_WIDTH, WIDTH, EGL_HEIGHT, HEIGHT, EGL_NONE};
+    EGLSurface surface = eglCreatePbufferSurface(display, config, pbuffer_attribs);
+
+    eglBindAPI(EGL_OPENGL_API);
+    EGLContext context = eglCreateContext(display, config, EGL_NO_CONTEXT, NULL);
+    if (!eglMakeCurrent(display, surface, surface, context))
+        return false;
+
+    printf("%s, OpenGL %s\n", glGetString(GL_RENDERER), glGetString(GL_VERSION));
+    return true;
+}
+
+
+enum {MODE_AVG, MODE_MINMAX, MODE_M4, NUM_MODES};
+static const char* mode_names[] = {"avg", "minmax", "m4"};
+
+
+static void setup_frame()
+{
+    glViewport(0, 0, WIDTH, HEIGHT);
+    glClear(GL_COLOR_BUFFER_BIT);
+    glMatrixMode(GL_PROJECTION);
+    glLoadIdentity();
+    glOrtho(0., WIDTH, -1.1, 1.1, -1., 1.);
+    glMatrixMode(GL_MODELVIEW);
+    glLoadIdentity();
+}
+
+
+// same setup as GraphRenderer: x in pixels, y scaled to the sample range.
+static void render_frame(MipBufRenderer* r, double start, double end, int mode)
+{
+    setup_frame();
+    if (mode == MODE_MINMAX)
+        r->render_minmax(start, end, WIDTH);
+    else if (mode == MODE_M4)
+        r->render_m4(start, end, WIDTH);
+    else
+        r->render_avg(start, end, WIDTH);
+}
+
+
+// every sample in the view, at the same x as render_avg puts them.
+static void render_samples(const float* samples, int n, double start, double end)
+{
+    setup_frame();
+    int a = int(start - 1.) > 0 ? int(start - 1.) : 0;
+    int b = int(end + 1.) < n ? int(end + 1.) : n;
+    double pixels_per_sample = WIDTH / (end - start);
+    float* v = new float[(b - a) * 2];
+    for (int i = a; i < b; i++)
+    {
+        v[(i - a) * 2]     = float((i + 0.5 - start) * pixels_per_sample);
+        v[(i - a) * 2 + 1] = samples[i];
+    }
+    glEnableClientState(GL_VERTEX_ARRAY);
+    glVertexPointer(2, GL_FLOAT, 0, v);
+    glDrawArrays(GL_LINE_STRIP, 0, b - a);
+    glDisableClientState(GL_VERTEX_ARRAY);
+    delete [] v;
+}
+
+
+static void read_pixels(unsigned char* out)
+{
+    glFinish();
+    glReadPixels(0, 0, WIDTH, HEIGHT, GL_RGBA, GL_UNSIGNED_BYTE, out);
+}
+
+
+// num of pixels in a that have no equal pixel in b at the same place or
+// one pixel left or right.
+static int compare_pixels(unsigned char* a, unsigned char* b)
+{
+    int diff = 0;
+    for (int y = 0; y < HEIGHT; y++)
+    {
+        for (int x = 0; x < WIDTH; x++)
+        {
+            unsigned char* pa = a + (y * WIDTH + x) * 4;
+            unsigned char* pb = b + (y * WIDTH + x) * 4;
+            if (memcmp(pa, pb, 4) == 0)
+                continue;
+            if (x > 0 && memcmp(pa, pb - 4, 4) == 0)
+                continue;
+            if (x < WIDTH - 1 && memcmp(pa, pb + 4, 4) == 0)
+                continue;
+            diff++;
+        }
+    }
+    return diff;
+}
+
+
+static double bench(MipBufRenderer* r, double start, double end, int mode, int frames)
+{
+    render_frame(r, start, end, mode);
+    glFinish();
+    double t = now();
+    for (int i = 0; i < frames; i++)
+        render_frame(r, start, end, mode);
+    glFinish();
+    return (now() - t) / frames * 1000.;
+}
+
+
+int main(int argc, char** argv)
+{
+    int n      = argc > 1 ? int(atof(argv[1])) : 1000000;
+    int frames = argc > 2 ? atoi(argv[2]) : 200;
+
+    if (!init_gl())
+    {
+        printf("no EGL pbuffer with desktop OpenGL available\n");
+        return 1;
+    }
+    if (!MipBufVbo::available())
+    {
+        printf("no vertex buffer object support\n");
+        return 1;
+    }
+
+    MipBufRenderer_t<float> r;
+    float* block = new float[n];
+    for (int i = 0; i < n; i++)
+        block[i] = float(sin(i * 0.001) + 0.1 * sin(i * 0.37));
+    r.append_array(block, n);
+
+    // (start, end) of the views to render. the last two are zoomed in
+    // enough to hit level 0, the very last one crosses a vbo block boundary.
+    double b = MIP_VBO_BLOCK_ENTRIES;
+    double views[][2] = {
+        {0., double(n)},
+        {n * 0.25, n * 0.75},
+        {n * 0.5, n * 0.5 + WIDTH * 8},
+        {n * 0.5 - 100.5, n * 0.5 + WIDTH - 100.5},
+        {b - 300.5, b + WIDTH - 300.5}};
+    int num_views = sizeof(views) / sizeof(views[0]);
+
+    unsigned char* pixels_immediate = new unsigned char[WIDTH * HEIGHT * 4];
+    unsigned char* pixels_vbo       = new unsigned char[WIDTH * HEIGHT * 4];
+    unsigned char* pixels_samples   = new unsigned char[WIDTH * HEIGHT * 4];
+    int errors = 0;
+
+    glEnable(GL_BLEND);
+    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA);
+
+    for (int mode = MODE_AVG; mode <= MODE_MINMAX; mode++)
+    {
+        for (int v = 0; v < num_views; v++)
+        {
+            r.set_use_vbo(false);
+            render_frame(&r, views[v][0], views[v][1], mode);
+            read_pixels(pixels_immediate);
+            r.set_use_vbo(true);
+            render_frame(&r, views[v][0], views[v][1], mode);
+            read_pixels(pixels_vbo);
+            int diff = compare_pixels(pixels_immediate, pixels_vbo) +
+                       compare_pixels(pixels_vbo, pixels_immediate);
+            if (diff)
+            {
+                printf("pixel mismatch: %s view %i, %i pixels differ\n",
+                    mode_names[mode], v, diff);
+                errors++;
+            }
+        }
+    }
+
+    printf("%i samples, %i frames per view, %ix%i\n", n, frames, WIDTH, HEIGHT);
+    printf("  %-8s %-24s %12s %12s %10s %14s\n", "", "view", "immediate", "vbo", "vertices", "pixels off");
+    for (int mode = MODE_AVG; mode < NUM_MODES; mode++)
+    {
+        for (int v = 0; v < num_views; v++)
+        {
+            char name[64];
+            snprintf(name, sizeof(name), "%.1f..%.1f", views[v][0], views[v][1]);
+
+            r.set_use_vbo(false);
+            render_samples(block, n, views[v][0], views[v][1]);
+            read_pixels(pixels_samples);
+            render_frame(&r, views[v][0], views[v][1], mode);
+            read_pixels(pixels_immediate);
+            int vertices = r.get_num_vertices();
+            int off = compare_pixels(pixels_samples, pixels_immediate) +
+                      compare_pixels(pixels_immediate, pixels_samples);
+
+            double t_immediate = bench(&r, views[v][0], views[v][1], mode, frames);
+            r.set_use_vbo(true);
+            // render_m4 has no vbo path
+            double t_vbo = mode == MODE_M4 ? 0. : bench(&r, views[v][0], views[v][1], mode, frames);
+            printf("  %-8s %-24s %9.3f ms %9.3f ms %10i %14i\n",
+                mode_names[mode], name, t_immediate, t_vbo, vertices, off);
+        }
+    }
+
+    delete [] block;
+    delete [] pixels_immediate;
+    delete [] pixels_vbo;
+    delete [] pixels_samples;
+    return errors ? 1 : 0;
+}
@@ -2,6 +2,8 @@
 
 #include <assert.h>
 #include <stdio.h>
+#include <string.h>
+#include <math.h>
 
 //extern "C"
 //{
@@ -29,12 +31,19 @@
 // --------------------------------------------------------------------------
 
 
-MipBufRenderer::MipBufRenderer()
+template<class T>
+MipBufRenderer_t<T>::MipBufRenderer_t(int capacity, int queue_size, int branching, int skip_levels):
+    m_mip_buf(capacity, branching, skip_levels), m_queue(queue_size)
 {
+    m_use_vbo       = false;
+    m_vbo_supported = -1;
+    m_num_vertices  = 0;
+    m_dropped       = 0;
 }
 
 
-MipBufRenderer::~MipBufRenderer()
+template<class T>
+MipBufRenderer_t<T>::~MipBufRenderer_t()
 {
 }
 
@@ -44,133 +53,716 @@ MipBufRenderer::~MipBufRenderer()
 // --------------------------------------------------------------------------
 
 
-// TODO: use vertex buffers
+template<> int MipBufRenderer_t<float>::get_sample_type()          { return MIP_FLOAT32; }
+template<> int MipBufRenderer_t<signed char>::get_sample_type()    { return MIP_INT8; }
+template<> int MipBufRenderer_t<unsigned char>::get_sample_type()  { return MIP_UINT8; }
+template<> int MipBufRenderer_t<short>::get_sample_type()          { return MIP_INT16; }
+template<> int MipBufRenderer_t<unsigned short>::get_sample_type() { return MIP_UINT16; }
+template<> int MipBufRenderer_t<int>::get_sample_type()            { return MIP_INT32; }
 
-void MipBufRenderer::render_avg(float start_index, float end_index, float resolution)
+
+template<class T>
+void MipBufRenderer_t<T>::render_avg(double start_index, double end_index, double resolution)
 {
-    MipBuf_t<float>* buf;
-    float _start_pixel;
-    int   _start_index;
-    float _end_pixel;
-    int   _end_index;
+    int         level;
+    double      _start_pixel;
+    mip_index_t _start_index;
+    double      _end_pixel;
+    mip_index_t _end_index;
 
     m_mip_buf.get_buf(
             start_index, end_index, resolution,
-            &buf,
+            &level,
             &_start_pixel, &_start_index,
             &_end_pixel,   &_end_index);
 
     // have to have at least 2 elements
+    m_num_vertices = 0;
     if (_end_index - _start_index <= 0)
         return;
 
-    float d = float(_end_pixel - _start_pixel) / (_end_index - _start_index);
+    // vertices are generated relative to the first visible entry, so the
+    // float32 coordinates sent to GL stay small no matter how far into the
+    // buffer we are.
+    float d = float((_end_pixel - _start_pixel) / (_end_index - _start_index));
     float k = 0.;
 
-    MipBufEntry<float>* e;
+    MipLevel_t<T>* l = m_mip_buf.level(level);
 
     glPushMatrix();
-    glTranslatef(_start_pixel, 0., 0.);
+    glTranslatef(float(_start_pixel), 0., 0.);
     glScalef(d, 1., 1.);
 
+    m_num_vertices = int(_end_index - _start_index + 1);
+
+    // with branching > 2 or skip_levels the level may have many entries per
+    // pixel. combine them to about one per pixel. the vbo path draws all.
+    int group = int((_end_index - _start_index) / (_end_pixel - _start_pixel));
+
+    MipBufEntry<T> tail;
+    float tail_x = 0.;
+    bool has_tail = m_tail(level, _start_index, &_end_index, &tail, &tail_x);
+
+    if (group >= 2 && !m_vbo_enabled())
+    {
+        m_render_groups(l, _start_index, _end_index, group, false, has_tail ? &tail : NULL, tail_x);
+        glPopMatrix();
+        return;
+    }
+
+    if (m_vbo_enabled())
+    {
+        m_vbo.draw_avg(&m_mip_buf, level, _start_index, _end_index);
+        if (has_tail)
+            m_render_tail(l, _start_index, _end_index, tail, tail_x, false);
+        glPopMatrix();
+        return;
+    }
+
     glBegin(GL_LINE_STRIP);
 
-    for (int i = _start_index; i <= _end_index; i++)
+    // one run for a growing level, at most two for a ring.
+    for (mip_index_t i = _start_index; i <= _end_index;)
     {
-        e = buf->get(i);
-        if (!e)
+        T *minval, *maxval, *avg;
+        mip_index_t n = l->span(i, _end_index - i + 1, &minval, &maxval, &avg);
+        assert(n);
+        for (mip_index_t j = 0; j < n; j++)
         {
-            printf("ERROR: start_index %i end_index %i i %i k %.2f\n", _start_index, _end_index, i, k);
+            glVertex3f(k, float(avg[j]), 0.);
+            k++;
         }
-        assert(e);
-        glVertex3f(k, e->avg, 0.);
-        k++;
+        i += n;
     }
 
     glEnd();
+    if (has_tail)
+        m_render_tail(l, _start_index, _end_index, tail, tail_x, false);
     glPopMatrix();
 }
 
 
-void MipBufRenderer::render_minmax(float start_index, float end_index, float resolution)
+template<class T>
+void MipBufRenderer_t<T>::render_minmax(double start_index, double end_index, double resolution)
 {
-    MipBuf_t<float>* buf;
-    float _start_pixel;
-    int   _start_index;
-    float _end_pixel;
-    int   _end_index;
+    int         level;
+    double      _start_pixel;
+    mip_index_t _start_index;
+    double      _end_pixel;
+    mip_index_t _end_index;
 
     m_mip_buf.get_buf(
             start_index, end_index, resolution,
-            &buf,
+            &level,
             &_start_pixel, &_start_index,
             &_end_pixel,   &_end_index);
 
     // have to have at least 2 elements
+    m_num_vertices = 0;
     if (_end_index - _start_index <= 0)
         return;
 
-    float d = float(_end_pixel - _start_pixel) / (_end_index - _start_index);
+    // vertices are generated relative to the first visible entry, so the
+    // float32 coordinates sent to GL stay small no matter how far into the
+    // buffer we are.
+    float d = float((_end_pixel - _start_pixel) / (_end_index - _start_index));
     float k = 0.;
 
-    MipBufEntry<float>* e;
+    MipLevel_t<T>* l = m_mip_buf.level(level);
 
     glPushMatrix();
-    glTranslatef(_start_pixel, 0., 0.);
+    glTranslatef(float(_start_pixel), 0., 0.);
     glScalef(d, 1., 1.);
 
+    m_num_vertices = int(_end_index - _start_index + 1) * 2;
+
+    // with branching > 2 or skip_levels the level may have many entries per
+    // pixel. combine them to about one per pixel. the vbo path draws all.
+    int group = int((_end_index - _start_index) / (_end_pixel - _start_pixel));
+
+    MipBufEntry<T> tail;
+    float tail_x = 0.;
+    bool has_tail = m_tail(level, _start_index, &_end_index, &tail, &tail_x);
+
+    if (group >= 2 && !m_vbo_enabled())
+    {
+        m_render_groups(l, _start_index, _end_index, group, true, has_tail ? &tail : NULL, tail_x);
+        glPopMatrix();
+        return;
+    }
+
+    if (m_vbo_enabled())
+    {
+        m_vbo.draw_minmax(&m_mip_buf, level, _start_index, _end_index);
+        if (has_tail)
+            m_render_tail(l, _start_index, _end_index, tail, tail_x, true);
+        glPopMatrix();
+        return;
+    }
+
     glBegin(GL_LINES);
 
-    for (int i = _start_index; i <= _end_index; i++)
+    for (mip_index_t i = _start_index; i <= _end_index;)
     {
-        e = buf->get(i);
-        if (!e)
+        T *minval, *maxval, *avg;
+        mip_index_t n = l->span(i, _end_index - i + 1, &minval, &maxval, &avg);
+        assert(n);
+        for (mip_index_t j = 0; j < n; j++)
         {
-            printf("ERROR: start_index %i end_index %i i %i k %.2f\n", _start_index, _end_index, i, k);
+            glVertex3f(k, float(minval[j]), 0.);
+            glVertex3f(k, float(maxval[j]), 0.);
+            k++;
         }
-        assert(e);
-        glVertex3f(k, e->minval, 0.);
-        glVertex3f(k, e->maxval, 0.);
-        k++;
+        i += n;
     }
 
     glEnd();
+    if (has_tail)
+        m_render_tail(l, _start_index, _end_index, tail, tail_x, true);
     glPopMatrix();
 }
 
 
-void MipBufRenderer::append(float avg)
+template<class T>
+void MipBufRenderer_t<T>::render_m4(double start_index, double end_index, double resolution)
+{
+    m_num_vertices = 0;
+    if (end_index <= start_index || resolution <= 0.1)
+        return;
+
+    double samples_per_pixel = (end_index - start_index) / resolution;
+    if (samples_per_pixel < 2.)
+    {
+        render_avg(start_index, end_index, resolution);
+        return;
+    }
+
+    // sample i is drawn at pixel (i + 0.5 - start_index) / samples_per_pixel,
+    // like render_avg does. column p gets the samples drawn into p..p+1
+    mip_index_t first = m_mip_buf.first();
+    mip_index_t size  = m_mip_buf.size();
+    int columns = int(ceil(resolution));
+
+    m_m4_vertices.clear();
+    mip_index_t i_start = (mip_index_t)ceil(start_index - 0.5);
+    for (int p = 0; p < columns; p++)
+    {
+        mip_index_t i_end = (mip_index_t)ceil(start_index + (p + 1) * samples_per_pixel - 0.5);
+        mip_index_t a = i_start > first ? i_start : first;
+        mip_index_t b = i_end < size ? i_end : size;
+        i_start = i_end;
+
+        MipBufEntry<T> e_first, e_last;
+        T mn, mx;
+        if (a >= b || !m_mip_buf.get(a, &e_first) || !m_mip_buf.get(b - 1, &e_last) ||
+                !m_mip_buf.get_minmax(a, b, &mn, &mx))
+            continue;
+
+        // visit the extreme closer to the first sample first. the strip
+        // covers min..max either way, this only saves some overdraw.
+        float x = float(p + 0.5);
+        float minval = float(mn), maxval = float(mx), first_avg = float(e_first.avg);
+        float* v = m_m4_vertices.append(8);
+        bool min_first = first_avg - minval < maxval - first_avg;
+        v[0] = x; v[1] = first_avg;
+        v[2] = x; v[3] = min_first ? minval : maxval;
+        v[4] = x; v[5] = min_first ? maxval : minval;
+        v[6] = x; v[7] = float(e_last.avg);
+    }
+
+    m_num_vertices = int(m_m4_vertices.size() / 2);
+    if (m_num_vertices < 2)
+        return;
+
+    glEnableClientState(GL_VERTEX_ARRAY);
+    glVertexPointer(2, GL_FLOAT, 0, m_m4_vertices.data());
+    glDrawArrays(GL_LINE_STRIP, 0, m_num_vertices);
+    glDisableClientState(GL_VERTEX_ARRAY);
+}
+
+
+template<class T>
+void MipBufRenderer_t<T>::render_density(double start_index, double end_index, double resolution,
+        double value_min, double value_max, int height)
+{
+    m_density.update(&m_mip_buf, start_index, end_index, resolution, value_min, value_max, height);
+    m_num_vertices = m_density.draw();
+}
+
+
+template<class T>
+int MipBufRenderer_t<T>::get_num_vertices()
+{
+    return m_num_vertices;
+}
+
+
+template<class T>
+void MipBufRenderer_t<T>::set_use_vbo(bool use_vbo)
+{
+    m_use_vbo = use_vbo;
+}
+
+
+template<class T>
+bool MipBufRenderer_t<T>::get_use_vbo()
+{
+    return m_use_vbo;
+}
+
+
+template<class T>
+void MipBufRenderer_t<T>::release_gl()
+{
+    m_vbo.release_gl();
+    m_density.release_gl();
+}
+
+
+template<class T>
+void MipBufRenderer_t<T>::append(float avg)
+{
+    m_mip_buf.append(MipSample<T>::from_double(avg));
+    m_trigger.update(&m_mip_buf);
+}
+
+template<class T>
+void MipBufRenderer_t<T>::append_minmaxavg(float minval, float maxval, float avg)
+{
+    m_mip_buf.append_minmaxavg(MipSample<T>::from_double(minval), MipSample<T>::from_double(maxval), MipSample<T>::from_double(avg));
+    m_trigger.update(&m_mip_buf);
+}
+
+template<class T>
+void MipBufRenderer_t<T>::append_array(const float* avg, int n)
+{
+    T block[MIP_DOWNSAMPLE_BLOCK];
+    int chunk = int(m_chunk(MIP_DOWNSAMPLE_BLOCK));
+    for (int i = 0; i < n; i += chunk)
+    {
+        int count = MIP_MIN(n - i, chunk);
+        m_convert(avg + i, block, count);
+        m_mip_buf.append_array(block, count);
+        m_trigger.update(&m_mip_buf);
+    }
+}
+
+template<>
+void MipBufRenderer_t<float>::append_array(const float* avg, int n)
+{
+    int chunk = int(m_chunk(n));
+    for (int i = 0; i < n; i += chunk)
+    {
+        m_mip_buf.append_array(avg + i, MIP_MIN(n - i, chunk));
+        m_trigger.update(&m_mip_buf);
+    }
+}
+
+template<class T>
+void MipBufRenderer_t<T>::append_minmaxavg_arrays(const float* minval, const float* maxval, const float* avg, int n)
+{
+    T bmin[MIP_DOWNSAMPLE_BLOCK];
+    T bmax[MIP_DOWNSAMPLE_BLOCK];
+    T bavg[MIP_DOWNSAMPLE_BLOCK];
+    int chunk = int(m_chunk(MIP_DOWNSAMPLE_BLOCK));
+    for (int i = 0; i < n; i += chunk)
+    {
+        int count = MIP_MIN(n - i, chunk);
+        m_convert(minval + i, bmin, count);
+        m_convert(maxval + i, bmax, count);
+        m_convert(avg + i, bavg, count);
+        m_mip_buf.append_minmaxavg_arrays(bmin, bmax, bavg, count);
+        m_trigger.update(&m_mip_buf);
+    }
+}
+
+template<>
+void MipBufRenderer_t<float>::append_minmaxavg_arrays(const float* minval, const float* maxval, const float* avg, int n)
+{
+    int chunk = int(m_chunk(n));
+    for (int i = 0; i < n; i += chunk)
+    {
+        m_mip_buf.append_minmaxavg_arrays(minval + i, maxval + i, avg + i, MIP_MIN(n - i, chunk));
+        m_trigger.update(&m_mip_buf);
+    }
+}
+
+template<class T>
+void MipBufRenderer_t<T>::append_raw_array(const void* avg, int n)
+{
+    int chunk = int(m_chunk(n));
+    for (int i = 0; i < n; i += chunk)
+    {
+        m_mip_buf.append_array((const T*)avg + i, MIP_MIN(n - i, chunk));
+        m_trigger.update(&m_mip_buf);
+    }
+}
+
+template<class T>
+void MipBufRenderer_t<T>::append_raw_minmaxavg_arrays(const void* minval, const void* maxval, const void* avg, int n)
+{
+    int chunk = int(m_chunk(n));
+    for (int i = 0; i < n; i += chunk)
+    {
+        int count = MIP_MIN(n - i, chunk);
+        m_mip_buf.append_minmaxavg_arrays((const T*)minval + i, (const T*)maxval + i, (const T*)avg + i, count);
+        m_trigger.update(&m_mip_buf);
+    }
+}
+
+template<class T>
+void MipBufRenderer_t<T>::append_arrays_parallel(const float* minval, const float* maxval, const float* avg, mip_index_t n, int num_threads)
+{
+    mip_index_t chunk = m_chunk(n);
+    for (mip_index_t i = 0; i < n; i += chunk)
+    {
+        m_mip_buf.append_minmaxavg_arrays_parallel(minval + i, maxval + i, avg + i, MIP_MIN(n - i, chunk), num_threads);
+        m_trigger.update(&m_mip_buf);
+    }
+}
+
+template<class T>
+void MipBufRenderer_t<T>::append_raw_arrays_parallel(const void* minval, const void* maxval, const void* avg, mip_index_t n, int num_threads)
+{
+    mip_index_t chunk = m_chunk(n);
+    for (mip_index_t i = 0; i < n; i += chunk)
+    {
+        mip_index_t count = MIP_MIN(n - i, chunk);
+        m_mip_buf.append_minmaxavg_arrays_parallel((const T*)minval + i, (const T*)maxval + i, (const T*)avg + i, count,
+                num_threads);
+        m_trigger.update(&m_mip_buf);
+    }
+}
+
+
+template<class T>
+bool MipBufRenderer_t<T>::get(mip_index_t i, MipBufEntry<float>* out)
+{
+    MipBufEntry<T> e;
+    if (!m_mip_buf.get(i, &e))
+        return false;
+    out->minval = float(e.minval);
+    out->maxval = float(e.maxval);
+    out->avg    = float(e.avg);
+    return true;
+}
+
+
+template<class T>
+int MipBufRenderer_t<T>::get_avg(mip_index_t start, int n, float* out)
+{
+    MipLevel_t<T>* l = m_mip_buf.level(0);
+    int copied = 0;
+    while (copied < n)
+    {
+        T *minval, *maxval, *avg;
+        int count = int(l->span(start + copied, n - copied, &minval, &maxval, &avg));
+        if (!count)
+            break;
+        for (int i = 0; i < count; i++)
+            out[copied + i] = float(avg[i]);
+        copied += count;
+    }
+    return copied;
+}
+
+
+template<class T>
+bool MipBufRenderer_t<T>::range_stats(mip_index_t start, mip_index_t end, float* minval, float* maxval, double* mean, mip_index_t* count)
+{
+    T mn, mx;
+    bool found = m_mip_buf.get_stats(start, end, &mn, &mx, mean, count);
+    *minval = float(mn);
+    *maxval = float(mx);
+    return found;
+}
+
+
+template<class T>
+void MipBufRenderer_t<T>::set_trigger(int mode, double level, double level2, mip_index_t holdoff)
+{
+    m_trigger.set(mode, level, level2, holdoff);
+    m_trigger.update(&m_mip_buf);
+}
+
+
+template<class T>
+mip_index_t MipBufRenderer_t<T>::find_trigger(mip_index_t start, mip_index_t end)
+{
+    return m_trigger.find(&m_mip_buf, start, end);
+}
+
+
+template<class T>
+mip_index_t MipBufRenderer_t<T>::num_triggers()
+{
+    return m_trigger.num_triggers();
+}
+
+
+template<class T>
+int MipBufRenderer_t<T>::get_triggers(mip_index_t start, mip_index_t end, mip_index_t* out, int max_n)
+{
+    return m_trigger.get_triggers(MIP_MAX(start, m_mip_buf.first()), end, out, max_n);
+}
+
+
+template<class T>
+mip_index_t MipBufRenderer_t<T>::last_trigger(mip_index_t end)
+{
+    mip_index_t i = m_trigger.last(end);
+    return i >= m_mip_buf.first() ? i : -1;
+}
+
+
+template<class T>
+int MipBufRenderer_t<T>::find(int mode, double level, double level2, mip_index_t start, mip_index_t end, bool backward,
+        mip_index_t* out, int max_n)
+{
+    MipSearch_t<T> search(mode, level, level2);
+    return search.find(&m_mip_buf, start, end, backward, out, max_n);
+}
+
+
+template<class T>
+int MipBufRenderer_t<T>::push(float avg)
+{
+    return push_minmaxavg_arrays(&avg, &avg, &avg, 1);
+}
+
+
+template<class T>
+int MipBufRenderer_t<T>::push_array(const float* avg, int n)
+{
+    return push_minmaxavg_arrays(avg, avg, avg, n);
+}
+
+
+template<class T>
+int MipBufRenderer_t<T>::push_minmaxavg_arrays(const float* minval, const float* maxval, const float* avg, int n)
+{
+    MipBufEntry<T> block[MIP_DOWNSAMPLE_BLOCK];
+    int pushed = 0;
+
+    while (pushed < n)
+    {
+        int count = n - pushed < MIP_DOWNSAMPLE_BLOCK ? n - pushed : MIP_DOWNSAMPLE_BLOCK;
+        for (int i = 0; i < count; i++)
+        {
+            block[i].minval = MipSample<T>::from_double(minval[pushed + i]);
+            block[i].maxval = MipSample<T>::from_double(maxval[pushed + i]);
+            block[i].avg    = MipSample<T>::from_double(avg[pushed + i]);
+        }
+        int c = m_queue.push(block, count);
+        pushed += c;
+        if (c < count)
+            break;
+    }
+
+    if (pushed < n)
+        m_dropped += n - pushed;
+    return pushed;
+}
+
+
+template<class T>
+int MipBufRenderer_t<T>::drain()
+{
+    T minval[MIP_DOWNSAMPLE_BLOCK];
+    T maxval[MIP_DOWNSAMPLE_BLOCK];
+    T avg[MIP_DOWNSAMPLE_BLOCK];
+    int drained = 0;
+
+    // a read-only file. samples stay in the queue.
+    if (!is_writable())
+        return 0;
+
+    // only what was in the queue when we started. a fast producer could
+    // keep us here forever otherwise.
+    int n = m_queue.size();
+    while (drained < n)
+    {
+        int count;
+        MipBufEntry<T>* e = m_queue.front(&count);
+        if (!count)
+            break;
+        if (count > m_chunk(MIP_DOWNSAMPLE_BLOCK))
+            count = int(m_chunk(MIP_DOWNSAMPLE_BLOCK));
+        if (count > n - drained)
+            count = n - drained;
+        for (int i = 0; i < count; i++)
+        {
+            minval[i] = e[i].minval;
+            maxval[i] = e[i].maxval;
+            avg[i]    = e[i].avg;
+        }
+        m_queue.pop(count);
+        m_mip_buf.append_minmaxavg_arrays(minval, maxval, avg, count);
+        m_trigger.update(&m_mip_buf);
+        drained += count;
+    }
+    return drained;
+}
+
+
+template<class T>
+mip_index_t MipBufRenderer_t<T>::get_dropped()
 {
-    m_mip_buf.append(avg);
+    return m_dropped;
 }
 
-void MipBufRenderer::append_minmaxavg(float minval, float maxval, float avg)
+
+template<class T>
+int MipBufRenderer_t<T>::queue_free()
+{
+    return m_queue.capacity() - m_queue.size();
+}
+
+
+template<class T>
+bool MipBufRenderer_t<T>::create_file(const char* path)
+{
+    if (m_file.is_open() || m_mip_buf.capacity())
+        return false;
+    if (!m_file.create(path, sizeof(T), get_sample_type()) || !m_mip_buf.set_file(&m_file))
+    {
+        m_file.close();
+        return false;
+    }
+    return true;
+}
+
+
+template<class T>
+bool MipBufRenderer_t<T>::open_file(const char* path, bool writable)
+{
+    if (m_file.is_open() || m_mip_buf.capacity() || m_mip_buf.size())
+        return false;
+    if (!m_file.open(path, sizeof(T), writable) || m_file.get_sample_type() != get_sample_type() ||
+            !m_mip_buf.set_file(&m_file))
+    {
+        m_file.close();
+        return false;
+    }
+    m_trigger.update(&m_mip_buf);
+    return true;
+}
+
+
+template<class T>
+bool MipBufRenderer_t<T>::flush_file()
+{
+    return m_file.is_open() ? m_file.flush() : true;
+}
+
+
+template<class T>
+bool MipBufRenderer_t<T>::has_file()
+{
+    return m_file.is_open();
+}
+
+
+template<class T>
+bool MipBufRenderer_t<T>::is_writable()
+{
+    return !m_file.is_open() || m_file.is_writable();
+}
+
+
+template<class T>
+int MipBufRenderer_t<T>::append_timestamps(const double* timestamps, int n)
+{
+    if (!m_file.is_writable())
+        return 0;
+
+    mip_index_t size = m_file.size(MIP_FILE_TIMESTAMPS);
+    int appended = 0;
+    while (appended < n)
+    {
+        char* column;
+        mip_index_t count = m_file.span(MIP_FILE_TIMESTAMPS, size + appended, &column, true);
+        if (!count)
+            break;
+        int c = count < n - appended ? int(count) : n - appended;
+        memcpy(column, timestamps + appended, sizeof(double) * c);
+        appended += c;
+    }
+    m_file.set_size(MIP_FILE_TIMESTAMPS, size + appended);
+    return appended;
+}
+
+
+template<class T>
+int MipBufRenderer_t<T>::get_timestamps(mip_index_t start, int n, double* out)
+{
+    mip_index_t size = m_file.size(MIP_FILE_TIMESTAMPS);
+    if (start < 0 || start >= size)
+        return 0;
+    if (n > size - start)
+        n = int(size - start);
+
+    int copied = 0;
+    while (copied < n)
+    {
+        char* column;
+        mip_index_t count = m_file.span(MIP_FILE_TIMESTAMPS, start + copied, &column, false);
+        if (!count)
+            break;
+        int c = count < n - copied ? int(count) : n - copied;
+        memcpy(out + copied, column, sizeof(double) * c);
+        copied += c;
+    }
+    return copied;
+}
+
+
+template<class T>
+mip_index_t MipBufRenderer_t<T>::num_timestamps()
 {
-    m_mip_buf.append_minmaxavg(minval, maxval, avg);
+    return m_file.size(MIP_FILE_TIMESTAMPS);
 }
 
 
-MipBufEntry<float>* MipBufRenderer::get(int i)
+template<class T>
+int MipBufRenderer_t<T>::get_user_data(char* out, int max_size)
 {
-    return m_mip_buf.get(i);
+    return m_file.get_user_data(out, max_size);
 }
 
 
-int MipBufRenderer::size()
+template<class T>
+bool MipBufRenderer_t<T>::set_user_data(const char* data, int size)
 {
-    return m_mip_buf.m_buf.size();
+    return m_file.set_user_data(data, size);
 }
 
 
-int MipBufRenderer::get_change_counter()
+template<class T>
+mip_index_t MipBufRenderer_t<T>::size()
 {
-    return m_mip_buf.m_buf.get_change_counter();
+    return m_mip_buf.size();
 }
 
 
-void MipBufRenderer::inc_change_counter()
+template<class T>
+mip_index_t MipBufRenderer_t<T>::first()
 {
-    m_mip_buf.m_buf.inc_change_counter();
+    return m_mip_buf.first();
+}
+
+
+template<class T>
+mip_index_t MipBufRenderer_t<T>::get_change_counter()
+{
+    return m_mip_buf.get_change_counter();
+}
+
+
+template<class T>
+void MipBufRenderer_t<T>::inc_change_counter()
+{
+    m_mip_buf.inc_change_counter();
 }
 
 
@@ -178,3 +770,162 @@ void MipBufRenderer::inc_change_counter()
 // ---- PRIVATE -------------------------------------------------------------
 // --------------------------------------------------------------------------
 
+
+template<class T>
+void MipBufRenderer_t<T>::m_render_groups(MipLevel_t<T>* l, mip_index_t start, mip_index_t end, int group, bool minmax,
+        const MipBufEntry<T>* tail, float tail_x)
+{
+    glBegin(minmax ? GL_LINES : GL_LINE_STRIP);
+
+    // groups start at multiples of 'group' so they stay the same while
+    // scrolling.
+    m_num_vertices = 0;
+    for (mip_index_t g = start - start % group; g <= end; g += group)
+    {
+        mip_index_t a = g > start ? g : start;
+        mip_index_t b = g + group - 1 < end ? g + group - 1 : end;
+        T minval = 0, maxval = 0;
+        double sum = 0.;
+        for (mip_index_t i = a; i <= b;)
+        {
+            T *mn, *mx, *avg;
+            mip_index_t n = l->span(i, b - i + 1, &mn, &mx, &avg);
+            assert(n);
+            for (mip_index_t j = 0; j < n; j++)
+            {
+                minval = i + j == a || mn[j] < minval ? mn[j] : minval;
+                maxval = i + j == a || mx[j] > maxval ? mx[j] : maxval;
+                sum += avg[j];
+            }
+            i += n;
+        }
+
+        float x = float((a + b) * 0.5 - start);
+        if (minmax)
+        {
+            glVertex3f(x, float(minval), 0.);
+            glVertex3f(x, float(maxval), 0.);
+            m_num_vertices += 2;
+        }
+        else
+        {
+            glVertex3f(x, float(sum / (b - a + 1)), 0.);
+            m_num_vertices++;
+        }
+    }
+
+    if (tail && minmax)
+    {
+        glVertex3f(tail_x, float(tail->minval), 0.);
+        glVertex3f(tail_x, float(tail->maxval), 0.);
+        m_num_vertices += 2;
+    }
+    else if (tail)
+    {
+        glVertex3f(tail_x, float(tail->avg), 0.);
+        m_num_vertices++;
+    }
+
+    glEnd();
+}
+
+
+template<class T>
+bool MipBufRenderer_t<T>::m_tail(int level, mip_index_t start, mip_index_t* end, MipBufEntry<T>* tail, float* x)
+{
+    mip_index_t count;
+    if (*end < m_mip_buf.level(level)->size() || !m_mip_buf.get_tail(level, tail, &count))
+        return false;
+    // complete entries are drawn at the middle of their samples. so is the
+    // tail, it just has fewer of them.
+    double entry = double(mip_index_t(1) << m_mip_buf.level_shift(level));
+    *x = float(*end - start + (count / entry - 1.) * 0.5);
+    (*end)--;
+    return true;
+}
+
+
+template<class T>
+void MipBufRenderer_t<T>::m_render_tail(MipLevel_t<T>* l, mip_index_t start, mip_index_t end, const MipBufEntry<T>& tail, float x, bool minmax)
+{
+    glBegin(GL_LINES);
+    if (minmax)
+    {
+        glVertex3f(x, float(tail.minval), 0.);
+        glVertex3f(x, float(tail.maxval), 0.);
+    }
+    else
+    {
+        // a flat line from the tail if entry 'end' isn't there
+        T minval = tail.minval, maxval = tail.maxval, avg = tail.avg;
+        l->get(end, &minval, &maxval, &avg);
+        glVertex3f(float(end - start), float(avg), 0.);
+        glVertex3f(x, float(tail.avg), 0.);
+    }
+    glEnd();
+}
+
+
+template<class T>
+bool MipBufRenderer_t<T>::m_vbo_enabled()
+{
+    if (!m_use_vbo)
+        return false;
+    if (m_vbo_supported == -1)
+        m_vbo_supported = MipBufVbo::available();
+    return m_vbo_supported == 1;
+}
+
+
+template<class T>
+void MipBufRenderer_t<T>::m_convert(const float* in, T* out, int n)
+{
+    for (int i = 0; i < n; i++)
+        out[i] = MipSample<T>::from_double(in[i]);
+}
+
+
+template<class T>
+mip_index_t MipBufRenderer_t<T>::m_chunk(mip_index_t block)
+{
+    if (m_trigger.mode() == MIP_TRIGGER_NONE || !m_mip_buf.capacity())
+        return MIP_MAX(block, 1);
+    return MIP_MAX(MIP_MIN(block, mip_index_t(m_mip_buf.capacity() - 1)), 1);
+}
+
+
+template class MipBufRenderer_t<float>;
+template class MipBufRenderer_t<signed char>;
+template class MipBufRenderer_t<unsigned char>;
+template class MipBufRenderer_t<short>;
+template class MipBufRenderer_t<unsigned short>;
+template class MipBufRenderer_t<int>;
+
+
+// --------------------------------------------------------------------------
+// ---- MipBufRenderer ------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+MipBufRenderer* MipBufRenderer::create(int sample_type, int capacity, int queue_size, int branching, int skip_levels)
+{
+    switch (sample_type)
+    {
+        case MIP_FLOAT32: return new MipBufRenderer_t<float>(capacity, queue_size, branching, skip_levels);
+        case MIP_INT8:    return new MipBufRenderer_t<signed char>(capacity, queue_size, branching, skip_levels);
+        case MIP_UINT8:   return new MipBufRenderer_t<unsigned char>(capacity, queue_size, branching, skip_levels);
+        case MIP_INT16:   return new MipBufRenderer_t<short>(capacity, queue_size, branching, skip_levels);
+        case MIP_UINT16:  return new MipBufRenderer_t<unsigned short>(capacity, queue_size, branching, skip_levels);
+        case MIP_INT32:   return new MipBufRenderer_t<int>(capacity, queue_size, branching, skip_levels);
+    }
+    return NULL;
+}
+
+
+int MipBufRenderer::file_sample_type(const char* path)
+{
+    MipFile file;
+    if (!file.open(path, 0, false))
+        return -1;
+    return file.get_sample_type();
+}
@@ -3,33 +3,262 @@
 
 
 #include "mip_buf_t.h"
+#include "mip_buf_vbo.h"
+#include "mip_density.h"
+#include "mip_trigger_t.h"
+#include "mip_search_t.h"
+#include "spsc_queue_t.h"
+
+
+// sample types a MipBufRenderer can store. integer samples are raw values,
+// the python side maps them to units with glScalef/glTranslatef anyway.
+enum
+{
+    MIP_FLOAT32 = 0,
+    MIP_INT8,
+    MIP_UINT8,
+    MIP_INT16,
+    MIP_UINT16,
+    MIP_INT32,
+    MIP_NUM_SAMPLE_TYPES
+};
 
 
 // MipBuf and renderer combined.
 // wrapper class to simplify python integration.
+//
+// the interface takes and returns float samples whatever the storage type
+// is. they are rounded and clamped to it on the way in. append_raw*()
+// copies samples of the storage type as they are.
 
 class MipBufRenderer
 {
 public:
-    MipBufRenderer();
-    ~MipBufRenderer();
+    // capacity 0: keep everything. otherwise every mip level keeps only its
+    // newest 'capacity' entries. see mip_buf_t.h
+    // queue_size 0: no push*() support. otherwise the size of the queue
+    // between the push*() thread and the render thread, in samples.
+    // branching, skip_levels: pyramid shape, see mip_buf_t.h
+    // sample_type: MIP_FLOAT32, MIP_INT8, .. return NULL for an unknown one.
+    static MipBufRenderer* create(int sample_type, int capacity=0, int queue_size=0, int branching=2, int skip_levels=0);
+    // sample type of a file saved by create_file(). -1 if it can't be opened.
+    static int file_sample_type(const char* path);
+
+    virtual ~MipBufRenderer() {}
+
+    virtual int  get_sample_type() = 0;
 
     // end_index NOT one past last. end_index points to a real entry.
-    void render_avg(float start_index, float end_index, float resolution);
+    virtual void render_avg(double start_index, double end_index, double resolution) = 0;
     // renders a solid column, not two separate lines.
-    void render_minmax(float start_index, float end_index, float resolution);
+    virtual void render_minmax(double start_index, double end_index, double resolution) = 0;
+    // one line strip through (first, min, max, last) of the samples of every
+    // pixel column (M4 aggregation). min and max are exact for any zoom, see
+    // MipBuf_t::get_minmax. at most 4 vertices per pixel. zoomed in to less
+    // than 2 samples per pixel it's the same as render_avg.
+    virtual void render_m4(double start_index, double end_index, double resolution) = 0;
+    // density ("phosphor") view, see mip_density.h. a histogram of every
+    // pixel column with 'height' bins from raw value_min to value_max, drawn
+    // in the current glColor. only columns not drawn before are computed.
+    virtual void render_density(double start_index, double end_index, double resolution,
+            double value_min, double value_max, int height) = 0;
+    // num of vertices the last render_*() call sent to GL
+    virtual int  get_num_vertices() = 0;
+    // render through vertex buffer objects (see mip_buf_vbo.h) instead of
+    // glBegin/glEnd. silently ignored if the driver doesn't support them.
+    virtual void set_use_vbo(bool use_vbo) = 0;
+    virtual bool get_use_vbo() = 0;
+    // delete the vertex buffers and the density texture. needs the GL
+    // context they were made in to be current. the destructor doesn't touch
+    // GL, rendering again after this uploads everything again.
+    virtual void release_gl() = 0;
     // same as append_minmaxavg, but minval and maxval will be equal to avg.
+    virtual void append(float avg) = 0;
+    virtual void append_minmaxavg(float minval, float maxval, float avg) = 0;
+    // append n samples at once. cheaper than n calls to append().
+    virtual void append_array(const float* avg, int n) = 0;
+    virtual void append_minmaxavg_arrays(const float* minval, const float* maxval, const float* avg, int n) = 0;
+    // append_array and append_minmaxavg_arrays for arrays of the storage
+    // type. no conversion, the fastest way in.
+    virtual void append_raw_array(const void* avg, int n) = 0;
+    virtual void append_raw_minmaxavg_arrays(const void* minval, const void* maxval, const void* avg, int n) = 0;
+    // append_minmaxavg_arrays and append_raw_minmaxavg_arrays of a whole
+    // recording on num_threads threads (0: one per core). the pyramid is the
+    // same as after serial appends, see MipBuf_t::append_minmaxavg_arrays_parallel.
+    virtual void append_arrays_parallel(const float* minval, const float* maxval, const float* avg, mip_index_t n, int num_threads) = 0;
+    virtual void append_raw_arrays_parallel(const void* minval, const void* maxval, const void* avg, mip_index_t n, int num_threads) = 0;
+    // thread safe versions of append*() for ONE producer thread. samples go
+    // into a lock-free queue and reach the mip levels on the next drain().
+    // return num of samples queued. if the queue is full, the rest are
+    // dropped and counted in get_dropped().
+    virtual int  push(float avg) = 0;
+    virtual int  push_array(const float* avg, int n) = 0;
+    virtual int  push_minmaxavg_arrays(const float* minval, const float* maxval, const float* avg, int n) = 0;
+    // move everything pushed so far into the mip levels. call from the
+    // thread that renders. return num of samples moved.
+    virtual int  drain() = 0;
+    // num of samples push*() had no room for
+    virtual mip_index_t get_dropped() = 0;
+    // num of samples push*() can take right now. from the producer thread
+    // it's a lower bound, drain() only makes more room.
+    virtual int  queue_free() = 0;
+    // keep the samples in a memory-mapped file, see mip_file.h. not for
+    // rings. return false on error.
+    // create_file: a new file. everything appended so far is copied there,
+    // new samples stream into it.
+    virtual bool create_file(const char* path) = 0;
+    // open_file: a file saved before, only on an empty renderer of the same
+    // sample type. nothing is read, pages are loaded when rendered.
+    // writable to continue appending.
+    virtual bool open_file(const char* path, bool writable) = 0;
+    // write everything to disk. true if there's no file.
+    virtual bool flush_file() = 0;
+    virtual bool has_file() = 0;
+    // false if the samples are in a file opened read-only
+    virtual bool is_writable() = 0;
+    // timestamps saved in the file next to the samples. return num of
+    // timestamps appended / copied, 0 if there's no file.
+    virtual int  append_timestamps(const double* timestamps, int n) = 0;
+    virtual int  get_timestamps(mip_index_t start, int n, double* out) = 0;
+    virtual mip_index_t num_timestamps() = 0;
+    // free-form blob saved in the file header. get_user_data returns its
+    // full size, copies at most max_size bytes.
+    virtual int  get_user_data(char* out, int max_size) = 0;
+    virtual bool set_user_data(const char* data, int size) = 0;
+    // return num of elements appended. memory consumption is a little bit
+    // more than for twice as much elements because of the 'mipmapping'.
+    virtual mip_index_t size() = 0;
+    // index of the oldest sample still kept
+    virtual mip_index_t first() = 0;
+    virtual mip_index_t get_change_counter() = 0;
+    virtual void inc_change_counter() = 0;
+    // return false if i is out of range
+    virtual bool get(mip_index_t i, MipBufEntry<float>* out) = 0;
+    // avg of samples start..start+n-1 into out. stops at the first sample
+    // not kept or not appended yet. return num copied.
+    virtual int  get_avg(mip_index_t start, int n, float* out) = 0;
+    // min, max and mean of samples start..end-1 in O(log(end - start)), see
+    // MipBuf_t::get_stats. count is the num of samples still kept in the
+    // range. return false if there are none.
+    virtual bool range_stats(mip_index_t start, mip_index_t end, float* minval, float* maxval, double* mean, mip_index_t* count) = 0;
+    // oscilloscope trigger on the avg of the samples, see mip_trigger_t.h.
+    // mode: MIP_TRIGGER_NONE, MIP_TRIGGER_RISING, .. levels are raw sample
+    // values. indexes the samples kept so far right away, new samples as
+    // they are appended or drained.
+    virtual void set_trigger(int mode, double level, double level2, mip_index_t holdoff) = 0;
+    // the first sample of start..end-1 that triggers, -1 if none. skips
+    // through the pyramid, no holdoff.
+    virtual mip_index_t find_trigger(mip_index_t start, mip_index_t end) = 0;
+    // num of triggers indexed since set_trigger
+    virtual mip_index_t num_triggers() = 0;
+    // indexed triggers in start..end-1, at most max_n. return num copied.
+    // triggers of samples not kept anymore don't count.
+    virtual int  get_triggers(mip_index_t start, mip_index_t end, mip_index_t* out, int max_n) = 0;
+    // the last indexed trigger before 'end', -1 if none
+    virtual mip_index_t last_trigger(mip_index_t end) = 0;
+    // threshold search, see mip_search_t.h. mode: MIP_SEARCH_ABOVE, ..
+    // levels are raw sample values. matching samples of start..end-1 in
+    // order (newest first if backward), at most max_n. return num copied.
+    virtual int  find(int mode, double level, double level2, mip_index_t start, mip_index_t end, bool backward,
+            mip_index_t* out, int max_n) = 0;
+};
+
+
+// the renderer of one sample type. T is float, signed char, unsigned char,
+// short, unsigned short or int, see MipBufRenderer::create.
+
+template<class T>
+class MipBufRenderer_t : public MipBufRenderer
+{
+public:
+    MipBufRenderer_t(int capacity=0, int queue_size=0, int branching=2, int skip_levels=0);
+    ~MipBufRenderer_t();
+
+    int  get_sample_type();
+
+    void render_avg(double start_index, double end_index, double resolution);
+    void render_minmax(double start_index, double end_index, double resolution);
+    void render_m4(double start_index, double end_index, double resolution);
+    void render_density(double start_index, double end_index, double resolution,
+            double value_min, double value_max, int height);
+    int  get_num_vertices();
+    void set_use_vbo(bool use_vbo);
+    bool get_use_vbo();
+    void release_gl();
     void append(float avg);
     void append_minmaxavg(float minval, float maxval, float avg);
-    // return num of elements appended. memory consumption is a little bit
-    // more than for twice as much elements because of the 'mipmapping'. 
-    int  size();
-    int  get_change_counter();
+    void append_array(const float* avg, int n);
+    void append_minmaxavg_arrays(const float* minval, const float* maxval, const float* avg, int n);
+    void append_raw_array(const void* avg, int n);
+    void append_raw_minmaxavg_arrays(const void* minval, const void* maxval, const void* avg, int n);
+    void append_arrays_parallel(const float* minval, const float* maxval, const float* avg, mip_index_t n, int num_threads);
+    void append_raw_arrays_parallel(const void* minval, const void* maxval, const void* avg, mip_index_t n, int num_threads);
+    int  push(float avg);
+    int  push_array(const float* avg, int n);
+    int  push_minmaxavg_arrays(const float* minval, const float* maxval, const float* avg, int n);
+    int  drain();
+    mip_index_t get_dropped();
+    int  queue_free();
+    bool create_file(const char* path);
+    bool open_file(const char* path, bool writable);
+    bool flush_file();
+    bool has_file();
+    bool is_writable();
+    int  append_timestamps(const double* timestamps, int n);
+    int  get_timestamps(mip_index_t start, int n, double* out);
+    mip_index_t num_timestamps();
+    int  get_user_data(char* out, int max_size);
+    bool set_user_data(const char* data, int size);
+    mip_index_t size();
+    mip_index_t first();
+    mip_index_t get_change_counter();
     void inc_change_counter();
-    MipBufEntry<float>* get(int i);
+    bool get(mip_index_t i, MipBufEntry<float>* out);
+    int  get_avg(mip_index_t start, int n, float* out);
+    bool range_stats(mip_index_t start, mip_index_t end, float* minval, float* maxval, double* mean, mip_index_t* count);
+    void set_trigger(int mode, double level, double level2, mip_index_t holdoff);
+    mip_index_t find_trigger(mip_index_t start, mip_index_t end);
+    mip_index_t num_triggers();
+    int  get_triggers(mip_index_t start, mip_index_t end, mip_index_t* out, int max_n);
+    mip_index_t last_trigger(mip_index_t end);
+    int  find(int mode, double level, double level2, mip_index_t start, mip_index_t end, bool backward,
+            mip_index_t* out, int max_n);
 
 private:
-    MipBuf_t<float> m_mip_buf;
+    // before m_mip_buf, the levels map its segments
+    MipFile         m_file;
+    MipBuf_t<T>     m_mip_buf;
+    MipBufVbo       m_vbo;
+    bool            m_use_vbo;
+    // -1: not checked yet. needs a current GL context to find out.
+    int             m_vbo_supported;
+    int             m_num_vertices;
+    // render_m4 vertices (x, y) before glDrawArrays
+    array_t<float>  m_m4_vertices;
+    MipDensity      m_density;
+    MipTrigger_t<T> m_trigger;
+
+    spsc_queue_t< MipBufEntry<T> > m_queue;
+    // written only by the producer
+    volatile mip_index_t m_dropped;
+
+    bool m_vbo_enabled();
+    // draw entries start..end of the level combined 'group' at a time, and
+    // the tail after them if not NULL
+    void m_render_groups(MipLevel_t<T>* l, mip_index_t start, mip_index_t end, int group, bool minmax,
+            const MipBufEntry<T>* tail=NULL, float tail_x=0.);
+    // if 'end' from get_buf is the tail of the level (see
+    // MipBuf_t::get_tail), get it and its x relative to entry 'start', and
+    // step 'end' back to the last complete entry.
+    bool m_tail(int level, mip_index_t start, mip_index_t* end, MipBufEntry<T>* tail, float* x);
+    // the tail after entry 'end'. a line from entry 'end' for avg.
+    void m_render_tail(MipLevel_t<T>* l, mip_index_t start, mip_index_t end, const MipBufEntry<T>& tail, float x, bool minmax);
+    // float samples to the storage type, MIP_DOWNSAMPLE_BLOCK at a time
+    void m_convert(const float* in, T* out, int n);
+    // samples to append before the next m_trigger.update(), at most 'block'.
+    // a ring with a trigger takes less than its capacity at a time, so every
+    // sample is scanned (with the one before it) before it can be dropped.
+    mip_index_t m_chunk(mip_index_t block);
 };
 
 
@@ -33,20 +33,160 @@
 //   and maxval. those are not averaged for each next buf level, but instead
 //   smallest of the two minval's and largest of maxval's will be selected.
 //
+//   storage: every level (buf0, buf1, ..) is a MipLevel_t - three flat
+//   arrays (structure of arrays), one per column. a level is always
+//   downsampled from the previous one a whole block at a time with a plain
+//   loop over raw pointers, and any entry of any level is one array lookup
+//   away.
+//
+//   retention: if created with a capacity, every level keeps only its newest
+//   'capacity' entries in a ring. buf0 then holds the last 'capacity'
+//   samples, buf1 the last 2*capacity samples at half the resolution, and so
+//   on. sample indices stay absolute and keep growing, only the oldest
+//   entries become unavailable (see MipLevel_t::first()).
+//
+//   branching: the example above is branching 2, the default. with
+//   branching B every B entries of a level make one entry of the next, so
+//   there are log_B(n) levels instead of log_2(n), and appending touches
+//   fewer levels. skip_levels N leaves out the N levels after buf0 (buf1 is
+//   made directly of B^(N+1) buf0 entries). both save append time and
+//   memory, but get_buf then may return a level with up to B^(N+1) entries
+//   per pixel, which the renderer has to aggregate while drawing.
+//
+//   files: set_file() moves every level into a memory-mapped MipFile (see
+//   mip_file.h). appending continues there, and a saved pyramid is opened
+//   without reading it.
+//
+//   sample types: T is float or any integer type up to 32 bits. integer
+//   levels average in 64 bits and round to nearest (see MipSample), so
+//   uint8 samples cost 3 bytes per entry instead of the 12 of float. the
+//   avg of an integer entry is the rounded mean of its samples, not of the
+//   rounded avgs of the level below: the exact sums of the entries that
+//   don't make a group yet are kept (one per level), and every block of
+//   appends passes the exact sums of its new entries up the levels.
+//
+//   bulk loads: append_minmaxavg_arrays_parallel() splits a large block
+//   into chunks aligned to the groups of the first few levels. every thread
+//   fills in level 0 and builds those levels of its own chunks, straight
+//   into the grown levels. the few coarser levels are built serially after
+//   that. every entry is computed by the same code from the same entries,
+//   so the pyramid is the same as after serial appends, bit for bit.
+//
+//   tails: an entry of level n is created only when its 2^n samples are
+//   all in, so the newest samples are missing from the coarser levels.
+//   get_tail() combines them into a partial entry after the last complete
+//   one of every level (a ninth sample appended to the example above
+//   would be the one-sample tail of buf1, buf2 and buf3). get_buf
+//   includes the tail if the range reaches past the last complete entry.
+//   tails are computed when asked for, from the few entries of every
+//   level that don't make a group yet, and are never stored in the levels.
+//
 
 #include "math.h"
+#include <limits>
 
 
-#include "pool_t.h"
+#include "mip_level_t.h"
+#include "parallel_for.h"
 
 
 #define MIP_MIN(X,Y) ((X) < (Y) ? (X) : (Y))
 #define MIP_MAX(X,Y) ((X) > (Y) ? (X) : (Y))
 
+// level n holds one entry for every 2^n appended samples. 64 levels is
+// more than any index type here can address.
+#define MIP_MAX_LEVELS 64
+// num of entries downsampled at once into a stack buffer
+#define MIP_DOWNSAMPLE_BLOCK 1024
+// level 0 entries downsampled at once by append_minmaxavg_arrays. bounds
+// the exact sums of the new entries of level 1 to a few MB.
+#define MIP_SUMS_BLOCK (1 << 20)
+// samples per work item of append_minmaxavg_arrays_parallel. a few MB, so
+// a chunk stays in the cache while its levels are built.
+#define MIP_PARALLEL_CHUNK (1 << 18)
+
+#if MIP_MAX_LEVELS > MIP_FILE_LEVELS
+    #error "MipFile can't hold all the levels"
+#endif
+
+
+// averaging and conversion of the sample type T. integer types sum in 64
+// bits, so no entry of any level overflows, and round halves up. 'exact':
+// levels are built from exact sums of samples. averaging the rounded avgs
+// of the level below would drift +0.25 per level.
+template<class T>
+struct MipSample
+{
+    typedef long long accum_t;
+    static const bool exact = true;
+
+    static inline T avg2(T a, T b)
+    {
+        return T((accum_t(a) + b + 1) >> 1);
+    }
+
+    // sum of 2^shift entries
+    static inline T avg(accum_t sum, int shift)
+    {
+        return T((sum + ((accum_t(1) << shift) >> 1)) >> shift);
+    }
+
+    // rounded and clamped to the range of T. nan is 0.
+    static inline T from_double(double v)
+    {
+        if (v != v)
+            return 0;
+        if (v <= double(std::numeric_limits<T>::min()))
+            return std::numeric_limits<T>::min();
+        if (v >= double(std::numeric_limits<T>::max()))
+            return std::numeric_limits<T>::max();
+        return T(floor(v + 0.5));
+    }
+};
+
+
+template<>
+struct MipSample<float>
+{
+    typedef double accum_t;
+    static const bool exact = false;
+
+    static inline float avg2(float a, float b)
+    {
+        return float((a + b) / 2.);
+    }
+
+    static inline float avg(accum_t sum, int shift)
+    {
+        return float(sum / (1 << shift));
+    }
+
+    static inline float from_double(double v)
+    {
+        return float(v);
+    }
+};
+
+
+// samples of type S to T, rounded and clamped. a plain copy if S is T.
+template<class T, class S>
+inline void mip_convert(const S* in, T* out, mip_index_t n)
+{
+    for (mip_index_t i = 0; i < n; i++)
+        out[i] = MipSample<T>::from_double(double(in[i]));
+}
+
+template<class T>
+inline void mip_convert(const T* in, T* out, mip_index_t n)
+{
+    memcpy(out, in, sizeof(T) * n);
+}
+
 
 template<class T>
 struct MipBufEntry
 {
+    MipBufEntry() {}
     MipBufEntry(T _minval, T _maxval, T _avg): minval(_minval), maxval(_maxval), avg(_avg) {}
     T minval;
     T maxval;
@@ -58,25 +198,159 @@ template<class T>
 class MipBuf_t
 {
 public:
-    MipBuf_t();
+    // capacity 0: keep everything. otherwise keep only the newest
+    // 'capacity' entries on every level. has to be at least
+    // branching^(skip_levels+1). branching is a power of two, 2..256.
+    MipBuf_t(int capacity=0, int branching=2, int skip_levels=0);
     ~MipBuf_t();
 
     void append(T avg);
     void append_minmaxavg(T minval, T maxval, T avg);
+    // bulk versions of append() and append_minmaxavg(). all mip levels are
+    // built level by level after the whole block is in, instead of one
+    // child append per sample.
+    void append_array(const T* avg, int n);
+    void append_minmaxavg_arrays(const T* minval, const T* maxval, const T* avg, int n);
+    // append_minmaxavg_arrays on num_threads threads (0: one per core), for
+    // loading large recordings. samples of type S are converted with
+    // MipSample<T>::from_double. the result is exactly the pyramid of serial
+    // appends. rings, files and small blocks are appended serially.
+    template<class S>
+    void append_minmaxavg_arrays_parallel(const S* minval, const S* maxval, const S* avg, mip_index_t n, int num_threads=0);
+
+    // keep all levels in the file from now on. if this MipBuf_t is empty, it
+    // takes over the pyramid in the file (appending only if the file is
+    // writable). otherwise the file has to be writable and empty, and
+    // everything appended so far is copied into it. a saved pyramid brings
+    // its own branching and skip_levels. the file has to outlive this
+    // MipBuf_t. not for rings. return false if not possible.
+    bool set_file(MipFile* file);
+    // NULL if none
+    MipFile* file();
 
     void get_buf(
-            float start_index, float end_index, float resolution,
-            MipBuf_t** out_buf,
-            float* out_start_pixel, int* out_start_index,
-            float* out_end_pixel,   int* out_end_index);
+            double start_index, double end_index, double resolution,
+            int* out_level,
+            double* out_start_pixel, mip_index_t* out_start_index,
+            double* out_end_pixel,   mip_index_t* out_end_index);
+
+    // entry i (-size..size-1) of the given level. return false if out of
+    // range or not kept anymore.
+    bool get(mip_index_t i, MipBufEntry<T>* out, int level=0);
+    // the partial entry at index size() of the given level: the samples
+    // after its last complete entry, combined the same way (avg is their
+    // mean). count is the num of samples in it. return false for level 0
+    // and if there are no such samples.
+    bool get_tail(int level, MipBufEntry<T>* out, mip_index_t* count);
+
+    // smallest minval and largest maxval of samples start..end-1. exact,
+    // combines the largest aligned entries of every level that fit in the
+    // range, so the cost is logarithmic in end - start. in ring mode
+    // samples not kept at a fine level come from a coarser entry that may
+    // reach outside the range. return false if nothing in range is kept.
+    bool get_minmax(mip_index_t start, mip_index_t end, T* minval, T* maxval);
+    // get_minmax, plus the mean of the samples (avg of every entry weighted
+    // by the num of samples it covers in the range) and the num of samples
+    // in the range still kept. the mean is exact up to the rounding of the
+    // averaged levels.
+    bool get_stats(mip_index_t start, mip_index_t end, T* minval, T* maxval, double* mean, mip_index_t* count);
+
+    // NULL if the level doesn't exist yet. level 0 always exists.
+    MipLevel_t<T>* level(int level);
+    int  num_levels();
 
-    MipBufEntry<T>* get(int i);
+    int  branching();
+    int  skip_levels();
+    // one entry of the given level covers 2^level_shift(level) samples
+    int  level_shift(int level);
 
-    pool_t<MipBufEntry<T> > m_buf;
+    // num of samples ever appended (level 0 size)
+    mip_index_t size();
+    // index of the oldest sample still kept in level 0
+    mip_index_t first();
+    int  capacity();
+    // append() will increment this. will be zero after creation.
+    // nothing can reset it.
+    mip_index_t get_change_counter();
+    void inc_change_counter();
 
 private:
+    typedef typename MipSample<T>::accum_t accum_t;
 
-    MipBuf_t* m_child;
+    MipLevel_t<T>* m_levels[MIP_MAX_LEVELS];
+    int m_num_levels;
+    int m_capacity;
+    int m_branching;
+    int m_branching_shift;
+    int m_skip_levels;
+    mip_index_t m_change_counter;
+    MipFile* m_file;
+    // get_tail of every level. up to date if m_tails_counter is m_change_counter.
+    MipBufEntry<T> m_tails[MIP_MAX_LEVELS];
+    mip_index_t    m_tail_counts[MIP_MAX_LEVELS];
+    mip_index_t    m_tails_counter;
+    // MipSample<T>::exact only. sum of the samples of the entries of every
+    // level after its last complete group.
+    accum_t        m_pending[MIP_MAX_LEVELS];
+    // exact sums of the new entries of a level and of the next level, for
+    // m_downsample
+    array_t<accum_t> m_sums[2];
+
+    // num of entries of the level that make one entry of the next level
+    int  m_group(int level);
+    // build the coarser levels from entries 'first'.. of the given level.
+    // sums: exact sums of those entries (MipSample<T>::exact), from
+    // m_group_sums(.., 1). NULL for level 0.
+    void m_downsample(int level, mip_index_t first, const accum_t* sums=NULL);
+    // m_sums[buf] for entries 'first'..first+n-1 of the given level and the
+    // entries of their group before them. the sum of those is on the first
+    // entry of the group. return the place of entry 'first'.
+    accum_t* m_group_sums(int level, mip_index_t first, mip_index_t n, int buf);
+    // sum of the entries a..b-1 of the level: sums[0..b-a-1], or the samples
+    // if NULL (level 0)
+    accum_t  m_sum(int level, mip_index_t a, mip_index_t b, const accum_t* sums);
+    // n entries of the next level out of n*g entries. exact types: ssum
+    // holds the sums of the entries (NULL: use savg, level 0), dsum gets
+    // the sums of the new ones, and shift is level_shift of the next level.
+    // otherwise shift is log2(g).
+    static void m_downsample_run(const T* smin, const T* smax, const T* savg, const accum_t* ssum, int n, int g, int shift,
+            T* dmin, T* dmax, T* davg, accum_t* dsum);
+    // levels 1..top of samples start..end-1, which are in level 0 already.
+    // the levels are grown to fit, start and end are multiples of
+    // 2^level_shift(top). exact types: top_sums gets the sums of the new
+    // entries of level top.
+    void m_build(mip_index_t start, mip_index_t end, int top, accum_t* top_sums);
+    // one chunk of append_minmaxavg_arrays_parallel. parallel_for_func_t
+    template<class S>
+    static void m_build_chunk(int i, void* arg);
+    // append_minmaxavg_arrays, MIP_DOWNSAMPLE_BLOCK converted samples at a time
+    template<class S>
+    void m_append_converted(const S* minval, const S* maxval, const S* avg, mip_index_t n);
+    // create the level if it doesn't exist yet
+    MipLevel_t<T>* m_get_level(int level);
+    // fill m_tails and m_tail_counts
+    void m_update_tails();
+    // m_pending of a pyramid taken over from a file, from the avgs of the
+    // entries. exact as long as those entries are.
+    void m_init_pending();
+};
+
+
+// work of append_minmaxavg_arrays_parallel, shared by the threads
+template<class T, class S>
+struct MipParallelBuild
+{
+    MipBuf_t<T>* buf;
+    const S*     minval;
+    const S*     maxval;
+    const S*     avg;
+    // level 0 index of minval[0]
+    mip_index_t  start;
+    mip_index_t  n;
+    mip_index_t  chunk;
+    int          top;
+    // MipSample<T>::exact: sums of the new entries of level top
+    typename MipSample<T>::accum_t* top_sums;
 };
 
 
@@ -86,16 +360,33 @@ private:
 
 
 template<class T>
-MipBuf_t<T>::MipBuf_t(): m_buf(20000, 2000)
+MipBuf_t<T>::MipBuf_t(int capacity, int branching, int skip_levels)
 {
-    m_child = NULL;
+    assert(branching >= 2 && branching <= 256 && (branching & (branching - 1)) == 0);
+    assert(skip_levels >= 0);
+    memset(m_levels, 0, sizeof(m_levels));
+    m_branching       = branching;
+    m_skip_levels     = skip_levels;
+    m_branching_shift = 0;
+    while ((1 << m_branching_shift) < branching)
+        m_branching_shift++;
+    assert(m_branching_shift * (skip_levels + 1) < 31);
+    assert(capacity == 0 || capacity >= m_group(0));
+    m_capacity       = capacity;
+    m_levels[0]      = new MipLevel_t<T>(m_capacity);
+    m_num_levels     = 1;
+    m_change_counter = 0;
+    m_file           = NULL;
+    m_tails_counter  = -1;
+    memset(m_pending, 0, sizeof(m_pending));
 }
 
 
 template<class T>
 MipBuf_t<T>::~MipBuf_t()
 {
-    delete m_child;
+    for (int i = 0; i < m_num_levels; i++)
+        delete m_levels[i];
 }
 
 
@@ -114,20 +405,168 @@ inline void MipBuf_t<T>::append(T avg)
 template<class T>
 void MipBuf_t<T>::append_minmaxavg(T minval, T maxval, T avg)
 {
-    MipBufEntry<T>* e = m_buf.append();
-    e->minval = minval;
-    e->maxval = maxval;
-    e->avg    = avg;
+    MipLevel_t<T>* l = m_levels[0];
+    l->append(minval, maxval, avg);
+    m_change_counter++;
+
+    if (m_branching != 2 || m_skip_levels)
+    {
+        if (l->size() % m_group(0) == 0)
+            m_downsample(0, l->size() - 1);
+        else
+            m_pending[0] += avg;
+        return;
+    }
 
-    if ((m_buf.size() & 1) == 0)
+    // every second entry completes a pair and creates an entry in the next
+    // level. sum: samples of the entry just appended to the level.
+    accum_t sum = avg;
+    int level = 0;
+    for (; (l->size() & 1) == 0 && level + 1 < MIP_MAX_LEVELS; level++)
     {
-        if (!m_child)
-            m_child = new MipBuf_t<T>();
-        MipBufEntry<T>* e1 = m_buf.get(-2);
-        MipBufEntry<T>* e2 = m_buf.get(-1);
-        // TODO: avg1 + avg2 overflow if unsigned char?
-        m_child->append_minmaxavg(MIP_MIN(e1->minval, e2->minval), MIP_MAX(e1->maxval, e2->maxval), (e1->avg + e2->avg) / 2.);
+        MipBufEntry<T> e1(0, 0, 0), e2(0, 0, 0);
+        l->get(l->size() - 2, &e1.minval, &e1.maxval, &e1.avg);
+        l->get(l->size() - 1, &e2.minval, &e2.maxval, &e2.avg);
+        sum += m_pending[level];
+        m_pending[level] = 0;
+        l = m_get_level(level + 1);
+        l->append(MIP_MIN(e1.minval, e2.minval), MIP_MAX(e1.maxval, e2.maxval),
+                MipSample<T>::exact ? MipSample<T>::avg(sum, level + 1) : MipSample<T>::avg2(e1.avg, e2.avg));
     }
+    m_pending[level] = sum;
+}
+
+
+template<class T>
+void MipBuf_t<T>::append_array(const T* avg, int n)
+{
+    append_minmaxavg_arrays(avg, avg, avg, n);
+}
+
+
+template<class T>
+void MipBuf_t<T>::append_minmaxavg_arrays(const T* minval, const T* maxval, const T* avg, int n)
+{
+    // a ring has to still hold the first entry of a group when the group
+    // gets completed. so feed it blocks that fit.
+    int block = MIP_MIN(m_capacity ? m_capacity - m_group(0) + 1 : n, MIP_SUMS_BLOCK);
+    for (int i = 0; i < n; i += block)
+    {
+        int c = MIP_MIN(block, n - i);
+        mip_index_t first = m_levels[0]->size();
+        m_levels[0]->append(minval + i, maxval + i, avg + i, c);
+        m_downsample(0, first);
+    }
+    m_change_counter += n;
+}
+
+
+template<class T>
+template<class S>
+void MipBuf_t<T>::append_minmaxavg_arrays_parallel(const S* minval, const S* maxval, const S* avg, mip_index_t n, int num_threads)
+{
+    // the threads build levels 1..top of their chunks. an entry of level
+    // top covers 2^16 samples or more, so what's left is little work.
+    int top = 1;
+    while (level_shift(top) < 16)
+        top++;
+    mip_index_t unit  = mip_index_t(1) << level_shift(top);
+    mip_index_t chunk = (MIP_PARALLEL_CHUNK + unit - 1) / unit * unit;
+
+    // serially up to a multiple of 'unit'. then every chunk starts at a
+    // group boundary of every level up to top, no group spans two chunks.
+    mip_index_t head = (unit - m_levels[0]->size() % unit) % unit;
+    if (m_capacity || m_file || num_threads == 1 || n - head < 2 * chunk)
+        head = n;
+    m_append_converted(minval, maxval, avg, head);
+    if (head == n)
+        return;
+
+    mip_index_t start = m_levels[0]->size();
+    mip_index_t body  = (n - head) / unit * unit;
+    for (int level = 0; level <= top; level++)
+        m_get_level(level)->grow(body >> level_shift(level));
+
+    MipParallelBuild<T, S> p;
+    p.buf    = this;
+    p.minval = minval + head;
+    p.maxval = maxval + head;
+    p.avg    = avg + head;
+    p.start  = start;
+    p.n      = body;
+    p.chunk  = chunk;
+    p.top    = top;
+    p.top_sums = NULL;
+    if (MipSample<T>::exact)
+        p.top_sums = m_group_sums(top, start >> level_shift(top), body >> level_shift(top), 1);
+    parallel_for(int((body + chunk - 1) / chunk), m_build_chunk<S>, &p, num_threads);
+    m_change_counter += body;
+
+    // the levels above top, and the samples after the last whole unit
+    m_downsample(top, start >> level_shift(top), p.top_sums);
+    m_append_converted(minval + head + body, maxval + head + body, avg + head + body, n - head - body);
+}
+
+
+template<class T>
+bool MipBuf_t<T>::set_file(MipFile* file)
+{
+    if (m_capacity || m_file || !file || !file->is_open() || file->get_elem_size() != int(sizeof(T)))
+        return false;
+
+    if (size() == 0)
+    {
+        if (file->get_branching())
+        {
+            m_branching       = file->get_branching();
+            m_skip_levels     = file->get_skip_levels();
+            m_branching_shift = 0;
+            while ((1 << m_branching_shift) < m_branching)
+                m_branching_shift++;
+        }
+        else if (file->is_writable())
+        {
+            file->set_branching(m_branching, m_skip_levels);
+        }
+        for (int i = 0; i < m_num_levels; i++)
+            delete m_levels[i];
+        m_num_levels = 0;
+        for (int level = 0; level < MIP_MAX_LEVELS && (level == 0 || file->size(level)); level++)
+            m_levels[m_num_levels++] = new MipLevel_t<T>(file, level);
+        m_change_counter += size();
+        m_init_pending();
+    }
+    else
+    {
+        if (!file->is_writable() || file->size(0))
+            return false;
+        file->set_branching(m_branching, m_skip_levels);
+        for (int level = 0; level < m_num_levels; level++)
+        {
+            MipLevel_t<T>* src = m_levels[level];
+            MipLevel_t<T>* dst = new MipLevel_t<T>(file, level);
+            for (mip_index_t i = 0; i < src->size();)
+            {
+                T *smin, *smax, *savg;
+                int n = int(src->span(i, MIP_MIN(src->size() - i, 1 << 20), &smin, &smax, &savg));
+                dst->append(smin, smax, savg, n);
+                i += n;
+            }
+            m_levels[level] = dst;
+            delete src;
+        }
+        m_change_counter++;
+    }
+
+    m_file = file;
+    return true;
+}
+
+
+template<class T>
+inline MipFile* MipBuf_t<T>::file()
+{
+    return m_file;
 }
 
 
@@ -141,18 +580,18 @@ void MipBuf_t<T>::append_minmaxavg(T minval, T maxval, T avg)
 //
 // start_index and end_index treat the samples as a continuous line. 0..1) is first sample,
 // 1..2) is second sample and so on.
-// out_start_index and out_end_index are traditional sample indices.
+// out_start_index and out_end_index are traditional sample indices of level out_level.
 template<class T>
 void MipBuf_t<T>::get_buf(
-        float start_index, float end_index, float resolution,
-        MipBuf_t** out_buf,
-        float* out_start_pixel, int* out_start_index,
-        float* out_end_pixel,   int* out_end_index)
+        double start_index, double end_index, double resolution,
+        int* out_level,
+        double* out_start_pixel, mip_index_t* out_start_index,
+        double* out_end_pixel,   mip_index_t* out_end_index)
 {
     // sanity check
     if (end_index <= start_index || resolution <= 0.1)
     {
-        *out_buf = this;
+        *out_level       = 0;
         *out_start_pixel = 0;
         *out_start_index = 0;
         *out_end_pixel   = 0;
@@ -160,45 +599,525 @@ void MipBuf_t<T>::get_buf(
     }
 
     // mathematically not exactly what it says.
-    float samples_per_pixel = (end_index - start_index) / resolution;
-    float pixels_per_sample = resolution / (end_index - start_index);
+    double samples_per_pixel = (end_index - start_index) / resolution;
+    double pixels_per_sample = resolution / (end_index - start_index);
 
-    if (samples_per_pixel >= 2. && m_child && (end_index - start_index) >= 4. + 1.)
+    // too much resolution, or the level doesn't reach back to start_index
+    // anymore. go to the coarser level.
+    int level = 0;
+    double g = m_group(0);
+    while (level + 1 < m_num_levels &&
+            ((samples_per_pixel >= g && (end_index - start_index) >= 2. * g + 1.) ||
+             (m_levels[level]->first() > 0 && round(start_index) < m_levels[level]->first())))
     {
-         // too much resolution. get child buf.
-        m_child->get_buf(start_index / 2., end_index / 2., resolution,
-                out_buf, out_start_pixel, out_start_index, out_end_pixel, out_end_index);
+        start_index /= g;
+        end_index   /= g;
+        samples_per_pixel /= g;
+        pixels_per_sample *= g;
+        level++;
+        g = m_group(level);
     }
-    else
+
+    mip_index_t size    = m_levels[level]->size();
+    mip_index_t i_start = (mip_index_t)round(start_index);
+    mip_index_t i_end   = (mip_index_t)round(end_index) - 1;
+
+    if (i_start < m_levels[level]->first())
+        i_start = m_levels[level]->first();
+
+    if (i_end >= size)
+        i_end = size - 1;
+
+    // the range reaches past the last complete entry. the tail there holds
+    // the newest samples.
+    MipBufEntry<T> tail;
+    mip_index_t    tail_count;
+    if (i_end == size - 1 && end_index > size && get_tail(level, &tail, &tail_count))
+        i_end = size;
+
+    *out_start_pixel = (i_start + 0.5 - start_index) * pixels_per_sample;
+    *out_end_pixel   = resolution - (end_index - i_end - 0.5) * pixels_per_sample;
+
+    *out_start_index = i_start;
+    *out_end_index   = i_end;
+
+    *out_level = level;
+}
+
+
+template<class T>
+bool MipBuf_t<T>::get(mip_index_t i, MipBufEntry<T>* out, int level)
+{
+    if (level < 0 || level >= m_num_levels)
+        return false;
+    MipLevel_t<T>* l = m_levels[level];
+    if (i < 0)
+        i += l->size();
+    return l->get(i, &out->minval, &out->maxval, &out->avg);
+}
+
+
+template<class T>
+bool MipBuf_t<T>::get_tail(int level, MipBufEntry<T>* out, mip_index_t* count)
+{
+    if (level <= 0 || level >= m_num_levels)
+        return false;
+    if (m_tails_counter != m_change_counter)
+        m_update_tails();
+    if (!m_tail_counts[level])
+        return false;
+    *out   = m_tails[level];
+    *count = m_tail_counts[level];
+    return true;
+}
+
+
+template<class T>
+bool MipBuf_t<T>::get_minmax(mip_index_t start, mip_index_t end, T* minval, T* maxval)
+{
+    double      mean;
+    mip_index_t count;
+    return get_stats(start, end, minval, maxval, &mean, &count);
+}
+
+
+// a segment tree query. the pyramid is the tree, every level holds nodes
+// of 2^level_shift(level) samples.
+template<class T>
+bool MipBuf_t<T>::get_stats(mip_index_t start, mip_index_t end, T* minval, T* maxval, double* mean, mip_index_t* count)
+{
+    // the coarsest level reaches back the furthest. every sample after its
+    // oldest entry is covered by some kept entry.
+    int top = m_num_levels - 1;
+    if (start < m_levels[top]->first() << level_shift(top))
+        start = m_levels[top]->first() << level_shift(top);
+    if (end > size())
+        end = size();
+    *minval = *maxval = 0;
+    *mean   = 0.;
+    *count  = 0;
+    if (start >= end)
+        return false;
+
+    double sum = 0.;
+    bool found = false;
+    while (start < end)
+    {
+        // the largest entry starting at 'start' that ends before 'end'
+        int level = 0;
+        while (level < top &&
+                (start & ((mip_index_t(1) << level_shift(level + 1)) - 1)) == 0 &&
+                start + (mip_index_t(1) << level_shift(level + 1)) <= end)
+            level++;
+
+        // a ring may have dropped it already. coarser levels keep longer.
+        T mn, mx, avg;
+        bool kept;
+        while (!(kept = m_levels[level]->get(start >> level_shift(level), &mn, &mx, &avg)) && level < top)
+            level++;
+        if (!kept)
+            break;
+
+        if (!found || mn < *minval)
+            *minval = mn;
+        if (!found || mx > *maxval)
+            *maxval = mx;
+        found = true;
+        // a coarser entry may start before 'start' and end after 'end'
+        mip_index_t next = ((start >> level_shift(level)) + 1) << level_shift(level);
+        mip_index_t n    = MIP_MIN(next, end) - start;
+        sum    += double(avg) * n;
+        *count += n;
+        start = next;
+    }
+    if (*count)
+        *mean = sum / *count;
+    return found;
+}
+
+
+template<class T>
+inline MipLevel_t<T>* MipBuf_t<T>::level(int level)
+{
+    if (level < 0 || level >= m_num_levels)
+        return NULL;
+    return m_levels[level];
+}
+
+
+template<class T>
+inline int MipBuf_t<T>::num_levels()
+{
+    return m_num_levels;
+}
+
+
+template<class T>
+inline int MipBuf_t<T>::branching()
+{
+    return m_branching;
+}
+
+
+template<class T>
+inline int MipBuf_t<T>::skip_levels()
+{
+    return m_skip_levels;
+}
+
+
+template<class T>
+inline int MipBuf_t<T>::level_shift(int level)
+{
+    return level ? (level + m_skip_levels) * m_branching_shift : 0;
+}
+
+
+template<class T>
+inline mip_index_t MipBuf_t<T>::size()
+{
+    return m_levels[0]->size();
+}
+
+
+template<class T>
+inline mip_index_t MipBuf_t<T>::first()
+{
+    return m_levels[0]->first();
+}
+
+
+template<class T>
+inline int MipBuf_t<T>::capacity()
+{
+    return m_capacity;
+}
+
+
+template<class T>
+mip_index_t MipBuf_t<T>::get_change_counter()
+{
+    return m_change_counter;
+}
+
+
+template<class T>
+void MipBuf_t<T>::inc_change_counter()
+{
+    m_change_counter++;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+inline MipLevel_t<T>* MipBuf_t<T>::m_get_level(int level)
+{
+    if (level == m_num_levels)
+        m_levels[m_num_levels++] = m_file ? new MipLevel_t<T>(m_file, level) : new MipLevel_t<T>(m_capacity);
+    return m_levels[level];
+}
+
+
+template<class T>
+inline int MipBuf_t<T>::m_group(int level)
+{
+    return 1 << (level_shift(level + 1) - level_shift(level));
+}
+
+
+// the tail of a level is the tail of the previous level plus the entries
+// of the previous level after the last complete group.
+template<class T>
+void MipBuf_t<T>::m_update_tails()
+{
+    m_tails_counter  = m_change_counter;
+    m_tail_counts[0] = 0;
+    // sum of the samples of the tail so far
+    double sum = 0.;
+    for (int level = 1; level < m_num_levels; level++)
+    {
+        MipLevel_t<T>* src = m_levels[level - 1];
+        MipBufEntry<T>* tail = &m_tails[level];
+        mip_index_t count  = m_tail_counts[level - 1];
+        mip_index_t weight = mip_index_t(1) << level_shift(level - 1);
+        if (count)
+            *tail = m_tails[level - 1];
+
+        for (mip_index_t i = m_levels[level]->size() * m_group(level - 1); i < src->size(); i++)
+        {
+            MipBufEntry<T> e(0, 0, 0);
+            src->get(i, &e.minval, &e.maxval, &e.avg);
+            tail->minval = count ? MIP_MIN(tail->minval, e.minval) : e.minval;
+            tail->maxval = count ? MIP_MAX(tail->maxval, e.maxval) : e.maxval;
+            if (!MipSample<T>::exact)
+                sum += double(e.avg) * weight;
+            count += weight;
+        }
+        if (MipSample<T>::exact)
+            sum += double(m_pending[level - 1]);
+
+        m_tail_counts[level] = count;
+        if (count)
+            tail->avg = MipSample<T>::from_double(sum / count);
+    }
+}
+
+
+template<class T>
+void MipBuf_t<T>::m_init_pending()
+{
+    memset(m_pending, 0, sizeof(m_pending));
+    if (!MipSample<T>::exact)
+        return;
+    for (int level = 0; level < m_num_levels; level++)
+    {
+        MipLevel_t<T>* l = m_levels[level];
+        accum_t weight = accum_t(mip_index_t(1) << level_shift(level));
+        mip_index_t i = level + 1 < m_num_levels ? m_levels[level + 1]->size() * m_group(level) : 0;
+        for (; i < l->size(); i++)
+        {
+            MipBufEntry<T> e(0, 0, 0);
+            l->get(i, &e.minval, &e.maxval, &e.avg);
+            m_pending[level] += accum_t(e.avg) * weight;
+        }
+    }
+}
+
+
+template<class T>
+void MipBuf_t<T>::m_downsample(int level, mip_index_t first, const accum_t* sums)
+{
+    T dmin[MIP_DOWNSAMPLE_BLOCK];
+    T dmax[MIP_DOWNSAMPLE_BLOCK];
+    T davg[MIP_DOWNSAMPLE_BLOCK];
+    assert(!MipSample<T>::exact || level == 0 || sums);
+    // the sums of the new entries of the next level go to m_sums[buf]. the
+    // other one may hold 'sums'.
+    int buf = 0;
+
+    for (; level + 1 < MIP_MAX_LEVELS; level++)
+    {
+        MipLevel_t<T>* src = m_levels[level];
+        int g     = m_group(level);
+        int shift = level_shift(level + 1) - level_shift(level);
+
+        // if 'first' is inside a group, the entries before it are the start
+        // of a group that the new entries completed.
+        mip_index_t i0  = first - first % g;
+        mip_index_t end = src->size() - src->size() % g;
+        // sums of the entries i0.., NULL for level 0
+        const accum_t* ssum = sums ? sums - (first - i0) : NULL;
+        if (i0 >= end)
+        {
+            if (MipSample<T>::exact)
+                m_pending[level] = m_sum(level, i0, src->size(), ssum);
+            return;
+        }
+
+        MipLevel_t<T>* dst = m_get_level(level + 1);
+        first = dst->size();
+        accum_t* dsum = NULL;
+        if (MipSample<T>::exact)
+        {
+            dsum = m_group_sums(level + 1, first, (end - i0) / g, buf);
+            buf ^= 1;
+        }
+
+        mip_index_t i = i0;
+        while (i < end)
+        {
+            T *smin, *smax, *savg;
+            int n = int(src->span(i, MIP_MIN(end - i, mip_index_t(g) * MIP_DOWNSAMPLE_BLOCK), &smin, &smax, &savg) / g);
+            assert(i >= src->first());
+
+            if (n == 0 && g == 2 && !MipSample<T>::exact)
+            {
+                // a pair split in two by the ring wraparound or a file segment
+                MipBufEntry<T> e1(0, 0, 0), e2(0, 0, 0);
+                src->get(i,     &e1.minval, &e1.maxval, &e1.avg);
+                src->get(i + 1, &e2.minval, &e2.maxval, &e2.avg);
+                dst->append(MIP_MIN(e1.minval, e2.minval), MIP_MAX(e1.maxval, e2.maxval), MipSample<T>::avg2(e1.avg, e2.avg));
+                i += 2;
+                continue;
+            }
+
+            if (n == 0)
+            {
+                MipBufEntry<T> e(0, 0, 0), d(0, 0, 0);
+                accum_t sum = 0;
+                for (int j = 0; j < g; j++)
+                {
+                    src->get(i + j, &e.minval, &e.maxval, &e.avg);
+                    d.minval = j ? MIP_MIN(d.minval, e.minval) : e.minval;
+                    d.maxval = j ? MIP_MAX(d.maxval, e.maxval) : e.maxval;
+                    sum += ssum ? ssum[i - i0 + j] : accum_t(e.avg);
+                }
+                if (dsum)
+                    dsum[(i - i0) / g] = sum;
+                dst->append(d.minval, d.maxval, MipSample<T>::avg(sum, MipSample<T>::exact ? level_shift(level + 1) : shift));
+                i += g;
+                continue;
+            }
+
+            m_downsample_run(smin, smax, savg, ssum ? ssum + (i - i0) : NULL, n, g,
+                    MipSample<T>::exact ? level_shift(level + 1) : shift, dmin, dmax, davg, dsum ? dsum + (i - i0) / g : NULL);
+            dst->append(dmin, dmax, davg, n);
+            i += mip_index_t(g) * n;
+        }
+
+        // the new entries after the last complete group
+        if (MipSample<T>::exact)
+            m_pending[level] = m_sum(level, end, src->size(), ssum ? ssum + (end - i0) : NULL);
+        sums = dsum;
+    }
+}
+
+
+template<class T>
+typename MipBuf_t<T>::accum_t MipBuf_t<T>::m_sum(int level, mip_index_t a, mip_index_t b, const accum_t* sums)
+{
+    accum_t sum = 0;
+    for (mip_index_t i = a; i < b; i++)
     {
-        int i_start = round(start_index);
-        int i_end   = round(end_index) - 1;
+        if (sums)
+        {
+            sum += sums[i - a];
+            continue;
+        }
+        MipBufEntry<T> e(0, 0, 0);
+        m_levels[level]->get(i, &e.minval, &e.maxval, &e.avg);
+        sum += accum_t(e.avg);
+    }
+    return sum;
+}
 
-        if (i_start < 0)
-            i_start = 0;
 
-        if (i_end >= m_buf.size())
-            i_end = m_buf.size() - 1;
+template<class T>
+typename MipBuf_t<T>::accum_t* MipBuf_t<T>::m_group_sums(int level, mip_index_t first, mip_index_t n, int buf)
+{
+    mip_index_t before = first % m_group(level);
+    m_sums[buf].clear();
+    accum_t* sums = m_sums[buf].append(before + n);
+    for (mip_index_t i = 0; i < before; i++)
+        sums[i] = i ? 0 : m_pending[level];
+    return sums + before;
+}
 
-        *out_start_pixel = (i_start + 0.5 - start_index) * pixels_per_sample;
-        *out_end_pixel   = resolution - (end_index - i_end - 0.5) * pixels_per_sample;
 
-        *out_start_index = i_start;
-        *out_end_index   = i_end;
+template<class T>
+void MipBuf_t<T>::m_downsample_run(const T* smin, const T* smax, const T* savg, const accum_t* ssum, int n, int g, int shift,
+        T* dmin, T* dmax, T* davg, accum_t* dsum)
+{
+    if (g == 2)
+    {
+        // no dependencies between iterations. easy prey for the vectorizer.
+        for (int j = 0; j < n; j++)
+            dmin[j] = MIP_MIN(smin[2*j], smin[2*j+1]);
+        for (int j = 0; j < n; j++)
+            dmax[j] = MIP_MAX(smax[2*j], smax[2*j+1]);
+        if (!MipSample<T>::exact)
+        {
+            for (int j = 0; j < n; j++)
+                davg[j] = MipSample<T>::avg2(savg[2*j], savg[2*j+1]);
+            return;
+        }
+        if (ssum)
+            for (int j = 0; j < n; j++)
+                dsum[j] = ssum[2*j] + ssum[2*j+1];
+        else
+            for (int j = 0; j < n; j++)
+                dsum[j] = accum_t(savg[2*j]) + savg[2*j+1];
+        for (int j = 0; j < n; j++)
+            davg[j] = MipSample<T>::avg(dsum[j], shift);
+        return;
+    }
+
+    for (int j = 0; j < n; j++)
+    {
+        T mn = smin[g*j], mx = smax[g*j];
+        accum_t sum = 0;
+        for (int k = 0; k < g; k++)
+        {
+            mn = MIP_MIN(mn, smin[g*j+k]);
+            mx = MIP_MAX(mx, smax[g*j+k]);
+            sum += ssum ? ssum[g*j+k] : accum_t(savg[g*j+k]);
+        }
+        dmin[j] = mn;
+        dmax[j] = mx;
+        davg[j] = MipSample<T>::avg(sum, shift);
+        if (dsum)
+            dsum[j] = sum;
+    }
+}
 
-        //if (*out_end_pixel <= *out_start_pixel)
-        //    printf("ERROR: out_start_pixel %.4f out_end_pixel %.4f start_index %.4f end_index %.4f i_start %i i_end %i mbufsize %i\n",
-        //            *out_start_pixel, *out_end_pixel, start_index, end_index, i_start, i_end, m_buf.size());
 
-        *out_buf = this;
+template<class T>
+void MipBuf_t<T>::m_build(mip_index_t start, mip_index_t end, int top, accum_t* top_sums)
+{
+    // exact sums of the entries of the level and of the next one
+    array_t<accum_t> sums[2];
+    const accum_t* ssum = NULL;
+    for (int level = 0; level < top; level++)
+    {
+        // growing levels are one run, span() covers it all
+        mip_index_t i = start >> level_shift(level + 1);
+        mip_index_t n = (end >> level_shift(level + 1)) - i;
+        int g = m_group(level);
+        T *smin, *smax, *savg, *dmin, *dmax, *davg;
+        mip_index_t count = m_levels[level]->span(i * g, n * g, &smin, &smax, &savg);
+        assert(count == n * g);
+        count = m_levels[level + 1]->span(i, n, &dmin, &dmax, &davg);
+        assert(count == n);
+        (void)count;
+        accum_t* dsum = NULL;
+        if (MipSample<T>::exact)
+        {
+            sums[level & 1].clear();
+            dsum = level + 1 == top ? top_sums : sums[level & 1].append(n);
+        }
+        m_downsample_run(smin, smax, savg, ssum, int(n), g,
+                MipSample<T>::exact ? level_shift(level + 1) : level_shift(level + 1) - level_shift(level),
+                dmin, dmax, davg, dsum);
+        ssum = dsum;
     }
 }
 
 
 template<class T>
-MipBufEntry<T>* MipBuf_t<T>::get(int i)
+template<class S>
+void MipBuf_t<T>::m_build_chunk(int i, void* arg)
 {
-    return m_buf.get(i);
+    MipParallelBuild<T, S>* p = (MipParallelBuild<T, S>*)arg;
+    mip_index_t a = mip_index_t(i) * p->chunk;
+    mip_index_t n = MIP_MIN(p->chunk, p->n - a);
+    T *mn, *mx, *av;
+    p->buf->m_levels[0]->span(p->start + a, n, &mn, &mx, &av);
+    mip_convert(p->minval + a, mn, n);
+    mip_convert(p->maxval + a, mx, n);
+    mip_convert(p->avg + a, av, n);
+    p->buf->m_build(p->start + a, p->start + a + n, p->top, p->top_sums ? p->top_sums + (a >> p->buf->level_shift(p->top)) : NULL);
+}
+
+
+template<class T>
+template<class S>
+void MipBuf_t<T>::m_append_converted(const S* minval, const S* maxval, const S* avg, mip_index_t n)
+{
+    T cmin[MIP_DOWNSAMPLE_BLOCK];
+    T cmax[MIP_DOWNSAMPLE_BLOCK];
+    T cavg[MIP_DOWNSAMPLE_BLOCK];
+    for (mip_index_t i = 0; i < n; i += MIP_DOWNSAMPLE_BLOCK)
+    {
+        int c = int(MIP_MIN(mip_index_t(MIP_DOWNSAMPLE_BLOCK), n - i));
+        mip_convert(minval + i, cmin, c);
+        mip_convert(maxval + i, cmax, c);
+        mip_convert(avg + i, cavg, c);
+        append_minmaxavg_arrays(cmin, cmax, cavg, c);
+    }
 }
 
 
@@ -1,52 +1,426 @@
 // almost a little joke :)
-// macosx: gcc mip_buf_test.cpp mip_buf_renderer.cpp -lstdc++ -framework OpenGL
+// macosx: gcc mip_buf_test.cpp mip_buf_renderer.cpp mip_derived.cpp mip_density.cpp mip_buf_vbo.cpp mip_file.cpp -I../helpers_src -lstdc++ -framework OpenGL
+// linux:  g++ mip_buf_test.cpp mip_buf_renderer.cpp mip_derived.cpp mip_density.cpp mip_buf_vbo.cpp mip_file.cpp -I../helpers_src -lGL -lpthread
 
 #include "mip_buf_t.h"
 #include "mip_buf_renderer.h"
+#include "mip_trigger_t.h"
+#include "mip_search_t.h"
+#include "mip_derived.h"
+#include "mip_density.h"
 #include <stdio.h>
 
 
+// every entry of every level bit for bit
+template<class T>
+static bool same_pyramid(MipBuf_t<T>* a, MipBuf_t<T>* b)
+{
+    if (a->num_levels() != b->num_levels())
+        return false;
+    for (int level = 0; level < a->num_levels(); level++)
+    {
+        MipLevel_t<T>* la = a->level(level);
+        MipLevel_t<T>* lb = b->level(level);
+        if (la->size() != lb->size())
+            return false;
+        T *amin, *amax, *aavg, *bmin, *bmax, *bavg;
+        mip_index_t n = la->span(0, la->size(), &amin, &amax, &aavg);
+        if (n != lb->span(0, lb->size(), &bmin, &bmax, &bavg) ||
+                memcmp(amin, bmin, sizeof(T) * n) || memcmp(amax, bmax, sizeof(T) * n) || memcmp(aavg, bavg, sizeof(T) * n))
+            return false;
+    }
+    return true;
+}
+
+
 int main()
 {
     printf("hello\n");
 
-    pool_t<int> p;
+    array_t<int> a;
     printf("testing\n");
-    //p.test();
+    a.test();
+    spsc_queue_t<int> q;
+    q.test();
 
     printf("tested\n");
     //return 0;
 
     MipBuf_t<float> m;
 
-    m.append(1, 2, 3);
-    m.append(1, 2, 3);
-    m.append(1, 2, 3);
-    m.append(1, 2, 3);
-    m.append(1, 2, 3);
+    m.append_minmaxavg(1, 2, 3);
+    m.append_minmaxavg(1, 2, 3);
+    m.append_minmaxavg(1, 2, 3);
+    m.append_minmaxavg(1, 2, 3);
+    m.append_minmaxavg(1, 2, 3);
 
-    MipBuf_t<float>* buf;
-    float start_pixel;
-    int   start_index;
-    float end_pixel;
-    int   end_index;
+    int         level;
+    double      start_pixel;
+    mip_index_t start_index;
+    double      end_pixel;
+    mip_index_t end_index;
 
     m.get_buf(
             1, 10, 10,
-            &buf,
+            &level,
             &start_pixel, &start_index,
             &end_pixel,   &end_index);
 
-    printf("start_pixel %.2f start_index %i end_pixel %.2f end_index %i\n",
-        start_pixel, start_index, end_pixel, end_index);
+    printf("level %i start_pixel %.2f start_index %lli end_pixel %.2f end_index %lli\n",
+        level, start_pixel, start_index, end_pixel, end_index);
+
+
+    // exact min/max of any range against a plain loop
+    MipBuf_t<float> mm;
+    float values[1000];
+    for (int i = 0; i < 1000; i++)
+        values[i] = float((i * 7919) % 1009);
+    mm.append_array(values, 1000);
+    for (int a = 0; a < 1000; a += 37)
+    {
+        for (int b = a + 1; b <= 1000; b += 53)
+        {
+            float minval, maxval, tmin = values[a], tmax = values[a];
+            for (int i = a; i < b; i++)
+            {
+                tmin = values[i] < tmin ? values[i] : tmin;
+                tmax = values[i] > tmax ? values[i] : tmax;
+            }
+            assert(mm.get_minmax(a, b, &minval, &maxval) && minval == tmin && maxval == tmax);
+        }
+    }
 
+    // mean of a range against a plain loop. the ring forgot the start of
+    // the range at full resolution, its coarse entries reach outside of it.
+    MipBuf_t<float> ms, mr(64, 4);
+    for (int i = 0; i < 1000; i++)
+        values[i] = float(i % 10);
+    ms.append_array(values, 1000);
+    mr.append_array(values, 1000);
+    float minval, maxval;
+    double mean;
+    mip_index_t count;
+    assert(ms.get_stats(3, 1000, &minval, &maxval, &mean, &count) && count == 997 && minval == 0 && maxval == 9);
+    assert(fabs(mean - (4500. - 3.) / 997.) < 1e-9);
+    assert(mr.get_stats(200, 1000, &minval, &maxval, &mean, &count) && count == 800 && fabs(mean - 4.5) < 0.05);
+    assert(!ms.get_stats(1000, 2000, &minval, &maxval, &mean, &count) && count == 0);
 
-    MipBufRenderer r;
+    MipBufRenderer_t<float> r;
 
     for (int i = 0; i < 100000; i++)
-        r.append(1,2,3);
+        r.append_minmaxavg(1,2,3);
+
+    MipBufEntry<float> e;
+    assert(r.get(1, &e) && e.avg == 3);
+    assert(!r.get(100000, &e));
+
+    // save to a file, keep appending, open it again
+    double timestamps[2] = {1000., 1001.};
+    assert(r.create_file("mip_buf_test.mip"));
+    for (int i = 0; i < 100000; i++)
+        r.append_minmaxavg(0, 4, 2);
+    assert(r.append_timestamps(timestamps, 2) == 2);
+    assert(r.set_user_data("{}", 2));
+    assert(r.flush_file());
+
+    MipBufRenderer_t<float> r2;
+    assert(r2.open_file("mip_buf_test.mip", false));
+    assert(r2.size() == 200000 && !r2.is_writable());
+    assert(r2.get(99999, &e) && e.avg == 3);
+    assert(r2.get(100000, &e) && e.minval == 0 && e.maxval == 4);
+    assert(r2.num_timestamps() == 2 && r2.get_timestamps(1, 5, timestamps) == 1 && timestamps[0] == 1001.);
+    assert(r2.get_user_data(NULL, 0) == 2);
+    remove("mip_buf_test.mip");
+
+    // integer samples. averages don't overflow, levels round to nearest.
+    MipBuf_t<unsigned char> m8;
+    m8.append(255);
+    m8.append(254);
+    MipBufEntry<unsigned char> e8;
+    assert(m8.get(0, &e8, 1) && e8.avg == 255 && e8.minval == 254);
+    MipBuf_t<int> m32(0, 4);
+    int big[4] = {2000000000, 2000000000, 2000000000, 1999999999};
+    m32.append_array(big, 4);
+    MipBufEntry<int> e32;
+    assert(m32.get(0, &e32, 1) && e32.avg == 2000000000 && e32.minval == 1999999999);
+
+    // a long integer run doesn't drift: every level is the rounded mean of
+    // its samples, whatever the appends were like
+    MipBuf_t<unsigned char> md, md4(0, 4);
+    unsigned char noise[4096];
+    long long noise_sum = 0;
+    srand(1);
+    for (int k = 0; k < 256; k++)
+    {
+        for (int i = 0; i < 4096; i++)
+            noise_sum += noise[i] = (unsigned char)(99 + (rand() % 3 == 0));
+        if (k & 1)
+            md.append_array(noise, 4096);
+        else
+            for (int i = 0; i < 4096; i++)
+                md.append(noise[i]);
+        md4.append_array(noise, 4096);
+    }
+    double true_mean = noise_sum / double(1 << 20);
+    unsigned char mn8, mx8;
+    double mean8;
+    mip_index_t count8;
+    assert(md.get(0, &e8, md.num_levels() - 1) && fabs(e8.avg - true_mean) <= 0.5);
+    assert(md4.get(0, &e8, md4.num_levels() - 1) && fabs(e8.avg - true_mean) <= 0.5);
+    assert(md.get_stats(0, 1 << 20, &mn8, &mx8, &mean8, &count8) && fabs(mean8 - true_mean) <= 0.5);
+    assert(md.get_stats(1000, 1 << 20, &mn8, &mx8, &mean8, &count8) && fabs(mean8 - true_mean) <= 0.5);
+
+    // float in, rounded and clamped to the storage type, float out
+    MipBufRenderer* r8 = MipBufRenderer::create(MIP_UINT8);
+    float in[4] = {-5.f, 1.4f, 1.6f, 300.f};
+    r8->append_array(in, 4);
+    assert(r8->get(0, &e) && e.avg == 0 && r8->get(1, &e) && e.avg == 1);
+    assert(r8->get(2, &e) && e.avg == 2 && r8->get(3, &e) && e.avg == 255);
+    assert(r8->create_file("mip_buf_test.mip") && r8->flush_file());
+    delete r8;
+    assert(MipBufRenderer::file_sample_type("mip_buf_test.mip") == MIP_UINT8);
+    MipBufRenderer_t<float> rf;
+    assert(!rf.open_file("mip_buf_test.mip", false));
+    MipBufRenderer_t<signed char> ri8;
+    assert(!ri8.open_file("mip_buf_test.mip", false));
+    MipBufRenderer_t<unsigned char> ru8;
+    assert(ru8.open_file("mip_buf_test.mip", false) && ru8.size() == 4);
+    remove("mip_buf_test.mip");
+
+    // parallel bulk appends build the same pyramid as serial appends. an
+    // unaligned start and a partial last chunk, float and converted uint8.
+    int shapes[3][2] = {{2, 0}, {4, 1}, {16, 0}};
+    int nb = 3000000;
+    float* bulk = new float[nb];
+    unsigned char* bulk8 = new unsigned char[nb];
+    for (int i = 0; i < nb; i++)
+        bulk[i] = float((mip_index_t(i) * 7919) % 1009) * 0.37f - 50.f;
+    mip_convert(bulk, bulk8, nb);
+    for (int c = 0; c < 3; c++)
+    {
+        MipBuf_t<float> fs(0, shapes[c][0], shapes[c][1]), fp(0, shapes[c][0], shapes[c][1]);
+        fs.append_array(bulk, 12345);
+        fp.append_array(bulk, 12345);
+        fs.append_array(bulk + 12345, nb - 12345);
+        fp.append_minmaxavg_arrays_parallel(bulk + 12345, bulk + 12345, bulk + 12345, nb - 12345, 4);
+        assert(same_pyramid(&fs, &fp) && fp.get_change_counter() == nb);
+
+        MipBuf_t<unsigned char> us(0, shapes[c][0], shapes[c][1]), up(0, shapes[c][0], shapes[c][1]);
+        us.append_array(bulk8, nb);
+        up.append_minmaxavg_arrays_parallel(bulk, bulk, bulk, nb, 3);
+        assert(same_pyramid(&us, &up));
+    }
+    delete [] bulk;
+    delete [] bulk8;
+
+    // tails: min, max and mean of the samples after the last complete entry
+    // of a level. get_buf reaches the tail of level 1 at index 4.
+    MipBuf_t<float> mt;
+    mt.append_array(values, 8);
+    assert(!mt.get_tail(1, &e, &count) && !mt.get_tail(0, &e, &count));
+    mt.append(9);
+    assert(mt.get_tail(1, &e, &count) && count == 1 && e.avg == 9);
+    assert(mt.get_tail(3, &e, &count) && count == 1 && e.minval == 9 && e.maxval == 9);
+    mt.get_buf(0, 9, 2, &level, &start_pixel, &start_index, &end_pixel, &end_index);
+    assert(level == 1 && end_index == 4);
+    for (int c = 0; c < 3; c++)
+    {
+        MipBuf_t<float> ts(0, shapes[c][0], shapes[c][1]);
+        for (int i = 0; i < 1000; i++)
+            values[i] = float((i * 7919) % 1009);
+        for (int n = 0; n < 1000; n += 97)
+        {
+            ts.append_array(values + n, MIP_MIN(97, 1000 - n));
+            for (level = 1; level < ts.num_levels(); level++)
+            {
+                mip_index_t start = ts.level(level)->size() << ts.level_shift(level);
+                mip_index_t tail_count;
+                bool tail = ts.get_tail(level, &e, &tail_count);
+                assert(tail == (start < ts.size()));
+                if (tail)
+                {
+                    assert(ts.get_stats(start, ts.size(), &minval, &maxval, &mean, &count) && count == tail_count);
+                    assert(e.minval == minval && e.maxval == maxval && fabs(e.avg - mean) < 1e-3);
+                }
+            }
+        }
+    }
+
+    // triggers found through the pyramid against a plain loop over the
+    // samples, with holdoff. a slow square wave with some noise.
+    for (int c = 0; c < 3; c++)
+    {
+        MipBuf_t<float> mb(0, shapes[c][0], shapes[c][1]);
+        for (int i = 0; i < 1000; i++)
+            values[i] = float((i / 100) % 2 * 50 + (i * 7919) % 13);
+        for (int i = 0; i < 20; i++)
+            mb.append_array(values, 1000);
+        int modes[3] = {MIP_TRIGGER_RISING, MIP_TRIGGER_FALLING, MIP_TRIGGER_WINDOW};
+        for (int m = 0; m < 3; m++)
+        {
+            MipTrigger_t<float> tr;
+            tr.set(modes[m], 30., 55., 150);
+            tr.update(&mb);
+            mip_index_t expected = 0, next = 1;
+            for (mip_index_t i = 1; i < mb.size(); i++)
+            {
+                float prev = values[(i - 1) % 1000], cur = values[i % 1000];
+                bool t = modes[m] == MIP_TRIGGER_RISING ? prev < 30 && cur >= 30 :
+                         modes[m] == MIP_TRIGGER_FALLING ? prev > 30 && cur <= 30 :
+                         prev >= 30 && prev <= 55 && (cur < 30 || cur > 55);
+                if (t && i >= next)
+                {
+                    mip_index_t got;
+                    assert(tr.find(&mb, next, mb.size()) == i);
+                    assert(tr.get_triggers(i, i + 1, &got, 1) == 1 && got == i);
+                    expected++;
+                    next = i + 150;
+                }
+            }
+            assert(tr.num_triggers() == expected && expected > 50);
+            assert(tr.last(mb.size()) > mb.size() - 1000 && tr.last(0) == -1);
+        }
+    }
+
+    // a ring renderer scans the blocks larger than its capacity too, so the
+    // count doesn't depend on how the samples were split
+    {
+        float wave[20000];
+        for (int i = 0; i < 20000; i++)
+            wave[i] = float((i / 100) % 2 * 50 + (i * 7919) % 13);
+        int blocks[4] = {20000, 100, 499, 7};
+        for (int b = 0; b < 4; b++)
+        {
+            MipBufRenderer_t<float> rr(500);
+            MipBufRenderer_t<short> rs(500);
+            rr.set_trigger(MIP_TRIGGER_RISING, 30., 0., 150);
+            rs.set_trigger(MIP_TRIGGER_RISING, 30., 0., 150);
+            for (int i = 0; i < 20000; i += blocks[b])
+            {
+                rr.append_array(wave + i, MIP_MIN(20000 - i, blocks[b]));
+                rs.append_array(wave + i, MIP_MIN(20000 - i, blocks[b]));
+            }
+            // a rising edge at 100, 300, .. 19900
+            assert(rr.num_triggers() == 100 && rs.num_triggers() == 100);
+        }
+    }
+
+    // threshold search through the pyramid against a plain loop, forward
+    // and backward, in a few ranges. samples with min and max, a few
+    // spikes and a long stretch inside the band. the last shape is a ring.
+    for (int c = 0; c < 4; c++)
+    {
+        MipBuf_t<float> mb(c < 3 ? 0 : 3000, shapes[c % 3][0], shapes[c % 3][1]);
+        for (int i = 0; i < 10000; i++)
+        {
+            float v = i % 997 == 0 ? 100.f : i > 4000 && i < 7000 ? 40.f : float((i * 7919) % 50);
+            mb.append_minmaxavg(v - (i % 3), v + (i % 5), v);
+        }
+        mip_index_t found[10000];
+        mip_index_t ranges[4][2] = {{0, 10000}, {1, 9999}, {4095, 4097}, {3333, 8765}};
+        for (int m = 0; m < MIP_NUM_SEARCH_MODES; m++)
+        {
+            MipSearch_t<float> search(m, m == MIP_SEARCH_BELOW ? 2. : 45., 35.);
+            for (int r = 0; r < 4; r++)
+            {
+                mip_index_t start = MIP_MAX(ranges[r][0], mb.first()), end = ranges[r][1];
+                int n = search.find(&mb, ranges[r][0], end, false, found, 10000);
+                int k = 0;
+                for (mip_index_t i = start; i < end; i++)
+                {
+                    MipBufEntry<float> e;
+                    mb.get(i, &e);
+                    bool match = m == MIP_SEARCH_ABOVE   ? e.maxval > 45 :
+                                 m == MIP_SEARCH_BELOW   ? e.minval < 2 :
+                                 m == MIP_SEARCH_OUTSIDE ? e.maxval > 45 || e.minval < 35 :
+                                 e.minval >= 35 && e.maxval <= 45;
+                    if (match)
+                        assert(k < n && found[k++] == i);
+                }
+                assert(k == n);
+                // backward is the same, newest first
+                mip_index_t last;
+                assert(search.find(&mb, ranges[r][0], end, true, &last, 1) == (n ? 1 : 0));
+                assert(!n || last == found[n - 1]);
+            }
+        }
+    }
+
+    // derived channels: 1 + a - b/2 of a 1kHz and a 500Hz channel, moving
+    // average of 4. updated after every small batch, and once at the end.
+    // b interpolated halfway between its samples where a has no partner.
+    for (int batches = 0; batches < 2; batches++)
+    {
+        MipBufRenderer_t<float> da, db, dout;
+        MipDerived d(&dout, 1000.);
+        d.add_source(&da, 1000., 1.);
+        d.add_source(&db, 500., -0.5);
+        d.set_offset(1.);
+        d.set_filter(MIP_FILTER_MOVING_AVG, 4);
+        for (int i = 0; i < 1000; i++)
+        {
+            da.append(float(i % 7));
+            if (i % 2 == 0)
+                db.append(float(i % 10));
+            if (batches)
+                d.update();
+        }
+        d.update();
+        // b reaches sample 499 = output sample 998
+        assert(dout.size() == 999);
+        double window[4];
+        for (int j = 0; j < 999; j++)
+        {
+            double b = j % 2 ? ((j - 1) % 10 + (j + 1) % 10) / 2. : j % 10;
+            window[j % 4] = 1. + j % 7 - 0.5 * b;
+            double mean = 0.;
+            for (int k = 0; k <= MIP_MIN(j, 3); k++)
+                mean += window[k];
+            mean /= MIP_MIN(j, 3) + 1;
+            assert(dout.get(j, &e) && fabs(e.avg - mean) < 1e-5);
+        }
+    }
+
+    // density: at 4 samples per column the columns are histograms of the
+    // level 0 samples. the same view again computes nothing, scrolling only
+    // (float noise included) the columns that came into view, a new sample
+    // only the newest column.
+    {
+        MipBuf_t<float> mb;
+        for (int i = 0; i < 10000; i++)
+            mb.append(float(i % 16));
+        MipDensity density;
+        assert(density.update(&mb, 1000., 1400., 100., 0., 16., 16) == 101);
+        for (mip_index_t c = 250; c < 351; c++)
+        {
+            int counts[16] = {0};
+            for (mip_index_t i = 0; i < 10000; i++)
+                if (density.column_of(i) == c)
+                    counts[i % 16]++;
+            const unsigned char* column = density.column(c);
+            for (int k = 0; k < 16; k++)
+                assert(column[k] == MIP_MIN(int(log(1. + counts[k]) * 255. / log(5.) + 0.5), 255));
+        }
+        assert(!density.column(351));
+        assert(density.update(&mb, 1000., 1400., 100., 0., 16., 16) == 0);
+        assert(density.update(&mb, 1040.000001, 1440., 100., 0., 16., 16) == 10);
+
+        assert(density.update(&mb, 9600., 10000., 100., 0., 16., 16) == 101);
+        assert(density.update(&mb, 9600., 10000., 100., 0., 16., 16) == 1);
+        mb.append(0.);
+        mb.append(1.);
+        assert(density.update(&mb, 9602., 10002., 100., 0., 16., 16) == 1);
 
-    r.get(1);
+        // 1000 samples per column: entries of 16 samples, every one of them
+        // 0..15 spread evenly. about the same as counting the samples.
+        assert(density.update(&mb, 0., 10000., 10., 0., 16., 16) == 11);
+        for (mip_index_t c = 0; c < 10; c++)
+        {
+            const unsigned char* column = density.column(c);
+            for (int k = 0; k < 16; k++)
+                assert(abs(column[k] - int(log(1. + 1000. / 16.) * 255. / log(1001.) + 0.5)) <= 1);
+        }
+    }
 
     printf("tests passed\n");
     return 0;
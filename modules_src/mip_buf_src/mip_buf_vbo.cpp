@@ -0,0 +1,301 @@
+#include "mip_buf_vbo.h"
+
+#include <assert.h>
+#include <stdio.h>
+#include <stddef.h>
+
+//extern "C"
+//{
+#if defined(WIN32)
+    #include <windows.h>
+    #include <GL/gl.h>
+#elif defined(__APPLE__)
+    #include <OpenGL/gl.h>
+#else // linux
+    #define GL_GLEXT_PROTOTYPES
+    #include <GL/gl.h>
+    #include <GL/glext.h>
+#endif
+//}
+
+
+#if defined(WIN32)
+
+// opengl32.dll exports only GL 1.1. everything newer has to be asked from
+// the driver, and only after a context exists.
+
+#define GL_ARRAY_BUFFER  0x8892
+#define GL_DYNAMIC_DRAW  0x88E8
+
+typedef void (APIENTRY *mip_glGenBuffers_t)(GLsizei n, GLuint* buffers);
+typedef void (APIENTRY *mip_glDeleteBuffers_t)(GLsizei n, const GLuint* buffers);
+typedef void (APIENTRY *mip_glBindBuffer_t)(GLenum target, GLuint buffer);
+typedef void (APIENTRY *mip_glBufferData_t)(GLenum target, ptrdiff_t size, const GLvoid* data, GLenum usage);
+typedef void (APIENTRY *mip_glBufferSubData_t)(GLenum target, ptrdiff_t offset, ptrdiff_t size, const GLvoid* data);
+
+static mip_glGenBuffers_t    glGenBuffers    = NULL;
+static mip_glDeleteBuffers_t glDeleteBuffers = NULL;
+static mip_glBindBuffer_t    glBindBuffer    = NULL;
+static mip_glBufferData_t    glBufferData    = NULL;
+static mip_glBufferSubData_t glBufferSubData = NULL;
+
+static bool load_gl_buffer_functions()
+{
+    if (!glGenBuffers)
+    {
+        glGenBuffers    = (mip_glGenBuffers_t)   wglGetProcAddress("glGenBuffers");
+        glDeleteBuffers = (mip_glDeleteBuffers_t)wglGetProcAddress("glDeleteBuffers");
+        glBindBuffer    = (mip_glBindBuffer_t)   wglGetProcAddress("glBindBuffer");
+        glBufferData    = (mip_glBufferData_t)   wglGetProcAddress("glBufferData");
+        glBufferSubData = (mip_glBufferSubData_t)wglGetProcAddress("glBufferSubData");
+    }
+    return glGenBuffers && glDeleteBuffers && glBindBuffer && glBufferData && glBufferSubData;
+}
+
+#else
+
+static bool load_gl_buffer_functions()
+{
+    return true;
+}
+
+#endif
+
+
+// byte offsets inside a block
+#define MIP_VBO_AVG_OFFSET    0
+#define MIP_VBO_MINMAX_OFFSET ((MIP_VBO_BLOCK_ENTRIES + 1) * 2 * sizeof(float))
+#define MIP_VBO_BLOCK_BYTES   (MIP_VBO_MINMAX_OFFSET + MIP_VBO_BLOCK_ENTRIES * 4 * sizeof(float))
+
+
+// --------------------------------------------------------------------------
+// ---- LIFECYCLE -----------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+MipBufVbo::MipBufVbo()
+{
+    for (int i = 0; i < MIP_MAX_LEVELS; i++)
+    {
+        m_levels[i].dropped  = 0;
+        m_levels[i].uploaded = 0;
+    }
+}
+
+
+MipBufVbo::~MipBufVbo()
+{
+}
+
+
+// --------------------------------------------------------------------------
+// ---- METHODS -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+void MipBufVbo::draw_avg(MipBuf_t<T>* buf, int level, mip_index_t start, mip_index_t end)
+{
+    m_update(buf, level);
+    m_draw(level, start, end, false);
+}
+
+
+template<class T>
+void MipBufVbo::draw_minmax(MipBuf_t<T>* buf, int level, mip_index_t start, mip_index_t end)
+{
+    m_update(buf, level);
+    m_draw(level, start, end, true);
+}
+
+
+void MipBufVbo::release_gl()
+{
+    for (int i = 0; i < MIP_MAX_LEVELS; i++)
+    {
+        Level* v = &m_levels[i];
+        for (mip_index_t b = v->dropped; b < v->blocks.size(); b++)
+            if (v->blocks.data()[b])
+                glDeleteBuffers(1, v->blocks.data() + b);
+        v->blocks.clear();
+        v->dropped  = 0;
+        v->uploaded = 0;
+    }
+}
+
+
+bool MipBufVbo::available()
+{
+    if (!load_gl_buffer_functions())
+        return false;
+    const char* version = (const char*)glGetString(GL_VERSION);
+    int major = 0, minor = 0;
+    if (!version || sscanf(version, "%i.%i", &major, &minor) != 2)
+        return false;
+    return major > 1 || (major == 1 && minor >= 5);
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+void MipBufVbo::m_update(MipBuf_t<T>* buf, int level)
+{
+    MipLevel_t<T>* l = buf->level(level);
+    Level* v = &m_levels[level];
+    if (!l)
+        return;
+
+    // the MipBuf_t ring dropped these entries. drop their blocks too.
+    mip_index_t first = l->first();
+    for (; v->dropped < first / MIP_VBO_BLOCK_ENTRIES && v->dropped < v->blocks.size(); v->dropped++)
+    {
+        unsigned int* name = v->blocks.data() + v->dropped;
+        if (*name)
+            glDeleteBuffers(1, name);
+        *name = 0;
+    }
+
+    if (v->uploaded < first)
+        v->uploaded = first;
+
+    T *minval = NULL, *maxval = NULL, *avg = NULL;
+    while (v->uploaded < l->size())
+    {
+        mip_index_t n = l->span(v->uploaded, l->size() - v->uploaded, &minval, &maxval, &avg);
+        assert(n);
+        // never cross a block boundary in one upload
+        mip_index_t left_in_block = MIP_VBO_BLOCK_ENTRIES - v->uploaded % MIP_VBO_BLOCK_ENTRIES;
+        if (n > left_in_block)
+            n = left_in_block;
+        m_upload(level, v->uploaded, n, minval, maxval, avg);
+        v->uploaded += n;
+    }
+
+    glBindBuffer(GL_ARRAY_BUFFER, 0);
+}
+
+
+unsigned int MipBufVbo::m_block(int level, mip_index_t block, bool create)
+{
+    Level* v = &m_levels[level];
+
+    if (block < v->dropped)
+        return 0;
+
+    if (block >= v->blocks.size())
+    {
+        if (!create)
+            return 0;
+        mip_index_t old_size = v->blocks.size();
+        unsigned int* names = v->blocks.append(block + 1 - old_size);
+        for (mip_index_t i = 0; i < block + 1 - old_size; i++)
+            names[i] = 0;
+    }
+
+    unsigned int* name = v->blocks.data() + block;
+    if (!*name && create)
+    {
+        glGenBuffers(1, name);
+        glBindBuffer(GL_ARRAY_BUFFER, *name);
+        glBufferData(GL_ARRAY_BUFFER, MIP_VBO_BLOCK_BYTES, NULL, GL_DYNAMIC_DRAW);
+    }
+    return *name;
+}
+
+
+template<class T>
+void MipBufVbo::m_upload(int level, mip_index_t i, mip_index_t n, T* minval, T* maxval, T* avg)
+{
+    mip_index_t block = i / MIP_VBO_BLOCK_ENTRIES;
+    int         local = int(i % MIP_VBO_BLOCK_ENTRIES);
+
+    m_vertices.clear();
+    float* avg_vertices    = m_vertices.append(n * 6);
+    float* minmax_vertices = avg_vertices + n * 2;
+    for (mip_index_t j = 0; j < n; j++)
+    {
+        float x = float(local + j);
+        avg_vertices[j*2]      = x;
+        avg_vertices[j*2+1]    = float(avg[j]);
+        minmax_vertices[j*4]   = x;
+        minmax_vertices[j*4+1] = float(minval[j]);
+        minmax_vertices[j*4+2] = x;
+        minmax_vertices[j*4+3] = float(maxval[j]);
+    }
+
+    glBindBuffer(GL_ARRAY_BUFFER, m_block(level, block, true));
+    glBufferSubData(GL_ARRAY_BUFFER,
+            MIP_VBO_AVG_OFFSET + local * 2 * sizeof(float),
+            n * 2 * sizeof(float), avg_vertices);
+    glBufferSubData(GL_ARRAY_BUFFER,
+            MIP_VBO_MINMAX_OFFSET + local * 4 * sizeof(float),
+            n * 4 * sizeof(float), minmax_vertices);
+
+    // first entry of a block is also the closing vertex of the previous
+    // block's line strip.
+    unsigned int prev = local == 0 && block > 0 ? m_block(level, block - 1, false) : 0;
+    if (prev)
+    {
+        float v[2] = {float(MIP_VBO_BLOCK_ENTRIES), float(avg[0])};
+        glBindBuffer(GL_ARRAY_BUFFER, prev);
+        glBufferSubData(GL_ARRAY_BUFFER,
+                MIP_VBO_AVG_OFFSET + MIP_VBO_BLOCK_ENTRIES * 2 * sizeof(float),
+                sizeof(v), v);
+    }
+}
+
+
+void MipBufVbo::m_draw(int level, mip_index_t start, mip_index_t end, bool minmax)
+{
+    glEnableClientState(GL_VERTEX_ARRAY);
+
+    for (mip_index_t block = start / MIP_VBO_BLOCK_ENTRIES; block <= end / MIP_VBO_BLOCK_ENTRIES; block++)
+    {
+        unsigned int name = m_block(level, block, false);
+        if (!name)
+            continue;
+
+        mip_index_t base = block * MIP_VBO_BLOCK_ENTRIES;
+        // line strips may use the copied closing vertex, lines may not
+        mip_index_t last = minmax ? MIP_VBO_BLOCK_ENTRIES - 1 : MIP_VBO_BLOCK_ENTRIES;
+        mip_index_t i1   = start > base ? start - base : 0;
+        mip_index_t i2   = end - base < last ? end - base : last;
+
+        glBindBuffer(GL_ARRAY_BUFFER, name);
+        glPushMatrix();
+        // block-local x to start-relative x. a small number, exact in float.
+        glTranslatef(float(base - start), 0., 0.);
+
+        if (minmax)
+        {
+            glVertexPointer(2, GL_FLOAT, 0, (const GLvoid*)MIP_VBO_MINMAX_OFFSET);
+            glDrawArrays(GL_LINES, GLint(i1 * 2), GLsizei((i2 - i1 + 1) * 2));
+        }
+        else if (i2 > i1)
+        {
+            glVertexPointer(2, GL_FLOAT, 0, (const GLvoid*)MIP_VBO_AVG_OFFSET);
+            glDrawArrays(GL_LINE_STRIP, GLint(i1), GLsizei(i2 - i1 + 1));
+        }
+
+        glPopMatrix();
+    }
+
+    glBindBuffer(GL_ARRAY_BUFFER, 0);
+    glDisableClientState(GL_VERTEX_ARRAY);
+}
+
+
+#define MIP_VBO_INSTANTIATE(T) \
+    template void MipBufVbo::draw_avg<T>(MipBuf_t<T>* buf, int level, mip_index_t start, mip_index_t end); \
+    template void MipBufVbo::draw_minmax<T>(MipBuf_t<T>* buf, int level, mip_index_t start, mip_index_t end);
+
+MIP_VBO_INSTANTIATE(float)
+MIP_VBO_INSTANTIATE(signed char)
+MIP_VBO_INSTANTIATE(unsigned char)
+MIP_VBO_INSTANTIATE(short)
+MIP_VBO_INSTANTIATE(unsigned short)
+MIP_VBO_INSTANTIATE(int)
@@ -0,0 +1,78 @@
+#ifndef __MIP_BUF_VBO_H__
+#define __MIP_BUF_VBO_H__
+
+//
+// vertex buffer object mirror of a MipBuf_t. integer samples are converted
+// to float vertices on upload.
+//
+// every level is uploaded into fixed size VBO blocks of
+// MIP_VBO_BLOCK_ENTRIES entries. only entries appended since the previous
+// draw of that level are uploaded, so the per-frame cost is one small
+// glBufferSubData plus one glDrawArrays per block touched by the visible
+// range (one, or two when crossing a block boundary).
+//
+// vertex x coordinates are the entry index inside the block, so they stay
+// exact in float32 no matter how many samples were appended.
+//
+// block layout, B = MIP_VBO_BLOCK_ENTRIES:
+//
+//   B+1 vertices (x, avg)   GL_LINE_STRIP. the last one is a copy of the
+//                           first entry of the next block, so strips of
+//                           neighbouring blocks join.
+//   2*B vertices (x, min), (x, max)   GL_LINES
+//
+// all methods but the destructor need the GL context to be current. the
+// destructor frees only memory: it runs whenever the owner is garbage
+// collected, in whatever context is current then. call release_gl() with
+// the right context current before.
+//
+
+#include "mip_buf_t.h"
+
+
+#define MIP_VBO_BLOCK_ENTRIES 65536
+
+
+class MipBufVbo
+{
+public:
+    MipBufVbo();
+    ~MipBufVbo();
+
+    // upload what's missing of 'level' and draw its entries start..end
+    // (inclusive). entry 'start' is drawn at x = 0, the next one at x = 1..
+    // instantiated for the sample types of MipBufRenderer.
+    template<class T> void draw_avg(MipBuf_t<T>* buf, int level, mip_index_t start, mip_index_t end);
+    template<class T> void draw_minmax(MipBuf_t<T>* buf, int level, mip_index_t start, mip_index_t end);
+
+    // delete all vertex buffers. next draw will upload everything again.
+    void release_gl();
+
+    // false if the driver has no vertex buffer object support (GL < 1.5).
+    static bool available();
+
+private:
+
+    struct Level
+    {
+        // GL buffer names by absolute block number. 0 for blocks not created
+        // yet or already dropped by the MipBuf_t ring.
+        array_t<unsigned int> blocks;
+        // blocks before this are deleted
+        mip_index_t dropped;
+        // entries before this are uploaded
+        mip_index_t uploaded;
+    };
+
+    Level m_levels[MIP_MAX_LEVELS];
+    // vertices are assembled here before upload
+    array_t<float> m_vertices;
+
+    template<class T> void m_update(MipBuf_t<T>* buf, int level);
+    unsigned int m_block(int level, mip_index_t block, bool create);
+    template<class T> void m_upload(int level, mip_index_t i, mip_index_t n, T* minval, T* maxval, T* avg);
+    void m_draw(int level, mip_index_t start, mip_index_t end, bool minmax);
+};
+
+
+#endif // __MIP_BUF_VBO_H__
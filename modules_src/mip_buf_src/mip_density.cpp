@@ -0,0 +1,309 @@
+#include "mip_density.h"
+
+#include <assert.h>
+#include <math.h>
+
+//extern "C"
+//{
+#if defined(WIN32)
+    #include <windows.h>
+    #include <GL/gl.h>
+#elif defined(__APPLE__)
+    #include <OpenGL/gl.h>
+#else // linux
+    #include <GL/gl.h>
+#endif
+//}
+
+
+// --------------------------------------------------------------------------
+// ---- LIFECYCLE -----------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+MipDensity::MipDensity():
+    m_samples_per_column(0.),
+    m_value_min(0.),
+    m_value_max(0.),
+    m_height(0),
+    m_start_index(0.),
+    m_c0(0),
+    m_c1(0),
+    m_first(0),
+    m_size(0),
+    m_rows(0),
+    m_pitch(0),
+    m_dirty0(0),
+    m_dirty1(0),
+    m_texture(0),
+    m_texture_size_changed(true)
+{
+}
+
+
+MipDensity::~MipDensity()
+{
+}
+
+
+// --------------------------------------------------------------------------
+// ---- METHODS -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+int MipDensity::update(MipBuf_t<T>* buf, double start_index, double end_index, double resolution,
+        double value_min, double value_max, int height)
+{
+    mip_index_t old_c0 = m_c0, old_c1 = m_c1;
+    m_c0 = m_c1 = 0;
+    if (end_index <= start_index || resolution < 1. || height < 1 || value_min == value_max)
+        return 0;
+
+    // every visible column fits into the ring
+    int rows = 1, pitch = 1;
+    while (rows < int(ceil(resolution)) + 2)
+        rows *= 2;
+    while (pitch < height)
+        pitch *= 2;
+
+    // another zoom or value range, start over. scrolling moves both ends of
+    // the range by the same amount, float noise is not a new zoom.
+    double spc = (end_index - start_index) / resolution;
+    if (fabs(spc - m_samples_per_column) > m_samples_per_column * 1e-6 || value_min != m_value_min ||
+            value_max != m_value_max || height != m_height || rows > m_rows)
+    {
+        m_samples_per_column = spc;
+        m_value_min = value_min;
+        m_value_max = value_max;
+        m_height    = height;
+        if (rows > m_rows || pitch != m_pitch)
+        {
+            m_rows  = MIP_MAX(rows, m_rows);
+            m_pitch = pitch;
+            m_pixels.clear();
+            unsigned char* p = m_pixels.append(m_rows * m_pitch);
+            for (int i = 0; i < m_rows * m_pitch; i++)
+                p[i] = 0;
+            m_texture_size_changed = true;
+        }
+        old_c0 = old_c1 = 0;
+    }
+    spc = m_samples_per_column;
+
+    // entries of at most 1/MIP_DENSITY_DETAIL of a column
+    int max_level = 0;
+    while (max_level + 1 < buf->num_levels() &&
+            double(mip_index_t(1) << buf->level_shift(max_level + 1)) * MIP_DENSITY_DETAIL <= spc)
+        max_level++;
+
+    mip_index_t first = buf->first(), size = buf->size();
+    m_start_index = start_index;
+    m_c0 = mip_index_t(floor(start_index / spc));
+    m_c1 = mip_index_t(floor(end_index / spc)) + 1;
+    assert(m_c1 - m_c0 <= m_rows);
+
+    int computed = 0;
+    for (mip_index_t c = m_c0; c < m_c1; c++)
+    {
+        bool known = c >= old_c0 && c < old_c1 && m_column_start(c + 1) <= m_size &&
+                (m_column_start(c) >= first || first == m_first);
+        if (known)
+            continue;
+        m_compute(buf, c, max_level);
+        computed++;
+        if (m_dirty1 <= m_dirty0)
+        {
+            m_dirty0 = c;
+            m_dirty1 = c + 1;
+        }
+        else
+        {
+            m_dirty0 = MIP_MIN(m_dirty0, c);
+            m_dirty1 = MIP_MAX(m_dirty1, c + 1);
+        }
+    }
+    m_first = first;
+    m_size  = size;
+    return computed;
+}
+
+
+int MipDensity::draw()
+{
+    if (m_c1 <= m_c0)
+        return 0;
+
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1);
+    if (!m_texture)
+    {
+        glGenTextures(1, &m_texture);
+        m_texture_size_changed = true;
+    }
+    glBindTexture(GL_TEXTURE_2D, m_texture);
+
+    if (m_texture_size_changed)
+    {
+        // columns wrap around the ring along t
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST);
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST);
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP);
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT);
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_ALPHA, m_pitch, m_rows, 0, GL_ALPHA, GL_UNSIGNED_BYTE, m_pixels.data());
+        m_texture_size_changed = false;
+    }
+    else
+    {
+        // the computed columns still visible. one upload, two where the
+        // ring wraps.
+        mip_index_t d0 = MIP_MAX(m_dirty0, m_c0);
+        mip_index_t d1 = MIP_MIN(m_dirty1, m_c1);
+        while (d0 < d1)
+        {
+            int row = int(d0 & (m_rows - 1));
+            int n   = int(MIP_MIN(d1 - d0, mip_index_t(m_rows - row)));
+            glTexSubImage2D(GL_TEXTURE_2D, 0, 0, row, m_pitch, n, GL_ALPHA, GL_UNSIGNED_BYTE,
+                    m_pixels.data() + row * m_pitch);
+            d0 += n;
+        }
+    }
+    m_dirty0 = m_dirty1 = 0;
+
+    // column c spans pixels c - start_index / spc .. +1
+    float x0 = float(double(m_c0) - m_start_index / m_samples_per_column);
+    float x1 = x0 + float(m_c1 - m_c0);
+    float t0 = float(m_c0 & (m_rows - 1)) / m_rows;
+    float t1 = t0 + float(m_c1 - m_c0) / m_rows;
+    float s1 = float(m_height) / m_pitch;
+
+    // the color of the current glColor, alpha from the texture
+    glEnable(GL_TEXTURE_2D);
+    glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE);
+    glBegin(GL_QUADS);
+    glTexCoord2f(0., t0); glVertex3f(x0, float(m_value_min), 0.);
+    glTexCoord2f(0., t1); glVertex3f(x1, float(m_value_min), 0.);
+    glTexCoord2f(s1, t1); glVertex3f(x1, float(m_value_max), 0.);
+    glTexCoord2f(s1, t0); glVertex3f(x0, float(m_value_max), 0.);
+    glEnd();
+    glBindTexture(GL_TEXTURE_2D, 0);
+    glDisable(GL_TEXTURE_2D);
+    return 4;
+}
+
+
+const unsigned char* MipDensity::column(mip_index_t c)
+{
+    if (c < m_c0 || c >= m_c1)
+        return NULL;
+    return m_pixels.data() + (c & (m_rows - 1)) * m_pitch;
+}
+
+
+mip_index_t MipDensity::column_of(mip_index_t i)
+{
+    return mip_index_t(floor((double(i) + 0.5) / m_samples_per_column));
+}
+
+
+void MipDensity::release_gl()
+{
+    if (m_texture)
+        glDeleteTextures(1, &m_texture);
+    m_texture = 0;
+    m_texture_size_changed = true;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+mip_index_t MipDensity::m_column_start(mip_index_t c)
+{
+    return mip_index_t(ceil(double(c) * m_samples_per_column - 0.5));
+}
+
+
+template<class T>
+void MipDensity::m_compute(MipBuf_t<T>* buf, mip_index_t c, int max_level)
+{
+    mip_index_t a = MIP_MAX(m_column_start(c), buf->first());
+    mip_index_t b = MIP_MIN(m_column_start(c + 1), buf->size());
+
+    m_diff.clear();
+    double* diff = m_diff.append(m_height + 1);
+    for (int i = 0; i <= m_height; i++)
+        diff[i] = 0.;
+
+    // the largest entry starting at 'a' that stays in the column, like
+    // MipSearch_t::find. if a coarse entry isn't there, try finer ones.
+    int top = max_level;
+    while (a < b)
+    {
+        int level = 0;
+        while (level < top &&
+                (a & ((mip_index_t(1) << buf->level_shift(level + 1)) - 1)) == 0 &&
+                b - a >= (mip_index_t(1) << buf->level_shift(level + 1)))
+            level++;
+
+        mip_index_t len = mip_index_t(1) << buf->level_shift(level);
+        T minval, maxval, avg;
+        if (buf->level(level)->get(a >> buf->level_shift(level), &minval, &maxval, &avg))
+        {
+            m_add(double(minval), double(maxval), double(len));
+            a  += len;
+            top = max_level;
+        }
+        else if (level == 0)
+            a++;
+        else
+            top = level - 1;
+    }
+
+    unsigned char* row = m_pixels.data() + (c & (m_rows - 1)) * m_pitch;
+    double scale = 255. / log(1. + MIP_MAX(m_samples_per_column, 1.));
+    double n = 0.;
+    for (int i = 0; i < m_height; i++)
+    {
+        n += diff[i];
+        int v = int(log(1. + MIP_MAX(n, 0.)) * scale + 0.5);
+        row[i] = (unsigned char)MIP_MIN(v, 255);
+    }
+}
+
+
+inline void MipDensity::m_add(double minval, double maxval, double count)
+{
+    double k  = m_height / (m_value_max - m_value_min);
+    double y0 = (minval - m_value_min) * k;
+    double y1 = (maxval - m_value_min) * k;
+    if (y0 > y1)
+    {
+        double y = y0;
+        y0 = y1;
+        y1 = y;
+    }
+    if (y1 < 0. || y0 >= m_height)
+        return;
+
+    // the share of the bins outside the range is lost
+    double w = count / (floor(y1) - floor(y0) + 1.);
+    int lo = int(MIP_MAX(floor(y0), 0.));
+    int hi = int(MIP_MIN(floor(y1), double(m_height - 1)));
+    double* diff = m_diff.data();
+    diff[lo]     += w;
+    diff[hi + 1] -= w;
+}
+
+
+#define MIP_DENSITY_INSTANTIATE(T) \
+    template int MipDensity::update<T>(MipBuf_t<T>* buf, double start_index, double end_index, double resolution, \
+            double value_min, double value_max, int height);
+
+MIP_DENSITY_INSTANTIATE(float)
+MIP_DENSITY_INSTANTIATE(signed char)
+MIP_DENSITY_INSTANTIATE(unsigned char)
+MIP_DENSITY_INSTANTIATE(short)
+MIP_DENSITY_INSTANTIATE(unsigned short)
+MIP_DENSITY_INSTANTIATE(int)
@@ -0,0 +1,97 @@
+#ifndef __MIP_DENSITY_H__
+#define __MIP_DENSITY_H__
+
+//
+// density ("phosphor") view of a MipBuf_t. every pixel column gets a
+// histogram of the values of its samples, one bin per pixel row, drawn as
+// an alpha texture: rows where the signal spends more time are brighter.
+//
+// a column is built from the largest pyramid entries that fit into it,
+// down to entries of about 1/MIP_DENSITY_DETAIL of the column. the samples
+// of an entry are spread evenly over the bins from its minval to its
+// maxval. zoomed in to few samples per column, that's level 0 and exact.
+//
+// the columns are at fixed sample positions: column c holds the samples i
+// with floor((i + 0.5) / samples_per_column) == c, the pixel render_m4
+// draws them to. as long as the zoom and the value range stay the same,
+// a column is computed once. the texture is a ring of columns, scrolling
+// and new samples upload only the columns that came into view or got new
+// samples.
+//
+// intensity of a bin is log(1 + n) / log(1 + samples_per_column), n the
+// num of its samples. a flat line is full brightness at any zoom.
+//
+// draw() needs the GL context to be current. the destructor doesn't touch
+// GL, release_gl() deletes the texture.
+//
+
+#include "mip_buf_t.h"
+
+
+// a column is built from entries of at most 1/MIP_DENSITY_DETAIL of it
+#define MIP_DENSITY_DETAIL 32
+
+
+class MipDensity
+{
+public:
+    MipDensity();
+    ~MipDensity();
+
+    // compute the columns of samples start_index..end_index for resolution
+    // pixel columns that aren't known yet. value_min..value_max: the raw
+    // value range of the 'height' bins, value_min at bin 0. return num of
+    // columns computed. instantiated for the sample types of MipBufRenderer.
+    template<class T> int update(MipBuf_t<T>* buf, double start_index, double end_index, double resolution,
+            double value_min, double value_max, int height);
+    // draw the columns of the last update() as a quad from x = 0 (pixel
+    // coordinates like render_m4) and y = value_min to value_max. return
+    // num of vertices, 0 if there are no columns.
+    int  draw();
+
+    // intensities (0..255) of the 'height' bins of column c, NULL if c is
+    // not visible since the last update()
+    const unsigned char* column(mip_index_t c);
+    // column of sample i at the zoom of the last update()
+    mip_index_t column_of(mip_index_t i);
+
+    // delete the texture. next draw will upload everything again.
+    void release_gl();
+
+private:
+    double        m_samples_per_column;
+    double        m_value_min;
+    double        m_value_max;
+    int           m_height;
+    // visible columns c0..c1-1 of the last update(), and start_index
+    double        m_start_index;
+    mip_index_t   m_c0;
+    mip_index_t   m_c1;
+    // first() and size() of the buffer at the last update(). a column is
+    // known if it's still visible, all of its samples were appended and
+    // none of them was dropped since.
+    mip_index_t   m_first;
+    mip_index_t   m_size;
+
+    // ring of columns: column c is row c % m_rows. m_pitch bytes per row,
+    // a power of two >= m_height. the texture is the same.
+    int           m_rows;
+    int           m_pitch;
+    array_t<unsigned char> m_pixels;
+    // columns m_dirty0..m_dirty1-1 are not uploaded yet
+    mip_index_t   m_dirty0;
+    mip_index_t   m_dirty1;
+    unsigned int  m_texture;
+    bool          m_texture_size_changed;
+    // bin boundaries of the histogram, summed up into bins
+    array_t<double> m_diff;
+
+    // first sample of column c
+    mip_index_t m_column_start(mip_index_t c);
+    template<class T> void m_compute(MipBuf_t<T>* buf, mip_index_t c, int max_level);
+    // 'count' samples spread over minval..maxval
+    inline void m_add(double minval, double maxval, double count);
+};
+
+
+#endif // __MIP_DENSITY_H__
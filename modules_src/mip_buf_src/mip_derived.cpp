@@ -0,0 +1,174 @@
+#include "mip_derived.h"
+
+#include <assert.h>
+#include <math.h>
+
+
+#ifndef M_PI
+    #define M_PI 3.1415926535897
+#endif
+
+
+// --------------------------------------------------------------------------
+// ---- LIFECYCLE -----------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+MipDerived::MipDerived(MipBufRenderer* out, double freq):
+    m_out(out),
+    m_freq(freq),
+    m_offset(0.),
+    m_next(0)
+{
+    assert(freq > 0.);
+    set_filter(MIP_FILTER_NONE, 0.);
+}
+
+
+// --------------------------------------------------------------------------
+// ---- METHODS -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+void MipDerived::add_source(MipBufRenderer* source, double freq, double gain)
+{
+    assert(freq > 0.);
+    Source s;
+    s.renderer = source;
+    s.ratio    = freq / m_freq;
+    s.gain     = gain;
+    m_sources.appendval(s);
+}
+
+
+void MipDerived::set_offset(double offset)
+{
+    m_offset = offset;
+}
+
+
+void MipDerived::set_filter(int filter, double param)
+{
+    assert(filter >= 0 && filter < MIP_NUM_FILTERS);
+    m_filter      = filter;
+    m_window_size = filter == MIP_FILTER_MOVING_AVG ? MIP_MAX(int(param), 1) : 1;
+    m_window_pos  = 0;
+    m_window_sum  = 0.;
+    m_window.clear();
+    m_alpha       = filter == MIP_FILTER_LOWPASS ? 1. - exp(-2. * M_PI * param / m_freq) : 1.;
+    m_y           = 0.;
+    m_started     = false;
+}
+
+
+int MipDerived::update()
+{
+    if (!m_sources.size())
+        return 0;
+
+    // output samples every source has reached. sample j interpolates
+    // source samples floor(j * ratio) and the one after it.
+    mip_index_t end = -1;
+    for (mip_index_t k = 0; k < m_sources.size(); k++)
+    {
+        Source* s = m_sources.get(k);
+        mip_index_t size = s->renderer->size();
+        if (!size)
+            return 0;
+        mip_index_t e = mip_index_t(floor(double(size - 1) / s->ratio)) + 1;
+        end = end < 0 ? e : MIP_MIN(end, e);
+    }
+
+    // a block reads at most ~MIP_DERIVED_BLOCK samples of any source
+    double max_ratio = 1.;
+    for (mip_index_t k = 0; k < m_sources.size(); k++)
+        max_ratio = MIP_MAX(max_ratio, m_sources.get(k)->ratio);
+    int block = MIP_MAX(int(MIP_DERIVED_BLOCK / max_ratio), 1);
+
+    int appended = 0;
+    while (m_next < end)
+    {
+        int n = int(MIP_MIN(end - m_next, mip_index_t(block)));
+        m_sum.clear();
+        double* sum = m_sum.append(n);
+        for (int j = 0; j < n; j++)
+            sum[j] = m_offset;
+        for (mip_index_t k = 0; k < m_sources.size(); k++)
+            m_add_source(m_sources.get(k), n);
+
+        m_result.clear();
+        float* result = m_result.append(n);
+        for (int j = 0; j < n; j++)
+            result[j] = float(m_filtered(sum[j]));
+        m_out->append_array(result, n);
+
+        m_next   += n;
+        appended += n;
+    }
+    return appended;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+void MipDerived::m_add_source(Source* s, int n)
+{
+    // the source samples the block needs, clamped to the ones kept
+    mip_index_t lo = mip_index_t(floor(double(m_next) * s->ratio));
+    mip_index_t hi = mip_index_t(floor(double(m_next + n - 1) * s->ratio)) + 1;
+    mip_index_t first = s->renderer->first(), last = s->renderer->size() - 1;
+    lo = MIP_MIN(MIP_MAX(lo, first), last);
+    hi = MIP_MIN(MIP_MAX(hi, lo), last);
+    m_in.clear();
+    float* in = m_in.append(hi - lo + 1);
+    int got = s->renderer->get_avg(lo, int(hi - lo + 1), in);
+    assert(got == hi - lo + 1);
+    (void)got;
+
+    double* sum = m_sum.data();
+    for (int j = 0; j < n; j++)
+    {
+        double x = double(m_next + j) * s->ratio;
+        mip_index_t i = mip_index_t(floor(x));
+        double a = in[MIP_MIN(MIP_MAX(i, lo), hi) - lo];
+        double b = in[MIP_MIN(MIP_MAX(i + 1, lo), hi) - lo];
+        sum[j] += s->gain * (a + (b - a) * (x - double(i)));
+    }
+}
+
+
+inline double MipDerived::m_filtered(double x)
+{
+    if (m_filter == MIP_FILTER_MOVING_AVG)
+    {
+        if (m_window.size() < m_window_size)
+        {
+            m_window.appendval(x);
+            m_window_sum += x;
+            return m_window_sum / double(m_window.size());
+        }
+        double* w = m_window.data();
+        m_window_sum += x - w[m_window_pos];
+        w[m_window_pos] = x;
+        m_window_pos = (m_window_pos + 1) % m_window_size;
+        // a fresh sum once per round, so rounding errors don't pile up
+        if (m_window_pos == 0)
+        {
+            m_window_sum = 0.;
+            for (int i = 0; i < m_window_size; i++)
+                m_window_sum += w[i];
+        }
+        return m_window_sum / double(m_window_size);
+    }
+    if (m_filter == MIP_FILTER_LOWPASS)
+    {
+        // starts from the first sample instead of from 0
+        m_y = m_started ? m_y + m_alpha * (x - m_y) : x;
+        m_started = true;
+        return m_y;
+    }
+    return x;
+}
@@ -0,0 +1,100 @@
+#ifndef __MIP_DERIVED_H__
+#define __MIP_DERIVED_H__
+
+//
+// a channel computed from other channels as their samples arrive.
+//
+//   out[j] = filter(offset + gain0 * source0(t) + gain1 * source1(t) + ..)
+//
+// output sample j is at time t = j / freq, sample i of a source at
+// i / (its freq), both counted from the first sample. a source of another
+// rate is linearly interpolated at t, so A - B of a 1kHz and a 500Hz
+// channel works. (a much faster source is only sampled, not averaged.)
+//
+// update() computes every output sample all the sources have reached and
+// appends them with append_array() of the output renderer: the result has
+// its own pyramid, triggers etc. like any channel. the filter state
+// carries over from one update() to the next, so updating after every
+// source batch gives the same samples as updating once at the end.
+//
+// filters:
+//   MIP_FILTER_NONE
+//   MIP_FILTER_MOVING_AVG : mean of the last 'param' samples (of all of
+//                           them at the start)
+//   MIP_FILTER_LOWPASS    : one-pole IIR low-pass, cutoff 'param' Hz:
+//                           y += (1 - exp(-2 pi param / freq)) * (x - y)
+//
+// source samples not kept anymore (rings) read as the oldest kept one.
+//
+
+#include "mip_buf_renderer.h"
+
+
+enum
+{
+    MIP_FILTER_NONE = 0,
+    MIP_FILTER_MOVING_AVG,
+    MIP_FILTER_LOWPASS,
+    MIP_NUM_FILTERS
+};
+
+
+// output samples computed at once
+#define MIP_DERIVED_BLOCK 4096
+
+
+class MipDerived
+{
+public:
+    // results are appended to 'out', which samples at freq Hz. out and the
+    // sources have to outlive this MipDerived.
+    MipDerived(MipBufRenderer* out, double freq);
+
+    // add gain * source. freq: sample rate of the source. before the first
+    // update().
+    void add_source(MipBufRenderer* source, double freq, double gain);
+    void set_offset(double offset);
+    // filter: MIP_FILTER_*, see above. before the first update().
+    void set_filter(int filter, double param);
+
+    // compute and append the output samples all the sources have samples
+    // for. return num appended.
+    int  update();
+
+private:
+    struct Source
+    {
+        MipBufRenderer* renderer;
+        // source samples per output sample
+        double ratio;
+        double gain;
+    };
+
+    MipBufRenderer*  m_out;
+    double           m_freq;
+    double           m_offset;
+    array_t<Source>  m_sources;
+    int              m_filter;
+    // moving avg: the last samples in a ring, and their sum
+    int              m_window_size;
+    int              m_window_pos;
+    double           m_window_sum;
+    array_t<double>  m_window;
+    // low-pass
+    double           m_alpha;
+    double           m_y;
+    bool             m_started;
+    // next output sample
+    mip_index_t      m_next;
+    // a block of source samples, the sums, the output
+    array_t<float>   m_in;
+    array_t<double>  m_sum;
+    array_t<float>   m_result;
+
+    // add gain * source for output samples m_next..m_next+n-1 to m_sum
+    void m_add_source(Source* s, int n);
+    inline double m_filtered(double x);
+};
+
+
+#endif // __MIP_DERIVED_H__
@@ -0,0 +1,435 @@
+#include "mip_file.h"
+
+#include <assert.h>
+#include <string.h>
+
+#if defined(WIN32)
+    #include <windows.h>
+#else
+    #include <sys/types.h>
+    #include <sys/stat.h>
+    #include <sys/mman.h>
+    #include <fcntl.h>
+    #include <unistd.h>
+#endif
+
+
+// --------------------------------------------------------------------------
+// ---- LIFECYCLE -----------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+MipFile::MipFile()
+{
+    m_header   = NULL;
+    m_writable = false;
+    memset(m_segments, 0, sizeof(m_segments));
+    memset(m_last, 0, sizeof(m_last));
+#if defined(WIN32)
+    m_file = INVALID_HANDLE_VALUE;
+#else
+    m_fd   = -1;
+#endif
+}
+
+
+MipFile::~MipFile()
+{
+    close();
+}
+
+
+// --------------------------------------------------------------------------
+// ---- METHODS -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+bool MipFile::create(const char* path, int elem_size, int sample_type)
+{
+    close();
+
+#if defined(WIN32)
+    m_file = CreateFileA(path, GENERIC_READ | GENERIC_WRITE, FILE_SHARE_READ, NULL,
+                         CREATE_ALWAYS, FILE_ATTRIBUTE_NORMAL, NULL);
+    if (m_file == INVALID_HANDLE_VALUE)
+        return false;
+#else
+    m_fd = ::open(path, O_RDWR | O_CREAT | O_TRUNC, 0644);
+    if (m_fd < 0)
+        return false;
+#endif
+    m_writable = true;
+
+    if (!m_resize(MIP_FILE_HEADER_SIZE))
+    {
+        close();
+        return false;
+    }
+    m_header = (MipFileHeader*)m_map(0, MIP_FILE_HEADER_SIZE);
+    if (!m_header)
+    {
+        close();
+        return false;
+    }
+
+    // a fresh file reads as zeros, only the non-zero fields are set
+    memcpy(m_header->magic, MIP_FILE_MAGIC, sizeof(m_header->magic));
+    m_header->elem_size   = elem_size;
+    m_header->sample_type = sample_type;
+    m_header->file_size   = MIP_FILE_HEADER_SIZE;
+    return true;
+}
+
+
+bool MipFile::open(const char* path, int elem_size, bool writable)
+{
+    close();
+
+#if defined(WIN32)
+    m_file = CreateFileA(path, GENERIC_READ | (writable ? GENERIC_WRITE : 0), FILE_SHARE_READ, NULL,
+                         OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, NULL);
+    if (m_file == INVALID_HANDLE_VALUE)
+        return false;
+    LARGE_INTEGER li;
+    if (!GetFileSizeEx(m_file, &li))
+    {
+        close();
+        return false;
+    }
+    long long file_size = li.QuadPart;
+#else
+    m_fd = ::open(path, writable ? O_RDWR : O_RDONLY);
+    if (m_fd < 0)
+        return false;
+    struct stat st;
+    if (fstat(m_fd, &st) != 0)
+    {
+        close();
+        return false;
+    }
+    long long file_size = st.st_size;
+#endif
+    m_writable = writable;
+    if (file_size < MIP_FILE_HEADER_SIZE)
+    {
+        close();
+        return false;
+    }
+
+    m_header = (MipFileHeader*)m_map(0, MIP_FILE_HEADER_SIZE);
+    if (!m_header ||
+            memcmp(m_header->magic, MIP_FILE_MAGIC, sizeof(m_header->magic)) != 0 ||
+            m_header->elem_size <= 0 || (elem_size && m_header->elem_size != elem_size) ||
+            m_header->num_segments < 0 || m_header->num_segments > MIP_FILE_MAX_SEGMENTS ||
+            m_header->file_size > file_size)
+    {
+        close();
+        return false;
+    }
+
+    for (int s = 0; s < m_header->num_segments; s++)
+    {
+        MipFileSegment* seg = &m_header->segments[s];
+        if (seg->stream < 0 || seg->stream >= MIP_FILE_STREAMS ||
+                seg->offset + seg->capacity * m_column_size(int(seg->stream)) * m_num_columns(int(seg->stream)) > m_header->file_size)
+        {
+            close();
+            return false;
+        }
+        m_segments[s] = m_map(seg->offset, seg->capacity * m_column_size(int(seg->stream)) * m_num_columns(int(seg->stream)));
+        if (!m_segments[s])
+        {
+            close();
+            return false;
+        }
+    }
+    return true;
+}
+
+
+void MipFile::close()
+{
+    if (m_header)
+    {
+        if (m_writable)
+            flush();
+        for (int s = 0; s < m_header->num_segments; s++)
+        {
+            MipFileSegment* seg = &m_header->segments[s];
+            if (m_segments[s])
+                m_unmap(m_segments[s], seg->capacity * m_column_size(int(seg->stream)) * m_num_columns(int(seg->stream)));
+        }
+        m_unmap((char*)m_header, MIP_FILE_HEADER_SIZE);
+        m_header = NULL;
+    }
+    memset(m_segments, 0, sizeof(m_segments));
+    memset(m_last, 0, sizeof(m_last));
+    m_writable = false;
+
+#if defined(WIN32)
+    if (m_file != INVALID_HANDLE_VALUE)
+        CloseHandle(m_file);
+    m_file = INVALID_HANDLE_VALUE;
+#else
+    if (m_fd >= 0)
+        ::close(m_fd);
+    m_fd = -1;
+#endif
+}
+
+
+bool MipFile::flush()
+{
+    if (!m_header || !m_writable)
+        return m_header != NULL;
+
+    // segments first. the sizes in the header must never cover entries
+    // that didn't reach the disk.
+    bool ok = true;
+    for (int s = 0; s < m_header->num_segments; s++)
+    {
+        MipFileSegment* seg = &m_header->segments[s];
+        ok &= m_sync(m_segments[s], seg->capacity * m_column_size(int(seg->stream)) * m_num_columns(int(seg->stream)));
+    }
+    ok &= m_sync((char*)m_header, MIP_FILE_HEADER_SIZE);
+    return ok;
+}
+
+
+bool MipFile::is_open()
+{
+    return m_header != NULL;
+}
+
+
+bool MipFile::is_writable()
+{
+    return m_header && m_writable;
+}
+
+
+int MipFile::get_elem_size()
+{
+    return m_header ? m_header->elem_size : 0;
+}
+
+
+int MipFile::get_sample_type()
+{
+    return m_header ? m_header->sample_type : 0;
+}
+
+
+long long MipFile::size(int stream)
+{
+    assert(stream >= 0 && stream < MIP_FILE_STREAMS);
+    return m_header ? m_header->stream_size[stream] : 0;
+}
+
+
+void MipFile::set_size(int stream, long long size)
+{
+    assert(stream >= 0 && stream < MIP_FILE_STREAMS);
+    assert(m_writable);
+    m_header->stream_size[stream] = size;
+}
+
+
+int MipFile::get_branching()
+{
+    return m_header ? m_header->branching : 0;
+}
+
+
+int MipFile::get_skip_levels()
+{
+    return m_header ? m_header->skip_levels : 0;
+}
+
+
+void MipFile::set_branching(int branching, int skip_levels)
+{
+    assert(m_writable);
+    m_header->branching   = branching;
+    m_header->skip_levels = skip_levels;
+}
+
+
+long long MipFile::span(int stream, long long i, char** columns, bool allocate)
+{
+    assert(stream >= 0 && stream < MIP_FILE_STREAMS);
+    if (!m_header || i < 0)
+        return 0;
+
+    int s = m_find(stream, i);
+    while (s < 0 && allocate && m_writable)
+    {
+        // segments are allocated in order. i has to be in the next one or
+        // right after it (appending never skips more than a segment).
+        if (m_allocate(stream) < 0)
+            return 0;
+        s = m_find(stream, i);
+    }
+    if (s < 0)
+        return 0;
+
+    MipFileSegment* seg = &m_header->segments[s];
+    long long column_bytes = seg->capacity * m_column_size(stream);
+    long long rel = i - seg->first;
+    for (int c = 0; c < m_num_columns(stream); c++)
+        columns[c] = m_segments[s] + c * column_bytes + rel * m_column_size(stream);
+    return seg->capacity - rel;
+}
+
+
+int MipFile::get_user_data(char* out, int max_size)
+{
+    if (!m_header)
+        return 0;
+    int n = m_header->user_size < max_size ? m_header->user_size : max_size;
+    if (out && n > 0)
+        memcpy(out, m_header->user, n);
+    return m_header->user_size;
+}
+
+
+bool MipFile::set_user_data(const char* data, int size)
+{
+    if (!m_header || !m_writable || size < 0 || size > MIP_FILE_USER_SIZE)
+        return false;
+    memcpy(m_header->user, data, size);
+    m_header->user_size = size;
+    return true;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+int MipFile::m_column_size(int stream)
+{
+    return stream == MIP_FILE_TIMESTAMPS ? int(sizeof(double)) : m_header->elem_size;
+}
+
+
+int MipFile::m_num_columns(int stream)
+{
+    return stream == MIP_FILE_TIMESTAMPS ? 1 : 3;
+}
+
+
+// index of the segment that holds entry i of the stream. -1 if none.
+int MipFile::m_find(int stream, long long i)
+{
+    MipFileSegment* seg = &m_header->segments[m_last[stream]];
+    if (m_last[stream] < m_header->num_segments &&
+            seg->stream == stream && i >= seg->first && i < seg->first + seg->capacity)
+        return m_last[stream];
+
+    for (int s = 0; s < m_header->num_segments; s++)
+    {
+        seg = &m_header->segments[s];
+        if (seg->stream == stream && i >= seg->first && i < seg->first + seg->capacity)
+        {
+            m_last[stream] = s;
+            return s;
+        }
+    }
+    return -1;
+}
+
+
+// add the next segment to the end of the stream and the end of the file.
+// return its index or -1 on error.
+int MipFile::m_allocate(int stream)
+{
+    int num = int(m_header->num_segments);
+    if (num >= MIP_FILE_MAX_SEGMENTS)
+        return -1;
+
+    long long first    = 0;
+    long long capacity = MIP_FILE_FIRST_SEGMENT;
+    for (int level = 0; level < stream && capacity > MIP_FILE_MIN_SEGMENT; level++)
+        capacity /= 2;
+    for (int s = 0; s < num; s++)
+    {
+        MipFileSegment* seg = &m_header->segments[s];
+        if (seg->stream == stream && seg->first + seg->capacity > first)
+        {
+            first    = seg->first + seg->capacity;
+            capacity = seg->capacity * 2;
+        }
+    }
+
+    long long offset = (m_header->file_size + MIP_FILE_ALIGN - 1) / MIP_FILE_ALIGN * MIP_FILE_ALIGN;
+    long long bytes  = capacity * m_column_size(stream) * m_num_columns(stream);
+    if (!m_resize(offset + bytes))
+        return -1;
+    char* p = m_map(offset, bytes);
+    if (!p)
+        return -1;
+
+    MipFileSegment* seg = &m_header->segments[num];
+    seg->stream   = stream;
+    seg->first    = first;
+    seg->capacity = capacity;
+    seg->offset   = offset;
+    m_segments[num] = p;
+    m_header->file_size    = offset + bytes;
+    m_header->num_segments = num + 1;
+    return num;
+}
+
+
+bool MipFile::m_resize(long long size)
+{
+#if defined(WIN32)
+    LARGE_INTEGER li;
+    li.QuadPart = size;
+    return SetFilePointerEx(m_file, li, NULL, FILE_BEGIN) && SetEndOfFile(m_file);
+#else
+    return ftruncate(m_fd, off_t(size)) == 0;
+#endif
+}
+
+
+char* MipFile::m_map(long long offset, long long size)
+{
+#if defined(WIN32)
+    // a mapping object can't grow. one per view, the view keeps it alive.
+    long long end = offset + size;
+    HANDLE mapping = CreateFileMappingA(m_file, NULL, m_writable ? PAGE_READWRITE : PAGE_READONLY,
+                                        DWORD(end >> 32), DWORD(end & 0xffffffff), NULL);
+    if (!mapping)
+        return NULL;
+    void* p = MapViewOfFile(mapping, m_writable ? FILE_MAP_WRITE : FILE_MAP_READ,
+                            DWORD(offset >> 32), DWORD(offset & 0xffffffff), SIZE_T(size));
+    CloseHandle(mapping);
+    return (char*)p;
+#else
+    void* p = mmap(NULL, size_t(size), m_writable ? PROT_READ | PROT_WRITE : PROT_READ, MAP_SHARED, m_fd, off_t(offset));
+    return p == MAP_FAILED ? NULL : (char*)p;
+#endif
+}
+
+
+void MipFile::m_unmap(char* p, long long size)
+{
+#if defined(WIN32)
+    UnmapViewOfFile(p);
+#else
+    munmap(p, size_t(size));
+#endif
+}
+
+
+bool MipFile::m_sync(char* p, long long size)
+{
+#if defined(WIN32)
+    return FlushViewOfFile(p, SIZE_T(size)) && FlushFileBuffers(m_file);
+#else
+    return msync(p, size_t(size), MS_SYNC) == 0;
+#endif
+}
@@ -0,0 +1,148 @@
+#ifndef __MIP_FILE_H__
+#define __MIP_FILE_H__
+
+//
+// memory-mapped file behind a MipBuf_t. every level of the pyramid, the
+// timestamps of the channel and a small blob of user data (the python side
+// keeps the channel mapping, freq etc there as json) in one file.
+//
+// the file is a number of streams. streams 0..MIP_FILE_LEVELS-1 are the
+// mip levels, three columns each (minval, maxval, avg) of 'elem_size'
+// bytes. stream MIP_FILE_TIMESTAMPS is one column of doubles.
+//
+// layout:
+//
+//   MIP_FILE_HEADER_SIZE bytes   MipFileHeader. magic, stream sizes,
+//                                segment table, user data.
+//   segments                     every segment holds 'capacity' entries of
+//                                one stream as plain columns one after
+//                                another: minval[capacity] maxval[capacity]
+//                                avg[capacity]. starts at a multiple of
+//                                MIP_FILE_ALIGN.
+//
+// a stream gets a new segment when it fills the previous one. segment
+// capacities of a stream double: c, 2c, 4c, .. so a stream of n entries has
+// only log2(n) segments, and every segment is mapped separately. pointers
+// into a segment stay valid until close(), appending never moves anything.
+//
+// opening a multi-GB file maps it, nothing is read. the OS pages in what
+// is looked at.
+//
+// the header is mapped too, stream sizes are written there on every
+// append. flush() forces everything to disk. files are in native byte
+// order, elem_size and the magic are checked on open. sample_type is free
+// for the owner to tell apart sample types of the same size.
+//
+
+#define MIP_FILE_MAGIC         "MIPBUF1"
+#define MIP_FILE_LEVELS        64
+#define MIP_FILE_TIMESTAMPS    MIP_FILE_LEVELS
+#define MIP_FILE_STREAMS       (MIP_FILE_LEVELS + 1)
+#define MIP_FILE_MAX_SEGMENTS  2048
+#define MIP_FILE_USER_SIZE     16384
+// mmap offsets have to be multiples of the allocation granularity. 64k
+// on windows, page size elsewhere.
+#define MIP_FILE_ALIGN         65536
+#define MIP_FILE_HEADER_SIZE   (2 * MIP_FILE_ALIGN)
+// entries in the first segment of level 0. coarser levels start smaller.
+#define MIP_FILE_FIRST_SEGMENT 65536
+#define MIP_FILE_MIN_SEGMENT   1024
+
+
+struct MipFileSegment
+{
+    long long stream;
+    long long first;     // stream index of the first entry
+    long long capacity;  // in entries
+    long long offset;    // in bytes from the start of the file
+};
+
+
+struct MipFileHeader
+{
+    char      magic[8];
+    int       elem_size;
+    int       user_size;
+    // MipBuf_t layout. 0 until set.
+    int       branching;
+    int       skip_levels;
+    int       sample_type;
+    int       reserved;
+    long long num_segments;
+    long long file_size;
+    long long stream_size[MIP_FILE_STREAMS];
+    MipFileSegment segments[MIP_FILE_MAX_SEGMENTS];
+    char      user[MIP_FILE_USER_SIZE];
+};
+
+
+class MipFile
+{
+public:
+    MipFile();
+    ~MipFile();
+
+    // create a new, empty file. an existing one is overwritten.
+    // elem_size is sizeof(T) of the MipBuf_t. return false on error.
+    bool create(const char* path, int elem_size, int sample_type=0);
+    // open an existing file. return false on error or if the file is not
+    // a mip file of elem_size. elem_size 0 accepts any.
+    bool open(const char* path, int elem_size, bool writable);
+    // unmap everything and close the file. sizes are flushed first.
+    void close();
+    // write everything to disk. return false on error.
+    bool flush();
+
+    bool is_open();
+    bool is_writable();
+    int  get_elem_size();
+    int  get_sample_type();
+
+    long long size(int stream);
+    void set_size(int stream, long long size);
+
+    // branching and skip_levels of the MipBuf_t in the file. branching is 0
+    // in a new file.
+    int  get_branching();
+    int  get_skip_levels();
+    void set_branching(int branching, int skip_levels);
+
+    // pointers to the columns of entry i of the stream (three for a level,
+    // one for the timestamps) and the num of entries following it in the
+    // same segment, i included. allocate creates the segment if needed
+    // (writable files only). return 0 if there's no segment for i.
+    long long span(int stream, long long i, char** columns, bool allocate);
+
+    // small free-form blob, MIP_FILE_USER_SIZE bytes at most.
+    // get_user_data returns its size, copies at most max_size bytes.
+    int  get_user_data(char* out, int max_size);
+    bool set_user_data(const char* data, int size);
+
+private:
+
+    MipFileHeader* m_header;
+    bool           m_writable;
+    // mapped address of every segment in m_header->segments
+    char*          m_segments[MIP_FILE_MAX_SEGMENTS];
+    // segment of the last span() of every stream. appends and renders
+    // mostly stay inside one segment.
+    int            m_last[MIP_FILE_STREAMS];
+
+#if defined(WIN32)
+    void*          m_file;
+#else
+    int            m_fd;
+#endif
+
+    int   m_column_size(int stream);
+    int   m_num_columns(int stream);
+    int   m_find(int stream, long long i);
+    int   m_allocate(int stream);
+    bool  m_resize(long long size);
+    char* m_map(long long offset, long long size);
+    void  m_unmap(char* p, long long size);
+    bool  m_sync(char* p, long long size);
+};
+
+
+#endif // __MIP_FILE_H__
@@ -0,0 +1,299 @@
+#ifndef __MIP_LEVEL_T_H__
+#define __MIP_LEVEL_T_H__
+
+//
+// one level of the MipBuf_t pyramid. structure of arrays: minval, maxval
+// and avg are separate columns, always of the same size.
+//
+// indices are absolute. entry i is the i-th entry ever appended to this
+// level, whether or not it is still kept.
+//
+// three storage modes:
+//
+//   capacity 0 : array_t columns. grows forever, nothing is ever dropped.
+//   capacity N : circular_buffer_t columns. keeps only the newest N
+//                entries, first() moves forward as older ones are
+//                overwritten. memory stays constant.
+//   file       : columns in the segments of a memory-mapped MipFile.
+//                grows forever like capacity 0, see mip_file.h
+//
+// either way the entries are reachable as runs of plain arrays through
+// span(). a growing level is always one run, a ring at most two, a file
+// one per segment.
+//
+
+#include "array_t.h"
+#include "circular_buffer_t.h"
+#include "mip_file.h"
+
+
+// absolute entry index. float32 is exact only up to 2^24 and int32 up to
+// 2^31, that's hours or days at kHz sample rates. 64 bits is forever.
+typedef long long mip_index_t;
+
+
+template<class T>
+class MipLevel_t
+{
+public:
+
+    MipLevel_t(int capacity=0);
+    // entries live in the file, stream 'level'. starts with what the file
+    // already has. the file has to outlive the level.
+    MipLevel_t(MipFile* file, int level);
+
+    void append(T minval, T maxval, T avg);
+    // ring mode: only the last 'capacity' of the n entries will be kept.
+    void append(const T* minval, const T* maxval, const T* avg, int n);
+    // n entries to be written through span() later, by several threads
+    // if need be (MipBuf_t::append_minmaxavg_arrays_parallel). growing
+    // levels only, not for rings and files.
+    void grow(mip_index_t n);
+
+    // pointers to the entry at absolute index i and the num of entries
+    // following it contiguously in memory, at most n. return 0 if i is not
+    // kept (anymore).
+    mip_index_t span(mip_index_t i, mip_index_t n, T** minval, T** maxval, T** avg);
+
+    // return false if entry i is not kept
+    bool get(mip_index_t i, T* minval, T* maxval, T* avg);
+
+    // num of entries ever appended. one past the newest entry.
+    mip_index_t size();
+    // absolute index of the oldest entry still kept. 0 if nothing is ever dropped.
+    mip_index_t first();
+    // 0 if growing forever
+    int  capacity();
+
+protected:
+
+    mip_index_t m_size;
+    int         m_capacity;
+
+    MipFile*    m_file;
+    int         m_level;
+
+    array_t<T> m_minval;
+    array_t<T> m_maxval;
+    array_t<T> m_avg;
+
+    circular_buffer_t<T> m_ring_minval;
+    circular_buffer_t<T> m_ring_maxval;
+    circular_buffer_t<T> m_ring_avg;
+
+    // room for n more entries in every growing column
+    void m_reserve(mip_index_t n);
+};
+
+
+// --------------------------------------------------------------------------
+// ---- LIFECYCLE -----------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+MipLevel_t<T>::MipLevel_t(int capacity)
+{
+    m_size     = 0;
+    m_capacity = capacity;
+    m_file     = NULL;
+    m_level    = 0;
+
+    if (m_capacity)
+    {
+        m_ring_minval.set_capacity(m_capacity);
+        m_ring_maxval.set_capacity(m_capacity);
+        m_ring_avg.set_capacity(m_capacity);
+    }
+}
+
+
+template<class T>
+MipLevel_t<T>::MipLevel_t(MipFile* file, int level)
+{
+    assert(file && file->is_open());
+    m_size     = file->size(level);
+    m_capacity = 0;
+    m_file     = file;
+    m_level    = level;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- METHODS -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+inline void MipLevel_t<T>::append(T minval, T maxval, T avg)
+{
+    if (m_file)
+    {
+        T* columns[3];
+        mip_index_t count = m_file->span(m_level, m_size, (char**)columns, true);
+        assert(count);
+        (void)count;
+        *columns[0] = minval;
+        *columns[1] = maxval;
+        *columns[2] = avg;
+        m_file->set_size(m_level, m_size + 1);
+    }
+    else if (m_capacity)
+    {
+        m_ring_minval.appendval(minval);
+        m_ring_maxval.appendval(maxval);
+        m_ring_avg.appendval(avg);
+    }
+    else
+    {
+        // all columns or none. a failed allocation throws before any grew.
+        m_reserve(1);
+        m_minval.appendval(minval);
+        m_maxval.appendval(maxval);
+        m_avg.appendval(avg);
+    }
+    m_size++;
+}
+
+
+template<class T>
+void MipLevel_t<T>::append(const T* minval, const T* maxval, const T* avg, int n)
+{
+    if (m_file)
+    {
+        // piecewise, the n entries may start a new segment
+        for (int i = 0; i < n;)
+        {
+            T* columns[3];
+            mip_index_t count = m_file->span(m_level, m_size + i, (char**)columns, true);
+            assert(count);
+            int c = count < n - i ? int(count) : n - i;
+            memcpy(columns[0], minval + i, sizeof(T) * c);
+            memcpy(columns[1], maxval + i, sizeof(T) * c);
+            memcpy(columns[2], avg + i,    sizeof(T) * c);
+            i += c;
+        }
+        m_file->set_size(m_level, m_size + n);
+    }
+    else if (m_capacity)
+    {
+        // skip what would be overwritten anyway
+        int skip = n > m_capacity ? n - m_capacity : 0;
+        for (int i = skip; i < n; i++)
+        {
+            *m_ring_minval.append() = minval[i];
+            *m_ring_maxval.append() = maxval[i];
+            *m_ring_avg.append()    = avg[i];
+        }
+    }
+    else
+    {
+        m_reserve(n);
+        memcpy(m_minval.append(n), minval, sizeof(T) * n);
+        memcpy(m_maxval.append(n), maxval, sizeof(T) * n);
+        memcpy(m_avg.append(n),    avg,    sizeof(T) * n);
+    }
+    m_size += n;
+}
+
+
+template<class T>
+void MipLevel_t<T>::grow(mip_index_t n)
+{
+    assert(!m_file && !m_capacity);
+    m_reserve(n);
+    m_minval.append(n);
+    m_maxval.append(n);
+    m_avg.append(n);
+    m_size += n;
+}
+
+
+template<class T>
+mip_index_t MipLevel_t<T>::span(mip_index_t i, mip_index_t n, T** minval, T** maxval, T** avg)
+{
+    if (i < first() || i >= m_size || n <= 0)
+        return 0;
+
+    mip_index_t count;
+    if (m_file)
+    {
+        T* columns[3];
+        count = m_file->span(m_level, i, (char**)columns, false);
+        if (!count)
+            return 0;
+        if (count > m_size - i)
+            count = m_size - i;
+        *minval = columns[0];
+        *maxval = columns[1];
+        *avg    = columns[2];
+    }
+    else if (m_capacity)
+    {
+        int rel = int(i - first());
+        int ring_count;
+        *minval = m_ring_minval.get_contiguous(rel, &ring_count);
+        count   = ring_count;
+        *maxval = m_ring_maxval.get(rel);
+        *avg    = m_ring_avg.get(rel);
+    }
+    else
+    {
+        count   = m_size - i;
+        *minval = m_minval.data() + i;
+        *maxval = m_maxval.data() + i;
+        *avg    = m_avg.data() + i;
+    }
+    return count < n ? count : n;
+}
+
+
+template<class T>
+bool MipLevel_t<T>::get(mip_index_t i, T* minval, T* maxval, T* avg)
+{
+    T *mn, *mx, *av;
+    if (!span(i, 1, &mn, &mx, &av))
+        return false;
+    *minval = *mn;
+    *maxval = *mx;
+    *avg    = *av;
+    return true;
+}
+
+
+template<class T>
+inline mip_index_t MipLevel_t<T>::size()
+{
+    return m_size;
+}
+
+
+template<class T>
+inline mip_index_t MipLevel_t<T>::first()
+{
+    return m_capacity ? m_size - m_ring_avg.size() : 0;
+}
+
+
+template<class T>
+inline int MipLevel_t<T>::capacity()
+{
+    return m_capacity;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+inline void MipLevel_t<T>::m_reserve(mip_index_t n)
+{
+    m_minval.reserve_more(n);
+    m_maxval.reserve_more(n);
+    m_avg.reserve_more(n);
+}
+
+
+#endif // __MIP_LEVEL_T_H__
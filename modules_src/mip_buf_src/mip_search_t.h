@@ -0,0 +1,199 @@
+#ifndef __MIP_SEARCH_T_H__
+#define __MIP_SEARCH_T_H__
+
+//
+// threshold search through the samples of a MipBuf_t.
+//
+//   above   : sample i matches if maxval[i] > level
+//   below   : sample i matches if minval[i] < level
+//   outside : sample i is above level2 or below level
+//   inside  : minval[i] >= level and maxval[i] <= level2
+//
+// (samples appended with append() have minval == maxval == avg.)
+//
+// find() walks the pyramid like MipBuf_t::get_stats, and looks into an
+// entry only if its minval and maxval allow a match. minval and maxval of
+// an entry are the extremes of its samples, so for above, below and
+// outside an entry holds a match exactly if its extremes match: one path
+// down the pyramid per match, and a range without matches costs
+// O(log n) instead of n. inside may descend into an entry for nothing.
+// entries where every sample matches (minval above the level, ..) are
+// copied out without descending.
+//
+
+#include "mip_buf_t.h"
+
+
+enum
+{
+    MIP_SEARCH_ABOVE = 0,
+    MIP_SEARCH_BELOW,
+    MIP_SEARCH_OUTSIDE,
+    MIP_SEARCH_INSIDE,
+    MIP_NUM_SEARCH_MODES
+};
+
+
+template<class T>
+class MipSearch_t
+{
+public:
+    // mode: MIP_SEARCH_*. level: threshold of above and below, the bottom
+    // of the band. level2: the top of the band.
+    MipSearch_t(int mode, double level, double level2);
+
+    // matching samples of start..end-1 in order (newest first if
+    // backward), at most max_n. return num copied. samples not kept
+    // anymore are not searched.
+    int find(MipBuf_t<T>* buf, mip_index_t start, mip_index_t end, bool backward, mip_index_t* out, int max_n);
+
+private:
+    int    m_mode;
+    double m_level;
+    double m_level2;
+
+    // does a sample with minval and maxval match
+    inline bool m_matches(double minval, double maxval);
+    // can any sample of an entry with minval and maxval match
+    inline bool m_may_match(double minval, double maxval);
+    // does every sample of it match
+    inline bool m_all_match(double minval, double maxval);
+    // matching samples of entry e of the level into out[*n..max_n-1]
+    void m_search(MipBuf_t<T>* buf, int level, mip_index_t e, bool backward, mip_index_t* out, int max_n, int* n);
+};
+
+
+// --------------------------------------------------------------------------
+// ---- LIFECYCLE -----------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+MipSearch_t<T>::MipSearch_t(int mode, double level, double level2)
+{
+    assert(mode >= 0 && mode < MIP_NUM_SEARCH_MODES);
+    m_mode   = mode;
+    m_level  = MIP_MIN(level, level2);
+    m_level2 = MIP_MAX(level, level2);
+    if (mode == MIP_SEARCH_ABOVE || mode == MIP_SEARCH_BELOW)
+        m_level = m_level2 = level;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- METHODS -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+int MipSearch_t<T>::find(MipBuf_t<T>* buf, mip_index_t start, mip_index_t end, bool backward, mip_index_t* out, int max_n)
+{
+    if (start < buf->first())
+        start = buf->first();
+    if (end > buf->size())
+        end = buf->size();
+
+    int n   = 0;
+    int top = buf->num_levels() - 1;
+    while (start < end && n < max_n)
+    {
+        // the largest entry starting at 'start' (or ending at 'end') that
+        // stays in the range
+        int level = 0;
+        mip_index_t i = backward ? end : start;
+        while (level < top &&
+                (i & ((mip_index_t(1) << buf->level_shift(level + 1)) - 1)) == 0 &&
+                end - start >= (mip_index_t(1) << buf->level_shift(level + 1)))
+            level++;
+
+        mip_index_t len = mip_index_t(1) << buf->level_shift(level);
+        if (backward)
+        {
+            end -= len;
+            m_search(buf, level, end >> buf->level_shift(level), true, out, max_n, &n);
+        }
+        else
+        {
+            m_search(buf, level, start >> buf->level_shift(level), false, out, max_n, &n);
+            start += len;
+        }
+    }
+    return n;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+inline bool MipSearch_t<T>::m_matches(double minval, double maxval)
+{
+    if (m_mode == MIP_SEARCH_ABOVE)
+        return maxval > m_level;
+    if (m_mode == MIP_SEARCH_BELOW)
+        return minval < m_level;
+    if (m_mode == MIP_SEARCH_OUTSIDE)
+        return maxval > m_level2 || minval < m_level;
+    return minval >= m_level && maxval <= m_level2;
+}
+
+
+template<class T>
+inline bool MipSearch_t<T>::m_may_match(double minval, double maxval)
+{
+    if (m_mode == MIP_SEARCH_INSIDE)
+        return maxval >= m_level && minval <= m_level2;
+    return m_matches(minval, maxval);
+}
+
+
+// a sample's extremes are inside the extremes of the entry
+template<class T>
+inline bool MipSearch_t<T>::m_all_match(double minval, double maxval)
+{
+    if (m_mode == MIP_SEARCH_ABOVE)
+        return minval > m_level;
+    if (m_mode == MIP_SEARCH_BELOW)
+        return maxval < m_level;
+    if (m_mode == MIP_SEARCH_OUTSIDE)
+        return minval > m_level2 || maxval < m_level;
+    return minval >= m_level && maxval <= m_level2;
+}
+
+
+template<class T>
+void MipSearch_t<T>::m_search(MipBuf_t<T>* buf, int level, mip_index_t e, bool backward, mip_index_t* out, int max_n, int* n)
+{
+    T minval, maxval, avg;
+    if (buf->level(level)->get(e, &minval, &maxval, &avg))
+    {
+        if (level == 0)
+        {
+            if (m_matches(double(minval), double(maxval)))
+                out[(*n)++] = e;
+            return;
+        }
+        if (!m_may_match(double(minval), double(maxval)))
+            return;
+        if (m_all_match(double(minval), double(maxval)))
+        {
+            mip_index_t first = e << buf->level_shift(level);
+            mip_index_t len   = mip_index_t(1) << buf->level_shift(level);
+            for (mip_index_t k = 0; k < len && *n < max_n; k++)
+                out[(*n)++] = backward ? first + len - 1 - k : first + k;
+            return;
+        }
+    }
+    // coarser levels keep longer. only a sample can be dropped already.
+    else if (level == 0)
+        return;
+
+    int children = 1 << (buf->level_shift(level) - buf->level_shift(level - 1));
+    for (int k = 0; k < children && *n < max_n; k++)
+        m_search(buf, level - 1, e * children + (backward ? children - 1 - k : k), backward, out, max_n, n);
+}
+
+
+#endif // __MIP_SEARCH_T_H__
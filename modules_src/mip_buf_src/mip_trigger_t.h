@@ -0,0 +1,301 @@
+#ifndef __MIP_TRIGGER_T_H__
+#define __MIP_TRIGGER_T_H__
+
+//
+// oscilloscope trigger on the avg of the samples of a MipBuf_t.
+//
+//   rising  : sample i triggers if avg[i-1] < level <= avg[i]
+//   falling : sample i triggers if avg[i-1] > level >= avg[i]
+//   window  : sample i triggers if avg[i-1] is inside level..level2 and
+//             avg[i] is outside of it
+//
+// find() searches any range of the history. it walks the pyramid like
+// MipBuf_t::get_stats and skips every entry whose minval and maxval (and
+// the sample before it) can't make a trigger, so a search through a quiet
+// signal costs O(log n) instead of n. the skipping assumes minval <= avg
+// <= maxval, which is true for anything appended with append().
+//
+// update() indexes the triggers of the samples appended since the last
+// call, with holdoff: the samples right after a trigger can't trigger
+// again. the index is sorted, get_triggers() and last() are binary
+// searches. in ring mode the triggers of dropped samples are forgotten.
+// MipBufRenderer_t appends to a ring in pieces smaller than its capacity
+// and updates after each, so every appended sample is scanned and the
+// count doesn't depend on how the producer splits its blocks. samples
+// dropped before set() are not scanned.
+//
+
+#include "mip_buf_t.h"
+
+
+enum
+{
+    MIP_TRIGGER_NONE = 0,
+    MIP_TRIGGER_RISING,
+    MIP_TRIGGER_FALLING,
+    MIP_TRIGGER_WINDOW,
+    MIP_NUM_TRIGGER_MODES
+};
+
+
+template<class T>
+class MipTrigger_t
+{
+public:
+    MipTrigger_t();
+
+    // mode: MIP_TRIGGER_*. level: threshold of rising and falling, the
+    // bottom of the window. level2: the top of the window. holdoff: num of
+    // samples after a trigger that can't trigger. forgets the index, the
+    // next update() starts from the oldest kept sample.
+    void set(int mode, double level, double level2, mip_index_t holdoff);
+    int  mode();
+
+    // index the triggers of the samples appended since the last call.
+    void update(MipBuf_t<T>* buf);
+
+    // the first sample of start..end-1 that triggers, -1 if none. holdoff
+    // and the index are not used.
+    mip_index_t find(MipBuf_t<T>* buf, mip_index_t start, mip_index_t end);
+
+    // num of triggers ever indexed since set()
+    mip_index_t num_triggers();
+    // indexed triggers in start..end-1, at most max_n. return num copied.
+    int  get_triggers(mip_index_t start, mip_index_t end, mip_index_t* out, int max_n);
+    // the last indexed trigger before 'end', -1 if none
+    mip_index_t last(mip_index_t end);
+
+private:
+    int    m_mode;
+    double m_level;
+    double m_level2;
+    mip_index_t m_holdoff;
+    // next sample update() looks at
+    mip_index_t m_next;
+    mip_index_t m_num_triggers;
+    // sorted sample indices
+    array_t<mip_index_t> m_positions;
+
+    inline bool m_inside(double v);
+    // does sample 'cur' trigger after 'prev'
+    inline bool m_triggers(double prev, double cur);
+    // can any sample of an entry with minval and maxval trigger, the first
+    // one after 'prev'
+    inline bool m_may_trigger(double prev, double minval, double maxval);
+    // index of the first trigger >= i
+    mip_index_t m_lower_bound(mip_index_t i);
+    // drop the triggers before 'first' once they are half of the index
+    void m_forget(mip_index_t first);
+};
+
+
+// --------------------------------------------------------------------------
+// ---- LIFECYCLE -----------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+MipTrigger_t<T>::MipTrigger_t()
+{
+    set(MIP_TRIGGER_NONE, 0., 0., 0);
+}
+
+
+// --------------------------------------------------------------------------
+// ---- METHODS -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+void MipTrigger_t<T>::set(int mode, double level, double level2, mip_index_t holdoff)
+{
+    assert(mode >= 0 && mode < MIP_NUM_TRIGGER_MODES);
+    m_mode    = mode;
+    m_level   = MIP_MIN(level, level2);
+    m_level2  = MIP_MAX(level, level2);
+    if (mode != MIP_TRIGGER_WINDOW)
+        m_level = m_level2 = level;
+    m_holdoff = holdoff;
+    m_next    = 0;
+    m_num_triggers = 0;
+    m_positions.clear();
+}
+
+
+template<class T>
+inline int MipTrigger_t<T>::mode()
+{
+    return m_mode;
+}
+
+
+template<class T>
+void MipTrigger_t<T>::update(MipBuf_t<T>* buf)
+{
+    if (m_mode == MIP_TRIGGER_NONE)
+        return;
+
+    for (mip_index_t t = find(buf, m_next, buf->size()); t >= 0; t = find(buf, m_next, buf->size()))
+    {
+        m_positions.appendval(t);
+        m_num_triggers++;
+        m_next = t + MIP_MAX(m_holdoff, 1);
+    }
+    // a holdoff can reach past the last sample
+    m_next = MIP_MAX(m_next, buf->size());
+
+    if (buf->capacity())
+        m_forget(buf->first());
+}
+
+
+template<class T>
+mip_index_t MipTrigger_t<T>::find(MipBuf_t<T>* buf, mip_index_t start, mip_index_t end)
+{
+    // every sample needs the one before it
+    if (start < buf->first() + 1)
+        start = buf->first() + 1;
+    if (end > buf->size())
+        end = buf->size();
+    if (m_mode == MIP_TRIGGER_NONE || start >= end)
+        return -1;
+
+    MipLevel_t<T>* l0 = buf->level(0);
+    T minval = 0, maxval = 0, avg = 0;
+    l0->get(start - 1, &minval, &maxval, &avg);
+    double prev = double(avg);
+
+    int top = buf->num_levels() - 1;
+    for (mip_index_t i = start; i < end;)
+    {
+        // the largest entry starting at i that ends before 'end'
+        int level = 0;
+        while (level < top &&
+                (i & ((mip_index_t(1) << buf->level_shift(level + 1)) - 1)) == 0 &&
+                i + (mip_index_t(1) << buf->level_shift(level + 1)) <= end)
+            level++;
+
+        // smaller ones while it may hold a trigger
+        while (level > 0 &&
+                (!buf->level(level)->get(i >> buf->level_shift(level), &minval, &maxval, &avg) ||
+                 m_may_trigger(prev, double(minval), double(maxval))))
+            level--;
+
+        if (level == 0)
+        {
+            l0->get(i, &minval, &maxval, &avg);
+            if (m_triggers(prev, double(avg)))
+                return i;
+            prev = double(avg);
+            i++;
+            continue;
+        }
+
+        // no trigger in the whole entry. its last sample is the one before
+        // the next entry.
+        i += mip_index_t(1) << buf->level_shift(level);
+        l0->get(i - 1, &minval, &maxval, &avg);
+        prev = double(avg);
+    }
+    return -1;
+}
+
+
+template<class T>
+inline mip_index_t MipTrigger_t<T>::num_triggers()
+{
+    return m_num_triggers;
+}
+
+
+template<class T>
+int MipTrigger_t<T>::get_triggers(mip_index_t start, mip_index_t end, mip_index_t* out, int max_n)
+{
+    int n = 0;
+    for (mip_index_t j = m_lower_bound(start); j < m_positions.size() && n < max_n; j++)
+    {
+        mip_index_t t = *m_positions.get(j);
+        if (t >= end)
+            break;
+        out[n++] = t;
+    }
+    return n;
+}
+
+
+template<class T>
+mip_index_t MipTrigger_t<T>::last(mip_index_t end)
+{
+    mip_index_t j = m_lower_bound(end);
+    return j ? *m_positions.get(j - 1) : -1;
+}
+
+
+// --------------------------------------------------------------------------
+// ---- PRIVATE -------------------------------------------------------------
+// --------------------------------------------------------------------------
+
+
+template<class T>
+inline bool MipTrigger_t<T>::m_inside(double v)
+{
+    return v >= m_level && v <= m_level2;
+}
+
+
+template<class T>
+inline bool MipTrigger_t<T>::m_triggers(double prev, double cur)
+{
+    if (m_mode == MIP_TRIGGER_RISING)
+        return prev < m_level && cur >= m_level;
+    if (m_mode == MIP_TRIGGER_FALLING)
+        return prev > m_level && cur <= m_level;
+    return m_inside(prev) && !m_inside(cur);
+}
+
+
+// an entry can hold a trigger only if its samples (and the one before)
+// reach both sides of the level, or inside and outside of the window.
+template<class T>
+inline bool MipTrigger_t<T>::m_may_trigger(double prev, double minval, double maxval)
+{
+    if (m_mode == MIP_TRIGGER_RISING)
+        return MIP_MIN(prev, minval) < m_level && maxval >= m_level;
+    if (m_mode == MIP_TRIGGER_FALLING)
+        return MIP_MAX(prev, maxval) > m_level && minval <= m_level;
+    return (m_inside(prev) || (maxval >= m_level && minval <= m_level2)) &&
+           (minval < m_level || maxval > m_level2);
+}
+
+
+template<class T>
+mip_index_t MipTrigger_t<T>::m_lower_bound(mip_index_t i)
+{
+    mip_index_t a = 0, b = m_positions.size();
+    while (a < b)
+    {
+        mip_index_t m = (a + b) / 2;
+        if (*m_positions.get(m) < i)
+            a = m + 1;
+        else
+            b = m;
+    }
+    return a;
+}
+
+
+template<class T>
+void MipTrigger_t<T>::m_forget(mip_index_t first)
+{
+    mip_index_t n = m_positions.size();
+    mip_index_t k = m_lower_bound(first);
+    if (k == 0 || k < n / 2)
+        return;
+    // clear() keeps the memory, the moved positions stay where they are
+    memmove(m_positions.data(), m_positions.data() + k, sizeof(mip_index_t) * (n - k));
+    m_positions.clear();
+    m_positions.append(n - k);
+}
+
+
+#endif // __MIP_TRIGGER_T_H__
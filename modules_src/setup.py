@@ -36,7 +36,7 @@ if sys.platform == "darwin":
 elif sys.platform == "win32":
     libraries = ["opengl32"]
 elif sys.platform == "linux2":
-    libraries = ["GL"]
+    libraries = ["GL", "pthread"]
 else:
     raise RuntimeError("platform %s not supported" % (sys.platform))
 
@@ -47,6 +47,10 @@ ext_cpp = Extension(
     sources=["cpp.pyx",
              "helpers_src/opengl_graphics.cpp",
              "mip_buf_src/mip_buf_renderer.cpp",
+             "mip_buf_src/mip_derived.cpp",
+             "mip_buf_src/mip_density.cpp",
+             "mip_buf_src/mip_buf_vbo.cpp",
+             "mip_buf_src/mip_file.cpp",
              "mip_buf_simple_src/mip_buf_simple_renderer.cpp"],
     include_dirs=["helpers_src", "mip_buf_src", "mip_buf_simple_src"],
     library_dirs=[],